@@ -54,9 +54,21 @@ class RoutingMeta(BaseModel):
         "normal" | "high" | "low"
     dup_suppress:
         Whether intermediate hops should attempt duplicate suppression.
+    path:
+        Hex digest of the routers that forwarded this envelope, used for
+        loop suppression (see routing_service.path_digest). Empty at origin.
+    copies:
+        Replicas the receiving router may hand out (spray-and-wait); 1 for
+        single-copy routing.
+    ack_for:
+        Set on delivery acknowledgments: the msg_id that reached its
+        recipient. An ACK carries no ciphertext.
     """
     priority: str = "normal"    # normal|high|low
     dup_suppress: bool = True
+    path: str = ""              # forwarding path digest (32 hex chars)
+    copies: int = 1             # replicas handed to the receiver
+    ack_for: str = ""           # msg_id acknowledged by this envelope
 
 
 class MessageEnvelope(BaseModel):
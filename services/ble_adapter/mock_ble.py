@@ -1,7 +1,7 @@
 # ble_adapter/mock_ble.py
 from __future__ import annotations
 import json
-from typing import Dict
+from typing import Dict, List, Optional
 from fastapi import FastAPI
 from pydantic import BaseModel
 from lib.envelope import MessageEnvelope
@@ -19,9 +19,23 @@ class SendChunkPayload(BaseModel):
         "chunk": <MessageEnvelope JSON>,
         "target_peer": "<recipient_fp string>"
       }
+
+    The router may instead send several envelopes for one target as
+    "bundle": [<MessageEnvelope JSON>, ...], transmitted as one unit.
+    target_peer null means broadcast.
+    """
+    chunk: Optional[Dict] = None
+    bundle: Optional[List[Dict]] = None
+    target_peer: Optional[str] = None
+
+
+@app.get("/v1/ble/health")
+def health():
+    """
+    Liveness probe; the router's adapter pool polls it to bring an adapter
+    back into rotation.
     """
-    chunk: Dict
-    target_peer: str
+    return {"ok": True}
 
 
 @app.post("/v1/ble/send_chunk")
@@ -34,30 +48,34 @@ def receive_chunk(payload: SendChunkPayload):
     - Logs a nicely formatted summary to stdout.
     - Always returns `{"queued": true, "estimate_ms": ...}`.
     """
-    # Validate and parse the envelope
-    try:
-        envelope = MessageEnvelope(**payload.chunk)
-    except Exception as exc:
-        # In a true mock we might just print the error; here we still
-        # try to be informative but keep the behavior simple.
-        print("[MOCK BLE] Invalid MessageEnvelope:", exc)
-        return {"queued": False, "error": "invalid envelope"}
-
-    # Defensive checks (same as real service) – useful to catch bugs in dev
-    try:
-        validate_ttl(envelope.header.ttl)
-        validate_priority(envelope.routing.priority)
-    except ValueError as exc:
-        print("[MOCK BLE] Invalid TTL/priority:", exc)
-        return {"queued": False, "error": str(exc)}
+    chunks = payload.bundle if payload.bundle is not None else [payload.chunk]
+    envelopes = []
+    for chunk in chunks:
+        # Validate and parse the envelope
+        try:
+            envelope = MessageEnvelope(**(chunk or {}))
+        except Exception as exc:
+            # In a true mock we might just print the error; here we still
+            # try to be informative but keep the behavior simple.
+            print("[MOCK BLE] Invalid MessageEnvelope:", exc)
+            return {"queued": False, "error": "invalid envelope"}
 
-    # Pretty-print a redacted view (no ciphertext content, just length)
-    safe_dict = envelope.model_dump()
-    # Optionally redact ciphertext length instead of full blob to avoid spam
-    safe_dict["ciphertext"] = f"<base64 ciphertext, len={len(envelope.ciphertext)}>"
+        # Defensive checks (same as real service) – useful to catch bugs in dev
+        try:
+            validate_ttl(envelope.header.ttl)
+            validate_priority(envelope.routing.priority)
+        except ValueError as exc:
+            print("[MOCK BLE] Invalid TTL/priority:", exc)
+            return {"queued": False, "error": str(exc)}
+        envelopes.append(envelope)
 
-    print("[MOCK BLE] Received chunk for target_peer:", payload.target_peer)
-    print(json.dumps(safe_dict, indent=2))
+    print(f"[MOCK BLE] Received {len(envelopes)} chunk(s) for target_peer:", payload.target_peer)
+    for envelope in envelopes:
+        # Pretty-print a redacted view (no ciphertext content, just length)
+        safe_dict = envelope.model_dump()
+        # Optionally redact ciphertext length instead of full blob to avoid spam
+        safe_dict["ciphertext"] = f"<base64 ciphertext, len={len(envelope.ciphertext)}>"
+        print(json.dumps(safe_dict, indent=2))
 
     # Simulate some network latency estimate
     estimate_ms = 150
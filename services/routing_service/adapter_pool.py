@@ -0,0 +1,223 @@
+# services/routing_service/adapter_pool.py
+# several BLE adapter endpoints: weighted / least-outstanding balancing, sticky target assignment, health and failover.
+
+"""
+BLE adapter pool for the router loop.
+
+ble_adapters.endpoints lists the adapters a node can transmit through
+(several radios, or a relay fronting several adapters); without it the
+pool holds ble_adapter_url alone. Each pass the router loop assigns every
+target (neighbor or broadcast) to an adapter and drains the adapters in
+parallel, each one target after the other.
+
+    sticky     a target keeps its adapter while that adapter is healthy
+               and the target was served within sticky_seconds, so one
+               peer's traffic stays on one radio link and in order
+    balance    a new assignment goes to the adapter with the fewest
+               outstanding transmissions per unit of weight
+               (least_outstanding), or follows smooth weighted
+               round-robin (weighted)
+
+An adapter that leaves fail_after transmissions in a row unanswered is
+taken out of rotation. A transmission it failed is resent through
+another adapter right away; the target's assignment and the
+transmission's outstanding count move with it.
+Out-of-rotation adapters are probed every health_check_seconds (GET
+health_url; any answer below 500 brings them back). If no adapter is
+healthy they are all tried anyway; with a single adapter there is
+nothing to fail over to and the circuit breakers handle outages.
+"""
+
+from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from .config_loader import AdapterEndpoint, AdapterPoolConfig, current as current_config
+
+_monotonic = time.monotonic
+
+
+class Adapter:
+    __slots__ = (
+        "url", "weight", "health_url", "healthy", "failures", "outstanding",
+        "current", "sent", "failed", "checked_at",
+    )
+
+    def __init__(self, endpoint: AdapterEndpoint) -> None:
+        self.url = endpoint.url
+        self.weight = endpoint.weight
+        self.health_url = endpoint.health_url
+        self.healthy = True
+        self.failures = 0              # consecutive unanswered transmissions
+        self.outstanding = 0           # transmissions assigned and not finished
+        self.current = 0.0             # smooth weighted round-robin state
+        self.sent = 0
+        self.failed = 0
+        self.checked_at = 0.0
+
+
+class AdapterPool:
+    def __init__(
+        self,
+        endpoints: Sequence[AdapterEndpoint] = (),
+        balance: str = "least_outstanding",
+        sticky_seconds: float = 300,
+        fail_after: int = 3,
+        health_check_seconds: float = 10,
+        max_sticky: int = 10_000,
+    ) -> None:
+        self.max_sticky = max(int(max_sticky), 1)
+        self._lock = threading.Lock()
+        # url -> Adapter, in config order
+        self._adapters: "OrderedDict[str, Adapter]" = OrderedDict()
+        # target -> (url, last used), least recently used first
+        self._sticky: "OrderedDict[Optional[str], Tuple[str, float]]" = OrderedDict()
+        self.failovers = 0
+        self.configure(endpoints, AdapterPoolConfig(
+            balance=balance,
+            sticky_seconds=sticky_seconds,
+            fail_after=fail_after,
+            health_check_seconds=health_check_seconds,
+        ))
+
+    @classmethod
+    def from_config(cls, endpoints: Sequence[AdapterEndpoint], settings: AdapterPoolConfig) -> "AdapterPool":
+        pool = cls(max_sticky=settings.max_sticky)
+        pool.configure(endpoints, settings)
+        return pool
+
+    def configure(self, endpoints: Sequence[AdapterEndpoint], settings: AdapterPoolConfig) -> None:
+        """
+        Apply the endpoint list and knobs (per pass, so a config reload
+        applies); adapters that stay keep their health and counters.
+        """
+        with self._lock:
+            self.balance = settings.balance
+            self.sticky_seconds = settings.sticky_seconds
+            self.fail_after = settings.fail_after
+            self.health_check_seconds = settings.health_check_seconds
+            if [a.url for a in self._adapters.values()] == [e.url for e in endpoints]:
+                for endpoint in endpoints:
+                    adapter = self._adapters[endpoint.url]
+                    adapter.weight, adapter.health_url = endpoint.weight, endpoint.health_url
+                return
+            adapters: "OrderedDict[str, Adapter]" = OrderedDict()
+            for endpoint in endpoints:
+                adapter = self._adapters.get(endpoint.url) or Adapter(endpoint)
+                adapter.weight, adapter.health_url = endpoint.weight, endpoint.health_url
+                adapters[endpoint.url] = adapter
+            self._adapters = adapters
+
+    def __len__(self) -> int:
+        return len(self._adapters)
+
+    def _choose(self, candidates: List[Adapter]) -> Adapter:
+        if self.balance == "weighted":
+            total = sum(a.weight for a in candidates)
+            for a in candidates:
+                a.current += a.weight
+            best = max(candidates, key=lambda a: a.current)
+            best.current -= total
+            return best
+        return min(candidates, key=lambda a: (a.outstanding / a.weight, a.sent / a.weight))
+
+    def pick(self, target: Optional[str], exclude: Iterable[str] = ()) -> Optional[Adapter]:
+        """
+        Adapter for a transmission to `target` (sticky, else balanced),
+        skipping urls in `exclude`; None if every adapter is excluded.
+        """
+        with self._lock:
+            excluded = set(exclude)
+            candidates = [a for a in self._adapters.values() if a.url not in excluded]
+            if not candidates:
+                return None
+            healthy = [a for a in candidates if a.healthy] or candidates
+            now = _monotonic()
+            entry = self._sticky.get(target)
+            adapter = None
+            if entry is not None and now - entry[1] < self.sticky_seconds:
+                adapter = next((a for a in healthy if a.url == entry[0]), None)
+            if adapter is None:
+                adapter = self._choose(healthy)
+            self._sticky[target] = (adapter.url, now)
+            self._sticky.move_to_end(target)
+            while len(self._sticky) > self.max_sticky:
+                self._sticky.popitem(last=False)
+            return adapter
+
+    def assign(self, adapter: Adapter, transmissions: int = 1) -> None:
+        with self._lock:
+            adapter.outstanding += transmissions
+
+    def release(self, adapter: Adapter, transmissions: int = 1) -> None:
+        with self._lock:
+            adapter.outstanding = max(adapter.outstanding - transmissions, 0)
+
+    def transfer(self, src: Adapter, dst: Adapter, transmissions: int = 1) -> None:
+        """Move outstanding transmissions to the adapter now carrying them."""
+        with self._lock:
+            src.outstanding = max(src.outstanding - transmissions, 0)
+            dst.outstanding += transmissions
+
+    def record(self, adapter: Adapter, answered: bool) -> None:
+        """Whether the adapter answered a transmission (any HTTP status)."""
+        with self._lock:
+            adapter.sent += 1
+            if answered:
+                adapter.failures = 0
+                adapter.healthy = True
+                return
+            adapter.failed += 1
+            adapter.failures += 1
+            if adapter.healthy and adapter.failures >= self.fail_after and len(self._adapters) > 1:
+                adapter.healthy = False
+                adapter.checked_at = _monotonic()
+                print(f"[Routing] BLE adapter {adapter.url} out of rotation after {adapter.failures} failures")
+
+    def failed_over(self) -> None:
+        with self._lock:
+            self.failovers += 1
+
+    def due_checks(self) -> List[Adapter]:
+        """Out-of-rotation adapters due for a health check (marked as checked)."""
+        with self._lock:
+            now = _monotonic()
+            due = [
+                a for a in self._adapters.values()
+                if not a.healthy and now - a.checked_at >= self.health_check_seconds
+            ]
+            for a in due:
+                a.checked_at = now
+            return due
+
+    def health_result(self, adapter: Adapter, ok: bool) -> None:
+        with self._lock:
+            if ok and not adapter.healthy:
+                adapter.healthy = True
+                adapter.failures = 0
+                print(f"[Routing] BLE adapter {adapter.url} back in rotation")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "balance": self.balance,
+                "failovers": self.failovers,
+                "sticky_targets": len(self._sticky),
+                "adapters": [
+                    {
+                        "url": a.url,
+                        "weight": a.weight,
+                        "healthy": a.healthy,
+                        "outstanding": a.outstanding,
+                        "sent": a.sent,
+                        "failed": a.failed,
+                    }
+                    for a in self._adapters.values()
+                ],
+            }
+
+
+# adapters of this process's router loop; the endpoint list is re-read every pass
+POOL = AdapterPool.from_config(current_config().ble_adapter_endpoints, current_config().ble_adapters)
@@ -0,0 +1,211 @@
+# services/routing_service/circuit_breaker.py
+# per-target circuit breakers for BLE transmissions and the failure rate that stretches retry backoff.
+
+"""
+Circuit breakers for the router loop.
+
+Every BLE transmission target (a neighbor fingerprint, or broadcast) has
+a breaker, and so does the BLE adapter itself:
+
+    closed     transmissions go out; failure_threshold consecutive
+               failures open the breaker
+    open       the target is skipped for open_seconds: its rows are not
+               attempted and keep their retry count
+    half-open  after that, a single message goes out as a probe; success
+               closes the breaker, failure opens it again for twice as
+               long (up to max_open_seconds)
+
+An adapter failure (no HTTP response at all) counts against the adapter
+breaker only, so a dead adapter stops the whole pass without marking
+every peer bad. An error response counts against the target.
+
+Each breaker also keeps an EWMA of its failure rate. The router loop
+stretches the retry backoff of a hand-off by 1 + backoff_failure_scale x
+the chance that it fails: from the target's own rate and the adapter's
+(an adapter fault hits every target). Retries towards a failing neighbor
+slow down without holding back traffic to healthy ones, and return to the
+base schedule once it recovers. The rate over all transmissions is kept
+for stats().
+"""
+
+from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from .config_loader import CircuitBreakerConfig, current as current_config
+
+_monotonic = time.monotonic
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# acquire() results besides None (skip)
+PROBE = "probe"
+
+ADAPTER = "<adapter>"
+BROADCAST = "*"
+
+
+class _Breaker:
+    __slots__ = ("state", "failures", "opened_at", "open_for", "probe_at", "failure_rate", "trips")
+
+    def __init__(self, open_for: float) -> None:
+        self.state = CLOSED
+        self.failures = 0              # consecutive
+        self.opened_at = 0.0
+        self.open_for = open_for
+        self.probe_at = 0.0
+        self.failure_rate = 0.0
+        self.trips = 0
+
+
+class BreakerTable:
+    """
+    Breakers by target, bounded (least recently used evicted).
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        open_seconds: float = 10,
+        max_open_seconds: float = 300,
+        failure_alpha: float = 0.2,
+        max_targets: int = 1_000,
+    ) -> None:
+        self.failure_threshold = max(int(failure_threshold), 1)
+        self.open_seconds = max(float(open_seconds), 0.0)
+        self.max_open_seconds = max(float(max_open_seconds), self.open_seconds)
+        self.alpha = min(max(float(failure_alpha), 0.0), 1.0)
+        self.max_targets = max(int(max_targets), 1)
+        self._lock = threading.Lock()
+        self._breakers: "OrderedDict[str, _Breaker]" = OrderedDict()
+        self.failure_rate = 0.0
+        self.skipped = 0
+        self.probes = 0
+
+    @classmethod
+    def from_config(cls, settings: CircuitBreakerConfig) -> "BreakerTable":
+        return cls(
+            settings.failure_threshold,
+            settings.open_seconds,
+            settings.max_open_seconds,
+            settings.failure_alpha,
+            settings.max_targets,
+        )
+
+    @staticmethod
+    def _key(target: Optional[str]) -> str:
+        return BROADCAST if target is None else target
+
+    def _breaker(self, key: str) -> _Breaker:
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = self._breakers[key] = _Breaker(self.open_seconds)
+            while len(self._breakers) > self.max_targets:
+                self._breakers.popitem(last=False)
+        else:
+            self._breakers.move_to_end(key)
+        return breaker
+
+    @staticmethod
+    def _admits(breaker: _Breaker, now: float) -> Optional[str]:
+        if breaker.state == CLOSED:
+            return CLOSED
+        if breaker.state == OPEN:
+            return PROBE if now - breaker.opened_at >= breaker.open_for else None
+        # half-open: one probe at a time, unless its outcome never came back
+        return PROBE if now - breaker.probe_at >= breaker.open_for else None
+
+    def acquire(self, target: Optional[str]) -> Optional[str]:
+        """
+        Permission for one transmission to `target`: CLOSED (send as
+        usual), PROBE (send a single message) or None (skip the target).
+        """
+        with self._lock:
+            now = _monotonic()
+            breakers = (self._breaker(ADAPTER), self._breaker(self._key(target)))
+            admitted = [self._admits(breaker, now) for breaker in breakers]
+            if None in admitted:
+                self.skipped += 1
+                return None
+            if PROBE not in admitted:
+                return CLOSED
+            for breaker, result in zip(breakers, admitted):
+                if result == PROBE:
+                    breaker.state = HALF_OPEN
+                    breaker.probe_at = now
+            self.probes += 1
+            return PROBE
+
+    def _outcome(self, breaker: _Breaker, ok: bool, now: float) -> None:
+        breaker.failure_rate += self.alpha * ((0.0 if ok else 1.0) - breaker.failure_rate)
+        if ok:
+            breaker.failures = 0
+            if breaker.state != CLOSED:
+                breaker.state = CLOSED
+                breaker.open_for = self.open_seconds
+            return
+        breaker.failures += 1
+        if breaker.state == HALF_OPEN:
+            # failed probe: back off further
+            breaker.open_for = min(breaker.open_for * 2, self.max_open_seconds)
+        elif breaker.state != CLOSED or breaker.failures < self.failure_threshold:
+            return
+        breaker.state = OPEN
+        breaker.opened_at = now
+        breaker.trips += 1
+
+    def record(self, target: Optional[str], ok: bool, adapter_ok: bool = True) -> None:
+        """
+        Outcome of a transmission to `target`. adapter_ok False means the
+        adapter itself did not answer; the target is not blamed for it.
+        """
+        with self._lock:
+            now = _monotonic()
+            self._outcome(self._breaker(ADAPTER), adapter_ok, now)
+            if adapter_ok:
+                self._outcome(self._breaker(self._key(target)), ok, now)
+            self.failure_rate += self.alpha * ((0.0 if ok and adapter_ok else 1.0) - self.failure_rate)
+
+    def state(self, target: Optional[str]) -> str:
+        with self._lock:
+            breaker = self._breakers.get(self._key(target))
+            return CLOSED if breaker is None else breaker.state
+
+    def backoff_factor(self, scale: float, target: Optional[str] = None) -> float:
+        """
+        Multiplier for retry backoff towards `target` (None = broadcast),
+        from the failure rates of its breaker and the adapter breaker.
+        """
+        with self._lock:
+            delivered = 1.0
+            for key in (ADAPTER, self._key(target)):
+                breaker = self._breakers.get(key)
+                if breaker is not None:
+                    delivered *= 1.0 - breaker.failure_rate
+            return 1.0 + max(float(scale), 0.0) * (1.0 - delivered)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "failure_rate": round(self.failure_rate, 4),
+                "skipped": self.skipped,
+                "probes": self.probes,
+                "not_closed": {
+                    key: {
+                        "state": breaker.state,
+                        "open_for": breaker.open_for,
+                        "failure_rate": round(breaker.failure_rate, 4),
+                        "trips": breaker.trips,
+                    }
+                    for key, breaker in self._breakers.items()
+                    if breaker.state != CLOSED
+                },
+            }
+
+
+# breakers of this process's router loop; sized from the config at startup
+BREAKERS = BreakerTable.from_config(current_config().circuit_breaker)
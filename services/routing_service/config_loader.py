@@ -1,13 +1,744 @@
 # services/routing_service/config_loader.py
+# typed, validated, immutable routing config snapshots; hot-reloaded on file change or SIGHUP.
+
+"""
+Routing configuration.
+
+The YAML file is parsed into a frozen RoutingConfig snapshot. Values used
+on every request (TTL bounds, freshness limits, size limits, IDS limiter
+parameters) are validated and precomputed once per load, so handlers read
+plain attributes instead of doing dict lookups with defaults.
+
+current() returns the active snapshot. reload() parses the file again and
+swaps the snapshot in with a single assignment; a handler that grabbed the
+old snapshot keeps using it until it finishes, so reloads never change
+settings halfway through a request. An invalid file is rejected and the
+previous snapshot stays active.
+
+Reloads are triggered by watch_config() (polls the file's mtime) and by
+SIGHUP (install_sighup_handler). IDS table sizes, shard counts, sketch
+dimensions and similar structural settings are read when the service
+starts; changing them still needs a restart (reload() prints a note for
+the ids.* ones).
+
+The file is `config/routing_config.yaml` in the repository, or the path in
+the ROUTING_CONFIG_PATH environment variable.
+"""
+
+from __future__ import annotations
+import asyncio
+import os
+import signal
+from dataclasses import dataclass, field, replace
+from datetime import timedelta
 from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Iterator, Mapping, Optional, Tuple
+
 import yaml
 
-CONFIG_PATH = Path("config/routing_config.yaml")
+CONFIG_PATH = Path(
+    os.getenv("ROUTING_CONFIG_PATH")
+    or Path(__file__).resolve().parents[2] / "config" / "routing_config.yaml"
+)
+
+# Hard safety caps to prevent misconfiguration from disabling freshness checks.
+HARD_MAX_SKEW = 3600        # 1 hour
+HARD_MAX_AGE = 24 * 3600    # 24 hours
+
+# ids.* keys that size in-memory structures at startup (not hot-reloadable)
+_RESTART_ONLY_IDS_KEYS = (
+    "max_tracked_peers",
+    "max_blocked_peers",
+    "state_shards",
+    "metrics_max_peers",
+    "sketch",
+    "scoring",
+    "anon",
+    "snapshot",
+    "log",
+)
+
+
+def _freeze(value: Any) -> Any:
+    """
+    Read-only deep copy of parsed YAML (dicts -> mappingproxy, lists -> tuples).
+    """
+    if isinstance(value, Mapping):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value: Any) -> Any:
+    if isinstance(value, Mapping):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+
+def _merge(base: dict, overrides: Mapping) -> dict:
+    out = dict(base)
+    for key, value in overrides.items():
+        if isinstance(value, Mapping) and isinstance(out.get(key), Mapping):
+            out[key] = _merge(dict(out[key]), value)
+        else:
+            out[key] = value
+    return out
+
+
+class _Reader:
+    """
+    Typed lookups with defaults; collects every problem instead of stopping
+    at the first one, so a bad reload reports all of them.
+    """
+
+    def __init__(self, data: Any, prefix: str, errors: list) -> None:
+        if data is None:
+            data = {}
+        if not isinstance(data, Mapping):
+            errors.append(f"{prefix.rstrip('.') or 'config'} must be a mapping")
+            data = {}
+        self.data = data
+        self.prefix = prefix
+        self.errors = errors
+
+    def _name(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def number(self, key: str, default: float, minimum: float = 0, integer: bool = False):
+        value = self.data.get(key, default)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            self.errors.append(f"{self._name(key)} must be a number, got {value!r}")
+            return default
+        if integer and value != int(value):
+            self.errors.append(f"{self._name(key)} must be an integer, got {value!r}")
+            return default
+        if value < minimum:
+            self.errors.append(f"{self._name(key)} must be >= {minimum}, got {value!r}")
+            return default
+        return int(value) if integer else float(value)
+
+    def integer(self, key: str, default: int, minimum: int = 0) -> int:
+        return self.number(key, default, minimum, integer=True)
+
+    def flag(self, key: str, default: bool) -> bool:
+        value = self.data.get(key, default)
+        if not isinstance(value, bool):
+            self.errors.append(f"{self._name(key)} must be true or false, got {value!r}")
+            return default
+        return value
+
+    def text(self, key: str, default: str, allow_empty: bool = False) -> str:
+        value = self.data.get(key, default)
+        if not isinstance(value, str) or not (value or allow_empty):
+            kind = "a string" if allow_empty else "a non-empty string"
+            self.errors.append(f"{self._name(key)} must be {kind}, got {value!r}")
+            return default
+        return value
+
+    def section(self, key: str) -> Mapping:
+        sub = _Reader(self.data.get(key), self._name(key) + ".", self.errors)
+        return _freeze(sub.data)
+
+
+@dataclass(frozen=True)
+class IdsConfig:
+    window_seconds: float
+    max_msgs_per_window: int
+    duplicate_suppression_ttl: float
+    block_peer_after: int
+    block_peer_ttl_seconds: float
+    max_tracked_peers: int
+    max_blocked_peers: int
+    state_shards: int
+    metrics_max_peers: int
+    # sub-blocks, read once at startup by ids_module
+    sketch: Mapping
+    scoring: Mapping
+    anon: Mapping
+    snapshot: Mapping
+    log: Mapping
+
+    # precomputed
+    block_peer_ttl: timedelta = field(init=False)
+    # GCRA parameters: one message "costs" emission_interval seconds, and a
+    # peer may run up to burst_tolerance ahead of schedule.
+    emission_interval: float = field(init=False)
+    burst_tolerance: float = field(init=False)
+
+    def __post_init__(self) -> None:
+        emission = self.window_seconds / max(self.max_msgs_per_window, 1)
+        object.__setattr__(self, "block_peer_ttl", timedelta(seconds=self.block_peer_ttl_seconds))
+        object.__setattr__(self, "emission_interval", emission)
+        object.__setattr__(self, "burst_tolerance", self.window_seconds - emission)
+
+    @classmethod
+    def _read(cls, r: _Reader) -> "IdsConfig":
+        window = r.number("window_seconds", 5)
+        if window <= 0:
+            r.errors.append(f"{r.prefix}window_seconds must be > 0")
+            window = 5.0
+        return cls(
+            window_seconds=window,
+            max_msgs_per_window=r.integer("max_msgs_per_window", 20, minimum=1),
+            duplicate_suppression_ttl=r.number("duplicate_suppression_ttl", 600),
+            block_peer_after=r.integer("block_peer_after", 999_999, minimum=1),
+            block_peer_ttl_seconds=r.number("block_peer_ttl_seconds", 3600),
+            max_tracked_peers=r.integer("max_tracked_peers", 100_000, minimum=1),
+            max_blocked_peers=r.integer("max_blocked_peers", 10_000, minimum=1),
+            state_shards=r.integer("state_shards", 16, minimum=1),
+            metrics_max_peers=r.integer("metrics_max_peers", 1_000, minimum=1),
+            sketch=r.section("sketch"),
+            scoring=r.section("scoring"),
+            anon=r.section("anon"),
+            snapshot=r.section("snapshot"),
+            log=r.section("log"),
+        )
+
+
+@dataclass(frozen=True)
+class IngressConfig:
+    # chunks a WebSocket ingress client may have in flight
+    ws_credits: int = 64
+    # items per batch / envelopes per bundle on ingress
+    max_batch_items: int = 1000
+
+    @classmethod
+    def _read(cls, r: _Reader) -> "IngressConfig":
+        d = cls()
+        return cls(
+            ws_credits=r.integer("ws_credits", d.ws_credits, minimum=1),
+            max_batch_items=r.integer("max_batch_items", d.max_batch_items, minimum=1),
+        )
+
+
+@dataclass(frozen=True)
+class AuthConfig:
+    # verified (device_fp, token) pairs kept in memory
+    cache_size: int = 10_000
+    cache_ttl_seconds: float = 60
+
+    @classmethod
+    def _read(cls, r: _Reader) -> "AuthConfig":
+        d = cls()
+        return cls(
+            cache_size=r.integer("cache_size", d.cache_size, minimum=1),
+            cache_ttl_seconds=r.number("cache_ttl_seconds", d.cache_ttl_seconds),
+        )
+
+
+@dataclass(frozen=True)
+class BundlingConfig:
+    enabled: bool = True
+    max_items: int = 32
+
+    @classmethod
+    def _read(cls, r: _Reader) -> "BundlingConfig":
+        d = cls()
+        return cls(
+            enabled=r.flag("enabled", d.enabled),
+            max_items=r.integer("max_items", d.max_items, minimum=1),
+        )
+
+
+@dataclass(frozen=True)
+class DutyCycleConfig:
+    enabled: bool = False
+    period_seconds: float = 30
+    window_seconds: float = 3
+
+    @classmethod
+    def _read(cls, r: _Reader) -> "DutyCycleConfig":
+        d = cls()
+        period = r.number("period_seconds", d.period_seconds)
+        if period <= 0:
+            r.errors.append(f"{r.prefix}period_seconds must be > 0")
+            period = d.period_seconds
+        window = r.number("window_seconds", d.window_seconds)
+        if window > period:
+            r.errors.append(f"{r.prefix}window_seconds must be <= period_seconds")
+        return cls(enabled=r.flag("enabled", d.enabled), period_seconds=period, window_seconds=window)
+
+
+@dataclass(frozen=True)
+class CircuitBreakerConfig:
+    enabled: bool = True
+    failure_threshold: int = 5
+    open_seconds: float = 10
+    max_open_seconds: float = 300
+    failure_alpha: float = 0.2
+    max_targets: int = 1_000
+    backoff_failure_scale: float = 4
+    max_backoff_ms: float = 60_000
+
+    @classmethod
+    def _read(cls, r: _Reader) -> "CircuitBreakerConfig":
+        d = cls()
+        open_seconds = r.number("open_seconds", d.open_seconds)
+        max_open_seconds = r.number("max_open_seconds", d.max_open_seconds)
+        if max_open_seconds < open_seconds:
+            r.errors.append(f"{r.prefix}max_open_seconds must be >= open_seconds")
+        failure_alpha = r.number("failure_alpha", d.failure_alpha)
+        if failure_alpha > 1:
+            r.errors.append(f"{r.prefix}failure_alpha must be <= 1")
+            failure_alpha = d.failure_alpha
+        return cls(
+            enabled=r.flag("enabled", d.enabled),
+            failure_threshold=r.integer("failure_threshold", d.failure_threshold, minimum=1),
+            open_seconds=open_seconds,
+            max_open_seconds=max_open_seconds,
+            failure_alpha=failure_alpha,
+            max_targets=r.integer("max_targets", d.max_targets, minimum=1),
+            backoff_failure_scale=r.number("backoff_failure_scale", d.backoff_failure_scale),
+            max_backoff_ms=r.number("max_backoff_ms", d.max_backoff_ms),
+        )
+
+
+@dataclass(frozen=True)
+class ShapingConfig:
+    enabled: bool = False
+    # 0 = unlimited
+    bytes_per_second: float = 0
+    msgs_per_second: float = 0
+    target_bytes_per_second: float = 0
+    target_msgs_per_second: float = 0
+    burst_seconds: float = 1.0
+    max_wait_ms: float = 500
+    target_estimate_ms: float = 300
+    decrease: float = 0.5
+    increase: float = 0.05
+    min_share: float = 0.05
+    max_targets: int = 1_000
+
+    @classmethod
+    def _read(cls, r: _Reader) -> "ShapingConfig":
+        d = cls()
+        values = {
+            key: r.number(key, getattr(d, key))
+            for key in (
+                "bytes_per_second", "msgs_per_second", "target_bytes_per_second",
+                "target_msgs_per_second", "burst_seconds", "max_wait_ms",
+                "target_estimate_ms", "decrease", "increase", "min_share",
+            )
+        }
+        for key in ("burst_seconds", "min_share"):
+            if values[key] <= 0:
+                r.errors.append(f"{r.prefix}{key} must be > 0")
+                values[key] = getattr(d, key)
+        for key in ("decrease", "min_share"):
+            if values[key] > 1:
+                r.errors.append(f"{r.prefix}{key} must be <= 1")
+                values[key] = getattr(d, key)
+        return cls(
+            enabled=r.flag("enabled", d.enabled),
+            max_targets=r.integer("max_targets", d.max_targets, minimum=1),
+            **values,
+        )
+
+
+@dataclass(frozen=True)
+class NeighborsConfig:
+    max_neighbors: int = 1_000
+    max_destinations: int = 10_000
+    rssi_alpha: float = 0.3
+    outcome_alpha: float = 0.2
+    neighbor_timeout_seconds: float = 120
+    route_timeout_seconds: float = 600
+    decision_ttl_seconds: float = 5
+
+    @classmethod
+    def _read(cls, r: _Reader) -> "NeighborsConfig":
+        d = cls()
+        alphas = {}
+        for key in ("rssi_alpha", "outcome_alpha"):
+            alphas[key] = r.number(key, getattr(d, key))
+            if not 0 < alphas[key] <= 1:
+                r.errors.append(f"{r.prefix}{key} must be > 0 and <= 1")
+                alphas[key] = getattr(d, key)
+        return cls(
+            max_neighbors=r.integer("max_neighbors", d.max_neighbors, minimum=1),
+            max_destinations=r.integer("max_destinations", d.max_destinations, minimum=1),
+            neighbor_timeout_seconds=r.number("neighbor_timeout_seconds", d.neighbor_timeout_seconds),
+            route_timeout_seconds=r.number("route_timeout_seconds", d.route_timeout_seconds),
+            decision_ttl_seconds=r.number("decision_ttl_seconds", d.decision_ttl_seconds),
+            **alphas,
+        )
+
+
+@dataclass(frozen=True)
+class SummaryConfig:
+    # false-positive target of the summaries this node sends
+    fp_rate: float = 0.01
+    max_ids: int = 20_000
+    # a neighbor's summary is trusted this long
+    ttl_seconds: float = 60
+    max_peers: int = 1_000
+
+    @classmethod
+    def _read(cls, r: _Reader) -> "SummaryConfig":
+        d = cls()
+        fp_rate = r.number("fp_rate", d.fp_rate)
+        if not 0 < fp_rate < 1:
+            r.errors.append(f"{r.prefix}fp_rate must be > 0 and < 1")
+            fp_rate = d.fp_rate
+        return cls(
+            fp_rate=fp_rate,
+            max_ids=r.integer("max_ids", d.max_ids, minimum=1),
+            ttl_seconds=r.number("ttl_seconds", d.ttl_seconds),
+            max_peers=r.integer("max_peers", d.max_peers, minimum=1),
+        )
+
+
+@dataclass(frozen=True)
+class ProphetConfig:
+    p_init: float = 0.75
+    beta: float = 0.25
+    gamma: float = 0.98
+    aging_seconds: float = 30
+    contact_gap_seconds: float = 10
+    max_entries: int = 10_000
+
+    @classmethod
+    def _read(cls, r: _Reader) -> "ProphetConfig":
+        d = cls()
+        values = {}
+        for key in ("p_init", "beta", "gamma"):
+            values[key] = r.number(key, getattr(d, key))
+            if not 0 < values[key] <= 1:
+                r.errors.append(f"{r.prefix}{key} must be > 0 and <= 1")
+                values[key] = getattr(d, key)
+        aging_seconds = r.number("aging_seconds", d.aging_seconds)
+        if aging_seconds <= 0:
+            r.errors.append(f"{r.prefix}aging_seconds must be > 0")
+            aging_seconds = d.aging_seconds
+        return cls(
+            aging_seconds=aging_seconds,
+            contact_gap_seconds=r.number("contact_gap_seconds", d.contact_gap_seconds),
+            max_entries=r.integer("max_entries", d.max_entries, minimum=1),
+            **values,
+        )
+
+
+STRATEGY_NAMES = ("next_hop", "spray_and_wait", "prophet")
+
+
+@dataclass(frozen=True)
+class StrategyConfig:
+    name: str = STRATEGY_NAMES[0]
+    spray_copies: int = 8
+    prophet: ProphetConfig = ProphetConfig()
+
+    @classmethod
+    def _read(cls, r: _Reader) -> "StrategyConfig":
+        d = cls()
+        name = r.text("name", d.name)
+        if name not in STRATEGY_NAMES:
+            r.errors.append(f"{r.prefix}name must be one of {', '.join(STRATEGY_NAMES)}, got {name!r}")
+            name = d.name
+        return cls(
+            name=name,
+            spray_copies=r.integer("spray_copies", d.spray_copies, minimum=1),
+            prophet=ProphetConfig._read(_Reader(r.data.get("prophet"), r.prefix + "prophet.", r.errors)),
+        )
+
+
+@dataclass(frozen=True)
+class AdapterEndpoint:
+    url: str
+    weight: float = 1.0
+    # GET target for health checks; derived from url when not configured
+    health_url: str = ""
+
+    def __post_init__(self) -> None:
+        if not self.health_url:
+            object.__setattr__(self, "health_url", self.url.rsplit("/", 1)[0] + "/health")
+
+
+BALANCE_MODES = ("least_outstanding", "weighted")
+
+
+@dataclass(frozen=True)
+class AdapterPoolConfig:
+    balance: str = BALANCE_MODES[0]
+    sticky_seconds: float = 300
+    fail_after: int = 3
+    health_check_seconds: float = 10
+    max_sticky: int = 10_000
+
+    @classmethod
+    def _read(cls, r: _Reader) -> "AdapterPoolConfig":
+        d = cls()
+        balance = r.text("balance", d.balance)
+        if balance not in BALANCE_MODES:
+            r.errors.append(f"{r.prefix}balance must be one of {', '.join(BALANCE_MODES)}, got {balance!r}")
+            balance = d.balance
+        return cls(
+            balance=balance,
+            sticky_seconds=r.number("sticky_seconds", d.sticky_seconds),
+            fail_after=r.integer("fail_after", d.fail_after, minimum=1),
+            health_check_seconds=r.number("health_check_seconds", d.health_check_seconds),
+            max_sticky=r.integer("max_sticky", d.max_sticky, minimum=1),
+        )
+
+
+def _read_adapters(r: _Reader, default_url: str) -> Tuple[AdapterEndpoint, ...]:
+    """
+    ble_adapters.endpoints (r reads the ble_adapters section); empty (the
+    default) means ble_adapter_url alone.
+    """
+    entries = r.data.get("endpoints") or []
+    if not isinstance(entries, (list, tuple)):
+        r.errors.append("ble_adapters.endpoints must be a list")
+        entries = []
+    endpoints = []
+    for i, entry in enumerate(entries):
+        e = _Reader(entry, f"ble_adapters.endpoints[{i}].", r.errors)
+        url = e.text("url", "")
+        weight = e.number("weight", 1.0)
+        health_url = e.text("health_url", "", allow_empty=True)
+        if weight <= 0:
+            r.errors.append(f"ble_adapters.endpoints[{i}].weight must be > 0")
+        elif url:
+            endpoints.append(AdapterEndpoint(url, weight, health_url))
+    if len({e.url for e in endpoints}) != len(endpoints):
+        r.errors.append("ble_adapters.endpoints must not repeat a url")
+    return tuple(endpoints) or (AdapterEndpoint(default_url),)
+
+
+@dataclass(frozen=True)
+class RoutingConfig:
+    max_envelope_bytes: int
+    max_ciphertext_bytes: int
+    max_retries: int
+    base_retry_backoff_ms: float
+    retry_jitter_ms: int
+    max_queue_size: int
+    ttl_min: int
+    ttl_default: int
+    max_ttl: int
+    max_ts_skew_seconds: float
+    max_msg_age_seconds: float
+    drop_on_duplicate: bool
+    forwarding_enabled: bool
+    node_fp: str
+    delivery_acks: bool
+    ble_adapter_url: str
+    ble_device_fp: str
+    ble_device_token: str
+    ingress: IngressConfig
+    auth: AuthConfig
+    ble_adapter_endpoints: Tuple[AdapterEndpoint, ...]
+    ble_adapters: AdapterPoolConfig
+    bundling: BundlingConfig
+    duty_cycle: DutyCycleConfig
+    circuit_breaker: CircuitBreakerConfig
+    shaping: ShapingConfig
+    neighbors: NeighborsConfig
+    strategy: StrategyConfig
+    summary: SummaryConfig
+    ids: IdsConfig
+    # the parsed file (read-only), for settings without a typed attribute
+    raw: Mapping = field(default_factory=lambda: MappingProxyType({}), repr=False)
+    source: Optional[Path] = None
+    mtime: Optional[float] = None
+
+    # precomputed: freshness limits after the hard caps
+    max_skew: float = field(init=False)
+    max_age: float = field(init=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, "max_skew", min(self.max_ts_skew_seconds, HARD_MAX_SKEW))
+        object.__setattr__(self, "max_age", min(self.max_msg_age_seconds, HARD_MAX_AGE))
+
+    @classmethod
+    def from_dict(
+        cls,
+        data: Mapping | None,
+        source: Optional[Path] = None,
+        mtime: Optional[float] = None,
+    ) -> "RoutingConfig":
+        """
+        Validate parsed YAML. Raises ValueError listing every problem.
+        """
+        errors: list = []
+        r = _Reader(data, "", errors)
+        adapters = _Reader(r.data.get("ble_adapters"), "ble_adapters.", errors)
+        cfg = dict(
+            max_envelope_bytes=r.integer("max_envelope_bytes", 16_384, minimum=1),
+            max_ciphertext_bytes=r.integer("max_ciphertext_bytes", 16_384, minimum=1),
+            max_retries=r.integer("max_retries", 5),
+            base_retry_backoff_ms=r.number("base_retry_backoff_ms", 500),
+            retry_jitter_ms=r.integer("retry_jitter_ms", 0),
+            max_queue_size=r.integer("max_queue_size", 5000),
+            ttl_min=r.integer("ttl_min", 1),
+            ttl_default=r.integer("ttl_default", 4),
+            max_ttl=r.integer("max_ttl", 8),
+            max_ts_skew_seconds=r.number("max_ts_skew_seconds", 300),
+            max_msg_age_seconds=r.number("max_msg_age_seconds", 3600),
+            drop_on_duplicate=r.flag("drop_on_duplicate", True),
+            forwarding_enabled=r.flag("forwarding_enabled", False),
+            node_fp=r.text("node_fp", "", allow_empty=True),
+            delivery_acks=r.flag("delivery_acks", True),
+            ble_adapter_url=r.text("ble_adapter_url", "http://localhost:7003/v1/ble/send_chunk"),
+            ble_device_fp=r.text("ble_device_fp", "DEV-BLE-ADAPTER"),
+            ble_device_token=r.text("ble_device_token", "dev-ble-token"),
+            ingress=IngressConfig._read(_Reader(r.data.get("ingress"), "ingress.", errors)),
+            auth=AuthConfig._read(_Reader(r.data.get("auth"), "auth.", errors)),
+            ble_adapters=AdapterPoolConfig._read(adapters),
+            bundling=BundlingConfig._read(_Reader(r.data.get("bundling"), "bundling.", errors)),
+            duty_cycle=DutyCycleConfig._read(_Reader(r.data.get("duty_cycle"), "duty_cycle.", errors)),
+            circuit_breaker=CircuitBreakerConfig._read(
+                _Reader(r.data.get("circuit_breaker"), "circuit_breaker.", errors)
+            ),
+            shaping=ShapingConfig._read(_Reader(r.data.get("shaping"), "shaping.", errors)),
+            neighbors=NeighborsConfig._read(_Reader(r.data.get("neighbors"), "neighbors.", errors)),
+            strategy=StrategyConfig._read(_Reader(r.data.get("strategy"), "strategy.", errors)),
+            summary=SummaryConfig._read(_Reader(r.data.get("summary"), "summary.", errors)),
+            ids=IdsConfig._read(_Reader(r.data.get("ids"), "ids.", errors)),
+        )
+        cfg["ble_adapter_endpoints"] = _read_adapters(adapters, cfg["ble_adapter_url"])
+        if not cfg["ttl_min"] <= cfg["ttl_default"] <= cfg["max_ttl"]:
+            errors.append(
+                "ttl_min <= ttl_default <= max_ttl must hold, got "
+                f"{cfg['ttl_min']} / {cfg['ttl_default']} / {cfg['max_ttl']}"
+            )
+        if errors:
+            raise ValueError("invalid routing config: " + "; ".join(errors))
+        return cls(**cfg, raw=_freeze(r.data), source=source, mtime=mtime)
+
+    def merged(self, overrides: Mapping) -> "RoutingConfig":
+        """
+        New snapshot with `overrides` deep-merged over this one's settings.
+        """
+        return RoutingConfig.from_dict(
+            _merge(_thaw(self.raw), overrides), source=self.source, mtime=self.mtime
+        )
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.raw.get(key, default)
+
+
+def load_config(path: Path | None = None) -> RoutingConfig:
+    """
+    Parse and validate the config file. A missing file yields the defaults;
+    an unreadable or invalid one raises (OSError / yaml.YAMLError / ValueError).
+    """
+    path = CONFIG_PATH if path is None else Path(path)
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return RoutingConfig.from_dict({}, source=path)
+    with path.open() as f:
+        data = yaml.safe_load(f) or {}
+    return RoutingConfig.from_dict(data, source=path, mtime=mtime)
+
+
+_current: RoutingConfig = load_config()
+
+
+def current() -> RoutingConfig:
+    """
+    The active config snapshot. Read it once per request / loop iteration
+    and use that object throughout, so one request never mixes two configs.
+    """
+    return _current
+
+
+def reload(path: Path | None = None) -> bool:
+    """
+    Re-read the config file and swap it in. Returns False (and keeps the
+    active snapshot) if the file cannot be read or fails validation.
+    """
+    global _current
+    path = _current.source if path is None else Path(path)
+    try:
+        new = load_config(path)
+    except (OSError, yaml.YAMLError, ValueError) as exc:
+        print(f"[Config] reload of {path} rejected, keeping previous config: {exc}")
+        return False
+
+    old = _current
+    changed = [
+        key for key in _RESTART_ONLY_IDS_KEYS
+        if getattr(old.ids, key) != getattr(new.ids, key)
+    ]
+    _current = new
+    print(f"[Config] reloaded {path}")
+    if changed:
+        print(f"[Config] ids.{', ids.'.join(changed)} changed; takes effect after a restart")
+    return True
+
+
+def _file_changed(cfg: RoutingConfig) -> bool:
+    if cfg.source is None:
+        return False
+    try:
+        mtime = cfg.source.stat().st_mtime
+    except OSError:
+        return False
+    return mtime != cfg.mtime
+
+
+async def watch_config(interval_seconds: float = 2.0) -> None:
+    """
+    Background task: reload whenever the config file's mtime changes.
+    """
+    global _current
+    while True:
+        await asyncio.sleep(interval_seconds)
+        cfg = _current
+        if not _file_changed(cfg) or reload():
+            continue
+        # rejected: remember this mtime so the same bad file is not re-read
+        # every interval (a later edit is picked up again)
+        try:
+            mtime = cfg.source.stat().st_mtime
+        except OSError:
+            continue
+        if _current is cfg:
+            _current = replace(cfg, mtime=mtime)
+
+
+def install_sighup_handler(loop: asyncio.AbstractEventLoop | None = None) -> bool:
+    """
+    Reload on SIGHUP. Returns False where the event loop cannot handle
+    signals (e.g. Windows); file watching still works there.
+    """
+    sighup = getattr(signal, "SIGHUP", None)
+    if sighup is None:
+        return False
+    loop = loop or asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(sighup, reload)
+    except (NotImplementedError, RuntimeError, ValueError):
+        return False
+    return True
+
+
+class _LiveConfigView(Mapping):
+    """
+    Read-only mapping over the current snapshot's raw settings, for code
+    that still does ROUTING_CFG.get(...).
+    """
+
+    def __getitem__(self, key: str) -> Any:
+        return _current.raw[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(_current.raw)
+
+    def __len__(self) -> int:
+        return len(_current.raw)
+
+
+ROUTING_CFG: Mapping = _LiveConfigView()
 
-def load_routing_cfg():
-    if CONFIG_PATH.exists():
-        with CONFIG_PATH.open() as f:
-            return yaml.safe_load(f) or {}
-    return {}  # fallback empty dict
 
-ROUTING_CFG = load_routing_cfg()
+def load_routing_cfg() -> dict:
+    """
+    Plain dict of the config file's settings (re-read from disk).
+    """
+    return _thaw(load_config().raw)
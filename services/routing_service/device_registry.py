@@ -0,0 +1,258 @@
+# services/routing_service/device_registry.py
+# SQLite-backed device registry (token hash + roles) with a bounded, TTL'd verification cache.
+
+"""
+Device registry for router auth.
+
+Devices live in the `devices` table (router_db): the SHA-256 hash of the
+device's API token, its roles and a revoked flag. Tokens are issued with
+lib.auth.create_device_token, so the plaintext is only ever returned once.
+
+Verifying a token costs a SHA-256 hash plus a DB read. Successful
+verifications are cached for `cache_ttl_seconds` in a bounded LRU keyed by
+a keyed BLAKE2b digest of (device_fp, token); the key is random per
+process, so cache entries are useless outside it. Failed attempts are
+never cached. Revoking or re-issuing a device's token through the registry
+drops its cache entries immediately; a revocation made by another process
+(e.g. the CLI) is picked up once the entries expire.
+
+Static devices (the dev credentials in routing_api) are used for a
+fingerprint that has no row in the table; a DB row always wins, so a
+static device can be revoked too.
+
+CLI:
+    python -m services.routing_service.device_registry add <device_fp> --roles gateway,ble
+    python -m services.routing_service.device_registry revoke <device_fp>
+    python -m services.routing_service.device_registry list
+"""
+
+from __future__ import annotations
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, List, Mapping, Optional
+
+from lib.auth import create_device_token, verify_api_token
+
+from . import router_db
+from .config_loader import AuthConfig
+
+_monotonic = time.monotonic
+
+
+def _join_roles(roles: Iterable[str]) -> str:
+    return ",".join(sorted({r.strip() for r in roles if r.strip()}))
+
+
+def _split_roles(roles: str) -> FrozenSet[str]:
+    return frozenset(r for r in roles.split(",") if r)
+
+
+class DeviceRegistry:
+    def __init__(
+        self,
+        static_devices: Optional[Mapping[str, Mapping]] = None,
+        cache_size: int = 10_000,
+        cache_ttl_seconds: float = 60,
+    ) -> None:
+        self._static = {
+            fp: {"device_fp": fp, "token_hash": info["token_hash"],
+                 "roles": _join_roles(info.get("roles", ())), "revoked": False}
+            for fp, info in (static_devices or {}).items()
+        }
+        self.cache_size = max(int(cache_size), 1)
+        self.cache_ttl_seconds = float(cache_ttl_seconds)
+        # the AuthConfig last applied by configure()
+        self._settings: Optional[AuthConfig] = None
+        self._key = os.urandom(32)
+        self._lock = threading.Lock()
+        # digest -> (expires_at, device_fp, roles), oldest first
+        self._cache: "OrderedDict[bytes, tuple]" = OrderedDict()
+        # device_fp -> digests cached for it (for revocation)
+        self._by_device: Dict[str, set] = {}
+        self.hits = 0
+        self.misses = 0
+        self._warned = False
+        # bumped by every invalidation, so a lookup that raced with a
+        # revocation does not re-cache the old answer
+        self._generation = 0
+
+    @classmethod
+    def from_config(
+        cls, settings: AuthConfig, static_devices: Optional[Mapping[str, Mapping]] = None
+    ) -> "DeviceRegistry":
+        registry = cls(static_devices)
+        registry.configure(settings)
+        return registry
+
+    def configure(self, settings: AuthConfig) -> None:
+        """
+        Apply cache size and TTL. Callers pass the current snapshot's section
+        on every request; only a new snapshot (a reload) costs anything.
+        Entries already cached keep their expiry.
+        """
+        if settings is self._settings:
+            return
+        with self._lock:
+            self._settings = settings
+            self.cache_size = settings.cache_size
+            self.cache_ttl_seconds = settings.cache_ttl_seconds
+            while len(self._cache) > self.cache_size:
+                self._drop(next(iter(self._cache)))
+
+    # ------------------------------------------------------------------
+    # verification
+    # ------------------------------------------------------------------
+
+    def verify(self, device_fp: str, token: str) -> Optional[FrozenSet[str]]:
+        """
+        Roles of the device if (device_fp, token) is valid and not revoked,
+        else None.
+        """
+        if not device_fp or not token:
+            return None
+        digest = self._digest(device_fp, token)
+        now = _monotonic()
+        with self._lock:
+            entry = self._cache.get(digest)
+            if entry is not None:
+                if entry[0] > now:
+                    self._cache.move_to_end(digest)
+                    self.hits += 1
+                    return entry[2]
+                self._drop(digest)
+            self.misses += 1
+            generation = self._generation
+
+        info = self.lookup(device_fp)
+        if info is None or info["revoked"] or not verify_api_token(token, info["token_hash"]):
+            return None
+
+        roles = _split_roles(info["roles"])
+        with self._lock:
+            if generation != self._generation:
+                return roles
+            self._cache[digest] = (now + self.cache_ttl_seconds, device_fp, roles)
+            self._cache.move_to_end(digest)
+            self._by_device.setdefault(device_fp, set()).add(digest)
+            while len(self._cache) > self.cache_size:
+                self._drop(next(iter(self._cache)))
+        return roles
+
+    def lookup(self, device_fp: str) -> Optional[dict]:
+        try:
+            info = router_db.get_device(device_fp)
+        except sqlite3.Error as exc:
+            # registry table not created yet (init_db not run): static devices only
+            if not self._warned:
+                self._warned = True
+                print(f"[Auth] device registry unavailable, using static devices: {exc}")
+            info = None
+        if info is None:
+            info = self._static.get(device_fp)
+        return info
+
+    def _digest(self, device_fp: str, token: str) -> bytes:
+        h = hashlib.blake2b(key=self._key, digest_size=16)
+        h.update(device_fp.encode("utf-8"))
+        h.update(b"\0")
+        h.update(token.encode("utf-8"))
+        return h.digest()
+
+    def _drop(self, digest: bytes) -> None:
+        _, device_fp, _ = self._cache.pop(digest)
+        keys = self._by_device.get(device_fp)
+        if keys is not None:
+            keys.discard(digest)
+            if not keys:
+                del self._by_device[device_fp]
+
+    # ------------------------------------------------------------------
+    # management
+    # ------------------------------------------------------------------
+
+    def register(self, device_fp: str, roles: Iterable[str]) -> str:
+        """
+        Issue a new token for a device (replacing any previous one) and
+        return the plaintext token. Only its hash is stored.
+        """
+        token, creds = create_device_token(device_fp)
+        router_db.upsert_device(creds.device_fp, creds.token_hash, _join_roles(roles))
+        self.invalidate(device_fp)
+        return token
+
+    def revoke(self, device_fp: str) -> bool:
+        """
+        Revoke a device; cached verifications for it stop working at once.
+        Returns False for an unknown device.
+        """
+        changed = router_db.set_device_revoked(device_fp, True)
+        if not changed and device_fp in self._static:
+            info = self._static[device_fp]
+            router_db.upsert_device(device_fp, info["token_hash"], info["roles"], revoked=True)
+            changed = True
+        self.invalidate(device_fp)
+        return changed
+
+    def invalidate(self, device_fp: str) -> None:
+        with self._lock:
+            self._generation += 1
+            for digest in list(self._by_device.get(device_fp, ())):
+                self._drop(digest)
+
+    def clear_cache(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._cache.clear()
+            self._by_device.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "cached": len(self._cache),
+                "capacity": self.cache_size,
+                "ttl_seconds": self.cache_ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m services.routing_service.device_registry",
+        description="Manage router device credentials.",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    add = sub.add_parser("add", help="register a device (or re-issue its token)")
+    add.add_argument("device_fp")
+    add.add_argument("--roles", default="gateway", help="comma-separated roles (gateway,ble,admin)")
+    revoke = sub.add_parser("revoke", help="revoke a device")
+    revoke.add_argument("device_fp")
+    sub.add_parser("list", help="list registered devices")
+    args = parser.parse_args(argv)
+
+    router_db.init_db()
+    registry = DeviceRegistry()
+    if args.command == "add":
+        token = registry.register(args.device_fp, args.roles.split(","))
+        print(f"device: {args.device_fp}")
+        print(f"token:  {token}  (shown once; only its hash is stored)")
+    elif args.command == "revoke":
+        if not registry.revoke(args.device_fp):
+            print(f"unknown device: {args.device_fp}", file=sys.stderr)
+            return 1
+        print(f"revoked {args.device_fp} (running routers drop cached logins within their cache TTL)")
+    else:
+        for dev in router_db.list_devices():
+            state = "revoked" if dev["revoked"] else "active"
+            print(f"{dev['device_fp']}\t{dev['roles']}\t{state}\t{dev['created_at']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+# services/routing_service/duty_cycle.py
+# duty-cycled transmission windows and a per-window log of radio-active time (energy estimates).
+
+"""
+Duty-cycled draining of the routing queue.
+
+With duty_cycle.enabled the router loop only transmits normal and low
+priority rows while a transmission window is open. Windows open every
+period_seconds, aligned to the wall clock (t mod period == 0) so nearby
+nodes with synced clocks wake together, and stay open for
+window_seconds. Traffic that comes due in between accumulates in the
+queue and leaves in one flush, which bundling then packs into few
+transmissions. High-priority rows (and ACKs) are sent at once.
+
+RADIO records every BLE transmission into the window (period) it fell
+in: transmissions, envelopes and radio-active time, i.e. how long the
+adapter call took. Active time x the radio's transmit power gives an
+energy estimate per window. Transmissions outside an open window (high
+priority bypass) are counted separately. The window log is kept whether
+or not duty cycling is enabled, so both modes can be compared.
+"""
+
+from __future__ import annotations
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import List
+
+from .config_loader import DutyCycleConfig
+
+_now = time.time
+
+
+class DutyCycle:
+    def __init__(self, enabled: bool = False, period_seconds: float = 30, window_seconds: float = 3) -> None:
+        self.enabled = bool(enabled)
+        self.period = max(float(period_seconds), 0.001)
+        self.window = min(max(float(window_seconds), 0.0), self.period)
+
+    @classmethod
+    def from_config(cls, settings: DutyCycleConfig) -> "DutyCycle":
+        return cls(settings.enabled, settings.period_seconds, settings.window_seconds)
+
+    def window_start(self, at: float) -> float:
+        """Start of the period `at` falls in."""
+        return math.floor(at / self.period) * self.period
+
+    def is_open(self, at: float) -> bool:
+        """Whether non-urgent traffic may be sent at `at` (always, when disabled)."""
+        return not self.enabled or at - self.window_start(at) < self.window
+
+    def seconds_until_open(self, at: float) -> float:
+        """0 while a window is open, else the wait for the next one."""
+        if self.is_open(at):
+            return 0.0
+        return self.window_start(at) + self.period - at
+
+
+class RadioLog:
+    """
+    Per-window transmission counters, newest max_windows windows.
+    """
+
+    def __init__(self, max_windows: int = 120) -> None:
+        self.max_windows = max(int(max_windows), 1)
+        self._lock = threading.Lock()
+        # window start -> counters
+        self._windows: "OrderedDict[float, dict]" = OrderedDict()
+        self.transmissions = 0
+        self.envelopes = 0
+        self.active_seconds = 0.0
+
+    def record(self, at: float, seconds: float, envelopes: int, duty: DutyCycle) -> None:
+        start = duty.window_start(at)
+        with self._lock:
+            self.transmissions += 1
+            self.envelopes += envelopes
+            self.active_seconds += seconds
+            window = self._windows.get(start)
+            if window is None:
+                window = self._windows[start] = {
+                    "window_start": start,
+                    "transmissions": 0,
+                    "envelopes": 0,
+                    "active_ms": 0.0,
+                    "bypass": 0,
+                }
+                while len(self._windows) > self.max_windows:
+                    self._windows.popitem(last=False)
+            window["transmissions"] += 1
+            window["envelopes"] += envelopes
+            window["active_ms"] += seconds * 1000.0
+            if not duty.is_open(at):
+                window["bypass"] += 1
+
+    def windows(self) -> List[dict]:
+        """Windows with traffic, oldest first."""
+        with self._lock:
+            return [
+                dict(w, active_ms=round(w["active_ms"], 3)) for w in self._windows.values()
+            ]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._windows.clear()
+            self.transmissions = self.envelopes = 0
+            self.active_seconds = 0.0
+
+    def stats(self, recent: int = 10) -> dict:
+        with self._lock:
+            return {
+                "transmissions": self.transmissions,
+                "envelopes": self.envelopes,
+                "envelopes_per_transmission": round(self.envelopes / max(self.transmissions, 1), 2),
+                "active_ms": round(self.active_seconds * 1000.0, 3),
+                "windows": [
+                    dict(w, active_ms=round(w["active_ms"], 3))
+                    for w in list(self._windows.values())[-recent:]
+                ],
+            }
+
+
+# transmissions of this process's router loop
+RADIO = RadioLog()
@@ -0,0 +1,92 @@
+# services/routing_service/ids_anon.py
+# keyed, memoized pseudonyms for peer / msg_id values in IDS records.
+
+"""
+Pseudonyms for identifiers written to the IDS log and metrics.
+
+An unkeyed hash of a fingerprint can be reversed by anyone who can hash
+candidate fingerprints. Pseudonyms here are BLAKE2b MACs under a per-node
+key, so they are only linkable by someone holding the key.
+
+Pseudonyms are stable within a key epoch. The epoch is the configured
+`epoch` number, plus the current `rotate_seconds` period when rotation is
+enabled; moving to a new epoch changes every pseudonym.
+
+Peer pseudonyms go through a bounded LRU cache, since a flood from one peer
+logs the same identifier thousands of times a second. msg_ids are nearly
+always unique, so they are digested directly.
+"""
+
+from __future__ import annotations
+import hashlib
+import os
+import time
+from functools import lru_cache
+
+# 8-byte digest -> 16 hex chars, same width as the old sha256()[:16] pseudonyms
+DIGEST_SIZE = 8
+
+
+class Pseudonymizer:
+    def __init__(
+        self,
+        key: bytes,
+        epoch: int = 0,
+        rotate_seconds: float = 0,
+        cache_size: int = 10_000,
+    ) -> None:
+        if not key:
+            raise ValueError("pseudonym key must not be empty")
+        self.key = key[:64]  # BLAKE2b key limit
+        self.base_epoch = int(epoch)
+        self.rotate_seconds = float(rotate_seconds)
+        self._cached = lru_cache(maxsize=max(int(cache_size), 1))(self._digest)
+        # keyed BLAKE2b state for the current epoch; copying it skips the
+        # per-call key setup
+        self._keyed = (None, None)
+
+    def epoch(self, now: float | None = None) -> int:
+        if self.rotate_seconds <= 0:
+            return self.base_epoch
+        now = time.time() if now is None else now
+        return self.base_epoch + int(now // self.rotate_seconds)
+
+    def peer(self, value: str) -> str:
+        """
+        Pseudonym for a peer identifier (memoized per epoch).
+        """
+        return self._cached(value, self.epoch())
+
+    def value(self, value: str) -> str:
+        """
+        Pseudonym for a one-off identifier such as a msg_id (not cached).
+        """
+        return self._digest(value, self.epoch())
+
+    def cache_info(self):
+        return self._cached.cache_info()
+
+    def _digest(self, value: str, epoch: int) -> str:
+        keyed_epoch, keyed = self._keyed
+        if keyed_epoch != epoch:
+            keyed = hashlib.blake2b(
+                digest_size=DIGEST_SIZE,
+                key=self.key,
+                person=epoch.to_bytes(8, "little", signed=True),
+            )
+            self._keyed = (epoch, keyed)
+        h = keyed.copy()
+        h.update(value.encode("utf-8"))
+        return h.hexdigest()
+
+
+def load_key(configured: str | None, env_var: str = "ROUTER_IDS_ANON_KEY") -> bytes:
+    """
+    Per-node key from the environment (preferred) or config. Without one a
+    random key is generated, so pseudonyms only stay stable for this process.
+    """
+    key = os.getenv(env_var) or configured
+    if key:
+        return key.encode("utf-8")
+    print(f"[IDS] no {env_var} / ids.anon.key configured; using a random per-process key")
+    return os.urandom(32)
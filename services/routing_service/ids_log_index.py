@@ -0,0 +1,152 @@
+# services/routing_service/ids_log_index.py
+# reverse-seek tail + filtered, paginated queries over the IDS JSON-lines log.
+
+"""
+Read side of the IDS log.
+
+Nothing here reads the whole log. Lines are read backwards from the end (or
+from a cursor) in fixed-size blocks. The sidecar index written by
+ids_logger (one JSON line per written block: byte range, time range and
+event types) lets a query skip every block that cannot match `since` or
+`event` without touching it.
+
+Cursors are byte offsets into the current log file: pass `next_cursor` back
+to get the page of older events.
+"""
+
+from __future__ import annotations
+import json
+import os
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+
+from .ids_logger import index_path, ts_to_epoch
+
+READ_BLOCK_BYTES = 64 * 1024
+
+
+def read_lines_backward(path: Path, end: int, start: int = 0) -> Iterator[Tuple[int, bytes]]:
+    """
+    Yield (offset, line) for the lines in [start, end), newest first.
+    """
+    with path.open("rb") as f:
+        pos = end
+        tail = b""
+        while pos > start:
+            size = min(READ_BLOCK_BYTES, pos - start)
+            pos -= size
+            f.seek(pos)
+            buf = f.read(size) + tail
+            parts = buf.split(b"\n")
+            # parts[0] may be a partial line unless we reached `start`
+            tail = parts[0] if pos > start else b""
+            first_complete = 1 if pos > start else 0
+            line_end = pos + len(buf)
+            for part in reversed(parts[first_complete:]):
+                line_end -= len(part) + 1
+                if part:
+                    yield line_end + 1, part
+
+
+def _load_index(path: Path, end: int) -> List[dict]:
+    """
+    Index blocks covering [0, end). Ranges the index does not know about
+    (e.g. lines written before the index existed) become blocks without
+    metadata, which are always scanned.
+    """
+    idx = index_path(path)
+    entries: List[dict] = []
+    if idx.exists():
+        with idx.open("rb") as f:
+            for raw in f:
+                try:
+                    entries.append(json.loads(raw))
+                except ValueError:
+                    continue
+
+    blocks: List[dict] = []
+    covered = 0
+    for e in entries:
+        o, n = e.get("o", 0), e.get("n", 0)
+        if o >= end:
+            break
+        if o > covered:
+            blocks.append({"o": covered, "n": o - covered})
+        blocks.append(dict(e, n=min(n, end - o)))
+        covered = o + n
+    if covered < end:
+        blocks.append({"o": covered, "n": end - covered})
+    return blocks
+
+
+def query_log(
+    path: Path,
+    limit: int = 50,
+    since: object = None,
+    event: Optional[str] = None,
+    peers: Optional[Iterable[str]] = None,
+    cursor: Optional[int] = None,
+) -> dict:
+    """
+    Return up to `limit` events older than `cursor` (or the newest ones),
+    oldest first, plus `next_cursor` when older matching events may remain.
+
+    since: unix seconds or ISO-8601 timestamp; older events are excluded.
+    event: exact event type.
+    peers: accepted values for the (anonymized) "peer" field.
+    """
+    if not path.exists():
+        return {"events": [], "next_cursor": None}
+
+    size = os.path.getsize(path)
+    end = size if cursor is None else max(0, min(int(cursor), size))
+    since_ts = ts_to_epoch(since)
+    peer_set: Optional[Set[str]] = set(peers) if peers else None
+
+    found: List[dict] = []
+    next_cursor: Optional[int] = None
+
+    blocks = _load_index(path, end)
+    # newest event in each block or any block before it (None = unknown):
+    # aggregation summaries can make a later block older than an earlier one
+    newest: List[Optional[float]] = []
+    for block in blocks:
+        t1 = block.get("t1")
+        prev = newest[-1] if newest else float("-inf")
+        newest.append(None if t1 is None or prev is None else max(prev, t1))
+
+    for block, upto in zip(reversed(blocks), reversed(newest)):
+        if since_ts is not None:
+            if upto is not None and upto < since_ts:
+                break  # nothing in this block or any older one is recent enough
+            t1 = block.get("t1")
+            if t1 is not None and t1 < since_ts:
+                continue
+        if event is not None and "ev" in block and event not in block["ev"]:
+            continue
+
+        for offset, raw in read_lines_backward(path, block["o"] + block["n"], block["o"]):
+            try:
+                rec = json.loads(raw)
+            except ValueError:
+                continue
+            if since_ts is not None:
+                ts = ts_to_epoch(rec.get("ts"))
+                if ts is not None and ts < since_ts:
+                    continue
+            if event is not None and rec.get("event") != event:
+                continue
+            if peer_set is not None and rec.get("peer") not in peer_set:
+                continue
+            if len(found) == limit:
+                next_cursor = found[-1]["_offset"]
+                break
+            rec["_offset"] = offset
+            found.append(rec)
+        if next_cursor is not None:
+            break
+
+    found.reverse()
+    for rec in found:
+        del rec["_offset"]
+    return {"events": found, "next_cursor": next_cursor}
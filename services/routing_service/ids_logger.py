@@ -0,0 +1,378 @@
+# services/routing_service/ids_logger.py
+# background writer for IDS events: bounded queue, batched writes, rotation, aggregation.
+
+"""
+Asynchronous IDS event log.
+
+Request handlers only append a dict to a bounded in-memory queue. A daemon
+thread drains it in batches, keeps the log file open between batches, and
+rotates it by size and age (routing_suspicious.log -> .1 -> .2 ...).
+
+Repeated events with the same (event, peer) inside `aggregate_window_seconds`
+are written once; the repeats are folded into a single summary line such as
+"RATE_LIMIT x500 for peer P in 5s" (with "count": 500) when the window closes.
+
+Every written block also appends one line to a sidecar index
+(routing_suspicious.log.idx) with its byte range, time range and event types,
+so readers can seek straight to the blocks they need (see ids_log_index).
+
+If the queue is full the event is dropped and counted; the writer reports the
+number of dropped events as a LOG_DROPPED record once it catches up. A batch
+that cannot be written (e.g. disk full) is counted in write_errors and lost;
+the writer reopens the file for the next batch instead of dying.
+"""
+
+from __future__ import annotations
+import atexit
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+
+
+class IdsEventLogger:
+    def __init__(
+        self,
+        path: Path,
+        queue_size: int = 10_000,
+        batch_size: int = 500,
+        flush_interval_seconds: float = 0.5,
+        max_bytes: int = 10 * 1024 * 1024,
+        backup_count: int = 5,
+        rotate_seconds: float = 24 * 3600,
+        aggregate_window_seconds: float = 5.0,
+        max_aggregate_keys: int = 10_000,
+    ) -> None:
+        self.path = path
+        self.queue_size = max(int(queue_size), 1)
+        self.batch_size = max(int(batch_size), 1)
+        self.flush_interval = float(flush_interval_seconds)
+        self.max_bytes = int(max_bytes)
+        self.backup_count = max(int(backup_count), 0)
+        self.rotate_seconds = float(rotate_seconds)
+        self.aggregate_window = float(aggregate_window_seconds)
+        self.max_aggregate_keys = int(max_aggregate_keys)
+
+        self._queue: Deque[dict] = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+        # counters (read by stats(); written under _cond or by the writer thread)
+        self._submitted = 0
+        self._processed = 0
+        self.dropped = 0
+        self._dropped_reported = 0
+        self.written = 0
+        self.aggregated = 0
+        self.rotations = 0
+        self.write_errors = 0
+
+        # writer-thread-only state
+        # (event, peer) -> [window_start, suppressed_count, last_record]
+        self._agg: Dict[Tuple[str, str], list] = {}
+        self._file = None
+        self._index = None
+        self._opened_at = 0.0
+        self._failing = False
+
+    # ------------------------------------------------------------------
+    # producer side (request threads)
+    # ------------------------------------------------------------------
+
+    def submit(self, record: dict) -> bool:
+        """
+        Queue one event without blocking. Returns False if it was dropped.
+        """
+        with self._cond:
+            if self._closed or len(self._queue) >= self.queue_size:
+                self.dropped += 1
+                return False
+            self._queue.append(record)
+            self._submitted += 1
+            if self._thread is None:
+                self._start()
+            elif len(self._queue) >= self.batch_size:
+                self._cond.notify()
+        return True
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """
+        Block until every event submitted so far has been processed.
+        """
+        with self._cond:
+            if self._thread is None:
+                return True
+            target = self._submitted
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._processed >= target, timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """
+        Drain the queue, emit pending aggregate summaries, and stop the writer.
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._queue),
+            "written": self.written,
+            "dropped": self.dropped,
+            "aggregated": self.aggregated,
+            "rotations": self.rotations,
+            "write_errors": self.write_errors,
+        }
+
+    def _start(self) -> None:
+        self._thread = threading.Thread(
+            target=self._run, name="ids-event-log", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ------------------------------------------------------------------
+    # writer thread
+    # ------------------------------------------------------------------
+
+    def _run(self) -> None:
+        try:
+            while True:
+                with self._cond:
+                    if not self._queue and not self._closed:
+                        self._cond.wait(self.flush_interval)
+                    batch = list(self._queue)
+                    self._queue.clear()
+                    closing = self._closed
+                    dropped = self.dropped
+
+                try:
+                    lines = self._prepare(batch, dropped, final=False)
+                    if lines:
+                        self._write(lines)
+                except Exception as exc:
+                    self._write_failed(exc)
+                else:
+                    self._failing = False
+
+                with self._cond:
+                    self._processed += len(batch)
+                    self._cond.notify_all()
+                    if closing and not self._queue:
+                        break
+            # one more pass so summaries of still-open windows are not lost
+            try:
+                lines = self._prepare([], self.dropped, final=True)
+                if lines:
+                    self._write(lines)
+            except Exception as exc:
+                self._write_failed(exc)
+        finally:
+            self._discard_files()
+
+    def _write_failed(self, exc: Exception) -> None:
+        """
+        A batch could not be written (disk full, rotation race, ...): count
+        it and drop the file handles so the next batch reopens the log.
+        The writer keeps running, so flush() and the queue keep moving.
+        """
+        self.write_errors += 1
+        if not self._failing:
+            print(f"[IDS] event log write failed, continuing: {exc}")
+        self._failing = True
+        self._discard_files()
+
+    def _prepare(self, batch: List[dict], dropped: int, final: bool) -> List[_Line]:
+        now = time.monotonic()
+        window = self.aggregate_window
+        agg = self._agg
+        lines: List[_Line] = []
+
+        for record in batch:
+            key = (record.get("event", ""), record.get("peer", ""))
+            slot = agg.get(key)
+            if slot is not None and now - slot[0] < window:
+                slot[1] += 1
+                slot[2] = record
+                self.aggregated += 1
+                continue
+            if slot is not None:
+                # re-insert so dict order stays oldest-window-first
+                del agg[key]
+                if slot[1]:
+                    lines.append(self._summary_line(key, slot))
+            if window > 0 and len(agg) < self.max_aggregate_keys:
+                agg[key] = [now, 0, record]
+            lines.append(_line(record))
+
+        # close expired windows (or all of them on shutdown)
+        while agg:
+            key, slot = next(iter(agg.items()))
+            if not final and now - slot[0] < window:
+                break
+            del agg[key]
+            if slot[1]:
+                lines.append(self._summary_line(key, slot))
+
+        if dropped > self._dropped_reported:
+            lines.append(
+                _line(
+                    {
+                        "ts": _iso_now(),
+                        "event": "LOG_DROPPED",
+                        "peer": "",
+                        "msg_id": "",
+                        "detail": "IDS log queue overflow",
+                        "extra": {"dropped": dropped - self._dropped_reported},
+                    }
+                )
+            )
+            self._dropped_reported = dropped
+
+        return lines
+
+    def _summary_line(self, key: Tuple[str, str], slot: list) -> _Line:
+        event, peer = key
+        count = slot[1]
+        last = slot[2]
+        return _line(
+            {
+                "ts": last.get("ts") or _iso_now(),
+                "event": event,
+                "peer": peer,
+                "msg_id": last.get("msg_id", ""),
+                "detail": f"{event} x{count} for peer {peer} in {self.aggregate_window:g}s",
+                "extra": {"aggregated": True},
+                "count": count,
+            }
+        )
+
+    def _write(self, lines: List[_Line]) -> None:
+        if self._file is None:
+            self._open()
+        if self._should_rotate_by_age():
+            self._rotate()
+
+        # split the batch at rotation points so no file outgrows max_bytes
+        chunk: List[_Line] = []
+        size = self._file.tell()
+        for line in lines:
+            n = len(line[0])
+            if self.max_bytes > 0 and size + n > self.max_bytes and size > 0:
+                if chunk:
+                    self._write_block(chunk)
+                    chunk = []
+                self._rotate()
+                size = 0
+            chunk.append(line)
+            size += n
+        if chunk:
+            self._write_block(chunk)
+        self._file.flush()
+        self._index.flush()
+        self.written += len(lines)
+
+    def _write_block(self, chunk: List[_Line]) -> None:
+        offset = self._file.tell()
+        data = b"".join(line[0] for line in chunk)
+        self._file.write(data)
+        # summary lines carry the time of their last folded event, so a
+        # block's lines are not in time order: index the min/max
+        stamps = [t for t in (ts_to_epoch(line[2]) for line in chunk) if t is not None]
+        entry = {
+            "o": offset,
+            "n": len(data),
+            "t0": min(stamps, default=None),
+            "t1": max(stamps, default=None),
+            "ev": sorted({line[1] for line in chunk}),
+        }
+        self._index.write(json.dumps(entry).encode("ascii") + b"\n")
+
+    def _open(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.path.open("ab")
+        self._index = index_path(self.path).open("ab")
+        self._opened_at = time.time()
+
+    def _close_files(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._index.close()
+            self._file = None
+            self._index = None
+
+    def _discard_files(self) -> None:
+        """Close whatever is open, ignoring errors (the handles may be broken)."""
+        for f in (self._file, self._index):
+            if f is not None:
+                try:
+                    f.close()
+                except OSError:
+                    pass
+        self._file = None
+        self._index = None
+
+    def _should_rotate_by_age(self) -> bool:
+        return self.rotate_seconds > 0 and time.time() - self._opened_at >= self.rotate_seconds
+
+    def _rotate(self) -> None:
+        self._close_files()
+        for src_of in (lambda p: p, index_path):
+            if self.backup_count > 0:
+                for i in range(self.backup_count - 1, 0, -1):
+                    src = src_of(rotated_path(self.path, i))
+                    if src.exists():
+                        src.replace(src_of(rotated_path(self.path, i + 1)))
+                src = src_of(self.path)
+                if src.exists():
+                    src.replace(src_of(rotated_path(self.path, 1)))
+            else:
+                src_of(self.path).unlink(missing_ok=True)
+        self.rotations += 1
+        self._open()
+
+
+# (encoded JSON line, event type, ts) as handed to the file writer
+_Line = Tuple[bytes, str, object]
+
+
+def _line(record: dict) -> _Line:
+    data = (json.dumps(record) + "\n").encode("utf-8")
+    return data, record.get("event", ""), record.get("ts", "")
+
+
+def rotated_path(path: Path, index: int) -> Path:
+    return path.with_name(f"{path.name}.{index}")
+
+
+def index_path(path: Path) -> Path:
+    return path.with_name(f"{path.name}.idx")
+
+
+def ts_to_epoch(ts: object) -> Optional[float]:
+    """
+    Unix seconds for a record "ts" (ISO-8601 string or number), else None.
+    """
+    if ts is None:
+        return None
+    try:
+        return float(ts)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(str(ts)).timestamp()
+    except ValueError:
+        return None
+
+
+def _iso_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
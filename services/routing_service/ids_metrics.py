@@ -0,0 +1,132 @@
+# services/routing_service/ids_metrics.py
+# ring-buffered IDS counters per event type and per anonymized peer (no disk access).
+
+"""
+In-memory IDS time series.
+
+- Per event type: 1 s buckets for the last 10 minutes and 1 min buckets for
+  the last 24 h.
+- Per anonymized peer: 10 s buckets for the last 10 minutes. Peers are kept
+  in a capped BoundedPeerTable, so a flood of identities cannot grow memory.
+
+Every bucket remembers which time slot it belongs to, so stale buckets read
+as zero and nothing has to be cleared on a timer. Queries cost O(buckets)
+per series.
+"""
+
+from __future__ import annotations
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from .ids_state import BoundedPeerTable
+
+
+class RingCounter:
+    """
+    Fixed number of time buckets of `resolution` seconds each.
+    """
+
+    __slots__ = ("resolution", "slots", "_counts", "_stamps")
+
+    def __init__(self, resolution: int, slots: int) -> None:
+        self.resolution = resolution
+        self.slots = slots
+        self._counts = array("q", [0]) * slots
+        self._stamps = array("q", [-1]) * slots
+
+    def add(self, now: float, n: int = 1) -> None:
+        slot_no = int(now // self.resolution)
+        i = slot_no % self.slots
+        if self._stamps[i] != slot_no:
+            self._stamps[i] = slot_no
+            self._counts[i] = 0
+        self._counts[i] += n
+
+    def series(self, now: float, span: float) -> List[Tuple[int, int]]:
+        """
+        [(bucket_start_unix, count), ...] oldest first, covering `span` seconds.
+        """
+        res = self.resolution
+        current = int(now // res)
+        n = min(max(int(span // res), 1), self.slots)
+        out = []
+        for slot_no in range(current - n + 1, current + 1):
+            i = slot_no % self.slots
+            count = self._counts[i] if self._stamps[i] == slot_no else 0
+            out.append((slot_no * res, count))
+        return out
+
+    def total(self, now: float, span: float) -> int:
+        return sum(c for _, c in self.series(now, span))
+
+
+class IdsMetrics:
+    def __init__(self, max_peers: int = 1_000) -> None:
+        self._lock = threading.Lock()
+        self._events_fine: Dict[str, RingCounter] = {}    # 1 s x 600
+        self._events_coarse: Dict[str, RingCounter] = {}  # 60 s x 1440
+        self._peers = BoundedPeerTable(max_peers)        # anon peer -> RingCounter (10 s x 60)
+
+    def record(self, event: str, anon_peer: str, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        with self._lock:
+            fine = self._events_fine.get(event)
+            if fine is None:
+                fine = self._events_fine[event] = RingCounter(1, 600)
+                self._events_coarse[event] = RingCounter(60, 1440)
+            fine.add(now)
+            self._events_coarse[event].add(now)
+
+            peer = self._peers.get(anon_peer)
+            if peer is None:
+                peer = RingCounter(10, 60)
+                self._peers[anon_peer] = peer
+            peer.add(now)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._events_fine.clear()
+            self._events_coarse.clear()
+            self._peers.clear()
+
+    def snapshot(self, window_seconds: int = 60, top: int = 10, now: Optional[float] = None) -> dict:
+        """
+        Event counts/rates and top offenders over the last `window_seconds`
+        (1 s series up to 10 min, 1 min series up to 24 h).
+        """
+        now = time.time() if now is None else now
+        window = min(max(int(window_seconds), 1), 24 * 3600)
+        fine = window <= 600
+
+        with self._lock:
+            rings = self._events_fine if fine else self._events_coarse
+            events = {}
+            for event, ring in rings.items():
+                series = ring.series(now, window)
+                count = sum(c for _, c in series)
+                if count:
+                    events[event] = {
+                        "count": count,
+                        "rate_per_sec": round(count / window, 3),
+                        "series": series,
+                    }
+
+            peer_window = min(window, 600)
+            offenders = []
+            for anon_peer, ring in self._peers.items():
+                count = ring.total(now, peer_window)
+                if count:
+                    offenders.append((count, anon_peer))
+
+        offenders.sort(reverse=True)
+        return {
+            "window_seconds": window,
+            "resolution_seconds": 1 if fine else 60,
+            "events": events,
+            "top_peers": [
+                {"peer": p, "count": c, "window_seconds": peer_window}
+                for c, p in offenders[:top]
+            ],
+        }
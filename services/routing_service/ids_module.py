@@ -4,31 +4,118 @@
 """
 Routing IDS / anomaly detection for Person 2.
 
-- Sliding-window rate limiting per peer
+- GCRA (token-bucket equivalent) rate limiting per peer
 - Duplicate msg_id suppression
 - Suspicious event logging (plaintext for now, can be encrypted later)
 """
 
 from __future__ import annotations
-import hashlib
-import json
-from collections import defaultdict, deque
-from datetime import datetime, timezone, timedelta
+import asyncio
+import threading
+import time
+from typing import List
+from datetime import datetime, timezone
+from operator import itemgetter
 from pathlib import Path
-from typing import Deque, Dict, Set
-from .config_loader import ROUTING_CFG
-cfg = ROUTING_CFG.get("ids", {})
-WINDOW_SECONDS = cfg.get("window_seconds", 5)
-MAX_MSGS_PER_WINDOW = cfg.get("max_msgs_per_window", 20)
-BLOCK_PEER_TTL = cfg.get("block_peer_ttl_seconds", 3600)
-
-# in-memory state
-_peer_windows: Dict[str, Deque[datetime]] = defaultdict(deque)
-_seen_msg_ids: Dict[str, float] = {}
-_peer_suspicious_counts = defaultdict(int)
-_blocked_peers = {} 
+from .config_loader import current as current_config
+from .ids_state import ShardedPeerTable, DedupTable, BlockedPeerTable, approx_table_bytes
+from .ids_logger import IdsEventLogger
+from .ids_metrics import IdsMetrics
+from .ids_sketch import TrafficSketch
+from .ids_scoring import PeerScorer, scoring_available
+from .ids_snapshot import read_snapshot, write_snapshot
+from .ids_anon import Pseudonymizer, load_key
+# Limiter / blocking / dedup knobs are read from the live config snapshot
+# (current_config().ids) on every call, so a config reload applies at once.
+# The sizes below shape in-memory structures and are fixed at startup.
+_startup_cfg = current_config().ids
+# Hard caps on per-peer state (Sybil floods churn these instead of growing memory)
+MAX_TRACKED_PEERS = _startup_cfg.max_tracked_peers
+MAX_BLOCKED_PEERS = _startup_cfg.max_blocked_peers
+# Lock stripes for the shared tables (handlers run concurrently in a threadpool)
+STATE_SHARDS = _startup_cfg.state_shards
+
+# Max idle entries dropped per call, so eviction cost stays bounded.
+_EVICT_BATCH = 32
+
+_monotonic = time.monotonic
+
+
+class _PeerRate:
+    """
+    Per-peer limiter state: the GCRA "theoretical arrival time" on the
+    monotonic clock. Once it is in the past the peer is indistinguishable
+    from one we have never seen, so the entry can be dropped.
+    """
+    __slots__ = ("tat",)
+
+    def __init__(self, tat: float) -> None:
+        self.tat = tat
+
+
+# in-memory state (hard-capped and lock-striped, see ids_state)
+_peer_windows = ShardedPeerTable(MAX_TRACKED_PEERS, STATE_SHARDS)            # peer -> _PeerRate
+_seen_msg_ids = DedupTable(STATE_SHARDS)                                     # msg_id -> first seen
+_peer_suspicious_counts = ShardedPeerTable(MAX_TRACKED_PEERS, STATE_SHARDS)  # peer -> int
+_blocked_peers = BlockedPeerTable(MAX_BLOCKED_PEERS)                         # peer -> blocked_at
+# ring-buffered event counters for the admin metrics endpoint
+_metrics = IdsMetrics(max_peers=_startup_cfg.metrics_max_peers)
+
+# fixed-memory heavy-hitter / distinct-sender sketches (distributed floods)
+_sketch_cfg = _startup_cfg.sketch
+_traffic_sketch: TrafficSketch | None = None
+if _sketch_cfg.get("enabled", True):
+    _traffic_sketch = TrafficSketch(
+        window_seconds=_sketch_cfg.get("window_seconds", 60),
+        width=_sketch_cfg.get("width", 2048),
+        depth=_sketch_cfg.get("depth", 4),
+        top_k=_sketch_cfg.get("top_k", 10),
+        hll_precision=_sketch_cfg.get("hll_precision", 12),
+        heavy_share=_sketch_cfg.get("heavy_share", 0.2),
+        heavy_min_count=_sketch_cfg.get("heavy_min_count", 200),
+        max_distinct_senders=_sketch_cfg.get("max_distinct_senders", 500),
+    )
+
+# optional vectorized anomaly scoring (needs numpy; see ids_scoring)
+_scoring_cfg = _startup_cfg.scoring
+_scorer: PeerScorer | None = None
+if _scoring_cfg.get("enabled", False) and scoring_available():
+    _scorer = PeerScorer(
+        max_peers=_scoring_cfg.get("max_peers", 100_000),
+        ewma_alpha=_scoring_cfg.get("ewma_alpha", 0.3),
+        threshold=_scoring_cfg.get("threshold", 8.0),
+        min_rate=_scoring_cfg.get("min_rate", 2.0),
+        weight_rate=_scoring_cfg.get("weight_rate", 1.0),
+        weight_duplicate=_scoring_cfg.get("weight_duplicate", 4.0),
+        weight_timestamp=_scoring_cfg.get("weight_timestamp", 2.0),
+        weight_size=_scoring_cfg.get("weight_size", 1.0),
+        idle_ticks=_scoring_cfg.get("idle_ticks", 60),
+    )
+
+# Events that must not count towards blocking the named peer: sketch alerts
+# about traffic *towards* a peer or from the whole mesh, the block itself,
+# and relayed mismatches (a relay without a node_fp leaves no path entry).
+_UNATTRIBUTED_EVENTS = {"HEAVY_RECIPIENT", "SENDER_FLOOD", "PEER_BLOCKED", "PEER_MISMATCH_RELAYED"}
 LOG_PATH = Path("routing_suspicious.log")
 
+# keyed pseudonyms for identifiers in IDS records (see ids_anon)
+_anon_cfg = _startup_cfg.anon
+_pseudonyms = Pseudonymizer(
+    load_key(_anon_cfg.get("key")),
+    epoch=_anon_cfg.get("epoch", 0),
+    rotate_seconds=_anon_cfg.get("rotate_seconds", 0),
+    cache_size=_anon_cfg.get("cache_size", 10_000),
+)
+
+# warm-restart snapshot of dedup ids, limiter state and blocks (see ids_snapshot)
+_snapshot_cfg = _startup_cfg.snapshot
+SNAPSHOT_PATH = Path(_snapshot_cfg.get("path", "routing_ids.snapshot"))
+_snapshot_stats: dict = {}
+
+# background writer for LOG_PATH (created lazily, replaced if LOG_PATH changes)
+_event_logger: IdsEventLogger | None = None
+_event_logger_lock = threading.Lock()
+
 
 def _now() -> datetime:
     return datetime.now(timezone.utc)
@@ -36,53 +123,131 @@ def _now() -> datetime:
 
 def is_rate_limited(peer: str) -> bool:
     """
-    Sliding-window rate limiting per peer.
-    """
-    if peer in _blocked_peers:
-        blocked_at = _blocked_peers[peer]
-        if _now() - blocked_at > timedelta(seconds=BLOCK_PEER_TTL):
-            # unblock and reset suspicious count
-            del _blocked_peers[peer]
-            _peer_suspicious_counts[peer] = 0
-        else:
-            return True
-    
-    window = _peer_windows[peer]
-    now = _now()
-    cutoff = now - timedelta(seconds=WINDOW_SECONDS)
+    GCRA rate limiting per peer (same knobs as the old sliding window:
+    at most ids.max_msgs_per_window messages per ids.window_seconds).
+
+    One message "costs" emission_interval seconds, and a peer may run up to
+    burst_tolerance ahead of schedule: max_msgs_per_window back-to-back
+    messages, then one every emission_interval seconds.
+    """
+    ids_cfg = current_config().ids
+    if _still_blocked(peer, ids_cfg):
+        return True
+
+    now = _monotonic()
+    lock, table = _peer_windows.shard(peer)
+    with lock:
+        return _gcra_limited(table, peer, now, ids_cfg)
+
+
+def is_rate_limited_many(peers: List[str]) -> List[bool]:
+    """
+    is_rate_limited for a batch, in order. Each limiter shard lock is taken
+    once for all its peers.
+    """
+    ids_cfg = current_config().ids
+    out = [True] * len(peers)
+    by_shard: dict = {}
+    for pos, peer in enumerate(peers):
+        if not _still_blocked(peer, ids_cfg):
+            lock, table = _peer_windows.shard(peer)
+            by_shard.setdefault(id(lock), (lock, table, []))[2].append(pos)
+
+    now = _monotonic()
+    for lock, table, positions in by_shard.values():
+        with lock:
+            for pos in positions:
+                out[pos] = _gcra_limited(table, peers[pos], now, ids_cfg)
+    return out
+
 
-    # drop old timestamps
-    while window and window[0] < cutoff:
-        window.popleft()
+def _still_blocked(peer: str, ids_cfg) -> bool:
+    blocked_at = _blocked_peers.get(peer)
+    if blocked_at is None:
+        return False
+    if _now() - blocked_at > ids_cfg.block_peer_ttl:
+        # unblock and reset suspicious count
+        if _blocked_peers.unblock(peer, blocked_at):
+            _peer_suspicious_counts.pop(peer)
+        return False
+    return True
 
-    if len(window) >= MAX_MSGS_PER_WINDOW:
+
+def _gcra_limited(table, peer: str, now: float, ids_cfg) -> bool:
+    # caller holds the shard lock
+    state = table.get(peer)
+    if state is None:
+        # entries whose TAT has passed are equivalent to a fresh peer
+        table.sweep(lambda st: st.tat <= now, _EVICT_BATCH)
+        table[peer] = _PeerRate(now + ids_cfg.emission_interval)
+        return False
+
+    tat = state.tat if state.tat > now else now
+    # small epsilon so float rounding never costs a peer its last slot
+    if tat - now > ids_cfg.burst_tolerance + 1e-9:
         return True
 
-    window.append(now)
+    state.tat = tat + ids_cfg.emission_interval
     return False
 
 
 def is_duplicate(msg_id: str) -> bool:
     """
     Duplicate detection with TTL-based memory purge.
+    Check-and-remember is atomic, so two threads racing on the same msg_id
+    cannot both see it as new.
     """
-    ttl_sec = cfg.get("duplicate_suppression_ttl", 600)
+    ttl_sec = current_config().ids.duplicate_suppression_ttl
+    return _seen_msg_ids.check_and_add(msg_id, _now().timestamp(), ttl_sec)
 
-    now = _now().timestamp()
-    cutoff = now - ttl_sec
 
-    # Purge old msg_ids
-    for mid, ts in list(_seen_msg_ids.items()):
-        if ts < cutoff:
-            del _seen_msg_ids[mid]
+def is_duplicate_many(msg_ids: List[str]) -> List[bool]:
+    """
+    is_duplicate for a batch, in order (a repeat within the batch counts as
+    a duplicate), taking each dedup shard lock once.
+    """
+    ttl_sec = current_config().ids.duplicate_suppression_ttl
+    return _seen_msg_ids.check_and_add_many(msg_ids, _now().timestamp(), ttl_sec)
+
+
+def forget_duplicates(msg_ids: List[str]) -> None:
+    """
+    Undo is_duplicate* for messages that were not stored after all (DB
+    error), so the sender's retry is not dropped as a duplicate.
+    """
+    _seen_msg_ids.discard_many(msg_ids)
 
-    if msg_id in _seen_msg_ids:
-        return True
 
-    _seen_msg_ids[msg_id] = now
-    return False
+
+def observe_traffic(sender: str, recipient: str, msg_id: str, size: int = 0) -> None:
+    """
+    Feed one ingress message into the traffic sketches (constant cost) and
+    log HEAVY_SENDER / HEAVY_RECIPIENT / SENDER_FLOOD alerts.
+    Also counts the message for the anomaly scorer, if enabled.
+    """
+    scorer = _scorer
+    if scorer is not None and sender not in _blocked_peers:
+        scorer.record_message(sender, size)
+
+    sketch = _traffic_sketch
+    if sketch is None:
+        return
+    for event_type, key, extra in sketch.observe(sender, recipient):
+        log_suspicious(
+            event_type,
+            key,
+            msg_id,
+            _SKETCH_DETAILS[event_type],
+            extra=extra,
+        )
 
 
+_SKETCH_DETAILS = {
+    "HEAVY_SENDER": "sender is a heavy hitter in the current window",
+    "HEAVY_RECIPIENT": "recipient is a heavy hitter in the current window",
+    "SENDER_FLOOD": "too many distinct senders in the current window",
+}
+
 
 def log_suspicious(
     event_type: str,
@@ -93,27 +258,284 @@ def log_suspicious(
 ) -> None:
     """
     Log suspicious events as JSON-lines.
+    The record is queued for the background writer (see ids_logger), so this
+    never touches the disk on the request path.
      can route this through the crypto service to encrypt
     json.dumps(record) before writing to disk.
     """
-    _peer_suspicious_counts[peer] += 1
-
-    limit = cfg.get("block_peer_after", 999999)
-    if _peer_suspicious_counts[peer] >= limit:
-        _blocked_peers[peer] = _now()
+    scorer = _scorer
+    if scorer is not None:
+        if event_type in ("DUPLICATE", "DUPLICATE_ENQUEUE"):
+            scorer.record_duplicate(peer)
+        elif event_type in ("TS_FUTURE", "TS_OLD"):
+            scorer.record_bad_timestamp(peer)
+    anon_peer = _anon_peer(peer)
+    _metrics.record(event_type, anon_peer)
     # cluster events per peer/message without exposing raw identifiers in a stolen log file.
     record = {
         "ts": _now().isoformat(),
         "event": event_type,
-        "peer": _anon(peer),
-        "msg_id": _anon(msg_id),
+        "peer": anon_peer,
+        "msg_id": _pseudonyms.value(msg_id),
         "detail": detail,
         "extra": extra or {},
     }
-    with LOG_PATH.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(record) + "\n")
+    _get_event_logger().submit(record)
+
+    if event_type not in _UNATTRIBUTED_EVENTS:
+        _note_suspicious(peer)
+
+
+def _get_event_logger() -> IdsEventLogger:
+    logger = _event_logger
+    if logger is not None and logger.path is LOG_PATH:
+        return logger
+    return _replace_event_logger()
+
+
+def _replace_event_logger() -> IdsEventLogger:
+    global _event_logger
+    with _event_logger_lock:
+        old = _event_logger
+        if old is not None and old.path is LOG_PATH:
+            return old
+        log_cfg = _startup_cfg.log
+        _event_logger = IdsEventLogger(
+            LOG_PATH,
+            queue_size=log_cfg.get("queue_size", 10_000),
+            batch_size=log_cfg.get("batch_size", 500),
+            flush_interval_seconds=log_cfg.get("flush_interval_seconds", 0.5),
+            max_bytes=log_cfg.get("max_bytes", 10 * 1024 * 1024),
+            backup_count=log_cfg.get("backup_count", 5),
+            rotate_seconds=log_cfg.get("rotate_seconds", 24 * 3600),
+            aggregate_window_seconds=log_cfg.get("aggregate_window_seconds", 5),
+        )
+    if old is not None:
+        old.close()
+    return _event_logger
+
+
+def flush_event_log(timeout: float = 5.0) -> None:
+    """
+    Wait until queued IDS events are on disk (used before reading the log).
+    """
+    logger = _event_logger
+    if logger is not None:
+        logger.flush(timeout)
+
+
+def close_event_log() -> None:
+    """
+    Drain and stop the background IDS log writer (shutdown hook).
+    """
+    logger = _event_logger
+    if logger is not None:
+        logger.close()
+
+
+def event_log_stats() -> dict:
+    logger = _event_logger
+    return logger.stats() if logger is not None else {}
+
+
+def _note_suspicious(peer: str) -> None:
+    """
+    Count a suspicious event against a peer and block it past the threshold.
+    """
+    lock, table = _peer_suspicious_counts.shard(peer)
+    with lock:
+        count = table.get(peer, 0) + 1
+        table[peer] = count
+
+    if count >= current_config().ids.block_peer_after:
+        _block_peer(peer, "suspicious_events")
+
+
+def _block_peer(peer: str, reason: str) -> None:
+    """
+    Block a peer (or refresh its block); a new block is logged as
+    PEER_BLOCKED so offline reports can measure time-to-block.
+    """
+    if _blocked_peers.block(peer, _now()):
+        log_suspicious("PEER_BLOCKED", peer, "", f"peer blocked ({reason})", extra={"reason": reason})
+
+
+def scoring_enabled() -> bool:
+    return _scorer is not None
+
+
+def scoring_tick() -> list:
+    """
+    Run one scoring pass and block every peer whose anomaly score crossed
+    the threshold. Returns [(peer, score), ...] for the blocked peers.
+    """
+    scorer = _scorer
+    if scorer is None:
+        return []
+    flagged = scorer.tick()
+    for peer, score in flagged:
+        scorer.forget(peer)
+        log_suspicious(
+            "ANOMALY_SCORE",
+            peer,
+            "",
+            "anomaly score above threshold; peer blocked",
+            extra={"score": round(score, 2), "threshold": scorer.threshold},
+        )
+        _block_peer(peer, "anomaly_score")
+    return flagged
+
+
+async def scoring_loop(interval_seconds: float = 1.0) -> None:
+    """
+    Background loop scoring all tracked peers once per tick, off the event
+    loop thread.
+    """
+    while True:
+        await asyncio.sleep(interval_seconds)
+        await asyncio.to_thread(scoring_tick)
+
+
+def snapshot_enabled() -> bool:
+    return bool(_snapshot_cfg.get("enabled", True))
+
+
+def save_state_snapshot(path: Path | None = None) -> int:
+    """
+    Write dedup ids, live limiter state and blocks to a binary snapshot
+    (atomic replace). Limiter TATs are stored on the wall clock, since the
+    monotonic clock does not survive a restart. Returns bytes written.
+    """
+    path = path or SNAPSHOT_PATH
+    wall = time.time()
+    mono = _monotonic()
+    to_wall = wall - mono
+
+    # time order, so loading keeps every dedup shard purge-from-the-front
+    dedup = sorted(_seen_msg_ids.items(), key=itemgetter(1))
+    rates = [(peer, st.tat + to_wall) for peer, st in _peer_windows.items() if st.tat > mono]
+    blocks = [(peer, at.timestamp()) for peer, at in _blocked_peers.snapshot()]
+
+    size = write_snapshot(path, (dedup, rates, blocks), wall)
+    _snapshot_stats.update(
+        saved_at=wall,
+        bytes=size,
+        entries={"seen_msg_ids": len(dedup), "rate_limit": len(rates), "blocked": len(blocks)},
+    )
+    return size
+
+
+def load_state_snapshot(path: Path | None = None) -> dict:
+    """
+    Restore state saved by save_state_snapshot, dropping anything that has
+    expired since (old msg_ids, caught-up limiters, elapsed blocks).
+    A missing or unreadable snapshot is ignored.
+    """
+    path = path or SNAPSHOT_PATH
+    if not path.exists():
+        return {}
+    try:
+        saved_at, (dedup, rates, blocks) = read_snapshot(path, 3)
+    except (OSError, ValueError) as exc:
+        print(f"[IDS] ignoring unreadable state snapshot {path}: {exc}")
+        return {}
+
+    wall = time.time()
+    mono = _monotonic()
+    ids_cfg = current_config().ids
+    ttl_sec = ids_cfg.duplicate_suppression_ttl
+    loaded_dedup = _seen_msg_ids.load(dedup[0], dedup[1], cutoff=wall - ttl_sec)
+
+    loaded_rates = 0
+    for peer, tat in zip(*rates):
+        if tat > wall:
+            lock, table = _peer_windows.shard(peer)
+            with lock:
+                table[peer] = _PeerRate(tat - wall + mono)
+            loaded_rates += 1
+
+    now = _now()
+    ttl = ids_cfg.block_peer_ttl
+    loaded_blocks = 0
+    for peer, ts in zip(*blocks):
+        blocked_at = datetime.fromtimestamp(ts, timezone.utc)
+        if now - blocked_at <= ttl:
+            _blocked_peers.block(peer, blocked_at)
+            loaded_blocks += 1
+
+    return {
+        "saved_at": saved_at,
+        "seen_msg_ids": loaded_dedup,
+        "rate_limit": loaded_rates,
+        "blocked": loaded_blocks,
+    }
+
+
+async def snapshot_loop(interval_seconds: float = 30.0) -> None:
+    """
+    Background loop writing the state snapshot off the event loop thread.
+    """
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await asyncio.to_thread(save_state_snapshot)
+        except OSError as exc:
+            print(f"[IDS] state snapshot failed: {exc}")
+
+
+def ids_memory_stats() -> dict:
+    """
+    Size of the in-memory IDS state, for the admin stats endpoint.
+    """
+    rate = len(_peer_windows)
+    suspicious = len(_peer_suspicious_counts)
+    blocked = len(_blocked_peers)
+    seen = len(_seen_msg_ids)
+    stats = {
+        "max_tracked_peers": _peer_windows.capacity,
+        "rate_limit_entries": rate,
+        "suspicious_count_entries": suspicious,
+        "blocked_peers": blocked,
+        "seen_msg_ids": seen,
+        "evicted_peers": _peer_windows.evictions + _peer_suspicious_counts.evictions,
+        "evicted_blocks": _blocked_peers.evictions,
+        "approx_bytes": approx_table_bytes(rate + suspicious + blocked + seen),
+    }
+    if _scorer is not None:
+        stats["scoring"] = _scorer.stats()
+    if _snapshot_stats:
+        stats["snapshot"] = dict(_snapshot_stats)
+    return stats
+
+
+def ids_metrics_snapshot(window_seconds: int = 60, top: int = 10) -> dict:
+    """
+    Event rates and top (anonymized) offenders from the in-memory counters.
+    """
+    snapshot = _metrics.snapshot(window_seconds=window_seconds, top=top)
+    if _traffic_sketch is not None:
+        snapshot["heavy_hitters"] = _anonymized_sketch_summary()
+    return snapshot
+
+
+def _anonymized_sketch_summary() -> dict:
+    summary = _traffic_sketch.summary()
+    for window in summary.values():
+        for key in ("top_senders", "top_recipients"):
+            if key in window:
+                window[key] = [
+                    {"peer": _anon_peer(peer), "estimate": est} for peer, est in window[key]
+                ]
+    return summary
+
+
+def anonymize_peer(peer: str) -> str:
+    """
+    Pseudonym used for `peer` in IDS log records (for filtering by raw id).
+    """
+    return _anon_peer(peer)
 
 
-def _anon(value: str) -> str:
-    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:16]
+def _anon_peer(peer: str) -> str:
+    return _pseudonyms.peer(peer)
 
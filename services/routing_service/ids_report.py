@@ -0,0 +1,345 @@
+# services/routing_service/ids_report.py
+# offline IDS log analytics: mmap + streaming line scan over current and rotated logs.
+
+"""
+Offline report over IDS logs (routing_suspicious.log and its rotations).
+
+    python -m services.routing_service.ids_report routing_suspicious.log*
+    python -m services.routing_service.ids_report --top 20 --json LOG
+    python -m services.routing_service.ids_report --csv events.csv --npz events.npz LOG
+
+Files are memory-mapped and scanned chunk by chunk with bytes regexes, so
+nothing is loaded whole and no line goes through json.loads. Lines with the
+same second / event / peer are counted together in C (collections.Counter),
+so the Python work grows with distinct keys, not with lines. Aggregated
+summary lines ("count": N) are weighted by N.
+
+Reports:
+- events per type
+- top peers (pseudonyms, as logged)
+- per-second histogram (peak seconds; full series in --json / --npz)
+- time-to-block: first event of a peer -> its first PEER_BLOCKED event
+
+Exports (optional): one row per log line with ts, event, peer, count, as a
+CSV file and/or NumPy arrays (.npz, needs numpy).
+"""
+
+from __future__ import annotations
+import argparse
+import csv
+import json
+import mmap
+import re
+import sys
+from array import array
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Records as ids_logger writes them (json.dumps key order: ts, event, peer, ...).
+# The ts is cut down to its second (ISO) or integer part (unix number), so
+# lines from the same second / event / peer collapse in a C-level Counter.
+_LINE_RE = re.compile(
+    rb'^\{"ts": (?:"(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.\d*)?([+-]\d\d:\d\d|Z)?"'
+    rb'|(\d+)(?:\.\d*)?), "event": "([^"]*)", "peer": "([^"]*)"[^\n]*',
+    re.MULTILINE,
+)
+# Same fields with the full ts, for the rare lines that need precise times.
+_PRECISE_RE = re.compile(rb'\{"ts": "?([^",]*)"?, "event": "([^"]*)", "peer": "([^"]*)"')
+# Aggregated summary lines end with the number of folded repeats.
+_COUNT_RE = re.compile(rb', "count": (\d+)\}\r?$', re.MULTILINE)
+
+BLOCK_EVENT = "PEER_BLOCKED"
+_BLOCK_NEEDLE = b'"event": "PEER_BLOCKED"'
+
+# Lines are counted per chunk of this many bytes (bounds the temporary lists).
+CHUNK_BYTES = 32 * 1024 * 1024
+
+# (iso second, utc offset, unix second) as captured by _LINE_RE
+_SecondKey = Tuple[bytes, bytes, bytes]
+
+
+class IdsReport:
+    def __init__(self, export: bool = False) -> None:
+        self.lines = 0
+        self.events = 0
+        self.by_event: Dict[str, int] = {}
+        self.by_peer: Dict[str, int] = {}
+        self.per_second: Dict[int, int] = {}
+        self.first_seen: Dict[str, float] = {}
+        self.blocked_at: Dict[str, float] = {}
+        self._seconds: Dict[_SecondKey, Optional[int]] = {}
+        # where a peer's first second was seen, to refine it to sub-second later
+        self._first_where: Dict[str, Tuple[Path, _SecondKey]] = {}
+
+        self.export = export
+        self.col_ts = array("d")
+        self.col_event = array("i")
+        self.col_peer = array("i")
+        self.col_count = array("q")
+        self.event_names: Dict[str, int] = {}
+        self.peer_names: Dict[str, int] = {}
+
+    # ------------------------------------------------------------------
+    # scanning
+    # ------------------------------------------------------------------
+
+    def scan(self, path: Path) -> None:
+        with path.open("rb") as f:
+            if f.seek(0, 2) == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                pos = 0
+                size = len(mm)
+                while pos < size:
+                    end = mm.find(b"\n", min(pos + CHUNK_BYTES, size))
+                    end = size if end < 0 else end + 1
+                    self._scan_chunk(path, mm, pos, end)
+                    pos = end
+
+    def _scan_chunk(self, path: Path, buf, pos: int, end: int) -> None:
+        for (iso, offset, unix, ev, peer), n in Counter(_LINE_RE.findall(buf, pos, end)).items():
+            self.lines += n
+            self._add((iso, offset, unix), ev.decode(), peer.decode(), n, path)
+
+        # summary lines stand for "count" events, not one
+        for m in _COUNT_RE.finditer(buf, pos, end):
+            extra = int(m.group(1)) - 1
+            line = _LINE_RE.match(buf, buf.rfind(b"\n", pos, m.start()) + 1)
+            if extra > 0 and line is not None:
+                iso, offset, unix, ev, peer = line.groups()
+                self._add((iso, offset, unix), ev.decode(), peer.decode(), extra, path)
+
+        # exact block times (rare lines)
+        at = buf.find(_BLOCK_NEEDLE, pos, end)
+        while at >= 0:
+            rec = _PRECISE_RE.match(buf, buf.rfind(b"\n", pos, at) + 1)
+            if rec is not None and rec.group(2) == BLOCK_EVENT.encode():
+                ts = _ts_seconds(rec.group(1))
+                peer = rec.group(3).decode()
+                if ts is not None and ts < self.blocked_at.get(peer, float("inf")):
+                    self.blocked_at[peer] = ts
+            at = buf.find(_BLOCK_NEEDLE, at + 1, end)
+
+        if self.export:
+            self._export_chunk(buf, pos, end)
+
+    def _add(self, key: _SecondKey, event: str, peer: str, n: int, path: Path) -> None:
+        self.events += n
+        self.by_event[event] = self.by_event.get(event, 0) + n
+        sec = self._second(key)
+        if sec is not None:
+            self.per_second[sec] = self.per_second.get(sec, 0) + n
+        if peer:
+            self.by_peer[peer] = self.by_peer.get(peer, 0) + n
+            if sec is not None and sec < self.first_seen.get(peer, float("inf")):
+                self.first_seen[peer] = float(sec)
+                self._first_where[peer] = (path, key)
+
+    def _second(self, key: _SecondKey) -> Optional[int]:
+        """
+        Unix second for a captured ts, cached per distinct second + offset.
+        """
+        sec = self._seconds.get(key, -1)
+        if sec == -1:
+            iso, offset, unix = key
+            if unix:
+                sec = int(unix)
+            else:
+                text = (iso + (offset or b"")).decode().replace("Z", "+00:00")
+                try:
+                    sec = int(datetime.fromisoformat(text).timestamp())
+                except ValueError:
+                    sec = None
+            self._seconds[key] = sec
+        return sec
+
+    def _refine_first_seen(self) -> None:
+        """
+        first_seen is counted at 1 s resolution; for blocked peers, look up
+        the exact ts of their first line (files are written in time order, so
+        it is the first line of the peer at or after the start of that second).
+        """
+        by_path: Dict[Path, List[str]] = {}
+        for peer in self.blocked_at:
+            if peer in self._first_where:
+                by_path.setdefault(self._first_where[peer][0], []).append(peer)
+
+        for path, peers in by_path.items():
+            with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for peer in peers:
+                    iso, _, unix = self._first_where[peer][1]
+                    start = mm.find(b'{"ts": "' + iso if iso else b'{"ts": ' + unix)
+                    at = mm.find(b'"peer": "' + peer.encode() + b'"', max(start, 0))
+                    if start < 0 or at < 0:
+                        continue
+                    rec = _PRECISE_RE.match(mm, mm.rfind(b"\n", 0, at) + 1)
+                    ts = _ts_seconds(rec.group(1)) if rec is not None else None
+                    if ts is not None and int(ts) == int(self.first_seen[peer]):
+                        self.first_seen[peer] = ts
+
+    def _export_chunk(self, buf, pos: int, end: int) -> None:
+        for m in _PRECISE_RE.finditer(buf, pos, end):
+            line_end = buf.find(b"\n", m.end(), end)
+            line_end = end if line_end < 0 else line_end
+            tail = _COUNT_RE.search(buf, max(m.end(), line_end - 32), line_end + 1)
+            ts = _ts_seconds(m.group(1))
+            event = m.group(2).decode()
+            peer = m.group(3).decode()
+            self.col_ts.append(float("nan") if ts is None else ts)
+            self.col_event.append(self.event_names.setdefault(event, len(self.event_names)))
+            self.col_peer.append(self.peer_names.setdefault(peer, len(self.peer_names)))
+            self.col_count.append(int(tail.group(1)) if tail else 1)
+
+    # ------------------------------------------------------------------
+    # results
+    # ------------------------------------------------------------------
+
+    def time_to_block(self) -> dict:
+        delays = sorted(
+            t - self.first_seen[peer]
+            for peer, t in self.blocked_at.items()
+            if peer in self.first_seen
+        )
+        if not delays:
+            return {"blocked_peers": 0}
+        return {
+            "blocked_peers": len(delays),
+            "min_seconds": round(delays[0], 3),
+            "median_seconds": round(delays[len(delays) // 2], 3),
+            "p90_seconds": round(delays[min(int(len(delays) * 0.9), len(delays) - 1)], 3),
+            "max_seconds": round(delays[-1], 3),
+        }
+
+    def summary(self, top: int = 10) -> dict:
+        peers = sorted(self.by_peer.items(), key=lambda kv: kv[1], reverse=True)[:top]
+        busiest = sorted(self.per_second.items(), key=lambda kv: kv[1], reverse=True)[:top]
+        seconds = sorted(self.per_second)
+        return {
+            "lines": self.lines,
+            "events": self.events,
+            "events_by_type": dict(sorted(self.by_event.items(), key=lambda kv: kv[1], reverse=True)),
+            "top_peers": [{"peer": p, "events": c} for p, c in peers],
+            "first_second": seconds[0] if seconds else None,
+            "last_second": seconds[-1] if seconds else None,
+            "peak_seconds": [{"second": s, "events": c} for s, c in busiest],
+            "time_to_block": self.time_to_block(),
+        }
+
+    def histogram(self) -> List[tuple]:
+        return sorted(self.per_second.items())
+
+    def write_csv(self, path: Path) -> None:
+        events = _names(self.event_names)
+        peers = _names(self.peer_names)
+        with path.open("w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["ts", "event", "peer", "count"])
+            for ts, ev, peer, n in zip(self.col_ts, self.col_event, self.col_peer, self.col_count):
+                writer.writerow([ts, events[ev], peers[peer], n])
+
+    def write_npz(self, path: Path) -> None:
+        import numpy as np  # optional dependency, only for --npz
+
+        hist = self.histogram()
+        np.savez_compressed(
+            path,
+            ts=np.frombuffer(self.col_ts, dtype=np.float64),
+            event=np.frombuffer(self.col_event, dtype=np.int32),
+            peer=np.frombuffer(self.col_peer, dtype=np.int32),
+            count=np.frombuffer(self.col_count, dtype=np.int64),
+            event_names=np.array(_names(self.event_names)),
+            peer_names=np.array(_names(self.peer_names)),
+            hist_second=np.array([s for s, _ in hist], dtype=np.int64),
+            hist_count=np.array([c for _, c in hist], dtype=np.int64),
+        )
+
+
+def _ts_seconds(ts: bytes) -> Optional[float]:
+    """
+    Unix seconds (with fraction) for a raw ts: ISO-8601 or a number.
+    """
+    try:
+        return float(ts)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(ts.decode().replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def _names(ids: Dict[str, int]) -> List[str]:
+    names = [""] * len(ids)
+    for name, i in ids.items():
+        names[i] = name
+    return names
+
+
+def build_report(paths: Sequence[Path], export: bool = False) -> IdsReport:
+    report = IdsReport(export=export)
+    for path in paths:
+        report.scan(path)
+    report._refine_first_seen()
+    return report
+
+
+def _print_text(summary: dict) -> None:
+    print(f"lines: {summary['lines']}  events: {summary['events']}")
+    if summary["first_second"] is not None:
+        span = summary["last_second"] - summary["first_second"] + 1
+        print(f"time span: {summary['first_second']} .. {summary['last_second']} ({span}s)")
+
+    print("\nevents by type:")
+    for event, count in summary["events_by_type"].items():
+        print(f"  {event:<24} {count:>10}")
+
+    print("\ntop peers:")
+    for row in summary["top_peers"]:
+        print(f"  {row['peer']:<24} {row['events']:>10}")
+
+    print("\npeak seconds:")
+    for row in summary["peak_seconds"]:
+        print(f"  {row['second']:<24} {row['events']:>10}")
+
+    print("\ntime to block:")
+    for key, value in summary["time_to_block"].items():
+        print(f"  {key:<24} {value:>10}")
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m services.routing_service.ids_report",
+        description="Summarize IDS logs (current and rotated).",
+    )
+    parser.add_argument("logs", nargs="*", type=Path, default=[Path("routing_suspicious.log")])
+    parser.add_argument("--top", type=int, default=10, help="rows in top-N tables")
+    parser.add_argument("--json", action="store_true", help="print JSON (incl. full histogram)")
+    parser.add_argument("--csv", type=Path, help="export one row per log line as CSV")
+    parser.add_argument("--npz", type=Path, help="export columns as NumPy .npz (needs numpy)")
+    args = parser.parse_args(argv)
+
+    missing = [str(p) for p in args.logs if not p.exists()]
+    if missing:
+        print(f"no such log file: {', '.join(missing)}", file=sys.stderr)
+        return 2
+
+    report = build_report(args.logs, export=bool(args.csv or args.npz))
+    summary = report.summary(top=args.top)
+
+    if args.json:
+        summary["histogram"] = report.histogram()
+        print(json.dumps(summary, indent=2))
+    else:
+        _print_text(summary)
+
+    if args.csv:
+        report.write_csv(args.csv)
+    if args.npz:
+        report.write_npz(args.npz)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+# services/routing_service/ids_scoring.py
+# optional NumPy anomaly scoring: per-peer feature arrays scored in one vectorized pass per tick.
+
+"""
+Per-tick anomaly scoring for the IDS (optional, needs NumPy).
+
+Static thresholds only see one signal at a time. PeerScorer keeps a few
+features for every tracked peer in contiguous arrays (one slot per peer):
+
+- message rate EWMA (messages per tick)
+- duplicate ratio EWMA
+- TS_FUTURE / TS_OLD events EWMA
+- message size EWMA, compared against the population
+
+Request handlers only bump per-tick counters (O(1) under a lock). Once per
+tick, tick() updates every EWMA and computes every score with array
+arithmetic, then returns the peers whose score crossed the threshold.
+Rate and size are scored as robust z-scores (median / MAD over the active
+peers), so "normal" adapts to the mesh instead of being a fixed number.
+
+Idle peers are released after `idle_ticks`, so slots are reused; when all
+slots are taken new peers are not scored (counted in `untracked`).
+"""
+
+from __future__ import annotations
+import threading
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency: scoring stays disabled without it
+    np = None
+
+# 1.4826 * MAD estimates the standard deviation for normal data
+_MAD_SCALE = 1.4826
+# median / MAD are estimated from about this many (evenly strided) slots
+_BASELINE_SAMPLE = 4096
+
+
+def scoring_available() -> bool:
+    return np is not None
+
+
+class PeerScorer:
+    def __init__(
+        self,
+        max_peers: int = 100_000,
+        ewma_alpha: float = 0.3,
+        threshold: float = 8.0,
+        min_rate: float = 2.0,
+        weight_rate: float = 1.0,
+        weight_duplicate: float = 4.0,
+        weight_timestamp: float = 2.0,
+        weight_size: float = 1.0,
+        idle_ticks: int = 60,
+    ) -> None:
+        if np is None:
+            raise RuntimeError("PeerScorer requires numpy")
+        self.capacity = int(max_peers)
+        self.alpha = float(ewma_alpha)
+        self.threshold = float(threshold)
+        self.min_rate = float(min_rate)
+        self.weights = (weight_rate, weight_duplicate, weight_timestamp, weight_size)
+        self.idle_ticks = int(idle_ticks)
+
+        n = self.capacity
+        self._lock = threading.Lock()
+        self._slots: Dict[str, int] = {}
+        self._peers: List[Optional[str]] = [None] * n
+        self._free: List[int] = list(range(n - 1, -1, -1))
+        self.untracked = 0
+        self.ticks = 0
+
+        # per-tick counters (written by request threads)
+        self._msgs = np.zeros(n, dtype=np.float32)
+        self._dups = np.zeros(n, dtype=np.float32)
+        self._ts_bad = np.zeros(n, dtype=np.float32)
+        self._bytes = np.zeros(n, dtype=np.float32)
+
+        # smoothed features (written by tick() only)
+        self.rate = np.zeros(n, dtype=np.float32)
+        self.dup_ratio = np.zeros(n, dtype=np.float32)
+        self.ts_rate = np.zeros(n, dtype=np.float32)
+        self.size = np.zeros(n, dtype=np.float32)
+        self.score = np.zeros(n, dtype=np.float32)
+        self._tmp = np.zeros(n, dtype=np.float32)
+        self._idle = np.zeros(n, dtype=np.int32)
+        self._used = np.zeros(n, dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    # ------------------------------------------------------------------
+    # request path
+    # ------------------------------------------------------------------
+
+    def record_message(self, peer: str, size: int = 0) -> None:
+        with self._lock:
+            i = self._slot(peer)
+            if i is not None:
+                self._msgs[i] += 1
+                self._bytes[i] += size
+
+    def record_duplicate(self, peer: str) -> None:
+        with self._lock:
+            i = self._slot(peer)
+            if i is not None:
+                self._dups[i] += 1
+
+    def record_bad_timestamp(self, peer: str) -> None:
+        with self._lock:
+            i = self._slot(peer)
+            if i is not None:
+                self._ts_bad[i] += 1
+
+    def _slot(self, peer: str) -> Optional[int]:
+        i = self._slots.get(peer)
+        if i is not None:
+            return i
+        if not self._free:
+            self.untracked += 1
+            return None
+        i = self._free.pop()
+        self._slots[peer] = i
+        self._peers[i] = peer
+        self._used[i] = True
+        self._idle[i] = 0
+        return i
+
+    # ------------------------------------------------------------------
+    # tick
+    # ------------------------------------------------------------------
+
+    def tick(self) -> List[Tuple[str, float]]:
+        """
+        Fold this tick's counters into the features, score every peer, and
+        return [(peer, score), ...] for peers at or above the threshold.
+        """
+        a = np.float32(self.alpha)
+        keep = np.float32(1 - self.alpha)
+        w_rate, w_dup, w_ts, w_size = self.weights
+        with self._lock:
+            msgs, dups, ts_bad, nbytes = self._msgs, self._dups, self._ts_bad, self._bytes
+            used = self._used
+            tmp = self._tmp
+
+            # EWMA updates for all slots at once (unused slots stay at zero)
+            _ewma(self.rate, msgs, a, keep, tmp)
+            _ewma(self.ts_rate, ts_bad, a, keep, tmp)
+            np.add(msgs, dups, out=tmp)
+            active = tmp > 0
+            np.divide(dups, tmp, out=tmp, where=active)
+            tmp[~active] = 0
+            _ewma(self.dup_ratio, tmp, a, keep, tmp)
+            has_msgs = msgs > 0
+            np.divide(nbytes, msgs, out=tmp, where=has_msgs)
+            np.subtract(tmp, self.size, out=tmp)
+            tmp *= a
+            np.add(self.size, tmp, out=self.size, where=has_msgs)
+            active |= ts_bad > 0
+
+            # score = sum of weighted features (rate / size as robust z-scores)
+            score = self.score
+            med, spread = _baseline(self.rate, used, min_spread=1.0)
+            np.subtract(self.rate, med, out=score)
+            score *= w_rate / spread
+            np.maximum(score, 0, out=score)
+            score[self.rate < self.min_rate] = 0
+            med, spread = _baseline(self.size, used, min_spread=256.0)
+            np.subtract(self.size, med, out=tmp)
+            tmp *= w_size / spread
+            np.maximum(tmp, 0, out=tmp)
+            score += tmp
+            np.multiply(self.dup_ratio, w_dup, out=tmp)
+            score += tmp
+            np.multiply(self.ts_rate, w_ts, out=tmp)
+            score += tmp
+            score[~used] = 0
+
+            flagged = np.flatnonzero(score >= self.threshold)
+            result = [(self._peers[i], float(score[i])) for i in flagged]
+
+            # release peers that have been quiet for idle_ticks (free slots
+            # count up too, so only used ones are candidates)
+            self._idle += 1
+            self._idle[active] = 0
+            for i in np.flatnonzero((self._idle >= self.idle_ticks) & used):
+                self._release(int(i))
+
+            msgs.fill(0)
+            dups.fill(0)
+            ts_bad.fill(0)
+            nbytes.fill(0)
+            self.ticks += 1
+        return result
+
+    def forget(self, peer: str) -> None:
+        """
+        Drop a peer's features (e.g. once it has been blocked).
+        """
+        with self._lock:
+            i = self._slots.get(peer)
+            if i is not None:
+                self._release(i)
+
+    def _release(self, i: int) -> None:
+        del self._slots[self._peers[i]]
+        self._peers[i] = None
+        self._used[i] = False
+        self._idle[i] = 0
+        for arr in (self.rate, self.dup_ratio, self.ts_rate, self.size, self.score,
+                    self._msgs, self._dups, self._ts_bad, self._bytes):
+            arr[i] = 0
+        self._free.append(i)
+
+    def clear(self) -> None:
+        with self._lock:
+            for i in list(self._slots.values()):
+                self._release(i)
+            self.untracked = 0
+
+    def stats(self) -> dict:
+        return {
+            "tracked_peers": len(self._slots),
+            "capacity": self.capacity,
+            "untracked": self.untracked,
+            "ticks": self.ticks,
+        }
+
+
+def _ewma(avg, sample, a, keep, tmp) -> None:
+    """
+    avg = keep * avg + a * sample, in place (tmp may alias sample).
+    """
+    avg *= keep
+    np.multiply(sample, a, out=tmp)
+    avg += tmp
+
+
+def _baseline(values, used, min_spread: float) -> Tuple[float, float]:
+    """
+    Median and 1.4826 * MAD of the non-zero values of used slots, estimated
+    from an evenly strided sample so the cost does not grow with the table.
+    The `min_spread` floor keeps a uniform population (MAD 0) from turning
+    tiny differences into huge scores.
+    """
+    step = max(values.size // _BASELINE_SAMPLE, 1)
+    sample = values[::step]
+    sample = sample[used[::step] & (sample > 0)]
+    if sample.size == 0:
+        return 0.0, min_spread
+    median = float(np.median(sample))
+    mad = float(np.median(np.abs(sample - median)))
+    return median, max(_MAD_SCALE * mad, min_spread)
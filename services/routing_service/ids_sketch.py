@@ -0,0 +1,263 @@
+# services/routing_service/ids_sketch.py
+# fixed-memory streaming sketches for distributed-flood detection (count-min + top-k + HyperLogLog).
+
+"""
+Streaming traffic sketches for the IDS.
+
+Per-peer windows catch one noisy peer; they cannot see a flood spread over
+many identities, and they cost memory per peer. These sketches use a fixed
+amount of memory regardless of how many peers exist, and a constant amount
+of work per message:
+
+- CountMinSketch: approximate per-key message counts (never underestimates).
+- TopK: the k heaviest keys seen by a count-min sketch.
+- HyperLogLog: approximate number of distinct keys.
+
+TrafficSketch combines them over tumbling windows and returns alerts:
+HEAVY_SENDER, HEAVY_RECIPIENT and SENDER_FLOOD (too many distinct senders).
+"""
+
+from __future__ import annotations
+import hashlib
+import math
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+_MASK64 = (1 << 64) - 1
+
+
+def hash_key(key: str) -> Tuple[int, int]:
+    """
+    Two independent 64-bit hashes of a key (double hashing for the sketches).
+    """
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+
+
+class CountMinSketch:
+    __slots__ = ("width", "depth", "_rows")
+
+    def __init__(self, width: int = 2048, depth: int = 4) -> None:
+        self.width = width
+        self.depth = depth
+        self._rows = [array("q", [0]) * width for _ in range(depth)]
+
+    def add(self, h1: int, h2: int, n: int = 1) -> int:
+        """
+        Count `n` more for the key and return its new estimate.
+        """
+        width = self.width
+        est = None
+        for i, row in enumerate(self._rows):
+            j = (h1 + i * h2) % width
+            row[j] += n
+            v = row[j]
+            if est is None or v < est:
+                est = v
+        return est
+
+    def estimate(self, h1: int, h2: int) -> int:
+        width = self.width
+        return min(row[(h1 + i * h2) % width] for i, row in enumerate(self._rows))
+
+    def clear(self) -> None:
+        self._rows = [array("q", [0]) * self.width for _ in range(self.depth)]
+
+
+class TopK:
+    """
+    The k keys with the largest count-min estimates seen so far.
+    Replacing the smallest entry is O(k), and only happens when a key
+    overtakes it, so the per-message cost stays constant.
+    """
+
+    __slots__ = ("k", "_items", "_floor")
+
+    def __init__(self, k: int = 10) -> None:
+        self.k = k
+        self._items: Dict[str, int] = {}
+        self._floor = 0
+
+    def offer(self, key: str, estimate: int) -> None:
+        items = self._items
+        if key in items:
+            items[key] = estimate
+            return
+        if len(items) < self.k:
+            items[key] = estimate
+            self._floor = min(items.values())
+            return
+        if estimate <= self._floor:
+            return
+        smallest = min(items, key=items.__getitem__)
+        del items[smallest]
+        items[key] = estimate
+        self._floor = min(items.values())
+
+    def top(self) -> List[Tuple[str, int]]:
+        return sorted(self._items.items(), key=lambda kv: kv[1], reverse=True)
+
+    def clear(self) -> None:
+        self._items.clear()
+        self._floor = 0
+
+
+class HyperLogLog:
+    """
+    Distinct-count estimator. The harmonic sum and zero-register count are
+    kept up to date on every add, so estimate() is O(1) as well.
+    """
+
+    __slots__ = ("p", "m", "_registers", "_alpha", "_inv_sum", "_zeros")
+
+    def __init__(self, precision: int = 12) -> None:
+        self.p = precision
+        self.m = 1 << precision
+        if self.m >= 128:
+            self._alpha = 0.7213 / (1 + 1.079 / self.m)
+        else:
+            self._alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(self.m, 0.7213)
+        self.clear()
+
+    def add(self, h: int) -> None:
+        p = self.p
+        idx = h >> (64 - p)
+        rest = (h << p) & _MASK64
+        # position of the first 1-bit in the remaining (64 - p) bits
+        rank = 65 - rest.bit_length() if rest else (64 - p) + 1
+        old = self._registers[idx]
+        if rank > old:
+            self._registers[idx] = rank
+            self._inv_sum += 2.0 ** -rank - 2.0 ** -old
+            if old == 0:
+                self._zeros -= 1
+
+    def estimate(self) -> float:
+        m = self.m
+        raw = self._alpha * m * m / self._inv_sum
+        if raw <= 2.5 * m and self._zeros:
+            return m * math.log(m / self._zeros)  # linear counting for small sets
+        return raw
+
+    def clear(self) -> None:
+        self._registers = bytearray(self.m)
+        self._inv_sum = float(self.m)
+        self._zeros = self.m
+
+
+class TrafficSketch:
+    """
+    Windowed heavy-hitter / distinct-sender detector.
+
+    A key is "heavy" once its estimate reaches both heavy_min_count and
+    heavy_share of all messages in the window. Each alert fires at most once
+    per key (or once for SENDER_FLOOD) per window.
+    """
+
+    # distinct-sender estimate is refreshed every N messages (amortized O(1))
+    DISTINCT_CHECK_EVERY = 64
+
+    def __init__(
+        self,
+        window_seconds: float = 60,
+        width: int = 2048,
+        depth: int = 4,
+        top_k: int = 10,
+        hll_precision: int = 12,
+        heavy_share: float = 0.2,
+        heavy_min_count: int = 200,
+        max_distinct_senders: int = 500,
+    ) -> None:
+        self.window_seconds = window_seconds
+        self.heavy_share = heavy_share
+        self.heavy_min_count = heavy_min_count
+        self.max_distinct_senders = max_distinct_senders
+
+        self._lock = threading.Lock()
+        self._senders = CountMinSketch(width, depth)
+        self._recipients = CountMinSketch(width, depth)
+        self._top_senders = TopK(top_k)
+        self._top_recipients = TopK(top_k)
+        self._distinct = HyperLogLog(hll_precision)
+
+        self._window_start: Optional[float] = None
+        self._total = 0
+        self._distinct_estimate = 0.0
+        self._alerted: set = set()
+        self._last_window: dict = {}
+
+    def observe(
+        self, sender: str, recipient: str, now: Optional[float] = None
+    ) -> List[Tuple[str, str, dict]]:
+        """
+        Count one message. Returns [(event_type, key, extra), ...] alerts.
+        """
+        now = time.time() if now is None else now
+        s1, s2 = hash_key(sender)
+        r1, r2 = hash_key(recipient)
+        alerts: List[Tuple[str, str, dict]] = []
+
+        with self._lock:
+            if self._window_start is None or now - self._window_start >= self.window_seconds:
+                self._roll(now)
+
+            self._total += 1
+            threshold = max(self.heavy_min_count, self.heavy_share * self._total)
+
+            est = self._senders.add(s1, s2)
+            self._top_senders.offer(sender, est)
+            if est >= threshold and ("S", sender) not in self._alerted:
+                self._alerted.add(("S", sender))
+                alerts.append(("HEAVY_SENDER", sender, {"estimate": est, "window_total": self._total}))
+
+            est = self._recipients.add(r1, r2)
+            self._top_recipients.offer(recipient, est)
+            if est >= threshold and ("R", recipient) not in self._alerted:
+                self._alerted.add(("R", recipient))
+                alerts.append(("HEAVY_RECIPIENT", recipient, {"estimate": est, "window_total": self._total}))
+
+            self._distinct.add(s1)
+            if self._total % self.DISTINCT_CHECK_EVERY == 0:
+                self._distinct_estimate = self._distinct.estimate()
+                if (
+                    self._distinct_estimate > self.max_distinct_senders
+                    and ("D", "") not in self._alerted
+                ):
+                    self._alerted.add(("D", ""))
+                    alerts.append((
+                        "SENDER_FLOOD",
+                        "*",
+                        {"distinct_senders": int(self._distinct_estimate), "window_total": self._total},
+                    ))
+        return alerts
+
+    def summary(self) -> dict:
+        """
+        Current and previous window: totals, distinct senders, heaviest keys.
+        """
+        with self._lock:
+            return {"current": self._window_summary(), "previous": dict(self._last_window)}
+
+    def _window_summary(self) -> dict:
+        return {
+            "window_start": self._window_start,
+            "total": self._total,
+            "distinct_senders": int(self._distinct.estimate()) if self._total else 0,
+            "top_senders": self._top_senders.top(),
+            "top_recipients": self._top_recipients.top(),
+        }
+
+    def _roll(self, now: float) -> None:
+        if self._window_start is not None:
+            self._last_window = self._window_summary()
+        self._window_start = now
+        self._total = 0
+        self._distinct_estimate = 0.0
+        self._alerted.clear()
+        self._senders.clear()
+        self._recipients.clear()
+        self._top_senders.clear()
+        self._top_recipients.clear()
+        self._distinct.clear()
@@ -0,0 +1,107 @@
+# services/routing_service/ids_snapshot.py
+# compact binary snapshot of IDS state (dedup ids, limiter state, blocks) for warm restarts.
+
+"""
+On-disk format for IDS state snapshots.
+
+A snapshot is a header followed by a fixed list of sections. Every section
+is a list of (key, float) pairs stored column-wise, so loading is one
+decode + split for the keys and one array copy for the values:
+
+    header   "IDSS" | u16 version | f64 saved_at (unix seconds)
+    section  u32 count | u64 key_bytes | keys (utf-8, NUL-separated)
+             | count x f64 values (little-endian)
+
+Files are written to a temp file in the same directory, fsync'ed and then
+renamed over the old snapshot, so a crash mid-write leaves the previous
+snapshot intact. Keys containing NUL are skipped.
+"""
+
+from __future__ import annotations
+import os
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Iterable, List, Sequence, Tuple
+
+MAGIC = b"IDSS"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sHd")
+_SECTION = struct.Struct("<IQ")
+
+# (keys, values) as returned by read_snapshot
+Section = Tuple[List[str], array]
+
+
+def write_snapshot(
+    path: Path, sections: Sequence[Iterable[Tuple[str, float]]], saved_at: float
+) -> int:
+    """
+    Atomically replace `path` with a snapshot of `sections`.
+    Returns the number of bytes written.
+    """
+    tmp = path.with_name(f"{path.name}.tmp")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+    with tmp.open("wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, saved_at))
+        written += _HEADER.size
+        for pairs in sections:
+            keys: List[str] = []
+            values = array("d")
+            for key, value in pairs:
+                if "\0" in key:
+                    continue
+                keys.append(key)
+                values.append(value)
+            blob = "\0".join(keys).encode("utf-8")
+            if sys.byteorder != "little":
+                values.byteswap()
+            f.write(_SECTION.pack(len(keys), len(blob)))
+            f.write(blob)
+            f.write(values.tobytes())
+            written += _SECTION.size + len(blob) + len(values) * values.itemsize
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return written
+
+
+def read_snapshot(path: Path, sections: int) -> Tuple[float, List[Section]]:
+    """
+    Return (saved_at, [(keys, values), ...]) for the first `sections`
+    sections. Raises ValueError on a foreign or truncated file.
+    """
+    data = path.read_bytes()
+    if len(data) < _HEADER.size:
+        raise ValueError("snapshot too short")
+    magic, version, saved_at = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"not an IDS snapshot (magic={magic!r}, version={version})")
+
+    view = memoryview(data)
+    pos = _HEADER.size
+    out: List[Section] = []
+    for _ in range(sections):
+        if pos + _SECTION.size > len(data):
+            raise ValueError("snapshot truncated")
+        count, key_bytes = _SECTION.unpack_from(data, pos)
+        pos += _SECTION.size
+        end = pos + key_bytes + 8 * count
+        if end > len(data):
+            raise ValueError("snapshot truncated")
+
+        keys = str(view[pos:pos + key_bytes], "utf-8").split("\0") if count else []
+        pos += key_bytes
+        values = array("d")
+        values.frombytes(view[pos:end])
+        if sys.byteorder != "little":
+            values.byteswap()
+        pos = end
+
+        if len(keys) != count:
+            raise ValueError("snapshot key count mismatch")
+        out.append((keys, values))
+    return saved_at, out
@@ -0,0 +1,386 @@
+# services/routing_service/ids_state.py
+# hard-capped per-peer tables for the IDS, so unique-peer (Sybil) floods cannot grow memory.
+
+"""
+Bounded state containers for the routing IDS.
+
+- BoundedPeerTable: segmented LRU (probation + protected) with a hard cap.
+  New peers land in probation; a peer seen again is promoted to protected.
+  On overflow probation is evicted first, so a flood of one-shot identities
+  only churns other one-shot identities and established peers survive.
+- BlockedPeerTable: capped dict for blocked peers. It is separate from the
+  tracked-peer tables so peer churn can never evict a block.
+- ShardedPeerTable / DedupTable: lock-striped versions for the request
+  threadpool. A key always maps to the same shard, and every shard has its
+  own lock, so concurrent handlers only contend when their keys collide on
+  a shard, and check-and-set sequences on one key are atomic.
+"""
+
+from __future__ import annotations
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Any, Callable, Iterator, List, Tuple
+
+_MISSING = object()
+
+# Fraction of a table's capacity reserved for promoted (repeat) peers.
+PROTECTED_SHARE = 0.8
+
+
+class BoundedPeerTable:
+    """
+    Dict-like peer -> value map with a hard entry cap.
+
+    Supports the subset of the dict API the IDS uses (get / [] / in / pop /
+    clear / len). Reads through get() and writes count as activity.
+    """
+
+    __slots__ = ("capacity", "_protected_cap", "_probation", "_protected", "evictions")
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = max(int(capacity), 1)
+        self._protected_cap = max(int(self.capacity * PROTECTED_SHARE), 1)
+        self._probation: "OrderedDict[str, Any]" = OrderedDict()
+        self._protected: "OrderedDict[str, Any]" = OrderedDict()
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._probation) + len(self._protected)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._protected or key in self._probation
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._probation
+        yield from self._protected
+
+    def items(self) -> Iterator[tuple]:
+        """
+        Iterate (key, value) pairs without counting it as activity.
+        """
+        yield from self._probation.items()
+        yield from self._protected.items()
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        protected = self._protected
+        if key in protected:
+            protected.move_to_end(key)
+            return protected[key]
+        probation = self._probation
+        if key in probation:
+            value = probation.pop(key)
+            self._promote(key, value)
+            return value
+        return default
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        protected = self._protected
+        if key in protected:
+            protected[key] = value
+            protected.move_to_end(key)
+            return
+        probation = self._probation
+        if key in probation:
+            del probation[key]
+            self._promote(key, value)
+            return
+        if len(probation) + len(protected) >= self.capacity:
+            self._evict_one()
+        probation[key] = value
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        if key in self._protected:
+            return self._protected.pop(key)
+        return self._probation.pop(key, default)
+
+    def clear(self) -> None:
+        self._probation.clear()
+        self._protected.clear()
+
+    def sweep(self, is_idle: Callable[[Any], bool], budget: int) -> int:
+        """
+        Drop up to `budget` idle entries from the cold end of each segment.
+        Stops at the first live entry per segment (amortized O(1) per call).
+        """
+        removed = 0
+        for segment in (self._probation, self._protected):
+            while segment and removed < budget:
+                oldest = next(iter(segment.values()))
+                if not is_idle(oldest):
+                    break
+                segment.popitem(last=False)
+                removed += 1
+        return removed
+
+    def _promote(self, key: str, value: Any) -> None:
+        protected = self._protected
+        protected[key] = value
+        if len(protected) > self._protected_cap:
+            # demote the coldest protected entry back to probation
+            old_key, old_value = protected.popitem(last=False)
+            self._probation[old_key] = old_value
+
+    def _evict_one(self) -> None:
+        segment = self._probation or self._protected
+        segment.popitem(last=False)
+        self.evictions += 1
+
+
+class ShardedPeerTable:
+    """
+    BoundedPeerTable split into `shards` independently locked shards.
+
+    Compound updates on one peer go through shard(key):
+
+        lock, table = peers.shard(key)
+        with lock:
+            ...
+
+    The dict-style helpers below lock the shard themselves. The hard cap is
+    split evenly, so the table never holds more than `capacity` entries.
+    """
+
+    __slots__ = ("capacity", "_mask", "_tables", "_locks")
+
+    def __init__(self, capacity: int, shards: int = 16) -> None:
+        n = _power_of_two(shards)
+        self.capacity = max(int(capacity), 1)
+        self._mask = n - 1
+        self._tables = [BoundedPeerTable(max(self.capacity // n, 1)) for _ in range(n)]
+        self._locks = [threading.Lock() for _ in range(n)]
+
+    def shard(self, key: str) -> Tuple[threading.Lock, BoundedPeerTable]:
+        i = hash(key) & self._mask
+        return self._locks[i], self._tables[i]
+
+    @property
+    def evictions(self) -> int:
+        return sum(t.evictions for t in self._tables)
+
+    def __len__(self) -> int:
+        return sum(len(t) for t in self._tables)
+
+    def __contains__(self, key: str) -> bool:
+        lock, table = self.shard(key)
+        with lock:
+            return key in table
+
+    def __iter__(self) -> Iterator[str]:
+        return iter([key for key, _ in self.items()])
+
+    def items(self) -> List[tuple]:
+        """
+        Snapshot of (key, value) pairs; does not count as activity.
+        """
+        out: List[tuple] = []
+        for lock, table in zip(self._locks, self._tables):
+            with lock:
+                out.extend(table.items())
+        return out
+
+    def get(self, key: str, default: Any = None) -> Any:
+        lock, table = self.shard(key)
+        with lock:
+            return table.get(key, default)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        lock, table = self.shard(key)
+        with lock:
+            table[key] = value
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        lock, table = self.shard(key)
+        with lock:
+            return table.pop(key, default)
+
+    def clear(self) -> None:
+        for lock, table in zip(self._locks, self._tables):
+            with lock:
+                table.clear()
+
+
+class DedupTable:
+    """
+    msg_id -> first-seen timestamp, striped like ShardedPeerTable.
+
+    Each shard is an OrderedDict in insertion (time) order, so expiring old
+    ids only looks at the front of the shard: O(expired), not O(table).
+
+    Ids restored from a snapshot live in one read-only dict next to the
+    shards (building it is a single C-level pass, which keeps warm restarts
+    fast). It is consulted on lookups and dropped as a whole once its newest
+    entry has expired.
+    """
+
+    __slots__ = ("_mask", "_shards", "_locks", "_restored", "_restored_until")
+
+    def __init__(self, shards: int = 16) -> None:
+        n = _power_of_two(shards)
+        self._mask = n - 1
+        self._shards: List["OrderedDict[str, float]"] = [OrderedDict() for _ in range(n)]
+        self._locks = [threading.Lock() for _ in range(n)]
+        self._restored: dict = {}
+        self._restored_until = 0.0
+
+    def check_and_add(self, msg_id: str, now: float, ttl: float) -> bool:
+        """
+        Atomically: True if msg_id was seen within `ttl`, else remember it
+        (at `now`) and return False.
+        """
+        i = hash(msg_id) & self._mask
+        cutoff = now - ttl
+        restored = self._live_restored(cutoff)
+        with self._locks[i]:
+            return self._check_locked(self._shards[i], msg_id, now, cutoff, restored)
+
+    def check_and_add_many(self, msg_ids: List[str], now: float, ttl: float) -> List[bool]:
+        """
+        check_and_add for a batch, in order (a repeat inside the batch is a
+        duplicate too). Each shard lock is taken once for all its ids.
+        """
+        by_shard: dict = {}
+        for pos, msg_id in enumerate(msg_ids):
+            by_shard.setdefault(hash(msg_id) & self._mask, []).append(pos)
+        cutoff = now - ttl
+        restored = self._live_restored(cutoff)
+        out = [False] * len(msg_ids)
+        for i, positions in by_shard.items():
+            shard = self._shards[i]
+            with self._locks[i]:
+                for pos in positions:
+                    out[pos] = self._check_locked(shard, msg_ids[pos], now, cutoff, restored)
+        return out
+
+    def discard_many(self, msg_ids: List[str]) -> None:
+        """
+        Forget ids recorded by check_and_add*, e.g. when the message they
+        belong to could not be stored and the sender will retry it.
+        """
+        for msg_id in msg_ids:
+            i = hash(msg_id) & self._mask
+            with self._locks[i]:
+                self._shards[i].pop(msg_id, None)
+
+    def _live_restored(self, cutoff: float) -> dict:
+        restored = self._restored
+        if restored and self._restored_until < cutoff:
+            self._restored = restored = {}
+        return restored
+
+    @staticmethod
+    def _check_locked(shard, msg_id: str, now: float, cutoff: float, restored: dict) -> bool:
+        while shard:
+            oldest_id, ts = next(iter(shard.items()))
+            if ts >= cutoff:
+                break
+            del shard[oldest_id]
+        ts = shard.get(msg_id)
+        if ts is None and restored:
+            ts = restored.get(msg_id)
+        # the front-purge stops early if the clock ever went backwards
+        if ts is not None and ts >= cutoff:
+            return True
+        shard.pop(msg_id, None)
+        shard[msg_id] = now
+        return False
+
+    def load(self, keys: List[str], stamps: Any, cutoff: float) -> int:
+        """
+        Restore (msg_id, first_seen) pairs given in time order, skipping
+        entries older than `cutoff`. Returns the number loaded.
+        """
+        start = bisect_left(stamps, cutoff)
+        if start >= len(keys):
+            return 0
+        restored = dict(self._restored)
+        restored.update(zip(keys[start:], stamps[start:]))
+        self._restored_until = max(self._restored_until, stamps[-1])
+        self._restored = restored
+        return len(keys) - start
+
+    def __len__(self) -> int:
+        return sum(len(s) for s in self._shards) + len(self._restored)
+
+    def __contains__(self, msg_id: str) -> bool:
+        return msg_id in self._shards[hash(msg_id) & self._mask] or msg_id in self._restored
+
+    def items(self) -> List[tuple]:
+        out: List[tuple] = list(self._restored.items())
+        for lock, shard in zip(self._locks, self._shards):
+            with lock:
+                out.extend(shard.items())
+        return out
+
+    def clear(self) -> None:
+        self._restored = {}
+        self._restored_until = 0.0
+        for lock, shard in zip(self._locks, self._shards):
+            with lock:
+                shard.clear()
+
+
+class BlockedPeerTable(dict):
+    """
+    peer -> blocked_at map with a hard cap.
+
+    Re-blocking moves a peer to the end; on overflow the oldest block (the one
+    closest to expiry) is released. Never touched by tracked-peer eviction.
+    Lookups are plain dict reads; block() takes a lock because it is a
+    read-modify-write.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        super().__init__()
+        self.capacity = max(int(capacity), 1)
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def block(self, peer: str, blocked_at: Any) -> bool:
+        """
+        Block (or re-block) a peer. Returns True if it was not blocked yet.
+        """
+        with self._lock:
+            new = peer not in self
+            if not new:
+                del self[peer]
+            elif len(self) >= self.capacity:
+                del self[next(iter(self))]
+                self.evictions += 1
+            self[peer] = blocked_at
+            return new
+
+    def snapshot(self) -> List[tuple]:
+        with self._lock:
+            return list(self.items())
+
+    def unblock(self, peer: str, blocked_at: Any) -> bool:
+        """
+        Remove the block only if it is still the one that was checked, so a
+        concurrent re-block is not lost. Returns True if it was removed.
+        """
+        with self._lock:
+            if self.get(peer) is blocked_at:
+                del self[peer]
+                return True
+            return False
+
+
+def _power_of_two(n: int) -> int:
+    n = max(int(n), 1)
+    return 1 << (n - 1).bit_length()
+
+
+# Rough per-entry cost in bytes (key str + dict slot + value object).
+_ENTRY_BYTES_ESTIMATE = 200
+
+
+def approx_table_bytes(entries: int) -> int:
+    return entries * _ENTRY_BYTES_ESTIMATE
+
@@ -0,0 +1,282 @@
+# services/routing_service/neighbor_table.py
+# in-memory neighbor / route table: link quality from BLE ingress + delivery outcomes, cached next-hop choice.
+
+"""
+Neighbor and route table for next-hop selection.
+
+Fed from two sides:
+  - BLE ingress (link_meta): every valid chunk refreshes the neighbor it
+    came from (RSSI EWMA, last seen) and teaches a reverse route: the
+    chunk's sender is reachable through that neighbor in hop_count hops.
+  - the router loop: each transmission to a neighbor updates its delivery
+    success ratio (EWMA).
+
+next_hop(destination) picks the live neighbor with the best
+    link quality / hops
+where link quality = success ratio x RSSI factor (-100 dBm -> ~0, -40 dBm -> 1).
+Decisions are cached per destination for `decision_ttl_seconds`; a failed
+delivery drops the cached decisions that use that neighbor. None means
+no known route (the caller broadcasts).
+
+Everything is bounded: neighbors and destinations are evicted least
+recently seen first, and each destination keeps its best few routes.
+"""
+
+from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .config_loader import NeighborsConfig, current as current_config
+
+_monotonic = time.monotonic
+
+MAX_ROUTES_PER_DESTINATION = 8
+
+
+@dataclass
+class Neighbor:
+    rssi: Optional[float] = None    # EWMA of link_meta.rssi (dBm)
+    success: float = 1.0            # EWMA of delivery outcomes (1 = delivered)
+    last_seen: float = 0.0
+    sent: int = 0
+    failed: int = 0
+
+
+def _rssi_factor(rssi: Optional[float]) -> float:
+    if rssi is None:
+        return 0.5
+    return min(1.0, max(0.05, (rssi + 100.0) / 60.0))
+
+
+class NeighborTable:
+    def __init__(
+        self,
+        max_neighbors: int = 1_000,
+        max_destinations: int = 10_000,
+        rssi_alpha: float = 0.3,
+        outcome_alpha: float = 0.2,
+        neighbor_timeout_seconds: float = 120,
+        route_timeout_seconds: float = 600,
+        decision_ttl_seconds: float = 5,
+    ) -> None:
+        self._lock = threading.Lock()
+        # neighbor_fp -> Neighbor, least recently seen first
+        self._neighbors: "OrderedDict[str, Neighbor]" = OrderedDict()
+        # destination -> {neighbor_fp: (hops, last_seen)}, least recently seen first
+        self._routes: "OrderedDict[str, Dict[str, Tuple[int, float]]]" = OrderedDict()
+        # destination -> (neighbor_fp, expires_at); neighbor_fp -> destinations
+        self._decisions: Dict[str, Tuple[str, float]] = {}
+        self._decided_via: Dict[str, set] = {}
+        self.decision_hits = 0
+        self.decision_misses = 0
+        self._settings: Optional[NeighborsConfig] = None
+        self.configure(NeighborsConfig(
+            max_neighbors=max(int(max_neighbors), 1),
+            max_destinations=max(int(max_destinations), 1),
+            rssi_alpha=float(rssi_alpha),
+            outcome_alpha=float(outcome_alpha),
+            neighbor_timeout_seconds=float(neighbor_timeout_seconds),
+            route_timeout_seconds=float(route_timeout_seconds),
+            decision_ttl_seconds=float(decision_ttl_seconds),
+        ))
+
+    @classmethod
+    def from_config(cls, settings: NeighborsConfig) -> "NeighborTable":
+        table = cls()
+        table.configure(settings)
+        return table
+
+    def configure(self, settings: NeighborsConfig) -> None:
+        """
+        Apply sizes, smoothing and timeouts. Callers pass the current
+        snapshot's section on every use; only a new snapshot (a reload)
+        costs anything. Shrunk limits evict least recently seen entries.
+        """
+        if settings is self._settings:
+            return
+        with self._lock:
+            self._settings = settings
+            self.max_neighbors = settings.max_neighbors
+            self.max_destinations = settings.max_destinations
+            self.rssi_alpha = settings.rssi_alpha
+            self.outcome_alpha = settings.outcome_alpha
+            self.neighbor_timeout = settings.neighbor_timeout_seconds
+            self.route_timeout = settings.route_timeout_seconds
+            self.decision_ttl = settings.decision_ttl_seconds
+            while len(self._neighbors) > self.max_neighbors:
+                self._forget_neighbor(next(iter(self._neighbors)))
+            while len(self._routes) > self.max_destinations:
+                oldest = next(iter(self._routes))
+                del self._routes[oldest]
+                self._drop_decision(oldest)
+
+    # ------------------------------------------------------------------
+    # feeding
+    # ------------------------------------------------------------------
+
+    def observe(self, neighbor: str, rssi: Optional[float], sender: str, hop_count: int) -> None:
+        self.observe_many([(neighbor, rssi, sender, hop_count)])
+
+    def observe_many(self, frames: Iterable[Tuple[str, Optional[float], str, int]]) -> None:
+        """
+        Chunks received over BLE, as (neighbor, rssi, sender, hop_count);
+        one lock acquisition for the lot.
+        """
+        now = _monotonic()
+        with self._lock:
+            for neighbor, rssi, sender, hop_count in frames:
+                if not neighbor or neighbor == "unknown":
+                    continue
+                entry = self._neighbors.get(neighbor)
+                if entry is None:
+                    entry = self._neighbors[neighbor] = Neighbor()
+                    while len(self._neighbors) > self.max_neighbors:
+                        self._forget_neighbor(next(iter(self._neighbors)))
+                self._neighbors.move_to_end(neighbor)
+                entry.last_seen = now
+                if isinstance(rssi, (int, float)):
+                    entry.rssi = (
+                        float(rssi) if entry.rssi is None
+                        else entry.rssi + self.rssi_alpha * (rssi - entry.rssi)
+                    )
+                # the neighbor itself is one hop away; the sender hop_count hops
+                self._learn(neighbor, neighbor, 1, now)
+                if sender and sender != neighbor:
+                    self._learn(sender, neighbor, max(int(hop_count), 1), now)
+
+    def _learn(self, destination: str, neighbor: str, hops: int, now: float) -> None:
+        routes = self._routes.get(destination)
+        if routes is None:
+            routes = self._routes[destination] = {}
+            while len(self._routes) > self.max_destinations:
+                oldest = next(iter(self._routes))
+                del self._routes[oldest]
+                self._drop_decision(oldest)
+        self._routes.move_to_end(destination)
+        routes[neighbor] = (hops, now)
+        if len(routes) > MAX_ROUTES_PER_DESTINATION:
+            # keep the shortest, most recent routes
+            worst = max(routes, key=lambda n: (routes[n][0], -routes[n][1]))
+            del routes[worst]
+
+    def record_outcome(self, neighbor: str, delivered: bool) -> None:
+        """
+        Result of a transmission to `neighbor` (router loop).
+        """
+        with self._lock:
+            entry = self._neighbors.get(neighbor)
+            if entry is None:
+                return
+            entry.sent += 1
+            entry.success += self.outcome_alpha * ((1.0 if delivered else 0.0) - entry.success)
+            if not delivered:
+                entry.failed += 1
+                for destination in list(self._decided_via.get(neighbor, ())):
+                    self._drop_decision(destination)
+
+    # ------------------------------------------------------------------
+    # selection
+    # ------------------------------------------------------------------
+
+    def next_hop(
+        self, destination: str, exclude: Optional[Callable[[str], bool]] = None
+    ) -> Optional[str]:
+        """
+        Best neighbor towards `destination`, or None if there is no live
+        route. `exclude(neighbor)` rules out neighbors (e.g. ones already
+        on the envelope's path); such a choice is not cached.
+        """
+        now = _monotonic()
+        with self._lock:
+            cached = self._decisions.get(destination)
+            if cached is not None and cached[1] > now:
+                if exclude is None or not exclude(cached[0]):
+                    self.decision_hits += 1
+                    return cached[0]
+            self.decision_misses += 1
+
+            best = None
+            best_score = 0.0
+            for neighbor, (hops, seen) in self._routes.get(destination, {}).items():
+                entry = self._neighbors.get(neighbor)
+                if entry is None or now - entry.last_seen > self.neighbor_timeout:
+                    continue
+                if now - seen > self.route_timeout:
+                    continue
+                if exclude is not None and exclude(neighbor):
+                    continue
+                score = entry.success * _rssi_factor(entry.rssi) / hops
+                if score > best_score:
+                    best, best_score = neighbor, score
+
+            if exclude is None:
+                self._drop_decision(destination)
+                if best is not None:
+                    self._decisions[destination] = (best, now + self.decision_ttl)
+                    self._decided_via.setdefault(best, set()).add(destination)
+            return best
+
+    def live_neighbors(self) -> List[str]:
+        """
+        Neighbors heard from within neighbor_timeout_seconds, most recent first.
+        """
+        now = _monotonic()
+        with self._lock:
+            live = []
+            for neighbor in reversed(self._neighbors):
+                if now - self._neighbors[neighbor].last_seen > self.neighbor_timeout:
+                    break
+                live.append(neighbor)
+            return live
+
+    # ------------------------------------------------------------------
+    # housekeeping
+    # ------------------------------------------------------------------
+
+    def _drop_decision(self, destination: str) -> None:
+        cached = self._decisions.pop(destination, None)
+        if cached is not None:
+            via = self._decided_via.get(cached[0])
+            if via is not None:
+                via.discard(destination)
+                if not via:
+                    del self._decided_via[cached[0]]
+
+    def _forget_neighbor(self, neighbor: str) -> None:
+        del self._neighbors[neighbor]
+        for destination in list(self._decided_via.get(neighbor, ())):
+            self._drop_decision(destination)
+
+    def neighbor(self, neighbor: str) -> Optional[Neighbor]:
+        with self._lock:
+            entry = self._neighbors.get(neighbor)
+            return None if entry is None else Neighbor(**vars(entry))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._neighbors.clear()
+            self._routes.clear()
+            self._decisions.clear()
+            self._decided_via.clear()
+
+    def stats(self) -> dict:
+        now = _monotonic()
+        with self._lock:
+            return {
+                "neighbors": len(self._neighbors),
+                "live_neighbors": sum(
+                    now - n.last_seen <= self.neighbor_timeout for n in self._neighbors.values()
+                ),
+                "destinations": len(self._routes),
+                "cached_decisions": len(self._decisions),
+                "decision_hits": self.decision_hits,
+                "decision_misses": self.decision_misses,
+            }
+
+
+# process-wide table shared by ingress (routing_api) and the router loop;
+# both re-apply the current snapshot's settings, so a reload resizes it
+NEIGHBORS = NeighborTable.from_config(current_config().neighbors)
@@ -0,0 +1,47 @@
+# services/routing_service/path_digest.py
+# compact digest of the routers an envelope has passed through (loop suppression without a global table).
+
+"""
+Path digest carried in RoutingMeta.path.
+
+A 128-bit Bloom filter (32 hex chars) over the node fingerprints of the
+routers that queued the envelope for forwarding. A router that finds
+itself in the digest has seen this envelope before and drops it instead of
+forwarding it again, even after its msg_id fell out of the dedup table.
+
+With max_ttl hops of 8 and 3 bits per node the false-positive rate (an
+envelope dropped as a loop although it never passed here) stays around
+0.5%. A missing or malformed digest counts as empty.
+"""
+
+from __future__ import annotations
+import hashlib
+
+PATH_DIGEST_BITS = 128
+PATH_DIGEST_HASHES = 3
+
+
+def _node_bits(node_fp: str) -> int:
+    digest = hashlib.blake2b(node_fp.encode("utf-8"), digest_size=2 * PATH_DIGEST_HASHES).digest()
+    bits = 0
+    for i in range(PATH_DIGEST_HASHES):
+        bits |= 1 << (int.from_bytes(digest[2 * i:2 * i + 2], "big") % PATH_DIGEST_BITS)
+    return bits
+
+
+def _parse(path: str) -> int:
+    if not path or len(path) != PATH_DIGEST_BITS // 4:
+        return 0
+    try:
+        return int(path, 16)
+    except ValueError:
+        return 0
+
+
+def path_contains(path: str, node_fp: str) -> bool:
+    bits = _node_bits(node_fp)
+    return _parse(path) & bits == bits
+
+
+def path_add(path: str, node_fp: str) -> str:
+    return format(_parse(path) | _node_bits(node_fp), f"0{PATH_DIGEST_BITS // 4}x")
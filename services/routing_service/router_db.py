@@ -1,10 +1,19 @@
 # services/routing_service/router_db.py
 import sqlite3
-from typing import List, Dict, Any
-from .config_loader import ROUTING_CFG
+from typing import List, Dict, Any, Tuple
+from .config_loader import current as current_config
 
 DB_PATH = "services/routing_service/routing.db"
 
+# RoutingMeta.priority -> queue.priority (lower is sent first)
+PRIORITY_RANK = {"high": 0, "normal": 1, "low": 2}
+
+# columns added after the first queue schema: name -> declaration
+_QUEUE_COLUMNS = {
+    "copies": "INTEGER DEFAULT 1",
+    "priority": "INTEGER DEFAULT 1",
+}
+
 def get_connection():
     return sqlite3.connect(DB_PATH)
 
@@ -21,6 +30,53 @@ def init_db():
             retries INTEGER DEFAULT 0,
             ttl INTEGER,
             status TEXT DEFAULT 'queued',
+            last_update TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            copies INTEGER DEFAULT 1,
+            priority INTEGER DEFAULT 1
+        )
+        """
+    )
+    # queue tables from older versions lack the later columns
+    columns = {row[1] for row in cur.execute("PRAGMA table_info(queue)")}
+    for column, decl in _QUEUE_COLUMNS.items():
+        if column not in columns:
+            cur.execute(f"ALTER TABLE queue ADD COLUMN {column} {decl}")
+    # per-message replica bookkeeping: which neighbors got a copy (and how
+    # many copies they may spread); see strategies
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS replicas (
+            msg_id TEXT,
+            neighbor_fp TEXT,
+            copies INTEGER,
+            handed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (msg_id, neighbor_fp)
+        )
+        """
+    )
+    # messages addressed to this node (node_fp), kept apart from the
+    # forwarding queue until the gateway fetches them
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS inbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            msg_id TEXT UNIQUE,
+            envelope_json TEXT,
+            fetched INTEGER DEFAULT 0,
+            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    # device registry (see device_registry); device_fp is the primary key,
+    # so per-request lookups are a single index probe
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS devices (
+            device_fp TEXT PRIMARY KEY,
+            token_hash TEXT NOT NULL,
+            roles TEXT NOT NULL DEFAULT '',
+            revoked INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             last_update TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
         """
@@ -35,17 +91,21 @@ def enqueue_message(
     ttl: int,
     sender_fp: str | None = None,
     recipient_fp: str | None = None,
+    copies: int = 1,
+    priority: int = 1,
 ):
     """
     Enqueue a message in the routing DB.
 
     sender_fp / recipient_fp are accepted for future per-peer quotas / stats
-    but are currently not stored in the schema.
+    but are currently not stored in the schema. copies is the number of
+    replicas the routing strategy may hand out; priority is a PRIORITY_RANK
+    value.
     """
     conn = get_connection()
     cur = conn.cursor()
 
-    max_size = ROUTING_CFG.get("max_queue_size", 5000)
+    max_size = current_config().max_queue_size
 
     cur.execute("SELECT COUNT(*) FROM queue WHERE delivered = 0")
     count = cur.fetchone()[0]
@@ -54,32 +114,116 @@ def enqueue_message(
 
     cur.execute(
         """
-        INSERT INTO queue (msg_id, envelope_json, ttl)
-        VALUES (?, ?, ?)
+        INSERT INTO queue (msg_id, envelope_json, ttl, copies, priority)
+        VALUES (?, ?, ?, ?, ?)
         ON CONFLICT(msg_id) DO NOTHING
         """,
-        (msg_id, envelope_json, ttl),
+        (msg_id, envelope_json, ttl, copies, priority),
     )
     conn.commit()
     conn.close()
 
 
+def enqueue_forwards(items: List[Tuple[str, str, int, int, int]]) -> List[str]:
+    """
+    Queue envelopes received over BLE for their next hop, all in one
+    transaction. items: (msg_id, envelope_json, ttl, copies, priority).
+
+    The UNIQUE msg_id makes the insert itself the durable duplicate check
+    (it also catches our own messages coming back), and the capacity check
+    sits in the same transaction. Returns per item:
+    "queued" | "duplicate" | "full".
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("SELECT COUNT(*) FROM queue WHERE delivered = 0")
+        free = current_config().max_queue_size - cur.fetchone()[0]
+        results = []
+        for msg_id, envelope_json, ttl, copies, priority in items:
+            if free <= 0:
+                results.append("full")
+                continue
+            cur.execute(
+                """
+                INSERT INTO queue (msg_id, envelope_json, ttl, copies, priority)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(msg_id) DO NOTHING
+                """,
+                (msg_id, envelope_json, ttl, copies, priority),
+            )
+            if cur.rowcount:
+                free -= 1
+                results.append("queued")
+            else:
+                results.append("duplicate")
+        conn.commit()
+    finally:
+        conn.close()
+    return results
+
+
+def deliver_local(items: List[Tuple[str, str]]) -> List[bool]:
+    """
+    Store envelopes addressed to this node in the inbox (one transaction).
+    items: (msg_id, envelope_json). False for a msg_id already delivered.
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        stored = []
+        for msg_id, envelope_json in items:
+            cur.execute(
+                "INSERT INTO inbox (msg_id, envelope_json) VALUES (?, ?) ON CONFLICT(msg_id) DO NOTHING",
+                (msg_id, envelope_json),
+            )
+            stored.append(cur.rowcount > 0)
+        conn.commit()
+    finally:
+        conn.close()
+    return stored
+
+
+def fetch_inbox(limit: int = 50) -> List[Dict[str, Any]]:
+    """
+    Oldest unfetched inbox messages; they are marked fetched in the same
+    transaction, so each is handed out once.
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        rows = cur.execute(
+            "SELECT id, msg_id, envelope_json, received_at FROM inbox WHERE fetched = 0 ORDER BY id LIMIT ?",
+            (limit,),
+        ).fetchall()
+        cur.executemany("UPDATE inbox SET fetched = 1 WHERE id = ?", [(row[0],) for row in rows])
+        conn.commit()
+    finally:
+        conn.close()
+    return [
+        {"msg_id": msg_id, "envelope_json": env_json, "received_at": received_at}
+        for _, msg_id, env_json, received_at in rows
+    ]
+
 
 def get_outgoing() -> List[Dict[str, Any]]:
     conn = get_connection()
     cur = conn.cursor()
     rows = cur.execute(
         """
-        SELECT id, msg_id, envelope_json, retries, ttl, status, last_update
+        SELECT id, msg_id, envelope_json, retries, ttl, status, last_update, copies, priority
         FROM queue
         WHERE delivered = 0 AND status = 'queued'
+        ORDER BY priority, id
         """
     ).fetchall()
     conn.close()
 
     result = []
     for row in rows:
-        row_id, msg_id, env_json, retries, ttl, status, last_update = row
+        row_id, msg_id, env_json, retries, ttl, status, last_update, copies, priority = row
         result.append(
             {
                 "row_id": row_id,
@@ -89,10 +233,114 @@ def get_outgoing() -> List[Dict[str, Any]]:
                 "ttl": ttl,
                 "status": status,
                 "last_update": last_update,
+                "copies": copies,
+                "priority": priority,
             }
         )
     return result
 
+
+def record_handoffs(row_id: int, msg_id: str, handoffs: List[Tuple[str, int]], copies_left: int):
+    """
+    Remember which neighbors got a copy of msg_id (and how many copies they
+    may spread) and store the copies this node has left, in one transaction.
+    A broadcast is recorded as neighbor "*".
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.executemany(
+            """
+            INSERT INTO replicas (msg_id, neighbor_fp, copies)
+            VALUES (?, ?, ?)
+            ON CONFLICT(msg_id, neighbor_fp) DO UPDATE SET
+                copies = replicas.copies + excluded.copies,
+                handed_at = CURRENT_TIMESTAMP
+            """,
+            [(msg_id, neighbor or "*", copies) for neighbor, copies in handoffs],
+        )
+        cur.execute(
+            "UPDATE queue SET copies = ?, last_update = CURRENT_TIMESTAMP WHERE id = ?",
+            (copies_left, row_id),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def handed_out(msg_ids: List[str]) -> Dict[str, set]:
+    """
+    msg_id -> neighbors that already got a copy, for many messages at once.
+    """
+    result: Dict[str, set] = {}
+    if not msg_ids:
+        return result
+    conn = get_connection()
+    try:
+        for start in range(0, len(msg_ids), 500):
+            chunk = msg_ids[start:start + 500]
+            rows = conn.execute(
+                f"SELECT msg_id, neighbor_fp FROM replicas WHERE msg_id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+            for msg_id, neighbor in rows:
+                result.setdefault(msg_id, set()).add(neighbor)
+    finally:
+        conn.close()
+    return result
+
+
+def known_msg_ids(limit: int) -> List[str]:
+    """
+    Most recent msg_ids this node holds or has handled (queue rows in any
+    state, then inbox), at most `limit`; the input of a summary vector.
+    """
+    conn = get_connection()
+    try:
+        ids = [
+            row[0] for row in conn.execute(
+                "SELECT msg_id FROM queue ORDER BY id DESC LIMIT ?", (limit,)
+            )
+        ]
+        if len(ids) < limit:
+            ids += [
+                row[0] for row in conn.execute(
+                    "SELECT msg_id FROM inbox ORDER BY id DESC LIMIT ?", (limit - len(ids),)
+                )
+            ]
+    finally:
+        conn.close()
+    return ids
+
+
+def cancel_acked(msg_ids: List[str]) -> int:
+    """
+    Stop sending messages whose delivery was acknowledged: one bulk update
+    for all pending rows with these msg_ids. Returns the rows cancelled.
+    """
+    if not msg_ids:
+        return 0
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cancelled = 0
+        for start in range(0, len(msg_ids), 500):
+            chunk = msg_ids[start:start + 500]
+            cur.execute(
+                f"""
+                UPDATE queue
+                SET delivered = 1, status = 'acked', last_update = CURRENT_TIMESTAMP
+                WHERE delivered = 0 AND msg_id IN ({','.join('?' * len(chunk))})
+                """,
+                chunk,
+            )
+            cancelled += cur.rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    return cancelled
+
+
 def mark_delivered(row_id: int):
     conn = get_connection()
     cur = conn.cursor()
@@ -136,3 +384,81 @@ def increment_retry(row_id: int):
     )
     conn.commit()
     conn.close()
+
+
+# ---------------------------------------------------------------------------
+# Device registry
+# ---------------------------------------------------------------------------
+
+def upsert_device(device_fp: str, token_hash: str, roles: str, revoked: bool = False):
+    """
+    Insert or replace a device's token hash and roles (comma-separated).
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        INSERT INTO devices (device_fp, token_hash, roles, revoked)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(device_fp) DO UPDATE SET
+            token_hash = excluded.token_hash,
+            roles = excluded.roles,
+            revoked = excluded.revoked,
+            last_update = CURRENT_TIMESTAMP
+        """,
+        (device_fp, token_hash, roles, int(revoked)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def get_device(device_fp: str) -> Dict[str, Any] | None:
+    conn = get_connection()
+    cur = conn.cursor()
+    row = cur.execute(
+        "SELECT token_hash, roles, revoked FROM devices WHERE device_fp = ?",
+        (device_fp,),
+    ).fetchone()
+    conn.close()
+    if row is None:
+        return None
+    token_hash, roles, revoked = row
+    return {
+        "device_fp": device_fp,
+        "token_hash": token_hash,
+        "roles": roles,
+        "revoked": bool(revoked),
+    }
+
+
+def set_device_revoked(device_fp: str, revoked: bool = True) -> bool:
+    """
+    Returns False if the device is not in the registry.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        UPDATE devices
+        SET revoked = ?, last_update = CURRENT_TIMESTAMP
+        WHERE device_fp = ?
+        """,
+        (int(revoked), device_fp),
+    )
+    changed = cur.rowcount > 0
+    conn.commit()
+    conn.close()
+    return changed
+
+
+def list_devices() -> List[Dict[str, Any]]:
+    conn = get_connection()
+    cur = conn.cursor()
+    rows = cur.execute(
+        "SELECT device_fp, roles, revoked, created_at FROM devices ORDER BY device_fp"
+    ).fetchall()
+    conn.close()
+    return [
+        {"device_fp": fp, "roles": roles, "revoked": bool(revoked), "created_at": created_at}
+        for fp, roles, revoked, created_at in rows
+    ]
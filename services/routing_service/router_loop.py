@@ -1,37 +1,53 @@
 # services/routing_service/router_loop.py
-# drains the SQLite queue and forwards messages to the BLE adapter with TTL + retry logic.
+# drains the SQLite queue and hands messages to the BLE adapter per the routing strategy, with TTL + retry logic.
 
 from __future__ import annotations
 import random
 import asyncio
 import json
+import time
 from datetime import datetime, timezone
-from math import pow
+from math import isfinite, pow
+from typing import Dict, List, Optional, Tuple
 
 import httpx
 
-from .config_loader import ROUTING_CFG
+from .config_loader import RoutingConfig, current as current_config
 from lib.envelope import MessageEnvelope
-from lib.utils import validate_ttl
+from lib.utils import current_unix_ts, validate_ttl
 from lib.auth import DEVICE_FP_HEADER, DEVICE_TOKEN_HEADER
 
-from .router_db import get_outgoing, mark_delivered, mark_dropped, increment_retry
-
-BLE_ADAPTER_URL = ROUTING_CFG.get(
-    "ble_adapter_url", "http://localhost:7003/v1/ble/send_chunk"
+from .router_db import (
+    PRIORITY_RANK,
+    get_outgoing,
+    handed_out,
+    increment_retry,
+    mark_delivered,
+    mark_dropped,
+    record_handoffs,
 )
+from . import duty_cycle, strategies
+from .adapter_pool import POOL, Adapter
+from .circuit_breaker import BREAKERS, PROBE
+from .duty_cycle import RADIO, DutyCycle
+from .neighbor_table import NEIGHBORS
+from .path_digest import path_contains
+from .shaper import SHAPER
+from .summary_vector import PEER_SUMMARIES
+
+# BLE adapter endpoints, retry knobs and router → BLE credentials come from
+# the config snapshot, read once per pass so a reload applies to the next pass.
 
-MAX_RETRIES = ROUTING_CFG.get("max_retries", 5)
-BASE_BACKOFF_MS = ROUTING_CFG.get("base_retry_backoff_ms", 500)
+_perf = time.perf_counter
+_sleep = asyncio.sleep
 
-# Optional: simple auth from router → BLE (can be ignored by BLE if not enabled)
-BLE_DEVICE_FP = ROUTING_CFG.get("ble_device_fp", "DEV-BLE-ADAPTER")
-BLE_DEVICE_TOKEN = ROUTING_CFG.get("ble_device_token", "dev-ble-token")
 
-BLE_AUTH_HEADERS = {
-    DEVICE_FP_HEADER: BLE_DEVICE_FP,
-    DEVICE_TOKEN_HEADER: BLE_DEVICE_TOKEN,
-}
+def _ble_auth_headers(cfg: RoutingConfig) -> dict:
+    # Optional: simple auth from router → BLE (can be ignored by BLE if not enabled)
+    return {
+        DEVICE_FP_HEADER: cfg.ble_device_fp,
+        DEVICE_TOKEN_HEADER: cfg.ble_device_token,
+    }
 
 
 def _parse_timestamp(ts: str) -> datetime:
@@ -39,9 +55,11 @@ def _parse_timestamp(ts: str) -> datetime:
     return datetime.fromisoformat(ts)
 
 
-def _should_retry(row: dict) -> bool:
+def _should_retry(row: dict, cfg: RoutingConfig, scale: float = 1.0, max_backoff_ms: float = 60_000) -> bool:
     """
-    Exponential backoff based on retries + last_update.
+    Exponential backoff based on retries + last_update, stretched by
+    `scale` (BREAKERS.backoff_factor: the recent failure rate towards the
+    hand-off's target).
     """
     retries = row["retries"]
     last_update = _parse_timestamp(row["last_update"])
@@ -49,10 +67,10 @@ def _should_retry(row: dict) -> bool:
     if retries == 0:
         return True
 
-    backoff_ms = BASE_BACKOFF_MS * pow(2, retries - 1)
+    backoff_ms = min(cfg.base_retry_backoff_ms * pow(2, retries - 1) * scale, max_backoff_ms)
 
     # Add jitter from config
-    jitter = ROUTING_CFG.get("retry_jitter_ms", 0)
+    jitter = cfg.retry_jitter_ms
     if jitter > 0:
         backoff_ms += random.randint(0, jitter)
 
@@ -63,80 +81,399 @@ def _should_retry(row: dict) -> bool:
     return elapsed_ms >= backoff_ms
 
 
+def _next_hop_envelope(row: dict, cfg: RoutingConfig) -> Optional[MessageEnvelope]:
+    """
+    Envelope to transmit for a queue row, with ttl / hop_count already
+    advanced for the hop; None (and the row marked dropped) if it must not
+    be sent again.
+    """
+    row_id = row["row_id"]
+    try:
+        envelope = MessageEnvelope.parse_raw(row["envelope_json"])
+    except Exception as e:
+        print(f"[Routing] invalid envelope JSON for row {row_id}: {e}")
+        mark_dropped(row_id, reason="invalid_envelope")
+        return None
+
+    ttl = envelope.header.ttl
+
+    # TTL guard (defense in depth + consistency with validate_ttl)
+    if ttl is None or ttl <= 0:
+        print(f"[Routing] dropping msg {envelope.header.msg_id}: TTL <= 0")
+        mark_dropped(row_id, reason="ttl_expired")
+        return None
+
+    try:
+        validate_ttl(ttl)
+    except ValueError as exc:
+        print(
+            f"[Routing] dropping msg {envelope.header.msg_id}: invalid TTL ({exc})"
+        )
+        mark_dropped(row_id, reason="ttl_invalid")
+        return None
+
+    # rows can wait for a contact (spray-and-wait, PRoPHET); once too old
+    # every receiver would drop them anyway
+    if current_unix_ts() - envelope.header.ts > cfg.max_age:
+        print(f"[Routing] dropping msg {envelope.header.msg_id}: too old")
+        mark_dropped(row_id, reason="expired")
+        return None
+
+    if row["retries"] >= cfg.max_retries:
+        print(
+            f"[Routing] dropping msg {envelope.header.msg_id}: max_retries exceeded"
+        )
+        mark_dropped(row_id, reason="max_retries")
+        return None
+
+    # Update TTL + hop count before forwarding
+    envelope.header.ttl -= 1
+    envelope.header.hop_count += 1
+    return envelope
+
+
+def next_hop_for(envelope: MessageEnvelope) -> Optional[str]:
+    """
+    Neighbor to hand the envelope to, skipping neighbors already on its
+    path; None if no route is known (the BLE adapter broadcasts). ACKs
+    are always broadcast so every router holding a replica hears them.
+    """
+    if envelope.routing.ack_for:
+        return None
+    path = envelope.routing.path
+    exclude = (lambda n: path_contains(path, n)) if path else None
+    return NEIGHBORS.next_hop(envelope.header.recipient_fp, exclude=exclude)
+
+
+class _Attempt:
+    """
+    One due queue row in a pass: its envelope, the strategy's hand-offs and
+    whether each hand-off went out (None: not attempted, e.g. the
+    target's circuit breaker is open).
+    """
+
+    __slots__ = ("row", "envelope", "plan", "ok")
+
+    def __init__(self, row: dict, envelope: MessageEnvelope, plan: List[Tuple[Optional[str], int]]) -> None:
+        self.row = row
+        self.envelope = envelope
+        self.plan = plan
+        self.ok: List[Optional[bool]] = [None] * len(plan)
+
+
 async def process_outgoing_queue() -> None:
+    """
+    One pass over the due rows: plan every row's hand-offs first, then
+    send them grouped by target, several envelopes per BLE transmission
+    (bundles of at most bundling.max_items envelopes and max_envelope_bytes
+    serialized bytes), then settle each row. Outside a duty-cycle window
+    only high-priority rows go out. Targets whose circuit breaker is open
+    are skipped; a half-open one gets a single envelope as a probe. With
+    shaping enabled each transmission first waits for SHAPER's token
+    buckets, at most shaping.max_wait_ms per pass; what does not fit is
+    left for the next pass. Each target is assigned to one of the BLE
+    adapters (POOL) and the adapters are drained in parallel.
+    """
     rows = get_outgoing()
     if not rows:
         return
 
-    async with httpx.AsyncClient() as client:
-        for row in rows:
-            if not _should_retry(row):
-                continue
+    cfg = current_config()
+    headers = _ble_auth_headers(cfg)
+    strategy = strategies.configure(cfg.strategy)
+    NEIGHBORS.configure(cfg.neighbors)
+    PEER_SUMMARIES.configure(cfg.summary)
+    contacts = NEIGHBORS.live_neighbors()
+    handed = handed_out([row["msg_id"] for row in rows])
+    duty = DutyCycle.from_config(cfg.duty_cycle)
+    window_open = duty.is_open(duty_cycle._now())
+    failure_scale = cfg.circuit_breaker.backoff_failure_scale
+    max_backoff_ms = cfg.circuit_breaker.max_backoff_ms
+    if cfg.shaping.enabled:
+        SHAPER.configure(cfg.shaping)
+    POOL.configure(cfg.ble_adapter_endpoints, cfg.ble_adapters)
 
-            row_id = row["row_id"]
-            env_json = row["envelope_json"]
+    attempts = []
+    # target -> [(attempt, hand-off index, envelope JSON)], in queue order
+    sends: Dict[Optional[str], list] = {}
+    for row in rows:
+        if not window_open and row["priority"] > PRIORITY_RANK["high"]:
+            # held for the next transmission window
+            continue
+        # not due even on the base schedule (backoff_factor is >= 1)
+        if not _should_retry(row, cfg, 1.0, max_backoff_ms):
+            continue
 
-            try:
-                envelope = MessageEnvelope.parse_raw(env_json)
-            except Exception as e:
-                print(f"[Routing] invalid envelope JSON for row {row_id}: {e}")
-                mark_dropped(row_id, reason="invalid_envelope")
-                continue
-
-            ttl = envelope.header.ttl
+        envelope = _next_hop_envelope(row, cfg)
+        if envelope is None:
+            continue
 
-            # TTL guard (defense in depth + consistency with validate_ttl)
-            if ttl is None or ttl <= 0:
-                print(f"[Routing] dropping msg {envelope.header.msg_id}: TTL <= 0")
-                mark_dropped(row_id, reason="ttl_expired")
+        msg_id = envelope.header.msg_id
+        if envelope.routing.ack_for:
+            # ACKs are flooded once, whatever the strategy
+            plan = [(None, 1)]
+        else:
+            # neighbors whose summary vector lists the message already have it
+            held = PEER_SUMMARIES.holders(msg_id, contacts)
+            plan = strategy.handoffs(envelope, row["copies"], contacts, handed.get(msg_id, set()) | held)
+            if not plan:
+                # waiting for a better contact; not a failed attempt
                 continue
-
-            try:
-                validate_ttl(ttl)
-            except ValueError as exc:
-                print(
-                    f"[Routing] dropping msg {envelope.header.msg_id}: invalid TTL ({exc})"
-                )
-                mark_dropped(row_id, reason="ttl_invalid")
+        if row["retries"]:
+            # hand-offs towards failing targets (or through a failing
+            # adapter) back off harder; the others go out on schedule
+            plan = [
+                (target, n) for target, n in plan
+                if _should_retry(row, cfg, BREAKERS.backoff_factor(failure_scale, target), max_backoff_ms)
+            ]
+            if not plan:
                 continue
 
-            if row["retries"] >= MAX_RETRIES:
-                print(
-                    f"[Routing] dropping msg {envelope.header.msg_id}: max_retries exceeded"
-                )
-                mark_dropped(row_id, reason="max_retries")
+        attempt = _Attempt(row, envelope, plan)
+        attempts.append(attempt)
+        for i, (target, n) in enumerate(plan):
+            if PEER_SUMMARIES.covers(target, msg_id, contacts):
+                # not sent and not counted as delivered: a Bloom false
+                # positive must not drop the message. The row stays queued
+                # until the summary expires or the target changes.
                 continue
+            envelope.routing.copies = n
+            sends.setdefault(target, []).append((attempt, i, envelope.model_dump_json()))
+
+    max_items = cfg.bundling.max_items if cfg.bundling.enabled else 1
+    async with httpx.AsyncClient() as client:
+        await _check_adapters(client)
+        # adapter url -> (adapter, [(target, bundles)])
+        work: Dict[str, Tuple[Adapter, list]] = {}
+        for target, items in sends.items():
+            bundles = list(_bundles(items, cfg.max_envelope_bytes, max_items))
+            adapter = POOL.pick(target)
+            POOL.assign(adapter, len(bundles))
+            work.setdefault(adapter.url, (adapter, []))[1].append((target, bundles))
+        await asyncio.gather(*(
+            _drain(client, cfg, headers, duty, adapter, queue) for adapter, queue in work.values()
+        ))
+
+    for attempt in attempts:
+        _settle(attempt, strategy)
+
+
+async def _drain(
+    client: httpx.AsyncClient,
+    cfg: RoutingConfig,
+    headers: dict,
+    duty: DutyCycle,
+    adapter: Adapter,
+    queue: list,
+) -> None:
+    """
+    Send one adapter's share of a pass, target after target, through the
+    circuit breakers and the shaper; records each hand-off's outcome on
+    its attempt.
+    """
+    breakers_on = cfg.circuit_breaker.enabled
+    shaping_on = cfg.shaping.enabled
+    wait_budget = cfg.shaping.max_wait_ms / 1000.0
+    for target, bundles in queue:
+        sent = 0
+        try:
+            for bundle in bundles:
+                wait = 0.0
+                if shaping_on:
+                    wait = SHAPER.delay(target, sum(len(item[2]) for item in bundle), len(bundle))
+                    if wait > wait_budget:
+                        # over the link's rate: the rest waits for the next pass
+                        SHAPER.defer(wait)
+                        break
+                if breakers_on:
+                    admitted = BREAKERS.acquire(target)
+                    if admitted is None:
+                        # open: left in the queue, retry count untouched
+                        continue
+                    if admitted == PROBE:
+                        bundle = bundle[:1]
+                chunks = [item[2] for item in bundle]
+                if shaping_on:
+                    if wait > 0:
+                        await _sleep(wait)
+                        wait_budget -= wait
+                    SHAPER.take(target, sum(len(chunk) for chunk in chunks), len(chunks), wait)
+                sent += 1
+                ok = await _send(client, cfg, headers, chunks, target, duty, adapter)
+                for attempt, i, _ in bundle:
+                    attempt.ok[i] = ok
+        finally:
+            POOL.release(adapter, len(bundles) - sent)
+
+
+async def _check_adapters(client: httpx.AsyncClient) -> None:
+    """Health-check the adapters out of rotation that are due for it."""
+    for adapter in POOL.due_checks():
+        try:
+            resp = await client.get(adapter.health_url, timeout=2.0)
+            ok = resp.status_code < 500
+        except Exception:
+            ok = False
+        POOL.health_result(adapter, ok)
+
+
+def _bundles(items: list, max_bytes: int, max_items: int):
+    """
+    Split one target's (attempt, index, envelope JSON) list into bundles,
+    in order. An envelope larger than max_bytes on its own goes alone.
+    """
+    bundle: list = []
+    size = 2
+    for item in items:
+        item_size = len(item[2]) + 1
+        if bundle and (size + item_size > max_bytes or len(bundle) >= max_items):
+            yield bundle
+            bundle, size = [], 2
+        bundle.append(item)
+        size += item_size
+    if bundle:
+        yield bundle
+
+
+def _settle(attempt: _Attempt, strategy: strategies.RoutingStrategy) -> None:
+    row_id = attempt.row["row_id"]
+    envelope = attempt.envelope
+    msg_id = envelope.header.msg_id
+    if envelope.routing.ack_for:
+        if attempt.ok[0]:
+            mark_delivered(row_id)
+        elif attempt.ok[0] is False:
+            increment_retry(row_id)
+        return
+
+    copies = attempt.row["copies"]
+    given = []
+    delivered = False
+    failed = False
+    for (target, n), ok in zip(attempt.plan, attempt.ok):
+        if ok:
+            given.append((target, n))
+            copies = strategy.after_handoff(copies, n)
+            delivered = delivered or target == envelope.header.recipient_fp
+        elif ok is False:
+            failed = True
+
+    if given:
+        record_handoffs(row_id, msg_id, given, copies)
+    if strategy.done(copies, delivered):
+        print(f"[Routing] delivered msg {msg_id}")
+        mark_delivered(row_id)
+    elif failed:
+        increment_retry(row_id)
+
+
+async def _send(
+    client: httpx.AsyncClient,
+    cfg: RoutingConfig,
+    headers: dict,
+    chunks: List[str],
+    target: Optional[str],
+    duty: DutyCycle,
+    holder: Adapter,
+) -> bool:
+    """
+    One transmission through a BLE adapter (target None = broadcast):
+    a single envelope as "chunk", several as one "bundle". It goes to the
+    target's adapter in POOL; if that one does not answer, it is resent
+    through the next adapter until one answers or none is left. `holder`
+    is the adapter the transmission was assigned to (counted as
+    outstanding there); the count follows it to whichever adapter carries
+    it and is released when it finishes. The outcome also feeds the
+    neighbor table, the circuit breakers and the shaper (with the
+    adapter's estimate_ms); the time it took goes to RADIO.
+    """
+    if len(chunks) == 1:
+        body = {"chunk": json.loads(chunks[0]), "target_peer": target}
+        what = f"msg {body['chunk']['header']['msg_id']}"
+    else:
+        body = {"bundle": [json.loads(chunk) for chunk in chunks], "target_peer": target}
+        what = f"bundle of {len(chunks)}"
+    ok = False
+    status = None
+    estimate_ms = None
+    started = _perf()
+    tried = []
+    adapter = POOL.pick(target)
+    while adapter is not None:
+        if adapter is not holder:
+            POOL.transfer(holder, adapter)
+            holder = adapter
+        try:
+            resp = await client.post(
+                adapter.url,
+                json=body,
+                headers=headers,
+                timeout=5.0,
+            )
+            status = resp.status_code
+            if status == 200:
+                ok = True
+                estimate_ms = _estimate_ms(resp)
+            else:
+                print(f"[Routing] BLE error {resp.status_code} for {what}: {resp.text}")
+        except Exception as e:
+            print(f"[Routing] exception sending {what}: {e}")
+        POOL.record(adapter, status is not None)
+        if status is not None:
+            break
+        tried.append(adapter.url)
+        adapter = POOL.pick(target, exclude=tried)
+        if adapter is not None:
+            POOL.failed_over()
+            print(f"[Routing] failing over {what} to BLE adapter {adapter.url}")
+    POOL.release(holder)
+
+    RADIO.record(duty_cycle._now(), _perf() - started, len(chunks), duty)
+    BREAKERS.record(target, ok, adapter_ok=status is not None)
+    SHAPER.feedback(target, status, estimate_ms)
+    if target is not None:
+        NEIGHBORS.record_outcome(target, ok)
+    return ok
+
+
+def _estimate_ms(resp: httpx.Response) -> Optional[float]:
+    """
+    The adapter's estimate_ms (time until the transmission leaves the
+    radio); None if the body has none or it is not a finite number >= 0.
+    """
+    try:
+        value = float(resp.json().get("estimate_ms"))
+    except (TypeError, ValueError, AttributeError, OverflowError):
+        return None
+    return value if isfinite(value) and value >= 0 else None
+
 
-            # Update TTL + hop count before forwarding
-            envelope.header.ttl -= 1
-            envelope.header.hop_count += 1
-
-            try:
-                resp = await client.post(
-                    BLE_ADAPTER_URL,
-                    json={"chunk": json.loads(envelope.json())},
-                    headers=BLE_AUTH_HEADERS,
-                    timeout=5.0,
-                )
-                if resp.status_code == 200:
-                    print(f"[Routing] delivered msg {envelope.header.msg_id}")
-                    mark_delivered(row_id)
-                else:
-                    print(
-                        f"[Routing] BLE error {resp.status_code} "
-                        f"for {envelope.header.msg_id}: {resp.text}"
-                    )
-                    increment_retry(row_id)
-
-            except Exception as e:
-                print(f"[Routing] exception sending msg {envelope.header.msg_id}: {e}")
-                increment_retry(row_id)
+def tx_stats() -> dict:
+    """BLE transmissions so far, the envelopes they carried and radio time per window."""
+    return RADIO.stats()
 
 
 async def routing_loop(interval_seconds: float = 2.0):
     """
-    Background loop polling the routing queue.
+    Background loop polling the routing queue. With duty cycling it wakes
+    at the start of the next window rather than up to one tick late; when
+    shaping left transmissions for later, it wakes as soon as they fit.
+    A failing pass is logged and the loop carries on with the next one.
     """
     while True:
-        await process_outgoing_queue()
-        await asyncio.sleep(interval_seconds)
+        try:
+            await process_outgoing_queue()
+        except Exception as e:
+            print(f"[Routing] routing pass failed: {e!r}")
+        delay = interval_seconds
+        try:
+            duty = DutyCycle.from_config(current_config().duty_cycle)
+            wait = duty.seconds_until_open(duty_cycle._now())
+            if wait > 0:
+                delay = min(delay, wait)
+            resume = SHAPER.resume_in()
+            if resume is not None:
+                delay = min(delay, resume)
+        except Exception as e:
+            print(f"[Routing] could not compute the next wake-up, sleeping {interval_seconds}s: {e!r}")
+        await _sleep(delay)
@@ -3,30 +3,74 @@
 
 from __future__ import annotations
 import os
-import asyncio
 import json
+import asyncio
+import sqlite3
 from pathlib import Path
 from typing import Optional
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Request, Depends
-
-from .config_loader import ROUTING_CFG
-from lib.envelope import MessageEnvelope
-from lib.errors import http_error, ErrorCode
-from lib.auth import DEVICE_FP_HEADER, DEVICE_TOKEN_HEADER, verify_api_token
+from fastapi import FastAPI, Request, Depends, HTTPException, WebSocket, WebSocketDisconnect, status
+from starlette.concurrency import run_in_threadpool
+
+from .config_loader import (
+    RoutingConfig,
+    current as current_config,
+    install_sighup_handler,
+    watch_config,
+)
+from lib.envelope import EnvelopeHeader, MessageEnvelope, RoutingMeta
+from lib.errors import http_error, make_error, ErrorCode
+from lib.auth import DEVICE_FP_HEADER, DEVICE_TOKEN_HEADER
 from lib.utils import hash_token, current_unix_ts, validate_ttl
 
-from .router_db import init_db, enqueue_message, get_outgoing, mark_delivered
-from .router_loop import routing_loop
-from .ids_module import is_rate_limited, is_duplicate, log_suspicious
+from .router_db import (
+    PRIORITY_RANK,
+    init_db,
+    enqueue_message,
+    enqueue_forwards,
+    deliver_local,
+    fetch_inbox,
+    get_outgoing,
+    cancel_acked,
+    known_msg_ids,
+    mark_delivered,
+)
+from .path_digest import path_add, path_contains
+from .device_registry import DeviceRegistry
+from .neighbor_table import NEIGHBORS
+from .summary_vector import PEER_SUMMARIES, SummaryVector
+from .circuit_breaker import BREAKERS
+from .shaper import SHAPER
+from .adapter_pool import POOL
+from . import strategies
+from .router_loop import next_hop_for, routing_loop, tx_stats
+from .ids_module import (
+    is_rate_limited,
+    is_duplicate,
+    is_duplicate_many,
+    forget_duplicates,
+    is_rate_limited_many,
+    log_suspicious,
+    ids_memory_stats,
+    event_log_stats,
+    flush_event_log,
+    close_event_log,
+    anonymize_peer,
+    ids_metrics_snapshot,
+    observe_traffic,
+    scoring_enabled,
+    scoring_loop,
+    snapshot_enabled,
+    load_state_snapshot,
+    save_state_snapshot,
+    snapshot_loop,
+)
+from .ids_log_index import query_log
 
 IDS_LOG_PATH = Path("routing_suspicious.log")
 DEBUG_MODE = os.getenv("ROUTER_DEBUG", "1") == "1"
-
-# Size limits (bytes / characters) – protects against oversized messages
-MAX_ENVELOPE_BYTES = ROUTING_CFG.get("max_envelope_bytes", 16_384)
-MAX_CIPHERTEXT_BYTES = ROUTING_CFG.get("max_ciphertext_bytes", 16_384)
+MAX_IDS_LOG_PAGE = 1000
 
 app = FastAPI()
 
@@ -49,19 +93,32 @@ DEV_DEVICES = {
     }
 }
 
+# Registered devices (SQLite) with a verification cache in front; DEV_DEVICES
+# are only used for fingerprints that have no registry row. The cache
+# settings follow config reloads (see _verify_device).
+DEVICES = DeviceRegistry.from_config(current_config().auth, static_devices=DEV_DEVICES)
+
 
 def _base_auth(request: Request) -> str:
     """
-    Core device auth: verify headers + token.
+    Core device auth: verify headers + token against the device registry.
 
     Global auth-level rate limiting is applied only to *failed* attempts,
     so normal traffic with valid credentials is not throttled.
+    The device's roles are left on request.state.device_roles.
     """
-    client_ip = request.client.host or "unknown"
-    bucket = f"auth:{client_ip}"
-
     device_fp = request.headers.get(DEVICE_FP_HEADER)
     token = request.headers.get(DEVICE_TOKEN_HEADER)
+    request.state.device_roles = _verify_device(device_fp, token, request.client.host)
+    return device_fp
+
+
+def _verify_device(device_fp: Optional[str], token: Optional[str], client_ip: Optional[str]):
+    """
+    Check device credentials (HTTP headers or WebSocket handshake) and
+    return the device's roles; raises 401 / 429 http_error otherwise.
+    """
+    bucket = f"auth:{client_ip or 'unknown'}"
 
     # --- Missing headers → failed auth attempt ---
     if not device_fp or not token:
@@ -80,8 +137,9 @@ def _base_auth(request: Request) -> str:
             retryable=False,
         )
 
-    dev_info = DEV_DEVICES.get(device_fp)
-    if not dev_info or not verify_api_token(token, dev_info["token_hash"]):
+    DEVICES.configure(current_config().auth)
+    roles = DEVICES.verify(device_fp, token)
+    if roles is None:
         # Invalid credentials → also count as failed attempt
         if is_rate_limited(bucket):
             raise http_error(
@@ -98,7 +156,7 @@ def _base_auth(request: Request) -> str:
         )
 
     # Success path – valid credentials, no auth rate limiting applied
-    return device_fp
+    return roles
 
 
 def require_device_auth(request: Request) -> str:
@@ -115,12 +173,10 @@ def require_device_auth_role(role: str):
     """
     async def _dep(request: Request) -> str:
         device_fp = _base_auth(request)
-        dev_info = DEV_DEVICES.get(device_fp) or {}
-        roles = dev_info.get("roles", set())
-        if role not in roles:
+        if role not in request.state.device_roles:
             raise http_error(
                 status_code=403,
-                code=ErrorCode.FORBIDDEN,
+                code=ErrorCode.UNAUTHORIZED,
                 detail=f"Device missing required role: {role}",
                 retryable=False,
             )
@@ -133,12 +189,9 @@ def require_device_auth_role(role: str):
 # Timestamp helper (shared between enqueue + BLE ingress)
 # ---------------------------------------------------------------------------
 
-# Hard safety caps to prevent misconfiguration from disabling freshness checks.
-_HARD_MAX_SKEW = 3600        # 1 hour
-_HARD_MAX_AGE = 24 * 3600    # 24 hours
-
-
-def _validate_timestamp_or_raise(msg_ts: int, peer: str, msg_id: str) -> None:
+def _validate_timestamp_or_raise(
+    msg_ts: int, peer: str, msg_id: str, cfg: Optional[RoutingConfig] = None
+) -> None:
     """
     Enforce timestamp freshness with sane upper bounds.
 
@@ -147,11 +200,10 @@ def _validate_timestamp_or_raise(msg_ts: int, peer: str, msg_id: str) -> None:
     """
     now = current_unix_ts()
 
-    cfg_skew = ROUTING_CFG.get("max_ts_skew_seconds", 300)      # default 5 min
-    cfg_age = ROUTING_CFG.get("max_msg_age_seconds", 3600)      # default 1 hour
-
-    max_skew = min(max(cfg_skew, 0), _HARD_MAX_SKEW)
-    max_age = min(max(cfg_age, 0), _HARD_MAX_AGE)
+    # limits are already clamped to the hard caps in config_loader
+    cfg = cfg or current_config()
+    max_skew = cfg.max_skew
+    max_age = cfg.max_age
 
     # Reject timestamps far in the future (likely clock or attack)
     if msg_ts - now > max_skew:
@@ -197,9 +249,25 @@ async def lifespan(app: FastAPI):
     Runs once when the app starts.
     """
     init_db()
+    ids_cfg = current_config().ids
+    if snapshot_enabled():
+        # warm restart: remember recent msg_ids, limiter state and blocks
+        load_state_snapshot()
+        asyncio.create_task(snapshot_loop(ids_cfg.snapshot.get("interval_seconds", 30)))
     asyncio.create_task(routing_loop(interval_seconds=2.0))
+    if scoring_enabled():
+        asyncio.create_task(scoring_loop(ids_cfg.scoring.get("tick_seconds", 1.0)))
+    # hot reload: config file changes and SIGHUP swap in a new config snapshot
+    asyncio.create_task(watch_config())
+    install_sighup_handler()
     yield
-    # optional: add shutdown cleanup here if needed
+    # write out queued IDS events (and IDS state) before the process exits
+    close_event_log()
+    if snapshot_enabled():
+        try:
+            save_state_snapshot()
+        except OSError as exc:
+            print(f"[IDS] state snapshot failed: {exc}")
 
 
 app = FastAPI(lifespan=lifespan)
@@ -223,9 +291,10 @@ def api_enqueue(
     msg_id = envelope.header.msg_id
     ttl = envelope.header.ttl
 
-    ttl_min = ROUTING_CFG.get("ttl_min", 1)
-    ttl_default = ROUTING_CFG.get("ttl_default", 4)
-    ttl_max = ROUTING_CFG.get("max_ttl", 8)
+    cfg = current_config()
+    ttl_min = cfg.ttl_min
+    ttl_default = cfg.ttl_default
+    ttl_max = cfg.max_ttl
 
     if ttl is None:
         ttl = ttl_default
@@ -253,7 +322,7 @@ def api_enqueue(
     # Timestamp freshness
     msg_ts = envelope.header.ts
     try:
-        _validate_timestamp_or_raise(msg_ts, envelope.header.sender_fp, msg_id)
+        _validate_timestamp_or_raise(msg_ts, envelope.header.sender_fp, msg_id, cfg)
     except Exception as exc:
         # Special handling for "too old" pseudo-error from _validate_timestamp_or_raise
         # We treat this as a logical drop, not HTTP failure.
@@ -262,12 +331,16 @@ def api_enqueue(
         raise
 
     envelope.header.ttl = ttl
+    if cfg.node_fp:
+        # the origin is on the path too, so a copy looping back is dropped
+        envelope.routing.path = path_add(envelope.routing.path, cfg.node_fp)
 
     # Enforce size limits before touching the DB
     envelope_json = _check_envelope_size(
         envelope=envelope,
         peer=envelope.header.sender_fp,
         msg_id=msg_id,
+        cfg=cfg,
     )
 
     try:
@@ -278,6 +351,8 @@ def api_enqueue(
             ttl=ttl,
             sender_fp=envelope.header.sender_fp,
             recipient_fp=envelope.header.recipient_fp,
+            copies=strategies.configure(cfg.strategy).initial_copies(),
+            priority=PRIORITY_RANK.get(envelope.routing.priority, 1),
         )
     except Exception as e:
         raise http_error(
@@ -292,35 +367,53 @@ def api_enqueue(
 @app.get("/v1/router/outgoing_chunks")
 def api_outgoing(
     limit: Optional[int] = 50,
+    peer: Optional[str] = None,
     device_fp: str = Depends(require_device_auth_role("ble")),
 ):
     """
     Internal API for BLE adapter / router debugging.
 
+    With ?peer=<fingerprint>, messages that neighbor's summary vector
+    (POST /v1/router/summary) says it already holds are left out.
+
     Out:
       {
         "items": [
           {
             "chunk": "<ENVELOPE_JSON_STRING>",
-            "target_peer": "fingerprint-or-placeholder"
+            "target_peer": "neighbor fingerprint, or null to broadcast"
           },
           ...
         ]
       }
     """
-    rows = get_outgoing()[: limit or 50]
+    rows = get_outgoing()
+    if peer:
+        PEER_SUMMARIES.configure(current_config().summary)
+        rows = [row for row in rows if not PEER_SUMMARIES.has(peer, row["msg_id"])]
+    rows = rows[: limit or 50]
     items = []
     for row in rows:
         items.append(
             {
                 "chunk": row["envelope_json"],
-                # TODO: real peer selection logic later; placeholder for now
-                "target_peer": row["msg_id"],
+                "target_peer": _target_peer(row["envelope_json"]),
             }
         )
     return {"items": items}
 
 
+def _target_peer(envelope_json: str) -> Optional[str]:
+    """
+    Next hop from the neighbor table; None = no known route (broadcast).
+    """
+    try:
+        env = MessageEnvelope.model_validate_json(envelope_json)
+    except Exception:
+        return None
+    return next_hop_for(env)
+
+
 @app.post("/v1/router/mark_delivered")
 def api_mark(
     payload: dict,
@@ -348,6 +441,150 @@ def api_mark(
     return {"ok": True}
 
 
+@app.get("/v1/router/inbox")
+def api_inbox(
+    limit: Optional[int] = 50,
+    device_fp: str = Depends(require_device_auth_role("gateway")),
+):
+    """
+    Gateway fetches messages addressed to this node (node_fp). Each
+    message is returned once.
+
+    Out:
+      { "items": [ { "msg_id": "...", "chunk": "<ENVELOPE_JSON_STRING>", "received_at": "..." }, ... ] }
+    """
+    rows = fetch_inbox(max(1, min(limit or 50, 500)))
+    return {
+        "items": [
+            {"msg_id": row["msg_id"], "chunk": row["envelope_json"], "received_at": row["received_at"]}
+            for row in rows
+        ]
+    }
+
+
+@app.post("/v1/router/contact")
+def api_contact(
+    payload: dict,
+    device_fp: str = Depends(require_device_auth_role("ble")),
+):
+    """
+    BLE adapter reports an encounter with a neighbor router, with the
+    neighbor's delivery predictabilities if it sent them (PRoPHET).
+    Returns ours for the adapter to hand to the neighbor.
+
+    In:  { "neighbor": "fingerprint", "predictability": { "<dest>": 0.4, ... } }
+    Out: { "strategy": "prophet", "predictability": { ... } }
+
+    Errors:
+      - 400 INVALID_INPUT (no neighbor / predictability not an object)
+    """
+    neighbor = payload.get("neighbor")
+    vector = payload.get("predictability")
+    if not isinstance(neighbor, str) or not neighbor or (vector is not None and not isinstance(vector, dict)):
+        raise http_error(
+            status_code=400,
+            code=ErrorCode.INVALID_INPUT,
+            detail="neighbor required; predictability must be an object",
+            retryable=False,
+        )
+    strategy = strategies.configure(current_config().strategy)
+    strategy.on_contact(neighbor, vector)
+    return {"strategy": strategy.name, "predictability": strategy.vector()}
+
+
+@app.get("/v1/router/summary")
+def api_summary(
+    device_fp: str = Depends(require_device_auth_role("ble")),
+):
+    """
+    Summary vector of the messages this node holds (queue and inbox), for
+    the BLE adapter to hand to a neighbor before exchanging messages.
+
+    Out: { "node_fp": "...", "summary": { "bits", "hashes", "salt", "count", "filter" } }
+    """
+    cfg = current_config()
+    try:
+        msg_ids = known_msg_ids(cfg.summary.max_ids)
+    except sqlite3.Error as e:
+        raise http_error(
+            status_code=500,
+            code=ErrorCode.DB_ERROR,
+            detail=f"Failed to read queue: {e}",
+            retryable=True,
+        )
+    summary = SummaryVector.build(msg_ids, cfg.summary.fp_rate)
+    return {"node_fp": cfg.node_fp, "summary": summary.to_dict()}
+
+
+@app.post("/v1/router/summary")
+def api_neighbor_summary(
+    payload: dict,
+    device_fp: str = Depends(require_device_auth_role("ble")),
+):
+    """
+    BLE adapter hands over a neighbor's summary vector. Until it expires,
+    messages it contains are not sent to that neighbor.
+
+    In:  { "neighbor": "fingerprint", "summary": { ... as GET /v1/router/summary ... } }
+    Out: { "accepted": true, "to_send": <queued messages the neighbor lacks> }
+
+    Errors:
+      - 400 INVALID_INPUT (no neighbor / malformed summary)
+    """
+    neighbor = payload.get("neighbor")
+    try:
+        if not isinstance(neighbor, str) or not neighbor:
+            raise ValueError("neighbor required")
+        summary = SummaryVector.from_dict(payload.get("summary"))
+    except ValueError as exc:
+        raise http_error(
+            status_code=400,
+            code=ErrorCode.INVALID_INPUT,
+            detail=str(exc),
+            retryable=False,
+        )
+    PEER_SUMMARIES.configure(current_config().summary)
+    PEER_SUMMARIES.update(neighbor, summary)
+    return {
+        "accepted": True,
+        "to_send": sum(row["msg_id"] not in summary for row in get_outgoing()),
+    }
+
+
+@app.post("/v1/router/devices/revoke")
+def api_revoke_device(
+    payload: dict,
+    device_fp: str = Depends(require_device_auth_role("admin")),
+):
+    """
+    Admin: revoke a device's credentials. Cached logins for it stop
+    working immediately.
+
+    In:  { "device_fp": "..." }
+    Out: { "revoked": true }
+
+    Errors:
+      - 400 INVALID_INPUT (no device_fp)
+      - 404 NOT_FOUND (unknown device)
+    """
+    target = payload.get("device_fp")
+    if not target:
+        raise http_error(
+            status_code=400,
+            code=ErrorCode.INVALID_INPUT,
+            detail="device_fp required",
+            retryable=False,
+        )
+    if not DEVICES.revoke(target):
+        raise http_error(
+            status_code=404,
+            code=ErrorCode.NOT_FOUND,
+            detail="unknown device",
+            retryable=False,
+        )
+    return {"revoked": True}
+
+
 @app.post("/v1/router/on_chunk_received")
 def api_on_chunk_received(
     payload: dict,
@@ -365,11 +602,93 @@ def api_on_chunk_received(
     Out (normal):
       { "accepted": true|false, "action": "forward|drop|final" }
 
+    A bundle (several envelopes sent as one BLE transmission) comes as
+      { "bundle": [ <MessageEnvelope JSON>, ... ], "link_meta": {...} }
+    and gets one verdict per envelope, as on_chunks_received:
+      { "verdicts": [ { "msg_id": "...", "accepted": true, "action": "forward" }, ... ] }
+
+    "final" for chunks addressed to this node (stored in the inbox) or when
+    forwarding is disabled; "forward" once the chunk is queued for the next
+    hop. Drops the router decided on carry a "reason" (loop, ttl_exhausted,
+    duplicate, full).
+
+    A message delivered to this node is answered with an ACK envelope
+    (routing.ack_for = msg_id, no ciphertext), flooded back at high
+    priority. Every router an ACK passes cancels its queued copies of the
+    acknowledged message and drops late copies as duplicates.
+
     Error cases:
       - 400 INVALID_INPUT (bad envelope)
       - 410 TTL_EXPIRED (ttl <= 0)
       - 200 with accepted:false for DUPLICATE / RATE_LIMITED
     """
+    # one config snapshot for the whole request, even if a reload happens meanwhile
+    cfg = current_config()
+    if "bundle" in payload:
+        return {"verdicts": _ingest_bundle(payload, cfg)}
+    return _ingest_chunk(payload, cfg)
+
+
+def _ingest_bundle(payload: dict, cfg: RoutingConfig) -> list:
+    """
+    Unpack a bundle into batch items sharing its link_meta.
+    """
+    bundle = payload.get("bundle")
+    if not isinstance(bundle, list):
+        raise http_error(
+            status_code=400,
+            code=ErrorCode.INVALID_INPUT,
+            detail="bundle must be a list",
+            retryable=False,
+        )
+    max_items = cfg.ingress.max_batch_items
+    if len(bundle) > max_items:
+        raise http_error(
+            status_code=413,
+            code=ErrorCode.INVALID_INPUT,
+            detail=f"at most {max_items} envelopes per bundle",
+            retryable=False,
+        )
+    link_meta = payload.get("link_meta")
+    return _ingest_batch([{"chunk": chunk, "link_meta": link_meta} for chunk in bundle], cfg)
+
+
+def _ingest_chunk(payload: dict, cfg: RoutingConfig) -> dict:
+    """
+    Shared ingress core for one received chunk (HTTP and WebSocket).
+    Returns the verdict or raises http_error, exactly as on_chunk_received.
+    """
+    try:
+        env, peer, envelope_json = _check_chunk(payload, cfg)
+    except Exception as exc:
+        # "too old" is treated as logical drop, not HTTP error
+        if getattr(exc, "status_code", None) == 200:
+            return {"accepted": False, "action": "drop"}
+        raise
+    msg_id = env.header.msg_id
+    NEIGHBORS.configure(cfg.neighbors)
+    NEIGHBORS.observe_many([_link_observation(payload, env)])
+
+    # Duplicate detection – now ALWAYS enforced, not controlled by env.routing.dup_suppress
+    if is_duplicate(msg_id):
+        log_suspicious("DUPLICATE", peer, msg_id, "duplicate msg_id seen")
+        # Not an HTTP error – this is expected behavior, we just tell BLE "drop it"
+        return {"accepted": False, "action": "drop"}
+
+    # Fixed-memory sketches catch floods spread over many identities
+    observe_traffic(peer, env.header.recipient_fp, msg_id, size=len(envelope_json))
+
+    return _route_chunk(env, peer, is_rate_limited(peer), cfg)
+
+
+def _check_chunk(payload: dict, cfg: RoutingConfig):
+    """
+    Stateless ingress checks for one chunk: envelope parsing, timestamp
+    freshness, peer normalization, size and TTL limits.
+
+    Returns (envelope, peer, envelope_json). Raises http_error; a "too old"
+    message raises the status-200 MESSAGE_TOO_OLD error (a logical drop).
+    """
     link_meta = payload.get("link_meta") or {}
     peer = link_meta.get("peer", "unknown")
 
@@ -387,34 +706,36 @@ def api_on_chunk_received(
     msg_id = env.header.msg_id
 
     # Timestamp freshness (with hard caps)
-    try:
-        _validate_timestamp_or_raise(env.header.ts, peer, msg_id)
-    except Exception as exc:
-        # "too old" is treated as logical drop, not HTTP error
-        if isinstance(exc, Exception) and getattr(exc, "status_code", None) == 200:
-            return {"accepted": False, "action": "drop"}
-        raise
-
-    # Normalize peer identity for IDS: trust header.sender_fp over link_meta
+    _validate_timestamp_or_raise(env.header.ts, peer, msg_id, cfg)
+
+    # Normalize peer identity for IDS: trust header.sender_fp over link_meta.
+    # A relayed chunk legitimately comes from a neighbor that is not the
+    # sender; that neighbor put itself into the path digest when it queued
+    # the chunk, so a neighbor missing from the path is a mismatch whatever
+    # hop_count claims. Relays without a node_fp do not extend the path, so
+    # a claimed relay is logged as PEER_MISMATCH_RELAYED, which does not
+    # count towards blocking the neighbor.
     header_sender = env.header.sender_fp
     if peer == "unknown":
         peer = header_sender
     elif peer != header_sender:
         # Log mismatch and still normalize to header_sender
-        log_suspicious(
-            "PEER_MISMATCH",
-            peer,
-            msg_id,
-            "link_meta.peer != header.sender_fp",
-            extra={"header_sender": header_sender},
-        )
+        if not path_contains(env.routing.path, peer):
+            log_suspicious(
+                "PEER_MISMATCH" if env.header.hop_count <= 1 else "PEER_MISMATCH_RELAYED",
+                peer,
+                msg_id,
+                "link_meta.peer != header.sender_fp",
+                extra={"header_sender": header_sender, "hop_count": env.header.hop_count},
+            )
         peer = header_sender
 
     # Enforce size limits on inbound envelopes from BLE
-    _check_envelope_size(
+    envelope_json = _check_envelope_size(
         envelope=env,
         peer=peer,
         msg_id=msg_id,
+        cfg=cfg,
     )
 
     # TTL guard on ingress (defense in depth with router TTL checks)
@@ -429,8 +750,8 @@ def api_on_chunk_received(
 
     # Enforce TTL bounds (defensive, fail-closed) with same config as enqueue
     ttl = env.header.ttl
-    ttl_min = ROUTING_CFG.get("ttl_min", 1)
-    ttl_max = ROUTING_CFG.get("max_ttl", 8)
+    ttl_min = cfg.ttl_min
+    ttl_max = cfg.max_ttl
 
     if ttl < ttl_min or ttl > ttl_max:
         log_suspicious(
@@ -457,26 +778,361 @@ def api_on_chunk_received(
             retryable=False,
         )
 
+    return env, peer, envelope_json
 
-    # Duplicate detection – now ALWAYS enforced, not controlled by env.routing.dup_suppress
-    if is_duplicate(msg_id):
-        log_suspicious("DUPLICATE", peer, msg_id, "duplicate msg_id seen")
-        # Not an HTTP error – this is expected behavior, we just tell BLE "drop it"
-        return {"accepted": False, "action": "drop"}
 
-    # Rate limiting per peer
-    if is_rate_limited(peer):
-        log_suspicious("RATE_LIMIT", peer, msg_id, "per-peer rate limit exceeded")
-        # Again, logical drop, not an HTTP failure
-        return {"accepted": False, "action": "drop"}
+def _link_observation(payload: dict, env: MessageEnvelope) -> tuple:
+    # raw link_meta (not the normalized IDS peer): which neighbor we heard
+    # it from, how well, and how far away the sender is through it
+    link_meta = payload.get("link_meta") or {}
+    return (link_meta.get("peer"), link_meta.get("rssi"), env.header.sender_fp, env.header.hop_count)
+
+
+def _route_chunk(env: MessageEnvelope, peer: str, rate_limited: bool, cfg: RoutingConfig) -> dict:
+    """
+    Verdict for a chunk that passed the checks and dedup.
+    """
+    return _route_chunks([(env, peer, rate_limited)], cfg)[0]
+
 
-    # Phase-1 behavior: final delivery to this node only.
-    # Phase-2 multi-hop behavior with one config flag.
-    # Phase-2/3 could enqueue for multi-hop forwarding.
-    if ROUTING_CFG.get("forwarding_enabled", False):
-        return {"accepted": True, "action": "forward"}
-    else:
-        return {"accepted": True, "action": "final"}
+def _route_chunks(chunks: list, cfg: RoutingConfig) -> list:
+    """
+    Verdicts for chunks that passed the checks and dedup, given as
+    (envelope, peer, rate_limited). Local deliveries and forwards are each
+    written in one DB transaction.
+
+      - addressed to this node (cfg.node_fp) → inbox, "final", and an ACK
+        is queued for the sender
+      - an ACK cancels the queued copies of the acknowledged message; one
+        addressed to this node is "final" and not stored
+      - forwarding disabled → "final" (phase-1: this node is the last hop)
+      - otherwise → queued for the next hop, "forward"; the router loop
+        decrements ttl / increments hop_count when it transmits
+    """
+    strategy = strategies.configure(cfg.strategy)
+    verdicts: list = [None] * len(chunks)
+    local = []
+    forward = []
+    acked = []
+    for pos, (env, peer, rate_limited) in enumerate(chunks):
+        msg_id = env.header.msg_id
+        # Rate limiting per peer
+        if rate_limited:
+            log_suspicious("RATE_LIMIT", peer, msg_id, "per-peer rate limit exceeded")
+            # Again, logical drop, not an HTTP failure
+            verdicts[pos] = {"accepted": False, "action": "drop"}
+            continue
+        if env.routing.ack_for:
+            acked.append(env.routing.ack_for)
+        if cfg.node_fp and env.header.recipient_fp == cfg.node_fp:
+            if env.routing.ack_for:
+                verdicts[pos] = {"accepted": True, "action": "final"}
+            else:
+                local.append((pos, env))
+        elif not cfg.forwarding_enabled:
+            verdicts[pos] = {"accepted": True, "action": "final"}
+        elif env.header.ttl <= 1:
+            # the next hop would receive it with ttl 0 and reject it
+            verdicts[pos] = {"accepted": False, "action": "drop", "reason": "ttl_exhausted"}
+        elif cfg.node_fp and path_contains(env.routing.path, cfg.node_fp):
+            # came back around a loop after its msg_id left the dedup table
+            verdicts[pos] = {"accepted": False, "action": "drop", "reason": "loop"}
+        else:
+            if cfg.node_fp:
+                env.routing.path = path_add(env.routing.path, cfg.node_fp)
+            copies = strategy.accept_copies(env.routing.copies)
+            forward.append((pos, *_queue_item(env, copies)))
+
+    try:
+        if acked:
+            cancel_acked(acked)
+        if local:
+            stored = deliver_local([(env.header.msg_id, env.model_dump_json()) for _, env in local])
+            for (pos, env), new in zip(local, stored):
+                verdicts[pos] = (
+                    {"accepted": True, "action": "final"}
+                    if new else {"accepted": False, "action": "drop", "reason": "duplicate"}
+                )
+                if new and cfg.delivery_acks:
+                    ack = _delivery_ack(env, cfg)
+                    forward.append((None, *_queue_item(ack, ack.routing.copies)))
+        if forward:
+            results = enqueue_forwards([item[1:] for item in forward])
+            for (pos, *_), result in zip(forward, results):
+                if pos is None:
+                    continue
+                verdicts[pos] = (
+                    {"accepted": True, "action": "forward"}
+                    if result == "queued" else {"accepted": False, "action": "drop", "reason": result}
+                )
+    except sqlite3.Error as e:
+        # the sender retries; its retry must not be dropped as a duplicate
+        forget_duplicates([env.header.msg_id for env, _, _ in chunks])
+        raise http_error(
+            status_code=500,
+            code=ErrorCode.DB_ERROR,
+            detail=f"Failed to store received chunk: {e}",
+            retryable=True,
+        )
+    if acked:
+        # late copies of acknowledged messages now drop as duplicates
+        is_duplicate_many(acked)
+    return verdicts
+
+
+def _queue_item(env: MessageEnvelope, copies: int) -> tuple:
+    # (msg_id, envelope_json, ttl, copies, priority) for enqueue_forwards
+    return (
+        env.header.msg_id,
+        env.model_dump_json(),
+        env.header.ttl,
+        copies,
+        PRIORITY_RANK.get(env.routing.priority, 1),
+    )
+
+
+def _delivery_ack(env: MessageEnvelope, cfg: RoutingConfig) -> MessageEnvelope:
+    """
+    ACK for a message delivered here: msg_id only, addressed to its sender.
+    """
+    msg_id = env.header.msg_id
+    return MessageEnvelope(
+        header=EnvelopeHeader(
+            sender_fp=cfg.node_fp,
+            recipient_fp=env.header.sender_fp,
+            msg_id=f"ack:{msg_id}",
+            nonce="",
+            ttl=cfg.max_ttl,
+            ts=current_unix_ts(),
+        ),
+        ciphertext="",
+        routing=RoutingMeta(
+            priority="high",
+            path=path_add("", cfg.node_fp),
+            copies=strategies.configure(cfg.strategy).initial_copies(),
+            ack_for=msg_id,
+        ),
+    )
+
+
+@app.post("/v1/router/on_chunks_received")
+def api_on_chunks_received(
+    payload: dict,
+    device_fp: str = Depends(require_device_auth_role("ble")),
+):
+    """
+    Batch form of on_chunk_received, e.g. for chunks buffered while a BLE
+    link was down. Auth, dedup and rate-limiter locking are paid once per
+    batch instead of once per chunk.
+
+    In:
+      { "items": [ { "chunk": <MessageEnvelope JSON>, "link_meta": {...} }, ... ] }
+
+    Out (one verdict per item, same order):
+      { "verdicts": [
+          { "msg_id": "...", "accepted": true, "action": "final" },
+          { "msg_id": "...", "status": 400, "error": {...} },
+          ...
+      ] }
+
+    Each item gets the verdict on_chunk_received would give it (an item
+    repeated inside the batch is a duplicate). Item errors do not fail the
+    batch; they are reported with the HTTP status the single call returns.
+
+    Errors:
+      - 400 INVALID_INPUT (items missing / not a list)
+      - 413 INVALID_INPUT (more than ingress.max_batch_items items)
+    """
+    cfg = current_config()
+    items = payload.get("items")
+    if not isinstance(items, list):
+        raise http_error(
+            status_code=400,
+            code=ErrorCode.INVALID_INPUT,
+            detail="items must be a list",
+            retryable=False,
+        )
+    max_items = cfg.ingress.max_batch_items
+    if len(items) > max_items:
+        raise http_error(
+            status_code=413,
+            code=ErrorCode.INVALID_INPUT,
+            detail=f"at most {max_items} items per batch",
+            retryable=False,
+        )
+    return {"verdicts": _ingest_batch(items, cfg)}
+
+
+def _ingest_batch(items: list, cfg: RoutingConfig) -> list:
+    """
+    _ingest_chunk for many chunks: per-item checks first, then one batched
+    dedup pass and one batched rate-limit pass over the survivors.
+    """
+    verdicts: list = [None] * len(items)
+    checked = []
+    for pos, item in enumerate(items):
+        msg_id = _frame_msg_id(item)
+        try:
+            if not isinstance(item, dict):
+                raise http_error(400, ErrorCode.INVALID_INPUT, "invalid item", retryable=False)
+            env, peer, envelope_json = _check_chunk(item, cfg)
+        except HTTPException as exc:
+            if exc.status_code == 200:
+                verdicts[pos] = {"msg_id": msg_id, "accepted": False, "action": "drop"}
+            else:
+                verdicts[pos] = {"msg_id": msg_id, "status": exc.status_code, **exc.detail}
+            continue
+        checked.append((pos, env, peer, envelope_json))
+    NEIGHBORS.configure(cfg.neighbors)
+    NEIGHBORS.observe_many([_link_observation(items[pos], env) for pos, env, _, _ in checked])
+
+    fresh = []
+    duplicates = is_duplicate_many([env.header.msg_id for _, env, _, _ in checked])
+    for (pos, env, peer, envelope_json), duplicate in zip(checked, duplicates):
+        msg_id = env.header.msg_id
+        if duplicate:
+            log_suspicious("DUPLICATE", peer, msg_id, "duplicate msg_id seen")
+            verdicts[pos] = {"msg_id": msg_id, "accepted": False, "action": "drop"}
+            continue
+        observe_traffic(peer, env.header.recipient_fp, msg_id, size=len(envelope_json))
+        fresh.append((pos, env, peer))
+
+    limited = is_rate_limited_many([peer for _, _, peer in fresh])
+    routed = _route_chunks(
+        [(env, peer, rate_limited) for (_, env, peer), rate_limited in zip(fresh, limited)], cfg
+    )
+    for (pos, env, _), verdict in zip(fresh, routed):
+        verdicts[pos] = {"msg_id": env.header.msg_id, **verdict}
+    return verdicts
+
+
+def _chunk_verdict(payload: dict, cfg: RoutingConfig) -> dict:
+    """
+    _ingest_chunk with errors turned into a verdict: {msg_id, status, error}.
+    """
+    msg_id = _frame_msg_id(payload)
+    try:
+        result = _ingest_chunk(payload, cfg)
+    except HTTPException as exc:
+        return {"msg_id": msg_id, "status": exc.status_code, **exc.detail}
+    return {"msg_id": msg_id, **result}
+
+
+def _frame_msg_id(payload) -> Optional[str]:
+    # best effort, so even a rejected chunk's verdict can be correlated
+    chunk = payload.get("chunk") if isinstance(payload, dict) else None
+    header = chunk.get("header") if isinstance(chunk, dict) else None
+    return header.get("msg_id") if isinstance(header, dict) else None
+
+
+# ---------------------------------------------------------------------------
+# Streaming ingress (WebSocket)
+# ---------------------------------------------------------------------------
+
+@app.websocket("/v1/router/ingress")
+async def ws_ingress(websocket: WebSocket):
+    """
+    Persistent BLE → Router ingress channel (HTTP on_chunk_received stays
+    as the fallback).
+
+    The adapter authenticates once, with the usual device headers on the
+    handshake ("ble" role). After accepting, the router sends
+      { "type": "hello", "credits": N }
+
+    Client frames are the on_chunk_received body:
+      { "chunk": <MessageEnvelope JSON>, "link_meta": {...} }
+
+    Every frame costs one credit and gets exactly one verdict, which gives
+    the credit back. Verdicts arrive as soon as each chunk is processed
+    (not necessarily in order) and carry the msg_id:
+      { "type": "verdict", "msg_id": "...", "accepted": true, "action": "final" }
+      { "type": "verdict", "msg_id": "...", "status": 400, "error": {...} }
+
+    Sending with no credits left, or the device being revoked, closes the
+    socket with 1008 (policy violation).
+    """
+    device_fp = websocket.headers.get(DEVICE_FP_HEADER)
+    token = websocket.headers.get(DEVICE_TOKEN_HEADER)
+    client_ip = websocket.client.host if websocket.client else None
+    try:
+        roles = await run_in_threadpool(_verify_device, device_fp, token, client_ip)
+    except HTTPException as exc:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=_error_detail(exc))
+        return
+    if "ble" not in roles:
+        await websocket.close(
+            code=status.WS_1008_POLICY_VIOLATION, reason="Device missing required role: ble"
+        )
+        return
+
+    credits = current_config().ingress.ws_credits
+    await websocket.accept()
+    await websocket.send_json({"type": "hello", "credits": credits})
+
+    outbox: asyncio.Queue = asyncio.Queue()
+    in_flight = 0
+
+    async def process(raw: str) -> None:
+        verdict = await run_in_threadpool(_ws_verdict, raw, device_fp, token)
+        await outbox.put(verdict)
+
+    async def send_verdicts() -> None:
+        nonlocal in_flight
+        while True:
+            verdict = await outbox.get()
+            if verdict is None:
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="device revoked")
+                return
+            await websocket.send_json(verdict)
+            in_flight -= 1
+
+    sender = asyncio.create_task(send_verdicts())
+    workers: set = set()
+    try:
+        while not sender.done():
+            raw = await websocket.receive_text()
+            if in_flight >= credits:
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="no credits left")
+                break
+            in_flight += 1
+            task = asyncio.create_task(process(raw))
+            workers.add(task)
+            task.add_done_callback(workers.discard)
+    except (WebSocketDisconnect, RuntimeError):
+        # client went away (or we closed the socket after a revocation)
+        pass
+    finally:
+        for task in workers:
+            task.cancel()
+        sender.cancel()
+
+
+def _ws_verdict(raw: str, device_fp: str, token: str) -> Optional[dict]:
+    """
+    Run one WebSocket frame through the ingress core (worker thread).
+    Returns None if the device has been revoked since the handshake.
+    """
+    if DEVICES.verify(device_fp, token) is None:
+        return None
+    try:
+        payload = json.loads(raw)
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict) or not isinstance(payload.get("chunk"), dict):
+        return {
+            "type": "verdict",
+            "msg_id": None,
+            "status": 400,
+            **make_error(ErrorCode.INVALID_INPUT, "invalid frame"),
+        }
+    return {"type": "verdict", **_chunk_verdict(payload, current_config())}
+
+
+def _error_detail(exc: HTTPException) -> str:
+    detail = exc.detail
+    if isinstance(detail, dict):
+        return detail.get("error", {}).get("detail", "")
+    return str(detail)
 
 
 @app.get("/v1/router/queue_debug")
@@ -504,6 +1160,14 @@ def api_stats(
     Simple stats endpoint for UI / metrics:
       - total_queued
       - total_retries
+      - ids: size of the in-memory IDS state
+      - neighbors: neighbor / route table sizes and next-hop cache hits
+      - strategy: active store-and-forward strategy
+      - summaries: neighbor summary vectors held, transmissions they saved
+      - radio: BLE transmissions, envelopes carried and radio-active time per duty-cycle window
+      - breakers: transmission failure rate, targets skipped / probed, breakers not closed
+      - shaping: current share of the configured rates, throttled targets, time waited for tokens
+      - adapters: BLE adapter health, outstanding / sent / failed transmissions, failovers
     """
     if not DEBUG_MODE:
         raise http_error(
@@ -516,17 +1180,63 @@ def api_stats(
     rows = get_outgoing()
     total = len(rows)
     retries = sum(r["retries"] for r in rows)
-    return {"total_queued": total, "total_retries": retries}
+    return {
+        "total_queued": total,
+        "total_retries": retries,
+        "ids": ids_memory_stats(),
+        "ids_log": event_log_stats(),
+        "auth": DEVICES.stats(),
+        "neighbors": NEIGHBORS.stats(),
+        "strategy": strategies.STRATEGY.stats(),
+        "summaries": PEER_SUMMARIES.stats(),
+        "radio": tx_stats(),
+        "breakers": BREAKERS.stats(),
+        "shaping": SHAPER.stats(),
+        "adapters": POOL.stats(),
+    }
+
+
+@app.get("/v1/router/ids_metrics")
+def api_ids_metrics(
+    window: int = 60,
+    top: int = 10,
+    device_fp: str = Depends(require_device_auth_role("admin")),
+):
+    """
+    IDS activity from in-memory ring buffers (never reads the log file):
+      - events: per event type count, rate_per_sec and [bucket_ts, count] series
+      - top_peers: anonymized peers with the most events
+      - heavy_hitters: sketch-based top senders/recipients and distinct senders
+    window: seconds to look back (1 s buckets up to 600, 1 min up to 86400).
+    """
+    if not DEBUG_MODE:
+        raise http_error(
+            status_code=404,
+            code=ErrorCode.NOT_FOUND,
+            detail="endpoint disabled",
+            retryable=False,
+        )
+    return ids_metrics_snapshot(window_seconds=window, top=max(1, min(top, 100)))
 
 
 @app.get("/v1/router/ids_log_tail")
 def api_ids_log_tail(
     limit: int = 50,
+    since: Optional[str] = None,
+    event: Optional[str] = None,
+    peer: Optional[str] = None,
+    cursor: Optional[int] = None,
     device_fp: str = Depends(require_device_auth_role("admin")),
 ):
     """
-    Return last N suspicious IDS events (JSON-lines file).
+    Return last N suspicious IDS events (JSON-lines file), oldest first.
     Restricted to admin role + debug mode.
+
+    Filters:
+      - since:  unix seconds or ISO-8601 timestamp
+      - event:  exact event type (e.g. RATE_LIMIT)
+      - peer:   raw or anonymized peer id
+      - cursor: `next_cursor` from a previous page, to page further back
     """
     if not DEBUG_MODE:
         raise http_error(
@@ -536,27 +1246,33 @@ def api_ids_log_tail(
             retryable=False,
         )
 
-    if not IDS_LOG_PATH.exists():
-        return {"events": []}
-
-    with IDS_LOG_PATH.open("r", encoding="utf-8") as f:
-        lines = f.readlines()[-limit:]
-
-    events = [json.loads(l) for l in lines]
-    return {"events": events}
+    limit = max(1, min(limit, MAX_IDS_LOG_PAGE))
+    peers = [peer, anonymize_peer(peer)] if peer else None
+
+    flush_event_log()
+    return query_log(
+        IDS_LOG_PATH,
+        limit=limit,
+        since=since,
+        event=event,
+        peers=peers,
+        cursor=cursor,
+    )
 
-def _check_envelope_size(envelope: MessageEnvelope, peer: str, msg_id: str) -> str:
+def _check_envelope_size(
+    envelope: MessageEnvelope, peer: str, msg_id: str, cfg: Optional[RoutingConfig] = None
+) -> str:
     """
     Enforce payload size limits from config:
 
-    - MAX_ENVELOPE_BYTES: maximum serialized JSON size of the envelope
-    - MAX_CIPHERTEXT_BYTES: maximum size of ciphertext field
+    - max_envelope_bytes: maximum serialized JSON size of the envelope
+    - max_ciphertext_bytes: maximum size of ciphertext field
 
     Returns the serialized JSON so callers can reuse it.
     """
-    # Use module-level constants so tests can monkeypatch them
-    max_env = MAX_ENVELOPE_BYTES
-    max_ct = MAX_CIPHERTEXT_BYTES
+    cfg = cfg or current_config()
+    max_env = cfg.max_envelope_bytes
+    max_ct = cfg.max_ciphertext_bytes
 
     # Serialize once and measure UTF-8 byte length
     env_json = envelope.model_dump_json()
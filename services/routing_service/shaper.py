@@ -0,0 +1,221 @@
+# services/routing_service/shaper.py
+# token-bucket shaping of router -> BLE transmissions (bytes and envelopes per second, global and per target), adapted from adapter feedback.
+
+"""
+Bandwidth shaping for the router loop.
+
+Two token buckets gate every transmission: a global one for everything
+the router hands to the BLE adapter and one per target (neighbor or
+broadcast). Each bucket limits bytes per second and envelopes per second
+and holds burst_seconds worth of tokens. A transmission waits until both
+buckets cover it; one larger than a full bucket waits for a full bucket
+and leaves it in debt, so big bundles are paced rather than stuck.
+
+The configured rates are ceilings. Each bucket runs at a share of them
+that adapts to what the adapter reports (AIMD):
+
+    congested  the adapter returned an error, or its estimate_ms (time
+               until the transmission leaves the radio) exceeds
+               target_estimate_ms, i.e. its buffer is filling
+               -> share x decrease
+    clean      -> share + increase, up to 1
+
+Target buckets react to any error for their target; the global bucket
+only to signs the adapter itself is saturated (no answer, 429, or a long
+estimate), so one dead peer does not slow everyone else down.
+"""
+
+from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from .config_loader import ShapingConfig, current as current_config
+
+_monotonic = time.monotonic
+
+
+class _Bucket:
+    __slots__ = ("bytes", "msgs", "updated", "share")
+
+    def __init__(self, now: float) -> None:
+        self.bytes = float("inf")      # full on first use
+        self.msgs = float("inf")
+        self.updated = now
+        self.share = 1.0
+
+
+class Shaper:
+    """
+    Global and per-target token buckets (targets bounded, least recently
+    used evicted).
+    """
+
+    def __init__(
+        self,
+        bytes_per_second: float = 0,
+        msgs_per_second: float = 0,
+        target_bytes_per_second: float = 0,
+        target_msgs_per_second: float = 0,
+        burst_seconds: float = 1.0,
+        target_estimate_ms: float = 300,
+        decrease: float = 0.5,
+        increase: float = 0.05,
+        min_share: float = 0.05,
+        max_targets: int = 1_000,
+    ) -> None:
+        self._lock = threading.Lock()
+        self.max_targets = max(int(max_targets), 1)
+        self._global = _Bucket(_monotonic())
+        self._targets: "OrderedDict[Optional[str], _Bucket]" = OrderedDict()
+        self.waited_seconds = 0.0
+        self.deferred = 0
+        # earliest time a transmission left for a later pass fits the buckets
+        self._resume_at: Optional[float] = None
+        self.configure(ShapingConfig(
+            bytes_per_second=bytes_per_second,
+            msgs_per_second=msgs_per_second,
+            target_bytes_per_second=target_bytes_per_second,
+            target_msgs_per_second=target_msgs_per_second,
+            burst_seconds=burst_seconds,
+            target_estimate_ms=target_estimate_ms,
+            decrease=decrease,
+            increase=increase,
+            min_share=min_share,
+        ))
+
+    @classmethod
+    def from_config(cls, settings: ShapingConfig) -> "Shaper":
+        shaper = cls(max_targets=settings.max_targets)
+        shaper.configure(settings)
+        return shaper
+
+    def configure(self, settings: ShapingConfig) -> None:
+        """Apply rates and adaptation knobs (per pass, so a config reload applies)."""
+        with self._lock:
+            # (bytes/s, envelopes/s); 0 = unlimited
+            self._rates = (settings.bytes_per_second, settings.msgs_per_second)
+            self._target_rates = (settings.target_bytes_per_second, settings.target_msgs_per_second)
+            self.burst = settings.burst_seconds
+            self.target_estimate_ms = settings.target_estimate_ms
+            self.decrease = settings.decrease
+            self.increase = settings.increase
+            self.min_share = settings.min_share
+
+    def _bucket(self, target: Optional[str], now: float) -> _Bucket:
+        bucket = self._targets.get(target)
+        if bucket is None:
+            bucket = self._targets[target] = _Bucket(now)
+            while len(self._targets) > self.max_targets:
+                self._targets.popitem(last=False)
+        else:
+            self._targets.move_to_end(target)
+        return bucket
+
+    def _refill(self, bucket: _Bucket, rates, now: float) -> None:
+        elapsed = max(now - bucket.updated, 0.0)
+        bucket.updated = now
+        byte_rate, msg_rate = rates[0] * bucket.share, rates[1] * bucket.share
+        bucket.bytes = min(bucket.bytes + elapsed * byte_rate, byte_rate * self.burst)
+        bucket.msgs = min(bucket.msgs + elapsed * msg_rate, max(msg_rate * self.burst, 1.0))
+
+    def _wait(self, bucket: _Bucket, rates, nbytes: int, nmsgs: int) -> float:
+        wait = 0.0
+        for tokens, rate, cost, floor in (
+            (bucket.bytes, rates[0], nbytes, 0.0),
+            (bucket.msgs, rates[1], nmsgs, 1.0),
+        ):
+            if rate <= 0:
+                continue
+            rate *= bucket.share
+            # a transmission bigger than the whole bucket waits for a full one
+            needed = min(cost, max(rate * self.burst, floor))
+            if tokens < needed:
+                wait = max(wait, (needed - tokens) / rate)
+        return wait
+
+    def delay(self, target: Optional[str], nbytes: int, nmsgs: int) -> float:
+        """Seconds until both buckets cover a transmission (0 = now)."""
+        with self._lock:
+            now = _monotonic()
+            bucket = self._bucket(target, now)
+            self._refill(self._global, self._rates, now)
+            self._refill(bucket, self._target_rates, now)
+            return max(
+                self._wait(self._global, self._rates, nbytes, nmsgs),
+                self._wait(bucket, self._target_rates, nbytes, nmsgs),
+            )
+
+    def take(self, target: Optional[str], nbytes: int, nmsgs: int, waited: float = 0.0) -> None:
+        """Charge a transmission to both buckets (they may go into debt)."""
+        with self._lock:
+            now = _monotonic()
+            bucket = self._bucket(target, now)
+            for b, rates in ((self._global, self._rates), (bucket, self._target_rates)):
+                self._refill(b, rates, now)
+                if rates[0] > 0:
+                    b.bytes -= nbytes
+                if rates[1] > 0:
+                    b.msgs -= nmsgs
+            self.waited_seconds += waited
+
+    def defer(self, wait: float) -> None:
+        """Note a transmission left for a later pass; it fits in `wait` seconds."""
+        with self._lock:
+            self.deferred += 1
+            at = _monotonic() + wait
+            if self._resume_at is None or at < self._resume_at:
+                self._resume_at = at
+
+    def resume_in(self) -> Optional[float]:
+        """
+        Seconds until the earliest deferred transmission fits (None if
+        nothing was deferred since the last call), so the loop can wake
+        then instead of a whole interval later.
+        """
+        with self._lock:
+            at, self._resume_at = self._resume_at, None
+            return None if at is None else max(at - _monotonic(), 0.0)
+
+    def _adapt(self, bucket: _Bucket, congested: bool) -> None:
+        if congested:
+            bucket.share = max(bucket.share * self.decrease, self.min_share)
+        else:
+            bucket.share = min(bucket.share + self.increase, 1.0)
+
+    def feedback(self, target: Optional[str], status: Optional[int], estimate_ms: Optional[float]) -> None:
+        """
+        Adapter response to a transmission: HTTP status (None = no answer)
+        and its estimate_ms, if any.
+        """
+        backlog = estimate_ms is not None and estimate_ms > self.target_estimate_ms
+        with self._lock:
+            self._adapt(self._bucket(target, _monotonic()), backlog or status != 200)
+            self._adapt(self._global, backlog or status is None or status == 429)
+
+    def share(self, target: Optional[str] = None, overall: bool = False) -> float:
+        """Current share of the configured rate (global bucket with overall=True)."""
+        with self._lock:
+            if overall:
+                return self._global.share
+            bucket = self._targets.get(target)
+            return 1.0 if bucket is None else bucket.share
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "share": round(self._global.share, 4),
+                "targets": len(self._targets),
+                "throttled": {
+                    "*" if target is None else target: round(bucket.share, 4)
+                    for target, bucket in self._targets.items()
+                    if bucket.share < 1.0
+                },
+                "waited_seconds": round(self.waited_seconds, 3),
+                "deferred": self.deferred,
+            }
+
+
+# buckets of this process's router loop; rates are re-read every pass
+SHAPER = Shaper.from_config(current_config().shaping)
@@ -0,0 +1,296 @@
+# services/routing_service/strategies.py
+# pluggable store-and-forward strategies: next hop (default), binary spray-and-wait, PRoPHET.
+
+"""
+Store-and-forward strategies used by the router loop.
+
+For every due queue row the loop asks the strategy for this pass's
+hand-offs, given the neighbors currently in range and the neighbors that
+already got a copy (router_db replica bookkeeping):
+
+    handoffs(envelope, copies, contacts, handed) -> [(target, copies_given), ...]
+
+target None means broadcast. Each successful hand-off is recorded with
+router_db.record_handoffs; the row is finished once done() says so.
+
+  next_hop        one copy to the neighbor-table next hop (broadcast when no
+                  route is known); finished after one successful send.
+  spray_and_wait  binary spray-and-wait: a message starts with spray_copies
+                  copies; a node holding n > 1 copies gives n // 2 to each
+                  new contact, and with one copy left it only hands the
+                  message to the destination itself.
+  prophet         PRoPHET: delivery predictabilities from encounters (with
+                  aging and transitivity); a copy goes to a contact that is
+                  more likely to meet the destination than this node.
+                  Needs the BLE adapter to report encounters (and the
+                  neighbor's predictability vector) via /v1/router/contact.
+"""
+
+from __future__ import annotations
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Mapping, Optional, Sequence, Set, Tuple
+
+from lib.envelope import MessageEnvelope
+
+from .config_loader import StrategyConfig, current as current_config
+from .neighbor_table import NEIGHBORS, NeighborTable
+from .path_digest import path_contains
+
+_monotonic = time.monotonic
+
+Handoff = Tuple[Optional[str], int]
+
+
+class RoutingStrategy(ABC):
+    name = "base"
+
+    def configure(self, settings: StrategyConfig) -> None:
+        """Apply this strategy's settings from the `strategy` block."""
+
+    def initial_copies(self) -> int:
+        """Copies a message originated here starts with."""
+        return 1
+
+    def accept_copies(self, copies: int) -> int:
+        """Copies to keep for a message received with `copies` (never trusted blindly)."""
+        return 1
+
+    @abstractmethod
+    def handoffs(
+        self,
+        envelope: MessageEnvelope,
+        copies: int,
+        contacts: Sequence[str],
+        handed: Set[str],
+    ) -> List[Handoff]:
+        """This pass's hand-offs as [(target, copies_given), ...]."""
+
+    def after_handoff(self, copies: int, given: int) -> int:
+        """Copies left after a successful hand-off of `given` copies."""
+        return copies - given
+
+    def done(self, copies: int, delivered: bool) -> bool:
+        """Whether the row is finished (delivered = the destination got it)."""
+        return delivered or copies <= 0
+
+    # PRoPHET-style encounter hooks; no-ops for the other strategies
+    def on_contact(self, neighbor: str, vector: Optional[Mapping[str, float]] = None) -> None:
+        pass
+
+    def vector(self) -> Dict[str, float]:
+        return {}
+
+    def stats(self) -> dict:
+        return {"name": self.name}
+
+
+def _new_contacts(envelope: MessageEnvelope, contacts: Sequence[str], handed: Set[str]) -> List[str]:
+    path = envelope.routing.path
+    return [
+        c for c in contacts
+        if c not in handed and not (path and path_contains(path, c))
+    ]
+
+
+class NextHopStrategy(RoutingStrategy):
+    name = "next_hop"
+
+    def __init__(self, neighbors: Optional[NeighborTable] = None) -> None:
+        self.neighbors = neighbors
+
+    def handoffs(self, envelope, copies, contacts, handed):
+        table = self.neighbors or NEIGHBORS
+        path = envelope.routing.path
+        exclude = (lambda n: path_contains(path, n)) if path else None
+        return [(table.next_hop(envelope.header.recipient_fp, exclude=exclude), copies)]
+
+
+class SprayAndWaitStrategy(RoutingStrategy):
+    name = "spray_and_wait"
+
+    def __init__(self, copies: int = 8) -> None:
+        self.copies = max(int(copies), 1)
+
+    def configure(self, settings):
+        self.copies = settings.spray_copies
+
+    def initial_copies(self) -> int:
+        return self.copies
+
+    def accept_copies(self, copies: int) -> int:
+        return min(max(int(copies), 1), self.copies)
+
+    def handoffs(self, envelope, copies, contacts, handed):
+        destination = envelope.header.recipient_fp
+        if destination in contacts:
+            # wait phase ends: hand everything to the destination
+            return [(destination, copies)]
+        plan = []
+        for contact in _new_contacts(envelope, contacts, handed):
+            if copies <= 1:
+                break
+            give = copies // 2
+            plan.append((contact, give))
+            copies -= give
+        return plan
+
+
+class ProphetStrategy(RoutingStrategy):
+    name = "prophet"
+
+    def __init__(
+        self,
+        p_init: float = 0.75,
+        beta: float = 0.25,
+        gamma: float = 0.98,
+        aging_seconds: float = 30,
+        contact_gap_seconds: float = 10,
+        max_entries: int = 10_000,
+    ) -> None:
+        self.p_init = float(p_init)
+        self.beta = float(beta)
+        self.gamma = float(gamma)
+        self.aging_seconds = max(float(aging_seconds), 1e-6)
+        self.contact_gap = float(contact_gap_seconds)
+        self.max_entries = max(int(max_entries), 1)
+        self._lock = threading.Lock()
+        # destination -> (predictability, last aged at)
+        self._p: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        # neighbor -> its last reported vector; neighbor -> last encounter
+        self._peer_vectors: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+        self._last_contact: Dict[str, float] = {}
+
+    def configure(self, settings):
+        p = settings.prophet
+        with self._lock:
+            self.p_init, self.beta, self.gamma = p.p_init, p.beta, p.gamma
+            self.aging_seconds = p.aging_seconds
+            self.contact_gap = p.contact_gap_seconds
+            self.max_entries = p.max_entries
+
+    def _get(self, destination: str, now: float) -> float:
+        entry = self._p.get(destination)
+        if entry is None:
+            return 0.0
+        p, aged_at = entry
+        p *= self.gamma ** ((now - aged_at) / self.aging_seconds)
+        self._p[destination] = (p, now)
+        return p
+
+    def _set(self, destination: str, p: float, now: float) -> None:
+        self._p[destination] = (p, now)
+        self._p.move_to_end(destination)
+        while len(self._p) > self.max_entries:
+            self._p.popitem(last=False)
+
+    def on_contact(self, neighbor, vector=None):
+        now = _monotonic()
+        with self._lock:
+            last = self._last_contact.get(neighbor)
+            if last is None or now - last >= self.contact_gap:
+                p = self._get(neighbor, now)
+                self._set(neighbor, p + (1.0 - p) * self.p_init, now)
+            self._last_contact[neighbor] = now
+            if vector is None:
+                return
+            clean = {
+                str(d): float(v) for d, v in vector.items()
+                if isinstance(v, (int, float)) and 0.0 <= v <= 1.0
+            }
+            self._peer_vectors[neighbor] = clean
+            self._peer_vectors.move_to_end(neighbor)
+            while len(self._peer_vectors) > self.max_entries:
+                self._peer_vectors.popitem(last=False)
+            # transitivity: reaching `neighbor` is a way to reach what it reaches
+            p_b = self._get(neighbor, now)
+            for destination, p_bc in clean.items():
+                p_ac = self._get(destination, now)
+                transitive = p_b * p_bc * self.beta
+                if transitive > p_ac:
+                    self._set(destination, transitive, now)
+
+    def predictability(self, destination: str) -> float:
+        with self._lock:
+            return self._get(destination, _monotonic())
+
+    def vector(self) -> Dict[str, float]:
+        now = _monotonic()
+        with self._lock:
+            return {d: round(self._get(d, now), 4) for d in list(self._p)}
+
+    def handoffs(self, envelope, copies, contacts, handed):
+        destination = envelope.header.recipient_fp
+        if destination in contacts:
+            return [(destination, 1)]
+        now = _monotonic()
+        with self._lock:
+            own = self._get(destination, now)
+            return [
+                (contact, 1)
+                for contact in _new_contacts(envelope, contacts, handed)
+                if self._peer_vectors.get(contact, {}).get(destination, 0.0) > own
+            ]
+
+    def after_handoff(self, copies, given):
+        # replication: this node keeps its copy until it meets the destination
+        return copies
+
+    def done(self, copies, delivered):
+        return delivered
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"name": self.name, "destinations": len(self._p), "peer_vectors": len(self._peer_vectors)}
+
+
+STRATEGIES = {
+    NextHopStrategy.name: NextHopStrategy,
+    SprayAndWaitStrategy.name: SprayAndWaitStrategy,
+    ProphetStrategy.name: ProphetStrategy,
+}
+
+
+def build_strategy(settings: StrategyConfig, neighbors: Optional[NeighborTable] = None) -> RoutingStrategy:
+    """
+    Strategy from the config's `strategy` block. Raises ValueError for an
+    unknown name.
+    """
+    if settings.name not in STRATEGIES:
+        raise ValueError(
+            f"unknown routing strategy {settings.name!r} (expected one of {', '.join(STRATEGIES)})"
+        )
+    if settings.name == NextHopStrategy.name:
+        strategy = NextHopStrategy(neighbors)
+    else:
+        strategy = STRATEGIES[settings.name]()
+    strategy.configure(settings)
+    return strategy
+
+
+def configure(settings: StrategyConfig) -> RoutingStrategy:
+    """
+    The active strategy, brought in line with `settings` (the current
+    snapshot's section). A new strategy.name swaps in a fresh strategy
+    (PRoPHET predictabilities start over); other changes apply in place.
+    """
+    global STRATEGY, _settings
+    if settings is not _settings:
+        with _lock:
+            if settings != _settings:
+                if settings.name == _settings.name:
+                    STRATEGY.configure(settings)
+                else:
+                    STRATEGY = build_strategy(settings)
+                    print(f"[Routing] strategy switched to {settings.name}")
+            _settings = settings
+    return STRATEGY
+
+
+_lock = threading.Lock()
+# settings STRATEGY was last configured from; callers pass every snapshot
+# through configure(), so a reload applies on the next use
+_settings = current_config().strategy
+STRATEGY = build_strategy(_settings)
@@ -0,0 +1,242 @@
+# services/routing_service/strategy_sim.py
+# local contact-trace simulation: delivery ratio vs. overhead for each store-and-forward strategy.
+
+"""
+Store-and-forward strategy simulation.
+
+Nodes live in communities and meet at random (more often inside their
+community). Every strategy replays the same contact trace and message
+load, using the real strategy classes (and, for next_hop, a real
+NeighborTable per node) with the router's ingress rules: dedup, ttl,
+path-digest loop suppression. A broadcast counts as one transmission.
+
+Usage:
+    python -m services.routing_service.strategy_sim --nodes 40 --messages 200 --ticks 600
+    python -m services.routing_service.strategy_sim --strategies spray_and_wait,prophet --json
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import random
+import sys
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from lib.envelope import EnvelopeHeader, MessageEnvelope, RoutingMeta
+
+from . import neighbor_table, strategies
+from .config_loader import RoutingConfig, StrategyConfig
+from .neighbor_table import NeighborTable
+from .path_digest import path_add, path_contains
+from .strategies import STRATEGIES, build_strategy
+
+
+@dataclass
+class Trace:
+    nodes: List[str]
+    contacts: List[List[Tuple[int, int]]]          # per tick: meeting pairs
+    messages: List[Tuple[int, int, int]]           # (tick, src, dst)
+
+
+@dataclass
+class Result:
+    strategy: str
+    messages: int
+    delivered: int = 0
+    transmissions: int = 0
+    latency_ticks: List[int] = field(default_factory=list)
+    peak_buffered: int = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "strategy": self.strategy,
+            "messages": self.messages,
+            "delivered": self.delivered,
+            "delivery_ratio": round(self.delivered / max(self.messages, 1), 3),
+            "transmissions": self.transmissions,
+            "overhead": round(self.transmissions / max(self.delivered, 1), 2),
+            "mean_latency_ticks": round(sum(self.latency_ticks) / max(len(self.latency_ticks), 1), 1),
+            "peak_buffered": self.peak_buffered,
+        }
+
+
+def make_trace(
+    nodes: int = 40,
+    ticks: int = 600,
+    messages: int = 200,
+    communities: int = 4,
+    p_inside: float = 0.02,
+    p_across: float = 0.002,
+    seed: int = 1,
+) -> Trace:
+    rng = random.Random(seed)
+    names = [f"node-{i}" for i in range(nodes)]
+    group = [i % communities for i in range(nodes)]
+    contacts = []
+    for _ in range(ticks):
+        pairs = []
+        for i in range(nodes):
+            for j in range(i + 1, nodes):
+                p = p_inside if group[i] == group[j] else p_across
+                if rng.random() < p:
+                    pairs.append((i, j))
+        contacts.append(pairs)
+    load = []
+    for _ in range(messages):
+        src, dst = rng.sample(range(nodes), 2)
+        load.append((rng.randrange(ticks // 2), src, dst))
+    return Trace(names, contacts, sorted(load))
+
+
+class _SimNode:
+    def __init__(self, name: str, settings: StrategyConfig) -> None:
+        self.name = name
+        self.neighbors = NeighborTable(neighbor_timeout_seconds=1, decision_ttl_seconds=0)
+        self.strategy = build_strategy(settings, neighbors=self.neighbors)
+        # msg_id -> [envelope, copies, handed]
+        self.buffer: Dict[str, list] = {}
+        self.seen: set = set()
+
+
+def simulate(trace: Trace, name: str, settings: Optional[dict] = None, max_ttl: int = 8) -> Result:
+    """
+    Replay `trace` with one strategy (`settings` as in the config's
+    strategy block). The strategy / neighbor-table clocks run on simulated
+    ticks for the duration of the call.
+    """
+    settings = RoutingConfig.from_dict({"strategy": dict(settings or {}, name=name)}).strategy
+    result = Result(name, len(trace.messages))
+    now = [0.0]
+    saved = (neighbor_table._monotonic, strategies._monotonic)
+    neighbor_table._monotonic = strategies._monotonic = lambda: now[0]
+    try:
+        nodes = [_SimNode(n, settings) for n in trace.nodes]
+        created: Dict[str, int] = {}
+        delivered: set = set()
+        pending = list(trace.messages)
+        for tick, pairs in enumerate(trace.contacts):
+            now[0] = float(tick)
+            while pending and pending[0][0] <= tick:
+                _, src, dst = pending.pop(0)
+                env = MessageEnvelope(
+                    header=EnvelopeHeader(
+                        sender_fp=trace.nodes[src], recipient_fp=trace.nodes[dst],
+                        msg_id=str(uuid.uuid4()), nonce="sim", ttl=max_ttl, ts=0,
+                    ),
+                    ciphertext="",
+                    routing=RoutingMeta(path=path_add("", trace.nodes[src])),
+                )
+                node = nodes[src]
+                node.buffer[env.header.msg_id] = [env, node.strategy.initial_copies(), set()]
+                node.seen.add(env.header.msg_id)
+                created[env.header.msg_id] = tick
+
+            met: Dict[int, List[int]] = {}
+            for i, j in pairs:
+                met.setdefault(i, []).append(j)
+                met.setdefault(j, []).append(i)
+                for a, b in ((i, j), (j, i)):
+                    # beacon: link + encounter (with the predictability vector)
+                    nodes[a].neighbors.observe(trace.nodes[b], -60, trace.nodes[b], 1)
+                    nodes[a].strategy.on_contact(trace.nodes[b], nodes[b].strategy.vector())
+
+            for i, peers in met.items():
+                _exchange(nodes, i, peers, tick, result, created, delivered)
+            result.peak_buffered = max(result.peak_buffered, sum(len(n.buffer) for n in nodes))
+    finally:
+        neighbor_table._monotonic, strategies._monotonic = saved
+    result.delivered = len(delivered)
+    return result
+
+
+def _exchange(nodes, i, peers, tick, result, created, delivered) -> None:
+    node = nodes[i]
+    by_name = {nodes[p].name: nodes[p] for p in peers}
+    contacts = list(by_name)
+    for msg_id in list(node.buffer):
+        env, copies, handed = node.buffer[msg_id]
+        plan = node.strategy.handoffs(env, copies, contacts, handed)
+        delivered_here = False
+        for target, n in plan:
+            result.transmissions += 1
+            receivers = list(by_name.values()) if target is None else (
+                [by_name[target]] if target in by_name else []
+            )
+            if target is not None:
+                node.neighbors.record_outcome(target, bool(receivers))
+            if not receivers:
+                continue
+            handed.add(target or "*")
+            copies = node.strategy.after_handoff(copies, n)
+            for receiver in receivers:
+                if _receive(node, receiver, env, n, tick, created, delivered, result):
+                    delivered_here = True
+        if node.strategy.done(copies, delivered_here):
+            del node.buffer[msg_id]
+        else:
+            node.buffer[msg_id][1] = copies
+
+
+def _receive(sender, node, env, copies, tick, created, delivered, result) -> bool:
+    header = env.header
+    msg_id = header.msg_id
+    if header.recipient_fp == node.name:
+        if msg_id not in delivered:
+            delivered.add(msg_id)
+            result.latency_ticks.append(tick - created[msg_id])
+        return True
+    node.neighbors.observe(sender.name, -60, header.sender_fp, header.hop_count + 1)
+    if msg_id in node.seen or header.ttl <= 1 or path_contains(env.routing.path, node.name):
+        return False
+    node.seen.add(msg_id)
+    copy = env.model_copy(deep=True)
+    copy.header.ttl -= 1
+    copy.header.hop_count += 1
+    copy.routing.path = path_add(copy.routing.path, node.name)
+    node.buffer[msg_id] = [copy, node.strategy.accept_copies(copies), set()]
+    return False
+
+
+def compare(trace: Trace, names: Sequence[str], settings: Optional[dict] = None) -> List[Result]:
+    return [simulate(trace, name, settings) for name in names]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m services.routing_service.strategy_sim",
+        description="Compare store-and-forward strategies on a random community contact trace.",
+    )
+    parser.add_argument("--nodes", type=int, default=40)
+    parser.add_argument("--ticks", type=int, default=600)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--communities", type=int, default=4)
+    parser.add_argument("--p-inside", type=float, default=0.02, help="per-tick meeting probability inside a community")
+    parser.add_argument("--p-across", type=float, default=0.002, help="per-tick meeting probability across communities")
+    parser.add_argument("--spray-copies", type=int, default=8)
+    parser.add_argument("--strategies", default=",".join(STRATEGIES))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    trace = make_trace(
+        args.nodes, args.ticks, args.messages, args.communities,
+        args.p_inside, args.p_across, args.seed,
+    )
+    results = compare(trace, args.strategies.split(","), {"spray_copies": args.spray_copies})
+    rows = [r.as_dict() for r in results]
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return 0
+    print(f"{'strategy':<16}{'delivered':>12}{'ratio':>8}{'tx':>8}{'tx/deliv':>10}{'latency':>9}{'peak buf':>10}")
+    for r in rows:
+        print(
+            f"{r['strategy']:<16}{r['delivered']:>7}/{r['messages']:<4}{r['delivery_ratio']:>8}"
+            f"{r['transmissions']:>8}{r['overhead']:>10}{r['mean_latency_ticks']:>9}{r['peak_buffered']:>10}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+# services/routing_service/summary_vector.py
+# anti-entropy summary vectors: Bloom filters of held msg_ids, exchanged on encounter so only the set difference is sent.
+
+"""
+Summary vectors for neighbor anti-entropy.
+
+When two routers meet, each one first tells the other which messages it
+already holds: a Bloom filter over the msg_ids in its queue and inbox
+(router_db.known_msg_ids), sized for summary.fp_rate. The BLE adapter
+fetches it from GET /v1/router/summary and hands it to the neighbor's
+POST /v1/router/summary. From then on the router loop skips hand-offs of
+messages the neighbor's summary contains, so the encounter carries only
+the set difference instead of the whole queue.
+
+A false positive means a message the neighbor lacks is held back. Every
+summary is built with a fresh random salt, so the same message is very
+unlikely to be hidden again by the next summary. A neighbor's summary is
+trusted for summary.ttl_seconds; after that (or before any exchange)
+everything is sent as before.
+
+Wire format (JSON):
+    {"bits": m, "hashes": k, "salt": "<hex>", "count": n, "filter": "<base64>"}
+"""
+
+from __future__ import annotations
+import base64
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Mapping, Optional, Sequence, Tuple
+
+from .config_loader import SummaryConfig, current as current_config
+
+_monotonic = time.monotonic
+
+MIN_SUMMARY_BITS = 64
+MAX_SUMMARY_BITS = 8 * 1024 * 1024      # 1 MiB filter
+MAX_SUMMARY_HASHES = 16
+
+
+class SummaryVector:
+    def __init__(self, bits: int, hashes: int, salt: bytes, data: Optional[bytes] = None, count: int = 0) -> None:
+        self.bits = bits
+        self.hashes = hashes
+        self.salt = salt
+        self.data = bytearray(data) if data is not None else bytearray(bits // 8)
+        self.count = count
+
+    @classmethod
+    def build(cls, msg_ids: Sequence[str], fp_rate: float = 0.01) -> "SummaryVector":
+        """
+        Filter over `msg_ids`, sized for the false-positive rate `fp_rate`.
+        """
+        n = max(len(msg_ids), 1)
+        fp_rate = min(max(float(fp_rate), 1e-6), 0.5)
+        bits = math.ceil(-n * math.log(fp_rate) / math.log(2) ** 2)
+        bits = min(max(bits, MIN_SUMMARY_BITS), MAX_SUMMARY_BITS)
+        bits += -bits % 8
+        hashes = min(max(round(bits / n * math.log(2)), 1), MAX_SUMMARY_HASHES)
+        vector = cls(bits, hashes, os.urandom(8))
+        for msg_id in msg_ids:
+            vector.add(msg_id)
+        return vector
+
+    def _positions(self, msg_id: str) -> Iterable[int]:
+        digest = hashlib.blake2b(msg_id.encode("utf-8"), digest_size=16, salt=self.salt).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, msg_id: str) -> None:
+        for pos in self._positions(msg_id):
+            self.data[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, msg_id: str) -> bool:
+        data = self.data
+        return all(data[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(msg_id))
+
+    def to_dict(self) -> dict:
+        return {
+            "bits": self.bits,
+            "hashes": self.hashes,
+            "salt": self.salt.hex(),
+            "count": self.count,
+            "filter": base64.b64encode(bytes(self.data)).decode("ascii"),
+        }
+
+    @classmethod
+    def from_dict(cls, obj: Mapping) -> "SummaryVector":
+        """
+        Parse a summary received from a neighbor. Raises ValueError.
+        """
+        if not isinstance(obj, Mapping):
+            raise ValueError("summary must be an object")
+        bits, hashes, count = obj.get("bits"), obj.get("hashes"), obj.get("count", 0)
+        if not isinstance(bits, int) or not MIN_SUMMARY_BITS <= bits <= MAX_SUMMARY_BITS or bits % 8:
+            raise ValueError(f"bits must be a multiple of 8 in [{MIN_SUMMARY_BITS}, {MAX_SUMMARY_BITS}]")
+        if not isinstance(hashes, int) or not 1 <= hashes <= MAX_SUMMARY_HASHES:
+            raise ValueError(f"hashes must be in [1, {MAX_SUMMARY_HASHES}]")
+        if not isinstance(count, int) or count < 0:
+            raise ValueError("count must be a non-negative integer")
+        try:
+            salt = bytes.fromhex(obj.get("salt", ""))
+            data = base64.b64decode(obj.get("filter", ""), validate=True)
+        except (TypeError, ValueError):
+            raise ValueError("salt must be hex and filter base64") from None
+        if len(salt) > hashlib.blake2b.SALT_SIZE:
+            raise ValueError(f"salt is at most {hashlib.blake2b.SALT_SIZE} bytes")
+        if len(data) != bits // 8:
+            raise ValueError("filter length does not match bits")
+        return cls(bits, hashes, salt, data, count)
+
+
+class PeerSummaries:
+    """
+    Latest summary per neighbor, bounded and expiring.
+    """
+
+    def __init__(self, max_peers: int = 1_000, ttl_seconds: float = 60) -> None:
+        self._lock = threading.Lock()
+        # neighbor -> (summary, received_at), least recently updated first
+        self._peers: "OrderedDict[str, Tuple[SummaryVector, float]]" = OrderedDict()
+        self.skipped = 0
+        self._settings: Optional[SummaryConfig] = None
+        self.configure(SummaryConfig(max_peers=max(int(max_peers), 1), ttl_seconds=float(ttl_seconds)))
+
+    @classmethod
+    def from_config(cls, settings: SummaryConfig) -> "PeerSummaries":
+        summaries = cls()
+        summaries.configure(settings)
+        return summaries
+
+    def configure(self, settings: SummaryConfig) -> None:
+        """
+        Apply max_peers and ttl_seconds; a no-op unless the snapshot changed
+        (a reload). A lower max_peers drops the oldest summaries.
+        """
+        if settings is self._settings:
+            return
+        with self._lock:
+            self._settings = settings
+            self.max_peers = settings.max_peers
+            self.ttl = settings.ttl_seconds
+            while len(self._peers) > self.max_peers:
+                self._peers.popitem(last=False)
+
+    def update(self, neighbor: str, summary: SummaryVector) -> None:
+        with self._lock:
+            self._peers[neighbor] = (summary, _monotonic())
+            self._peers.move_to_end(neighbor)
+            while len(self._peers) > self.max_peers:
+                self._peers.popitem(last=False)
+
+    def _get(self, neighbor: str) -> Optional[SummaryVector]:
+        entry = self._peers.get(neighbor)
+        if entry is None:
+            return None
+        if _monotonic() - entry[1] > self.ttl:
+            del self._peers[neighbor]
+            return None
+        return entry[0]
+
+    def has(self, neighbor: str, msg_id: str) -> bool:
+        """Whether the neighbor's current summary says it holds msg_id."""
+        with self._lock:
+            summary = self._get(neighbor)
+            return summary is not None and msg_id in summary
+
+    def holders(self, msg_id: str, contacts: Sequence[str]) -> set:
+        """Contacts whose summary contains msg_id."""
+        with self._lock:
+            result = set()
+            for contact in contacts:
+                summary = self._get(contact)
+                if summary is not None and msg_id in summary:
+                    result.add(contact)
+            return result
+
+    def covers(self, target: Optional[str], msg_id: str, contacts: Sequence[str]) -> bool:
+        """
+        Whether sending msg_id to `target` would be redundant: the target
+        already holds it, or (broadcast, target None) every contact does.
+        Counts the transmissions saved.
+        """
+        if target is not None:
+            covered = self.has(target, msg_id)
+        else:
+            covered = bool(contacts) and len(self.holders(msg_id, contacts)) == len(contacts)
+        if covered:
+            with self._lock:
+                self.skipped += 1
+        return covered
+
+    def forget(self, neighbor: str) -> None:
+        with self._lock:
+            self._peers.pop(neighbor, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"peers": len(self._peers), "skipped": self.skipped}
+
+
+# summaries received from neighbors, shared by the API and the router
+# loop; both re-apply the current snapshot's settings
+PEER_SUMMARIES = PeerSummaries.from_config(current_config().summary)
@@ -2,6 +2,7 @@
 # pytest services/routing_service/test/routing_config_test.py -v
 
 import time
+import uuid
 from datetime import datetime, timedelta, timezone
 
 import pytest
@@ -10,6 +11,8 @@ from fastapi.testclient import TestClient
 from services.routing_service import routing_api
 from services.routing_service import ids_module
 from services.routing_service import router_db
+from services.routing_service import config_loader
+from services.routing_service.config_loader import RoutingConfig, current as current_config
 
 from lib.envelope import MessageEnvelope, EnvelopeHeader, ChunkInfo, RoutingMeta
 from lib.utils import current_unix_ts
@@ -17,6 +20,16 @@ from lib.utils import current_unix_ts
 
 client = TestClient(routing_api.app)
 
+
+def _use_config(monkeypatch, settings) -> None:
+    """
+    Swap in a config snapshot for one test (a dict is validated first).
+    """
+    if not isinstance(settings, RoutingConfig):
+        settings = RoutingConfig.from_dict(settings)
+    monkeypatch.setattr(config_loader, "_current", settings)
+
+
 AUTH_HEADERS = {
     "X-Device-Fp": routing_api.DEV_DEVICE_FP,
     "X-Device-Token": routing_api.DEV_DEVICE_TOKEN,
@@ -42,7 +55,8 @@ def _make_env(ttl: int) -> MessageEnvelope:
 
 
 @pytest.fixture(autouse=True)
-def reset_ids_state():
+def reset_ids_state(monkeypatch, tmp_path):
+    monkeypatch.setattr(ids_module, "LOG_PATH", tmp_path / "routing_suspicious.log", raising=False)
     ids_module._peer_windows.clear()
     ids_module._seen_msg_ids.clear()
     ids_module._peer_suspicious_counts.clear()
@@ -56,12 +70,7 @@ def reset_ids_state():
 
 def test_enqueue_rejects_ttl_below_min(monkeypatch):
     # Force config for this test
-    monkeypatch.setattr(
-        routing_api,
-        "ROUTING_CFG",
-        {"ttl_min": 2, "ttl_default": 4, "max_ttl": 8},
-        raising=False,
-    )
+    _use_config(monkeypatch, {"ttl_min": 2, "ttl_default": 4, "max_ttl": 8})
     env = _make_env(ttl=1)
 
     resp = client.post("/v1/router/enqueue", json=env.model_dump(), headers=AUTH_HEADERS)
@@ -72,12 +81,7 @@ def test_enqueue_rejects_ttl_below_min(monkeypatch):
 
 
 def test_enqueue_rejects_ttl_above_max(monkeypatch):
-    monkeypatch.setattr(
-        routing_api,
-        "ROUTING_CFG",
-        {"ttl_min": 1, "ttl_default": 4, "max_ttl": 3},
-        raising=False,
-    )
+    _use_config(monkeypatch, {"ttl_min": 1, "ttl_default": 2, "max_ttl": 3})
     env = _make_env(ttl=5)
 
     resp = client.post("/v1/router/enqueue", json=env.model_dump(), headers=AUTH_HEADERS)
@@ -88,12 +92,7 @@ def test_enqueue_rejects_ttl_above_max(monkeypatch):
 
 
 def test_enqueue_uses_default_ttl_when_none(monkeypatch):
-    monkeypatch.setattr(
-        routing_api,
-        "ROUTING_CFG",
-        {"ttl_min": 1, "ttl_default": 4, "max_ttl": 8},
-        raising=False,
-    )
+    _use_config(monkeypatch, {"ttl_min": 1, "ttl_default": 4, "max_ttl": 8})
 
     env = _make_env(ttl=5)
     # simulate "no ttl" after validation
@@ -106,12 +105,7 @@ def test_enqueue_uses_default_ttl_when_none(monkeypatch):
 
 def test_enqueue_duplicate_msg_id_is_dropped(monkeypatch):
     # use a reasonable config
-    monkeypatch.setattr(
-        routing_api,
-        "ROUTING_CFG",
-        {"ttl_min": 1, "ttl_default": 4, "max_ttl": 8},
-        raising=False,
-    )
+    _use_config(monkeypatch, {"ttl_min": 1, "ttl_default": 4, "max_ttl": 8})
 
     env = _make_env(ttl=5)  # uses fixed msg_id="test-ttl"
 
@@ -133,9 +127,8 @@ def test_enqueue_drops_too_old_message(monkeypatch):
     """
     Verify that the HTTP-layer timestamp freshness also applies to /enqueue.
     """
-    monkeypatch.setattr(
-        routing_api,
-        "ROUTING_CFG",
+    _use_config(
+        monkeypatch,
         {
             "ttl_min": 1,
             "ttl_default": 4,
@@ -143,7 +136,6 @@ def test_enqueue_drops_too_old_message(monkeypatch):
             "max_ts_skew_seconds": 300,
             "max_msg_age_seconds": 0,  # anything older than now is "too old"
         },
-        raising=False,
     )
 
     env = _make_env(ttl=5)
@@ -207,12 +199,7 @@ def test_auth_rate_limit_returns_429(monkeypatch):
 # ---------------------------------------------------------------------------
 
 def test_on_chunk_received_action_final_by_default(monkeypatch):
-    monkeypatch.setattr(
-        routing_api,
-        "ROUTING_CFG",
-        {"forwarding_enabled": False},
-        raising=False,
-    )
+    _use_config(monkeypatch, {"forwarding_enabled": False})
 
     env = _make_env(ttl=5)
     payload = {
@@ -225,15 +212,15 @@ def test_on_chunk_received_action_final_by_default(monkeypatch):
     assert resp.json() == {"accepted": True, "action": "final"}
 
 
-def test_on_chunk_received_action_forward_when_enabled(monkeypatch):
-    monkeypatch.setattr(
-        routing_api,
-        "ROUTING_CFG",
-        {"forwarding_enabled": True},
-        raising=False,
-    )
+def test_on_chunk_received_action_forward_when_enabled(monkeypatch, tmp_path):
+    # forwarding queues the envelope: use a temporary DB
+    monkeypatch.setattr(router_db, "DB_PATH", str(tmp_path / "routing.db"), raising=False)
+    router_db.init_db()
+    _use_config(monkeypatch, {"forwarding_enabled": True})
 
     env = _make_env(ttl=5)
+    # the queue's msg_id is unique
+    env.header.msg_id = f"test-forward-{uuid.uuid4()}"
     payload = {
         "chunk": env.model_dump(),
         "link_meta": {"peer": "peer-1", "rssi": -40},
@@ -246,9 +233,8 @@ def test_on_chunk_received_action_forward_when_enabled(monkeypatch):
 
 def test_on_chunk_received_rejects_future_timestamp(monkeypatch):
     # Very small skew so "now+10" looks too far in future
-    monkeypatch.setattr(
-        routing_api,
-        "ROUTING_CFG",
+    _use_config(
+        monkeypatch,
         {
             "max_ts_skew_seconds": 0,
             "max_msg_age_seconds": 3600,
@@ -256,7 +242,6 @@ def test_on_chunk_received_rejects_future_timestamp(monkeypatch):
             "ttl_default": 4,
             "max_ttl": 8,
         },
-        raising=False,
     )
 
     env = _make_env(ttl=5)
@@ -275,9 +260,8 @@ def test_on_chunk_received_rejects_future_timestamp(monkeypatch):
 
 def test_on_chunk_received_drops_old_message(monkeypatch):
     # Very small age so "now-10" looks too old
-    monkeypatch.setattr(
-        routing_api,
-        "ROUTING_CFG",
+    _use_config(
+        monkeypatch,
         {
             "max_ts_skew_seconds": 300,
             "max_msg_age_seconds": 0,
@@ -285,7 +269,6 @@ def test_on_chunk_received_drops_old_message(monkeypatch):
             "ttl_default": 4,
             "max_ttl": 8,
         },
-        raising=False,
     )
 
     env = _make_env(ttl=5)
@@ -302,17 +285,15 @@ def test_on_chunk_received_drops_old_message(monkeypatch):
 
 
 def test_on_chunk_received_rejects_ttl_above_max(monkeypatch):
-    monkeypatch.setattr(
-        routing_api,
-        "ROUTING_CFG",
+    _use_config(
+        monkeypatch,
         {
             "ttl_min": 1,
-            "ttl_default": 4,
+            "ttl_default": 2,
             "max_ttl": 3,  # strict max
             "max_ts_skew_seconds": 300,
             "max_msg_age_seconds": 3600,
         },
-        raising=False,
     )
 
     env = _make_env(ttl=10)  # way above max
@@ -413,7 +394,7 @@ def test_block_peer_after_threshold(monkeypatch):
     ids_module._blocked_peers.clear()
 
     # Configure low threshold
-    monkeypatch.setattr(ids_module, "cfg", {"block_peer_after": 3}, raising=False)
+    _use_config(monkeypatch, current_config().merged({"ids": {"block_peer_after": 3}}))
 
     peer = "evil-peer"
 
@@ -427,13 +408,15 @@ def test_block_peer_after_threshold(monkeypatch):
 
 def test_blocked_peer_auto_unblocks_after_ttl(monkeypatch):
     """
-    Verify BLOCK_PEER_TTL unblocks a peer after enough time:
+    Verify ids.block_peer_ttl_seconds unblocks a peer after enough time:
       - Immediately after being blocked, is_rate_limited == True
       - After TTL has elapsed, is_rate_limited == False
     """
     # Make TTL small for the test
-    monkeypatch.setattr(ids_module, "BLOCK_PEER_TTL", 10, raising=False)
-    monkeypatch.setattr(ids_module, "cfg", {"block_peer_after": 1}, raising=False)
+    _use_config(
+        monkeypatch,
+        current_config().merged({"ids": {"block_peer_ttl_seconds": 10, "block_peer_after": 1}}),
+    )
 
     base = datetime(2024, 1, 1, tzinfo=timezone.utc)
 
@@ -448,12 +431,12 @@ def test_blocked_peer_auto_unblocks_after_ttl(monkeypatch):
     # Log 1 suspicious event → hits threshold, peer gets blocked at `base`
     ids_module.log_suspicious("TEST", peer, "msg-0", "detail")
 
-    # At time `base` (< BLOCK_PEER_TTL after block), peer must still be blocked
+    # At time `base` (< block_peer_ttl_seconds after block), peer must still be blocked
     assert ids_module.is_rate_limited(peer) is True
 
     # Phase 2: advance time beyond TTL
     def now_phase2():
-        # 20s > BLOCK_PEER_TTL (10s)
+        # 20s > block_peer_ttl_seconds (10s)
         return base + timedelta(seconds=20)
 
     monkeypatch.setattr(ids_module, "_now", now_phase2, raising=False)
@@ -464,12 +447,7 @@ def test_blocked_peer_auto_unblocks_after_ttl(monkeypatch):
 def test_duplicate_ttl_eviction(monkeypatch):
     ids_module._seen_msg_ids.clear()
     # Remember duplicates only for 1 second
-    monkeypatch.setattr(
-        ids_module,
-        "cfg",
-        {"duplicate_suppression_ttl": 1},
-        raising=False,
-    )
+    _use_config(monkeypatch, current_config().merged({"ids": {"duplicate_suppression_ttl": 1}}))
 
     msg_id = "dup-test"
 
@@ -488,7 +466,7 @@ def test_duplicate_ttl_eviction(monkeypatch):
 
 def test_queue_full_returns_db_error(monkeypatch):
     # force max_queue_size to 0 so first insert fails
-    monkeypatch.setattr(router_db, "ROUTING_CFG", {"max_queue_size": 0}, raising=False)
+    _use_config(monkeypatch, current_config().merged({"max_queue_size": 0}))
 
     env = _make_env(ttl=5)
     resp = client.post("/v1/router/enqueue", json=env.model_dump(), headers=AUTH_HEADERS)
@@ -536,12 +514,8 @@ def test_mark_dropped_removes_from_outgoing(tmp_path, monkeypatch):
     assert outgoing_after == []
 
 def test_enqueue_rejects_oversized_ciphertext(monkeypatch):
-    monkeypatch.setattr(
-        routing_api,
-        "MAX_CIPHERTEXT_BYTES",
-        10,  # very small for the test
-        raising=False,
-    )
+    # very small for the test
+    _use_config(monkeypatch, current_config().merged({"max_ciphertext_bytes": 10}))
 
     env = _make_env(ttl=5)
     env.ciphertext = "A" * 100  # bigger than limit
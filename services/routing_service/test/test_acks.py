@@ -0,0 +1,239 @@
+# services/routing_service/test/test_acks.py
+# end-to-end delivery ACKs: generation on local delivery, bulk cancel of queued copies, late-copy suppression, retry traffic.
+# test: pytest services/routing_service/test/test_acks.py -v -s
+import asyncio
+import json
+import uuid
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from lib.envelope import MessageEnvelope, EnvelopeHeader, ChunkInfo, RoutingMeta
+from lib.utils import current_unix_ts
+from services.routing_service import circuit_breaker, config_loader, ids_module, router_db, router_loop, routing_api, strategies
+from services.routing_service.ids_state import BlockedPeerTable, DedupTable, ShardedPeerTable
+from services.routing_service.circuit_breaker import BreakerTable
+from services.routing_service.neighbor_table import NeighborTable
+from services.routing_service.strategies import NextHopStrategy
+
+client = TestClient(routing_api.app)
+
+_REAL_CLIENT = httpx.AsyncClient
+
+AUTH_HEADERS = {
+    "X-Device-Fp": routing_api.DEV_DEVICE_FP,
+    "X-Device-Token": routing_api.DEV_DEVICE_TOKEN,
+}
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch, tmp_path):
+    monkeypatch.setattr(router_db, "DB_PATH", str(tmp_path / "routing.db"))
+    router_db.init_db()
+    monkeypatch.setattr(ids_module, "LOG_PATH", tmp_path / "ids.log", raising=False)
+    monkeypatch.setattr(ids_module, "_seen_msg_ids", DedupTable())
+    monkeypatch.setattr(ids_module, "_peer_windows", ShardedPeerTable(10_000))
+    # a strategy block in a test config swaps strategies.STRATEGY; undo that
+    monkeypatch.setattr(strategies, "STRATEGY", strategies.STRATEGY)
+    monkeypatch.setattr(strategies, "_settings", strategies._settings)
+
+
+def _use_node(monkeypatch, node_fp="R1", **overrides):
+    cfg = config_loader.current().merged({"node_fp": node_fp, "forwarding_enabled": True, **overrides})
+    monkeypatch.setattr(config_loader, "_current", cfg)
+    return cfg
+
+
+def _env(sender="S", recipient="D", msg_id=None, ack_for="", priority="normal"):
+    return MessageEnvelope(
+        header=EnvelopeHeader(
+            sender_fp=sender,
+            recipient_fp=recipient,
+            msg_id=msg_id or str(uuid.uuid4()),
+            nonce="dummy",
+            ttl=4,
+            hop_count=1,
+            ts=current_unix_ts(),
+        ),
+        ciphertext="" if ack_for else "deadbeef",
+        chunks=ChunkInfo(),
+        routing=RoutingMeta(ack_for=ack_for, priority=priority),
+    )
+
+
+def _receive(env, peer=None):
+    payload = {"chunk": env.model_dump(), "link_meta": {"peer": peer or env.header.sender_fp, "rssi": -50}}
+    return client.post("/v1/router/on_chunk_received", json=payload, headers=AUTH_HEADERS).json()
+
+
+def test_delivery_queues_high_priority_ack(monkeypatch):
+    _use_node(monkeypatch, "R1")
+    router_db.enqueue_message("earlier", _env().model_dump_json(), 4)
+    env = _env(sender="S", recipient="R1")
+
+    assert _receive(env) == {"accepted": True, "action": "final"}
+    rows = router_db.get_outgoing()
+    # the ACK jumps the queue
+    assert [row["msg_id"] for row in rows] == [f"ack:{env.header.msg_id}", "earlier"]
+    ack = MessageEnvelope.model_validate_json(rows[0]["envelope_json"])
+    assert (ack.header.sender_fp, ack.header.recipient_fp) == ("R1", "S")
+    assert (ack.routing.ack_for, ack.routing.priority, ack.ciphertext) == (env.header.msg_id, "high", "")
+    # ACKs are broadcast, whatever the neighbor table knows
+    assert router_loop.next_hop_for(ack) is None
+
+    # a repeated delivery is not acknowledged twice
+    monkeypatch.setattr(ids_module, "_seen_msg_ids", DedupTable())
+    assert _receive(env)["reason"] == "duplicate"
+    assert len(router_db.get_outgoing()) == 2
+
+
+def test_acks_can_be_disabled(monkeypatch):
+    _use_node(monkeypatch, "R1", delivery_acks=False)
+    assert _receive(_env(recipient="R1"))["action"] == "final"
+    assert router_db.get_outgoing() == []
+
+
+def test_relayed_ack_cancels_copies_and_late_copies(monkeypatch):
+    _use_node(monkeypatch, "R1")
+    queued, unseen = _env(), _env()
+    assert _receive(queued, peer="R0")["action"] == "forward"
+
+    for data in (queued, unseen):
+        ack = _env(sender="D", recipient="S", msg_id=f"ack:{data.header.msg_id}", ack_for=data.header.msg_id)
+        assert _receive(ack, peer="R2")["action"] == "forward"
+
+    # only the ACKs are left to send; the data copy is cancelled, not dropped
+    assert {row["msg_id"] for row in router_db.get_outgoing()} == {
+        f"ack:{queued.header.msg_id}", f"ack:{unseen.header.msg_id}",
+    }
+    conn = router_db.get_connection()
+    status = conn.execute("SELECT status FROM queue WHERE msg_id = ?", (queued.header.msg_id,)).fetchone()[0]
+    conn.close()
+    assert status == "acked"
+    # a copy arriving after its ACK is a duplicate
+    assert _receive(unseen, peer="R0") == {"accepted": False, "action": "drop"}
+
+
+def test_ack_reaching_the_origin_is_final(monkeypatch):
+    _use_node(monkeypatch, "S", strategy={"name": "spray_and_wait"})
+    env = _env(sender="S", recipient="D")
+    assert client.post("/v1/router/enqueue", json=env.model_dump(), headers=AUTH_HEADERS).json()["queued"]
+
+    ack = _env(sender="D", recipient="S", msg_id=f"ack:{env.header.msg_id}", ack_for=env.header.msg_id)
+    assert _receive(ack, peer="R1") == {"accepted": True, "action": "final"}
+    assert router_db.get_outgoing() == []
+    assert router_db.fetch_inbox(limit=10) == []
+
+
+class _Node:
+    """
+    One router with its own DB, config, IDS state and neighbor table,
+    swapped into the module globals while it is active.
+    """
+
+    def __init__(self, name, tmp_path, acks):
+        self.fp = name
+        self.db = str(tmp_path / f"{name}.db")
+        self.cfg = config_loader.current().merged({
+            "node_fp": name,
+            "forwarding_enabled": True,
+            "delivery_acks": acks,
+            "max_retries": 10,
+            "base_retry_backoff_ms": 0,
+            "retry_jitter_ms": 0,
+            "ids": {"max_msgs_per_window": 1_000_000},
+        })
+        self.neighbors = NeighborTable()
+        self.breakers = BreakerTable()
+        self.strategy = NextHopStrategy(self.neighbors)
+        self.seen = DedupTable()
+        self.windows = ShardedPeerTable(10_000)
+        self.counts = ShardedPeerTable(10_000)
+        self.blocked = BlockedPeerTable(1_000)
+
+    def activate(self, monkeypatch):
+        monkeypatch.setattr(router_db, "DB_PATH", self.db)
+        monkeypatch.setattr(config_loader, "_current", self.cfg)
+        monkeypatch.setattr(ids_module, "_seen_msg_ids", self.seen)
+        monkeypatch.setattr(ids_module, "_peer_windows", self.windows)
+        monkeypatch.setattr(ids_module, "_peer_suspicious_counts", self.counts)
+        monkeypatch.setattr(ids_module, "_blocked_peers", self.blocked)
+        monkeypatch.setattr(routing_api, "NEIGHBORS", self.neighbors)
+        monkeypatch.setattr(router_loop, "NEIGHBORS", self.neighbors)
+        monkeypatch.setattr(router_loop, "BREAKERS", self.breakers)
+        monkeypatch.setattr(strategies, "STRATEGY", self.strategy)
+
+
+def _run_diamond(monkeypatch, tmp_path, acks, count=20, rounds=12):
+    """
+    A reaches D through B and C; the B -> D direction is dead, so B's copy
+    fails every attempt. Every node runs the real router loop; the BLE
+    adapter is a mock that hands frames to the neighbors' ingress.
+    Returns (messages delivered at D, data envelopes in failed transmissions).
+    """
+    links = {"A": "BC", "B": "AD", "C": "AD", "D": "BC"}
+    monkeypatch.setattr(circuit_breaker, "_monotonic", lambda: 0.0)
+    dead = {("B", "D")}
+    workdir = tmp_path / ("acks" if acks else "plain")
+    workdir.mkdir()
+    nodes = {name: _Node(name, workdir, acks) for name in links}
+    for node in nodes.values():
+        node.activate(monkeypatch)
+        router_db.init_db()
+    active = {}
+    failed = []
+
+    def handler(request):
+        body = json.loads(request.content)
+        sender = active["node"]
+        target = body["target_peer"]
+        receivers = [
+            n for n in links[sender.fp]
+            if (sender.fp, n) not in dead and target in (None, n)
+        ]
+        chunks = body.get("bundle") or [body["chunk"]]
+        if not receivers:
+            failed.extend(sender.fp for chunk in chunks if not chunk["routing"]["ack_for"])
+        for name in receivers:
+            nodes[name].activate(monkeypatch)
+            frames = [{"chunk": chunk, "link_meta": {"peer": sender.fp, "rssi": -50}} for chunk in chunks]
+            routing_api._ingest_batch(frames, nodes[name].cfg)
+        sender.activate(monkeypatch)
+        return httpx.Response(200 if receivers else 503)
+
+    monkeypatch.setattr(
+        router_loop.httpx, "AsyncClient",
+        lambda: _REAL_CLIENT(transport=httpx.MockTransport(handler)),
+    )
+
+    nodes["A"].activate(monkeypatch)
+    for _ in range(count):
+        env = _env(sender="A", recipient="D")
+        assert client.post("/v1/router/enqueue", json=env.model_dump(), headers=AUTH_HEADERS).json()["queued"]
+
+    for _ in range(rounds):
+        for name, node in nodes.items():
+            # beacons: every node hears its neighbors
+            for other in links[name]:
+                node.neighbors.observe(other, -50, other, 1)
+            node.activate(monkeypatch)
+            active["node"] = node
+            asyncio.run(router_loop.process_outgoing_queue())
+
+    nodes["D"].activate(monkeypatch)
+    return len(router_db.fetch_inbox(limit=count * 2)), failed
+
+
+def test_acks_stop_retry_traffic_after_delivery(monkeypatch, tmp_path):
+    count = 20
+    delivered_plain, failed_plain = _run_diamond(monkeypatch, tmp_path, acks=False, count=count)
+    delivered_acks, failed_acks = _run_diamond(monkeypatch, tmp_path, acks=True, count=count)
+    print(f"\nfailed retransmissions: {len(failed_plain)} without ACKs, {len(failed_acks)} with ACKs")
+
+    assert delivered_plain == delivered_acks == count
+    # without ACKs B retries its copy until its breaker to D opens
+    # (failure_threshold failed bundles; the clock does not reach a probe)
+    assert failed_plain.count("B") == count * BreakerTable().failure_threshold
+    # with ACKs it gives up after the first attempt, once D's ACK reaches it
+    assert failed_acks.count("B") <= count
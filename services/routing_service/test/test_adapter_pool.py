@@ -0,0 +1,226 @@
+# services/routing_service/test/test_adapter_pool.py
+# multiple BLE adapters: config validation, least-outstanding / weighted balancing, sticky targets, failover and health checks.
+# test: pytest services/routing_service/test/test_adapter_pool.py -v -s
+import asyncio
+import json
+import uuid
+from collections import Counter
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from lib.envelope import MessageEnvelope, EnvelopeHeader, ChunkInfo, RoutingMeta
+from lib.utils import current_unix_ts
+from services.ble_adapter import mock_ble
+from services.routing_service import adapter_pool, config_loader, router_db, router_loop, strategies
+from services.routing_service.adapter_pool import AdapterPool
+from services.routing_service.circuit_breaker import BreakerTable
+from services.routing_service.config_loader import AdapterEndpoint, RoutingConfig
+from services.routing_service.neighbor_table import NeighborTable
+from services.routing_service.strategies import NextHopStrategy
+
+_REAL_CLIENT = httpx.AsyncClient
+
+URL_A = "http://ble-a/v1/ble/send_chunk"
+URL_B = "http://ble-b/v1/ble/send_chunk"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000.0]
+    monkeypatch.setattr(adapter_pool, "_monotonic", lambda: now[0])
+    return now
+
+
+def test_endpoints_are_validated():
+    cfg = RoutingConfig.from_dict({"ble_adapter_url": URL_A})
+    assert cfg.ble_adapter_endpoints == (AdapterEndpoint(URL_A),)
+    assert cfg.ble_adapter_endpoints[0].health_url == "http://ble-a/v1/ble/health"
+
+    with pytest.raises(ValueError) as exc:
+        RoutingConfig.from_dict({"ble_adapters": {
+            "balance": "random",
+            "endpoints": [{"url": URL_A, "weight": 0}, {"weight": 1}, {"url": URL_B}, {"url": URL_B}],
+        }})
+    msg = str(exc.value)
+    assert msg.count("ble_adapters.balance") == 1
+    assert "endpoints[0].weight" in msg
+    assert "endpoints[1].url" in msg
+    assert "must not repeat" in msg
+
+    cfg = RoutingConfig.from_dict({"ble_adapters": {"fail_after": 2, "balance": "weighted"}})
+    pool = AdapterPool.from_config(cfg.ble_adapter_endpoints, cfg.ble_adapters)
+    assert (pool.fail_after, pool.balance, pool.sticky_seconds) == (2, "weighted", 300.0)
+    with pytest.raises(ValueError) as exc:
+        RoutingConfig.from_dict({"ble_adapters": {"fail_after": 0, "sticky_seconds": "5m"}})
+    assert "ble_adapters.fail_after" in str(exc.value)
+    assert "ble_adapters.sticky_seconds" in str(exc.value)
+
+
+def test_least_outstanding_weighted_and_sticky(clock):
+    pool = AdapterPool([AdapterEndpoint(URL_A, weight=2), AdapterEndpoint(URL_B)], sticky_seconds=60)
+    for i in range(9):
+        adapter = pool.pick(f"N{i}")
+        pool.assign(adapter, 1)
+    assert Counter(a["outstanding"] for a in pool.stats()["adapters"]) == Counter([6, 3])
+    # a target keeps its adapter, even a busy one, until it has been idle
+    # for sticky_seconds
+    first = pool.pick("N0")
+    assert first.url == URL_A
+    pool.assign(first, 100)
+    assert all(pool.pick("N0").url == URL_A for _ in range(5))
+    clock[0] += 61
+    assert pool.pick("N0").url == URL_B
+
+    rr = AdapterPool([AdapterEndpoint(URL_A, weight=2), AdapterEndpoint(URL_B)], balance="weighted")
+    assert [rr.pick(f"T{i}").url for i in range(6)] == [URL_A, URL_B, URL_A] * 2
+
+
+def test_unanswered_adapter_leaves_rotation_and_comes_back(clock):
+    pool = AdapterPool([AdapterEndpoint(URL_A), AdapterEndpoint(URL_B)], fail_after=2, health_check_seconds=10)
+    a = pool.pick("N1")
+    assert a.url == URL_A
+    pool.record(a, False)
+    assert pool.pick("N2").url == URL_B
+    pool.record(a, False)
+    assert [x["healthy"] for x in pool.stats()["adapters"]] == [False, True]
+    assert pool.pick("N1").url == URL_B          # the sticky target moves
+    assert pool.due_checks() == []
+    clock[0] += 10
+    assert [x.url for x in pool.due_checks()] == [URL_A]
+    pool.health_result(a, True)
+    assert pool.stats()["adapters"][0]["healthy"]
+
+    # a single adapter is never taken out: there is nothing to fail over to
+    solo = AdapterPool([AdapterEndpoint(URL_A)], fail_after=1)
+    solo.record(solo.pick(None), False)
+    assert solo.stats()["adapters"][0]["healthy"]
+
+
+def _env(recipient):
+    return MessageEnvelope(
+        header=EnvelopeHeader(
+            sender_fp="S",
+            recipient_fp=recipient,
+            msg_id=str(uuid.uuid4()),
+            nonce="dummy",
+            ttl=4,
+            hop_count=0,
+            ts=current_unix_ts(),
+        ),
+        ciphertext="deadbeef",
+        chunks=ChunkInfo(),
+        routing=RoutingMeta(),
+    )
+
+
+@pytest.fixture
+def router(monkeypatch, tmp_path, clock):
+    monkeypatch.setattr(router_db, "DB_PATH", str(tmp_path / "routing.db"))
+    router_db.init_db()
+    table = NeighborTable(neighbor_timeout_seconds=10**9)
+    for i in range(6):
+        table.observe(f"N{i}", -50, f"D{i}", 1)
+    monkeypatch.setattr(router_loop, "NEIGHBORS", table)
+    monkeypatch.setattr(strategies, "STRATEGY", NextHopStrategy(table))
+    monkeypatch.setattr(router_loop, "BREAKERS", BreakerTable())
+    pool = AdapterPool()
+    monkeypatch.setattr(router_loop, "POOL", pool)
+    cfg = config_loader.current().merged({
+        "base_retry_backoff_ms": 0,
+        "retry_jitter_ms": 0,
+        "bundling": {"max_items": 4},
+        "ble_adapters": {
+            "endpoints": [{"url": URL_A}, {"url": URL_B}],
+            "fail_after": 2,
+            "health_check_seconds": 10,
+        },
+    })
+    monkeypatch.setattr(config_loader, "_current", cfg)
+
+    down = set()
+    log = []
+    # outstanding per adapter at each delivered transmission
+    load = []
+
+    def handler(request):
+        host = request.url.host
+        if host in down:
+            raise httpx.ConnectError(f"{host} unreachable")
+        if request.method == "GET":
+            log.append((host, "health", None))
+            return httpx.Response(200, json={"ok": True})
+        load.append(tuple(a["outstanding"] for a in pool.stats()["adapters"]))
+        body = json.loads(request.content)
+        for chunk in body.get("bundle") or [body["chunk"]]:
+            log.append((host, body["target_peer"], chunk["header"]["msg_id"]))
+        return httpx.Response(200)
+
+    monkeypatch.setattr(
+        router_loop.httpx, "AsyncClient",
+        lambda: _REAL_CLIENT(transport=httpx.MockTransport(handler)),
+    )
+    return pool, down, log, load
+
+
+def _enqueue(n):
+    for i in range(n):
+        env = _env(f"D{i % 6}")
+        router_db.enqueue_message(env.header.msg_id, env.model_dump_json(), 4)
+
+
+def test_router_loop_spreads_targets_and_fails_over(router, clock):
+    pool, down, log, _ = router
+    _enqueue(60)
+    asyncio.run(router_loop.process_outgoing_queue())
+    assert router_db.get_outgoing() == []
+    by_host = Counter(host for host, _, _ in log)
+    assert by_host == {"ble-a": 30, "ble-b": 30}
+    # sticky: every target went through exactly one adapter
+    assignment = {}
+    for host, target, _ in log:
+        assert assignment.setdefault(target, host) == host
+
+    # ble-a dies: its targets move to ble-b in the same pass, nothing is lost
+    log.clear()
+    down.add("ble-a")
+    _enqueue(60)
+    asyncio.run(router_loop.process_outgoing_queue())
+    assert router_db.get_outgoing() == []
+    assert Counter(host for host, _, _ in log) == {"ble-b": 60}
+    stats = pool.stats()
+    assert [a["healthy"] for a in stats["adapters"]] == [False, True]
+    assert stats["failovers"] >= 2
+    conn = router_db.get_connection()
+    assert conn.execute("SELECT MAX(retries) FROM queue").fetchone()[0] == 0
+    conn.close()
+
+    # back up: the health check brings it back into rotation
+    log.clear()
+    down.clear()
+    clock[0] += 10
+    _enqueue(6)
+    asyncio.run(router_loop.process_outgoing_queue())
+    assert ("ble-a", "health", None) in log
+    assert all(a["healthy"] for a in pool.stats()["adapters"])
+
+
+def test_failover_moves_outstanding_to_the_carrying_adapter(router, monkeypatch):
+    pool, down, log, load = router
+    monkeypatch.setattr(config_loader, "_current", config_loader.current().merged({"bundling": {"enabled": False}}))
+    down.add("ble-a")
+    for _ in range(3):
+        env = _env("D0")
+        router_db.enqueue_message(env.header.msg_id, env.model_dump_json(), 4)
+    asyncio.run(router_loop.process_outgoing_queue())
+
+    # N0 was assigned to ble-a; each transmission counts against ble-b,
+    # which carries it, while in flight
+    assert [host for host, _, _ in log] == ["ble-b"] * 3
+    assert load == [(2, 1), (1, 1), (0, 1)]
+    assert [a["outstanding"] for a in pool.stats()["adapters"]] == [0, 0]
+
+
+def test_mock_ble_health():
+    assert TestClient(mock_ble.app).get("/v1/ble/health").json() == {"ok": True}
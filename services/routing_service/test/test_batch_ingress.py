@@ -0,0 +1,109 @@
+# services/routing_service/test/test_batch_ingress.py
+# batch BLE ingress: per-item parity with on_chunk_received, limits, and amortized cost.
+# test: pytest services/routing_service/test/test_batch_ingress.py -v -s
+import time
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from lib.envelope import MessageEnvelope, EnvelopeHeader, ChunkInfo, RoutingMeta
+from lib.utils import current_unix_ts
+from services.routing_service import config_loader, ids_module, routing_api
+from services.routing_service.ids_state import BlockedPeerTable, DedupTable, ShardedPeerTable
+
+client = TestClient(routing_api.app)
+
+AUTH_HEADERS = {
+    "X-Device-Fp": routing_api.DEV_DEVICE_FP,
+    "X-Device-Token": routing_api.DEV_DEVICE_TOKEN,
+}
+
+
+def _reset(monkeypatch, tmp_path):
+    monkeypatch.setattr(ids_module, "LOG_PATH", tmp_path / "ids.log", raising=False)
+    monkeypatch.setattr(ids_module, "_peer_windows", ShardedPeerTable(10_000))
+    monkeypatch.setattr(ids_module, "_peer_suspicious_counts", ShardedPeerTable(10_000))
+    monkeypatch.setattr(ids_module, "_seen_msg_ids", DedupTable())
+    monkeypatch.setattr(ids_module, "_blocked_peers", BlockedPeerTable(1_000))
+    monkeypatch.setattr(ids_module, "_monotonic", lambda: 1_000.0)
+
+
+def _item(sender="A", msg_id=None, ttl=4, age=0):
+    env = MessageEnvelope(
+        header=EnvelopeHeader(
+            sender_fp=sender,
+            recipient_fp="B",
+            msg_id=msg_id or str(uuid.uuid4()),
+            nonce="dummy",
+            ttl=ttl,
+            hop_count=0,
+            ts=current_unix_ts() - age,
+        ),
+        ciphertext="deadbeef",
+        chunks=ChunkInfo(),
+        routing=RoutingMeta(),
+    )
+    return {"chunk": env.model_dump(), "link_meta": {"peer": sender, "rssi": -50}}
+
+
+def test_verdicts_match_single_endpoint(monkeypatch, tmp_path):
+    burst = config_loader.current().ids.max_msgs_per_window
+    items = [
+        _item(msg_id="ok-1"),
+        _item(msg_id="ok-1"),                    # duplicate inside the batch
+        _item(msg_id="bad-ttl", ttl=99),          # 400
+        _item(msg_id="old", age=10 * 24 * 3600),  # too old -> drop
+        {"chunk": {"header": {"msg_id": "broken"}}},
+    ] + [_item(sender="noisy") for _ in range(burst + 3)]  # last 3 rate-limited
+
+    _reset(monkeypatch, tmp_path)
+    resp = client.post("/v1/router/on_chunks_received", json={"items": items}, headers=AUTH_HEADERS)
+    assert resp.status_code == 200
+    batch = resp.json()["verdicts"]
+
+    _reset(monkeypatch, tmp_path)
+    single = []
+    for item in items:
+        r = client.post("/v1/router/on_chunk_received", json=item, headers=AUTH_HEADERS)
+        body = r.json()
+        single.append(body if r.status_code == 200 else {"status": r.status_code, **body["detail"]})
+
+    assert len(batch) == len(items)
+    assert [b["msg_id"] for b in batch[:5]] == ["ok-1", "ok-1", "bad-ttl", "old", "broken"]
+    for b, s in zip(batch, single):
+        b = dict(b)
+        b.pop("msg_id")
+        assert b == s
+    assert [b["action"] for b in batch[-4:]] == ["final", "drop", "drop", "drop"]
+
+
+def test_batch_limits(monkeypatch):
+    resp = client.post("/v1/router/on_chunks_received", json={"items": "nope"}, headers=AUTH_HEADERS)
+    assert resp.status_code == 400
+
+    monkeypatch.setattr(
+        config_loader, "_current", config_loader.current().merged({"ingress": {"max_batch_items": 2}})
+    )
+    items = [_item() for _ in range(3)]
+    resp = client.post("/v1/router/on_chunks_received", json={"items": items}, headers=AUTH_HEADERS)
+    assert resp.status_code == 413
+
+
+def test_batch_is_cheaper_than_single_calls(monkeypatch, tmp_path):
+    _reset(monkeypatch, tmp_path)
+    items = [_item(sender=f"peer-{i % 50}") for i in range(500)]
+
+    t0 = time.perf_counter()
+    for item in items:
+        client.post("/v1/router/on_chunk_received", json=item, headers=AUTH_HEADERS)
+    single = time.perf_counter() - t0
+
+    _reset(monkeypatch, tmp_path)
+    t0 = time.perf_counter()
+    resp = client.post("/v1/router/on_chunks_received", json={"items": items}, headers=AUTH_HEADERS)
+    batch = time.perf_counter() - t0
+
+    assert len(resp.json()["verdicts"]) == 500
+    print(f"\n500 chunks: single calls {single * 1000:.0f} ms, one batch {batch * 1000:.0f} ms")
+    assert batch < single / 2
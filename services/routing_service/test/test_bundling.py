@@ -0,0 +1,166 @@
+# services/routing_service/test/test_bundling.py
+# per-target bundling: size-bounded bundles in the router loop, unpacking on ingress, envelopes per transmission.
+# test: pytest services/routing_service/test/test_bundling.py -v -s
+import asyncio
+import json
+import uuid
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from lib.envelope import MessageEnvelope, EnvelopeHeader, ChunkInfo, RoutingMeta
+from lib.utils import current_unix_ts
+from services.ble_adapter import mock_ble
+from services.routing_service import config_loader, ids_module, router_db, router_loop, routing_api, strategies
+from services.routing_service.circuit_breaker import BreakerTable
+from services.routing_service.ids_state import DedupTable, ShardedPeerTable
+from services.routing_service.neighbor_table import NeighborTable
+from services.routing_service.strategies import NextHopStrategy
+
+client = TestClient(routing_api.app)
+
+AUTH_HEADERS = {
+    "X-Device-Fp": routing_api.DEV_DEVICE_FP,
+    "X-Device-Token": routing_api.DEV_DEVICE_TOKEN,
+}
+
+_REAL_CLIENT = httpx.AsyncClient
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch, tmp_path):
+    monkeypatch.setattr(router_db, "DB_PATH", str(tmp_path / "routing.db"))
+    router_db.init_db()
+    monkeypatch.setattr(ids_module, "LOG_PATH", tmp_path / "ids.log", raising=False)
+    monkeypatch.setattr(ids_module, "_seen_msg_ids", DedupTable())
+    monkeypatch.setattr(ids_module, "_peer_windows", ShardedPeerTable(10_000))
+    monkeypatch.setattr(router_loop, "BREAKERS", BreakerTable())
+
+
+def _env(recipient="D", msg_id=None, size=100):
+    return MessageEnvelope(
+        header=EnvelopeHeader(
+            sender_fp="S",
+            recipient_fp=recipient,
+            msg_id=msg_id or str(uuid.uuid4()),
+            nonce="dummy",
+            ttl=4,
+            hop_count=0,
+            ts=current_unix_ts(),
+        ),
+        ciphertext="a" * size,
+        chunks=ChunkInfo(),
+        routing=RoutingMeta(),
+    )
+
+
+def test_bundles_respect_size_and_count():
+    items = [(None, i, "x" * 99) for i in range(10)]     # 100 bytes each with the separator
+    assert [len(b) for b in router_loop._bundles(items, 2 + 300, 32)] == [3, 3, 3, 1]
+    assert [len(b) for b in router_loop._bundles(items, 10_000, 4)] == [4, 4, 2]
+    # an envelope over the limit on its own still goes out, alone
+    big = [(None, 0, "x" * 500), (None, 1, "x" * 10)]
+    assert [len(b) for b in router_loop._bundles(big, 100, 32)] == [1, 1]
+
+
+def test_bundling_settings_are_validated():
+    cfg = config_loader.RoutingConfig.from_dict({"bundling": {"max_items": 4}})
+    assert cfg.bundling == config_loader.BundlingConfig(enabled=True, max_items=4)
+    with pytest.raises(ValueError) as exc:
+        config_loader.RoutingConfig.from_dict({"bundling": {"enabled": "yes", "max_items": 0}})
+    assert "bundling.enabled" in str(exc.value)
+    assert "bundling.max_items" in str(exc.value)
+
+
+def _run_pass(monkeypatch, respond=200):
+    transmissions = []
+
+    def handler(request):
+        body = json.loads(request.content)
+        transmissions.append((body["target_peer"], body.get("bundle") or [body["chunk"]], len(request.content)))
+        return httpx.Response(respond)
+
+    monkeypatch.setattr(
+        router_loop.httpx, "AsyncClient",
+        lambda: _REAL_CLIENT(transport=httpx.MockTransport(handler)),
+    )
+    asyncio.run(router_loop.process_outgoing_queue())
+    return transmissions
+
+
+@pytest.fixture
+def router(monkeypatch):
+    table = NeighborTable()
+    table.observe("N1", -50, "D", 2)
+    monkeypatch.setattr(router_loop, "NEIGHBORS", table)
+    monkeypatch.setattr(strategies, "STRATEGY", NextHopStrategy(table))
+    return table
+
+
+def _use_bundling(monkeypatch, **settings):
+    cfg = config_loader.current().merged({"bundling": settings, "max_envelope_bytes": 8192})
+    monkeypatch.setattr(config_loader, "_current", cfg)
+    return cfg
+
+
+@pytest.mark.parametrize("enabled", [False, True])
+def test_router_loop_bundles_per_target(monkeypatch, router, enabled):
+    _use_bundling(monkeypatch, enabled=enabled, max_items=32)
+    for i in range(40):
+        env = _env(recipient="D" if i % 8 else "X")
+        router_db.enqueue_message(env.header.msg_id, env.model_dump_json(), 4)
+
+    transmissions = _run_pass(monkeypatch)
+    envelopes = sum(len(chunks) for _, chunks, _ in transmissions)
+    print(
+        f"\nbundling {'on' if enabled else 'off'}: {envelopes} envelopes in "
+        f"{len(transmissions)} transmissions ({envelopes / len(transmissions):.1f} per wakeup)"
+    )
+    assert envelopes == 40
+    assert router_db.get_outgoing() == []
+    if not enabled:
+        assert len(transmissions) == 40
+        return
+    # 35 for N1 (two bundles within 8 KB), 5 broadcast (one bundle)
+    assert sorted((target or "", len(chunks)) for target, chunks, _ in transmissions)[0] == ("", 5)
+    assert len(transmissions) == 3
+    for _, chunks, _ in transmissions:
+        assert sum(len(json.dumps(c, separators=(",", ":"))) + 1 for c in chunks) + 1 <= 8192
+    assert router.neighbor("N1").sent == len(transmissions) - 1
+
+
+def test_failed_bundle_retries_every_row(monkeypatch, router):
+    _use_bundling(monkeypatch, max_items=32)
+    for _ in range(5):
+        env = _env()
+        router_db.enqueue_message(env.header.msg_id, env.model_dump_json(), 4)
+
+    assert len(_run_pass(monkeypatch, respond=503)) == 1
+    assert [row["retries"] for row in router_db.get_outgoing()] == [1] * 5
+
+
+def test_bundle_ingress_gives_a_verdict_per_envelope(monkeypatch):
+    cfg = config_loader.current().merged({"node_fp": "R1", "forwarding_enabled": True})
+    monkeypatch.setattr(config_loader, "_current", cfg)
+    first, local = _env(), _env(recipient="R1")
+    bundle = [first.model_dump(), local.model_dump(), first.model_dump(), {"header": {}}]
+    resp = client.post(
+        "/v1/router/on_chunk_received",
+        json={"bundle": bundle, "link_meta": {"peer": "N1", "rssi": -60}},
+        headers=AUTH_HEADERS,
+    )
+    verdicts = resp.json()["verdicts"]
+    assert [v.get("action") for v in verdicts] == ["forward", "final", "drop", None]
+    assert verdicts[0]["msg_id"] == first.header.msg_id
+    assert verdicts[3]["status"] == 400
+
+    resp = client.post("/v1/router/on_chunk_received", json={"bundle": "nope"}, headers=AUTH_HEADERS)
+    assert resp.status_code == 400
+
+
+def test_mock_ble_accepts_bundles():
+    ble = TestClient(mock_ble.app)
+    bundle = [_env().model_dump(), _env().model_dump()]
+    assert ble.post("/v1/ble/send_chunk", json={"bundle": bundle, "target_peer": None}).json()["queued"] is True
+    assert ble.post("/v1/ble/send_chunk", json={"chunk": bundle[0], "target_peer": "N1"}).json()["queued"] is True
@@ -0,0 +1,255 @@
+# services/routing_service/test/test_circuit_breaker.py
+# per-target circuit breakers: closed / open / half-open transitions, adapter outages, retries saved on a dead link, adaptive backoff.
+# test: pytest services/routing_service/test/test_circuit_breaker.py -v -s
+import asyncio
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+from lib.envelope import MessageEnvelope, EnvelopeHeader, ChunkInfo, RoutingMeta
+from lib.utils import current_unix_ts
+from services.routing_service import circuit_breaker, config_loader, router_db, router_loop, strategies
+from services.routing_service.circuit_breaker import ADAPTER, CLOSED, HALF_OPEN, OPEN, PROBE, BreakerTable
+from services.routing_service.neighbor_table import NeighborTable
+from services.routing_service.strategies import NextHopStrategy
+
+_REAL_CLIENT = httpx.AsyncClient
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000.0]
+    monkeypatch.setattr(circuit_breaker, "_monotonic", lambda: now[0])
+    return now
+
+
+def test_breaker_opens_probes_and_closes(clock):
+    table = BreakerTable(failure_threshold=3, open_seconds=10, max_open_seconds=25)
+    for _ in range(2):
+        assert table.acquire("N1") == CLOSED
+        table.record("N1", False)
+    table.record("N1", True)                 # a success resets the streak
+    for _ in range(3):
+        table.record("N1", False)
+    assert table.state("N1") == OPEN
+    assert table.acquire("N1") is None
+    assert table.acquire("N2") == CLOSED
+
+    clock[0] += 10
+    assert table.acquire("N1") == PROBE
+    assert table.state("N1") == HALF_OPEN
+    assert table.acquire("N1") is None       # one probe at a time
+    table.record("N1", False)                # failed probe: open twice as long
+    clock[0] += 10
+    assert table.acquire("N1") is None
+    clock[0] += 10
+    assert table.acquire("N1") == PROBE
+    table.record("N1", False)
+    assert table.stats()["not_closed"]["N1"]["open_for"] == 25
+
+    clock[0] += 25
+    assert table.acquire("N1") == PROBE
+    table.record("N1", True)
+    assert table.state("N1") == CLOSED
+    assert table.acquire("N1") == CLOSED
+    assert table.stats()["probes"] == 3
+
+
+def test_adapter_outage_does_not_blame_peers(clock):
+    table = BreakerTable(failure_threshold=2, open_seconds=5)
+    table.record("N1", False, adapter_ok=False)
+    table.record(None, False, adapter_ok=False)
+    assert table.state(ADAPTER) == OPEN
+    assert table.state("N1") == table.state(None) == CLOSED
+    assert table.acquire("N2") is None
+
+    clock[0] += 5
+    assert table.acquire("N2") == PROBE
+    table.record("N2", True)
+    assert table.state(ADAPTER) == CLOSED
+
+
+def test_backoff_follows_failure_rate():
+    table = BreakerTable(failure_alpha=0.5)
+    assert table.backoff_factor(4, "N1") == 1.0
+    table.record("N1", False)
+    table.record("N1", False)
+    assert table.backoff_factor(4, "N1") == pytest.approx(1 + 4 * 0.75)
+    # a failing neighbor does not slow down the others
+    assert table.backoff_factor(4, "N2") == 1.0
+    table.record("N1", True)
+    assert table.backoff_factor(4, "N1") == pytest.approx(1 + 4 * 0.375)
+
+    # adapter faults count for every target
+    table.record("N2", False, adapter_ok=False)
+    assert table.backoff_factor(4, "N2") == pytest.approx(1 + 4 * 0.5)
+    assert table.backoff_factor(4, "N1") == pytest.approx(1 + 4 * (1 - 0.5 * 0.625))
+
+    cfg = config_loader.current().merged({"base_retry_backoff_ms": 1000, "retry_jitter_ms": 0})
+    last = (datetime.now(timezone.utc) - timedelta(seconds=3)).strftime("%Y-%m-%d %H:%M:%S")
+    row = {"retries": 2, "last_update": last}
+    assert router_loop._should_retry(row, cfg)              # 2 s backoff
+    assert not router_loop._should_retry(row, cfg, 2.0)     # 4 s while failing
+    assert router_loop._should_retry(row, cfg, 2.0, max_backoff_ms=2500)
+
+
+def test_breaker_settings_are_validated():
+    cfg = config_loader.RoutingConfig.from_dict({"circuit_breaker": {"failure_threshold": 2, "open_seconds": 30}})
+    table = BreakerTable.from_config(cfg.circuit_breaker)
+    assert (table.failure_threshold, table.open_seconds, table.max_open_seconds) == (2, 30.0, 300.0)
+    with pytest.raises(ValueError) as exc:
+        config_loader.current().merged({"circuit_breaker": {
+            "enabled": 1, "failure_threshold": 0, "failure_alpha": 2, "max_open_seconds": 5, "max_backoff_ms": "1s",
+        }})
+    msg = str(exc.value)
+    for key in ("enabled", "failure_threshold", "failure_alpha", "max_open_seconds", "max_backoff_ms"):
+        assert f"circuit_breaker.{key}" in msg
+
+
+def _env(recipient):
+    return MessageEnvelope(
+        header=EnvelopeHeader(
+            sender_fp="S",
+            recipient_fp=recipient,
+            msg_id=str(uuid.uuid4()),
+            nonce="dummy",
+            ttl=4,
+            hop_count=0,
+            ts=current_unix_ts(),
+        ),
+        ciphertext="deadbeef",
+        chunks=ChunkInfo(),
+        routing=RoutingMeta(),
+    )
+
+
+@pytest.fixture
+def router(monkeypatch, tmp_path, clock):
+    monkeypatch.setattr(router_db, "DB_PATH", str(tmp_path / "routing.db"))
+    router_db.init_db()
+    table = NeighborTable(neighbor_timeout_seconds=10**9)
+    table.observe("N1", -50, "D1", 1)
+    table.observe("N2", -50, "D2", 1)
+    monkeypatch.setattr(router_loop, "NEIGHBORS", table)
+    monkeypatch.setattr(strategies, "STRATEGY", NextHopStrategy(table))
+    breakers = BreakerTable(failure_threshold=5, open_seconds=10)
+    monkeypatch.setattr(router_loop, "BREAKERS", breakers)
+
+    state = {"down": {"N1"}, "adapter_down": False}
+    sent = []
+
+    def handler(request):
+        if state["adapter_down"]:
+            raise httpx.ConnectError("adapter unreachable")
+        body = json.loads(request.content)
+        sent.append(body["target_peer"])
+        return httpx.Response(503 if body["target_peer"] in state["down"] else 200)
+
+    monkeypatch.setattr(
+        router_loop.httpx, "AsyncClient",
+        lambda: _REAL_CLIENT(transport=httpx.MockTransport(handler)),
+    )
+    return breakers, state, sent
+
+
+def _use_breakers(monkeypatch, enabled):
+    cfg = config_loader.current().merged({
+        "base_retry_backoff_ms": 0,
+        "retry_jitter_ms": 0,
+        "bundling": {"enabled": False},
+        "circuit_breaker": {"enabled": enabled},
+    })
+    monkeypatch.setattr(config_loader, "_current", cfg)
+
+
+def _retries():
+    conn = router_db.get_connection()
+    rows = conn.execute("SELECT envelope_json, retries FROM queue WHERE delivered = 0").fetchall()
+    conn.close()
+    return sorted(r[1] for r in rows if json.loads(r[0])["header"]["recipient_fp"] == "D1")
+
+
+@pytest.mark.parametrize("enabled", [False, True])
+def test_dead_link_does_not_burn_the_queue(monkeypatch, router, clock, enabled):
+    breakers, state, sent = router
+    _use_breakers(monkeypatch, enabled)
+    for i in range(40):
+        env = _env("D1" if i % 2 else "D2")
+        router_db.enqueue_message(env.header.msg_id, env.model_dump_json(), 4)
+
+    asyncio.run(router_loop.process_outgoing_queue())
+    retries = _retries()
+    print(
+        f"\nbreakers {'on' if enabled else 'off'}: {sent.count('N1')} transmissions to the dead link, "
+        f"{sum(retries)} retries burned"
+    )
+    # the live link is unaffected either way
+    assert sent.count("N2") == 20
+    if not enabled:
+        assert retries == [1] * 20
+        return
+    assert sent.count("N1") == 5
+    assert retries == [0] * 15 + [1] * 5
+    assert breakers.state("N1") == OPEN
+
+    # still open: nothing goes to N1
+    asyncio.run(router_loop.process_outgoing_queue())
+    assert sent.count("N1") == 5
+
+    # half-open: a single probe, which fails
+    clock[0] += 10
+    asyncio.run(router_loop.process_outgoing_queue())
+    assert sent.count("N1") == 6
+    assert breakers.stats()["not_closed"]["N1"]["open_for"] == 20
+
+    # the link recovers: the probe succeeds and the rest follows
+    state["down"].clear()
+    clock[0] += 20
+    asyncio.run(router_loop.process_outgoing_queue())
+    assert breakers.state("N1") == CLOSED
+    assert router_db.get_outgoing() == []
+
+
+def test_adapter_outage_stops_the_pass(monkeypatch, router):
+    breakers, state, sent = router
+    _use_breakers(monkeypatch, True)
+    state["down"].clear()
+    state["adapter_down"] = True
+    for _ in range(20):
+        env = _env("D2")
+        router_db.enqueue_message(env.header.msg_id, env.model_dump_json(), 4)
+
+    asyncio.run(router_loop.process_outgoing_queue())
+    assert breakers.state(ADAPTER) == OPEN
+    assert breakers.state("N2") == CLOSED
+    assert sorted(row["retries"] for row in router_db.get_outgoing()) == [0] * 15 + [1] * 5
+    # transmissions fail: retries back off harder
+    assert breakers.backoff_factor(4) > 3
+
+
+def test_backoff_is_per_target(monkeypatch, router):
+    breakers, state, sent = router
+    _use_breakers(monkeypatch, True)
+    monkeypatch.setattr(
+        config_loader, "_current", config_loader.current().merged({"base_retry_backoff_ms": 1000})
+    )
+    for recipient in ("D1", "D2"):
+        env = _env(recipient)
+        router_db.enqueue_message(env.header.msg_id, env.model_dump_json(), 4)
+    # both rows failed once, 1.5 s ago (base backoff: 1 s)
+    last = (datetime.now(timezone.utc) - timedelta(seconds=1.5)).strftime("%Y-%m-%d %H:%M:%S")
+    conn = router_db.get_connection()
+    conn.execute("UPDATE queue SET retries = 1, last_update = ?", (last,))
+    conn.commit()
+    conn.close()
+    for _ in range(3):
+        breakers.record("N1", False)
+
+    state["down"].clear()
+    asyncio.run(router_loop.process_outgoing_queue())
+    # N1's failures stretch only its own backoff
+    assert sent == ["N2"]
+    assert _retries() == [1]
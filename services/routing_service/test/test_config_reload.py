@@ -0,0 +1,117 @@
+# services/routing_service/test/test_config_reload.py
+# routing config snapshots: validation, atomic reload, rejected reloads, SIGHUP / file watching.
+# test: pytest services/routing_service/test/test_config_reload.py -v
+import asyncio
+import os
+import signal
+
+import pytest
+
+from services.routing_service import config_loader, ids_module
+from services.routing_service.config_loader import RoutingConfig
+
+
+@pytest.fixture
+def cfg_file(tmp_path, monkeypatch):
+    path = tmp_path / "routing_config.yaml"
+    path.write_text("max_ttl: 8\nids:\n  max_msgs_per_window: 20\n")
+    monkeypatch.setattr(config_loader, "_current", config_loader.load_config(path))
+    return path
+
+
+def _rewrite(path, text):
+    # bump the mtime explicitly; some filesystems only have 1s resolution
+    mtime = path.stat().st_mtime
+    path.write_text(text)
+    os.utime(path, (mtime + 5, mtime + 5))
+
+
+def test_hot_values_are_precomputed():
+    cfg = RoutingConfig.from_dict({
+        "max_ts_skew_seconds": 99_999,
+        "ids": {"window_seconds": 5, "max_msgs_per_window": 20, "block_peer_ttl_seconds": 60},
+    })
+    assert cfg.max_skew == config_loader.HARD_MAX_SKEW
+    assert cfg.ids.emission_interval == 0.25
+    assert cfg.ids.burst_tolerance == 4.75
+    assert cfg.ids.block_peer_ttl.total_seconds() == 60
+
+
+def test_invalid_settings_are_all_reported():
+    with pytest.raises(ValueError) as exc:
+        RoutingConfig.from_dict({"ttl_min": 5, "forwarding_enabled": "yes", "ids": {"window_seconds": -1}})
+    msg = str(exc.value)
+    assert "forwarding_enabled" in msg
+    assert "ids.window_seconds" in msg
+    assert "ttl_default" in msg
+
+
+def test_snapshot_is_immutable():
+    cfg = config_loader.current()
+    with pytest.raises(AttributeError):
+        cfg.max_ttl = 1
+    with pytest.raises(TypeError):
+        cfg.raw["max_ttl"] = 1
+
+
+def test_reload_swaps_snapshot_and_keeps_old_one_intact(cfg_file):
+    in_flight = config_loader.current()
+    _rewrite(cfg_file, "max_ttl: 6\nids:\n  max_msgs_per_window: 2\n")
+
+    assert config_loader.reload() is True
+    assert config_loader.current().max_ttl == 6
+    assert config_loader.current().ids.max_msgs_per_window == 2
+    assert config_loader.ROUTING_CFG["max_ttl"] == 6
+    # a request holding the old snapshot still sees consistent old values
+    assert in_flight.max_ttl == 8
+    assert in_flight.ids.max_msgs_per_window == 20
+
+
+def test_rate_limit_change_applies_without_restart(cfg_file, monkeypatch):
+    monkeypatch.setattr(ids_module, "_monotonic", lambda: 5_000.0)
+    _rewrite(cfg_file, "ids:\n  max_msgs_per_window: 2\n")
+    config_loader.reload()
+
+    allowed = sum(not ids_module.is_rate_limited("reload-peer") for _ in range(10))
+    assert allowed == 2
+
+
+def test_invalid_reload_keeps_previous_config(cfg_file, capsys):
+    before = config_loader.current()
+    _rewrite(cfg_file, "max_ttl: 0\n")
+    assert config_loader.reload() is False
+    assert config_loader.current() is before
+
+    _rewrite(cfg_file, "max_ttl: [unclosed\n")
+    assert config_loader.reload() is False
+    assert config_loader.current() is before
+    assert "rejected" in capsys.readouterr().out
+
+
+def test_watcher_reloads_on_file_change(cfg_file):
+    async def scenario():
+        task = asyncio.create_task(config_loader.watch_config(0.01))
+        _rewrite(cfg_file, "max_ttl: 5\n")
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if config_loader.current().max_ttl == 5:
+                break
+        task.cancel()
+
+    asyncio.run(scenario())
+    assert config_loader.current().max_ttl == 5
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGHUP"), reason="no SIGHUP on this platform")
+def test_sighup_reloads(cfg_file):
+    async def scenario():
+        assert config_loader.install_sighup_handler() is True
+        _rewrite(cfg_file, "max_ttl: 7\n")
+        os.kill(os.getpid(), signal.SIGHUP)
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if config_loader.current().max_ttl == 7:
+                break
+
+    asyncio.run(scenario())
+    assert config_loader.current().max_ttl == 7
@@ -0,0 +1,159 @@
+# services/routing_service/test/test_device_registry.py
+# device registry: token issue / verify, verification cache, revocation, static dev devices.
+# test: pytest services/routing_service/test/test_device_registry.py -v
+import pytest
+from fastapi.testclient import TestClient
+
+from lib.utils import hash_token
+from services.routing_service import device_registry, router_db, routing_api
+from services.routing_service.device_registry import DeviceRegistry
+
+
+@pytest.fixture
+def registry_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(router_db, "DB_PATH", str(tmp_path / "routing.db"))
+    router_db.init_db()
+
+
+@pytest.fixture
+def db_reads(monkeypatch):
+    calls = []
+    real = router_db.get_device
+
+    def counting(device_fp):
+        calls.append(device_fp)
+        return real(device_fp)
+
+    monkeypatch.setattr(router_db, "get_device", counting)
+    return calls
+
+
+def test_register_and_verify_roles(registry_db):
+    reg = DeviceRegistry()
+    token = reg.register("gw-1", ["gateway", "ble"])
+
+    assert reg.verify("gw-1", token) == {"gateway", "ble"}
+    assert reg.verify("gw-1", "wrong-token") is None
+    assert reg.verify("unknown", token) is None
+    # only the hash is stored
+    assert router_db.get_device("gw-1")["token_hash"] == hash_token(token)
+
+
+def test_repeat_callers_hit_the_cache(registry_db, db_reads):
+    reg = DeviceRegistry()
+    token = reg.register("gw-1", ["gateway"])
+
+    for _ in range(100):
+        assert reg.verify("gw-1", token) == {"gateway"}
+    assert len(db_reads) == 1
+    assert reg.stats()["hits"] == 99
+
+
+def test_failed_attempts_are_not_cached(registry_db, db_reads):
+    reg = DeviceRegistry()
+    reg.register("gw-1", ["gateway"])
+
+    for _ in range(3):
+        assert reg.verify("gw-1", "guess") is None
+    assert len(db_reads) == 3
+    assert reg.stats()["cached"] == 0
+
+
+def test_cache_entries_expire(registry_db, db_reads, monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(device_registry, "_monotonic", lambda: clock[0])
+    reg = DeviceRegistry(cache_ttl_seconds=60)
+    token = reg.register("gw-1", ["gateway"])
+
+    reg.verify("gw-1", token)
+    clock[0] += 61
+    reg.verify("gw-1", token)
+    assert len(db_reads) == 2
+
+
+def test_cache_is_bounded(registry_db):
+    reg = DeviceRegistry(cache_size=10)
+    tokens = {f"dev-{i}": reg.register(f"dev-{i}", ["gateway"]) for i in range(50)}
+    for fp, token in tokens.items():
+        assert reg.verify(fp, token) == {"gateway"}
+    assert reg.stats()["cached"] == 10
+
+
+def test_revocation_invalidates_cache_immediately(registry_db):
+    reg = DeviceRegistry(cache_ttl_seconds=3600)
+    token = reg.register("gw-1", ["gateway"])
+    assert reg.verify("gw-1", token) is not None
+
+    assert reg.revoke("gw-1") is True
+    assert reg.verify("gw-1", token) is None
+    assert reg.revoke("never-registered") is False
+
+
+def test_reissued_token_replaces_old_one(registry_db):
+    reg = DeviceRegistry()
+    old = reg.register("gw-1", ["gateway"])
+    reg.verify("gw-1", old)
+
+    new = reg.register("gw-1", ["gateway", "admin"])
+    assert reg.verify("gw-1", old) is None
+    assert reg.verify("gw-1", new) == {"gateway", "admin"}
+
+
+def test_static_devices_without_registry_row(registry_db):
+    reg = DeviceRegistry(static_devices={"dev": {"token_hash": hash_token("t"), "roles": {"admin"}}})
+    assert reg.verify("dev", "t") == {"admin"}
+
+    # a revoked registry row overrides the static entry
+    assert reg.revoke("dev") is True
+    assert reg.verify("dev", "t") is None
+
+
+def test_revoke_endpoint(registry_db, monkeypatch):
+    reg = DeviceRegistry(static_devices=routing_api.DEV_DEVICES)
+    monkeypatch.setattr(routing_api, "DEVICES", reg)
+    client = TestClient(routing_api.app)
+    admin = {
+        "X-Device-Fp": routing_api.DEV_DEVICE_FP,
+        "X-Device-Token": routing_api.DEV_DEVICE_TOKEN,
+    }
+    token = reg.register("ble-1", ["ble"])
+    ble = {"X-Device-Fp": "ble-1", "X-Device-Token": token}
+
+    resp = client.post("/v1/router/mark_delivered", json={"row_id": 1}, headers=ble)
+    assert resp.status_code == 200
+    # role check uses the roles from the same verification
+    resp = client.post("/v1/router/devices/revoke", json={"device_fp": "x"}, headers=ble)
+    assert resp.status_code == 403
+
+    resp = client.post("/v1/router/devices/revoke", json={"device_fp": "ble-1"}, headers=admin)
+    assert resp.json() == {"revoked": True}
+    resp = client.post("/v1/router/mark_delivered", json={"row_id": 1}, headers=ble)
+    assert resp.status_code == 401
+
+    resp = client.post("/v1/router/devices/revoke", json={"device_fp": "ghost"}, headers=admin)
+    assert resp.status_code == 404
+
+
+def test_auth_settings_follow_config_reloads(registry_db, monkeypatch):
+    from services.routing_service import config_loader
+
+    with pytest.raises(ValueError) as exc:
+        config_loader.current().merged({"auth": {"cache_size": 0, "cache_ttl_seconds": "1m"}})
+    assert "auth.cache_size" in str(exc.value)
+    assert "auth.cache_ttl_seconds" in str(exc.value)
+
+    reg = DeviceRegistry.from_config(config_loader.current().auth, static_devices=routing_api.DEV_DEVICES)
+    monkeypatch.setattr(routing_api, "DEVICES", reg)
+    tokens = {f"ble-{i}": reg.register(f"ble-{i}", ["ble"]) for i in range(3)}
+    client = TestClient(routing_api.app)
+
+    monkeypatch.setattr(
+        config_loader, "_current",
+        config_loader.current().merged({"auth": {"cache_size": 2, "cache_ttl_seconds": 5}}),
+    )
+    for fp, token in tokens.items():
+        resp = client.post("/v1/router/mark_delivered", json={"row_id": 1},
+                           headers={"X-Device-Fp": fp, "X-Device-Token": token})
+        assert resp.status_code == 200
+    stats = reg.stats()
+    assert (stats["capacity"], stats["ttl_seconds"], stats["cached"]) == (2, 5.0, 2)
@@ -0,0 +1,185 @@
+# services/routing_service/test/test_duty_cycle.py
+# duty-cycled transmission windows: alignment, high-priority bypass, radio-active time per window under trickle traffic.
+# test: pytest services/routing_service/test/test_duty_cycle.py -v -s
+import asyncio
+import json
+import uuid
+
+import httpx
+import pytest
+
+from lib.envelope import MessageEnvelope, EnvelopeHeader, ChunkInfo, RoutingMeta
+from lib.utils import current_unix_ts
+from services.routing_service import config_loader, duty_cycle, router_db, router_loop, strategies
+from services.routing_service.circuit_breaker import BreakerTable
+from services.routing_service.duty_cycle import DutyCycle, RadioLog
+from services.routing_service.neighbor_table import NeighborTable
+from services.routing_service.router_db import PRIORITY_RANK
+from services.routing_service.strategies import NextHopStrategy
+
+_REAL_CLIENT = httpx.AsyncClient
+
+
+def test_windows_are_aligned():
+    duty = DutyCycle(enabled=True, period_seconds=30, window_seconds=3)
+    assert duty.is_open(60.0) and duty.is_open(62.9)
+    assert not duty.is_open(63.0)
+    assert duty.seconds_until_open(64.0) == 26.0
+    assert duty.seconds_until_open(61.0) == 0.0
+    assert duty.window_start(89.9) == 60.0
+    # disabled: always open
+    assert DutyCycle(enabled=False).is_open(64.0)
+
+
+def test_duty_cycle_settings_are_validated():
+    cfg = config_loader.RoutingConfig.from_dict({"duty_cycle": {"enabled": True, "period_seconds": 10}})
+    duty = DutyCycle.from_config(cfg.duty_cycle)
+    assert (duty.enabled, duty.period, duty.window) == (True, 10.0, 3.0)
+    with pytest.raises(ValueError) as exc:
+        config_loader.current().merged({"duty_cycle": {"period_seconds": "x", "window_seconds": 60}})
+    assert "duty_cycle.period_seconds must be a number" in str(exc.value)
+    assert "duty_cycle.window_seconds must be <= period_seconds" in str(exc.value)
+
+
+@pytest.fixture
+def radio(monkeypatch, tmp_path):
+    monkeypatch.setattr(router_db, "DB_PATH", str(tmp_path / "routing.db"))
+    router_db.init_db()
+    table = NeighborTable(neighbor_timeout_seconds=10**9)
+    table.observe("N1", -50, "D", 2)
+    monkeypatch.setattr(router_loop, "NEIGHBORS", table)
+    monkeypatch.setattr(strategies, "STRATEGY", NextHopStrategy(table))
+    log = RadioLog()
+    monkeypatch.setattr(router_loop, "RADIO", log)
+    monkeypatch.setattr(router_loop, "BREAKERS", BreakerTable())
+
+    # wall clock and radio time are simulated: a transmission keeps the
+    # radio busy 20 ms plus 2 ms per envelope
+    clock = {"now": 0.0, "perf": 0.0}
+    monkeypatch.setattr(duty_cycle, "_now", lambda: clock["now"])
+    monkeypatch.setattr(router_loop, "_perf", lambda: clock["perf"])
+
+    sent = []
+
+    def handler(request):
+        body = json.loads(request.content)
+        chunks = body.get("bundle") or [body["chunk"]]
+        clock["perf"] += 0.020 + 0.002 * len(chunks)
+        sent.extend(chunk["header"]["msg_id"] for chunk in chunks)
+        return httpx.Response(200)
+
+    monkeypatch.setattr(
+        router_loop.httpx, "AsyncClient",
+        lambda: _REAL_CLIENT(transport=httpx.MockTransport(handler)),
+    )
+    return clock, sent, log
+
+
+def _use_duty_cycle(monkeypatch, enabled):
+    cfg = config_loader.current().merged({
+        "duty_cycle": {"enabled": enabled, "period_seconds": 30, "window_seconds": 3},
+    })
+    monkeypatch.setattr(config_loader, "_current", cfg)
+
+
+def _enqueue(priority="normal"):
+    env = MessageEnvelope(
+        header=EnvelopeHeader(
+            sender_fp="S",
+            recipient_fp="D",
+            msg_id=str(uuid.uuid4()),
+            nonce="dummy",
+            ttl=4,
+            hop_count=0,
+            ts=current_unix_ts(),
+        ),
+        ciphertext="deadbeef",
+        chunks=ChunkInfo(),
+        routing=RoutingMeta(priority=priority),
+    )
+    router_db.enqueue_message(env.header.msg_id, env.model_dump_json(), 4, priority=PRIORITY_RANK[priority])
+    return env.header.msg_id
+
+
+def test_routing_loop_survives_failures(monkeypatch, capsys):
+    _use_duty_cycle(monkeypatch, True)
+    now = iter([RuntimeError("clock"), 10.0, 31.0])
+
+    def clock():
+        value = next(now)
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    monkeypatch.setattr(duty_cycle, "_now", clock)
+    passes = []
+
+    async def flaky_pass():
+        passes.append(len(passes))
+        if len(passes) == 1:
+            raise RuntimeError("database is locked")
+
+    delays = []
+
+    async def sleep(seconds):
+        delays.append(seconds)
+        if len(delays) == 3:
+            raise asyncio.CancelledError
+
+    monkeypatch.setattr(router_loop, "process_outgoing_queue", flaky_pass)
+    monkeypatch.setattr(router_loop, "_sleep", sleep)
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(router_loop.routing_loop(interval_seconds=60.0))
+    # a failed pass or wake-up computation does not stop the loop; the latter
+    # falls back to the plain interval
+    assert passes == [0, 1, 2]
+    assert delays == [60.0, 20.0, 60.0]
+    out = capsys.readouterr().out
+    assert "routing pass failed" in out
+    assert "next wake-up" in out
+
+
+def test_high_priority_bypasses_the_window(monkeypatch, radio):
+    clock, sent, log = radio
+    _use_duty_cycle(monkeypatch, True)
+    clock["now"] = 10.0
+    normal = _enqueue("normal")
+    urgent = _enqueue("high")
+
+    asyncio.run(router_loop.process_outgoing_queue())
+    assert sent == [urgent]
+    assert [row["msg_id"] for row in router_db.get_outgoing()] == [normal]
+
+    clock["now"] = 30.5
+    asyncio.run(router_loop.process_outgoing_queue())
+    assert sent == [urgent, normal]
+    windows = log.windows()
+    assert [(w["window_start"], w["transmissions"], w["bypass"]) for w in windows] == [(0.0, 1, 1), (30.0, 1, 0)]
+    assert windows[0]["active_ms"] == pytest.approx(22.0)
+
+
+@pytest.mark.parametrize("enabled", [False, True])
+def test_trickle_traffic_wakes_the_radio_less(monkeypatch, radio, enabled):
+    clock, sent, log = radio
+    _use_duty_cycle(monkeypatch, enabled)
+
+    # one message every 2 s tick for two minutes, then drain
+    for tick in range(0, 122, 2):
+        clock["now"] = float(tick)
+        if tick < 120:
+            _enqueue()
+        asyncio.run(router_loop.process_outgoing_queue())
+
+    stats = log.stats(recent=100)
+    print(
+        f"\nduty cycle {'on' if enabled else 'off'}: {len(sent)} msgs, {stats['transmissions']} wakeups, "
+        f"{stats['active_ms']:.0f} ms radio-active over {len(stats['windows'])} windows"
+    )
+    assert len(sent) == 60
+    assert router_db.get_outgoing() == []
+    if enabled:
+        # at most the two ticks inside each of the 5 windows
+        assert stats["transmissions"] <= 10
+        assert stats["active_ms"] < 0.3 * 60 * 22
+    else:
+        assert stats["transmissions"] == 60
@@ -2,6 +2,7 @@
 # unit test for the IDS helpers.
 # test: pytest services/routing_service/test/test_ids.py -v
 import time
+from services.routing_service.config_loader import current as current_config
 from services.routing_service.ids_module import is_duplicate, is_rate_limited
 
 def test_duplicate_detection():
@@ -21,3 +22,39 @@ def test_rate_limiting():
             limited = True
             break
     assert limited == True
+
+
+def test_rate_limit_allows_full_burst_then_refills(monkeypatch):
+    from services.routing_service import ids_module
+
+    clock = [1000.0]
+    monkeypatch.setattr(ids_module, "_monotonic", lambda: clock[0])
+    peer = "peer-burst"
+
+    burst = current_config().ids.max_msgs_per_window
+    allowed = sum(not is_rate_limited(peer) for _ in range(burst + 5))
+    assert allowed == burst
+
+    # one emission interval later exactly one more message fits
+    clock[0] += current_config().ids.emission_interval
+    assert is_rate_limited(peer) is False
+    assert is_rate_limited(peer) is True
+
+
+def test_idle_peers_are_evicted(monkeypatch):
+    from services.routing_service import ids_module
+    from services.routing_service.ids_state import ShardedPeerTable
+
+    clock = [2000.0]
+    monkeypatch.setattr(ids_module, "_monotonic", lambda: clock[0])
+    # one shard, so the newcomer's sweep sees every idle entry
+    monkeypatch.setattr(ids_module, "_peer_windows", ShardedPeerTable(100, shards=1))
+
+    for i in range(10):
+        is_rate_limited(f"idle-{i}")
+    assert len(ids_module._peer_windows) == 10
+
+    # after a full window every entry is back to a fresh state and can go
+    clock[0] += current_config().ids.window_seconds
+    is_rate_limited("newcomer")
+    assert list(ids_module._peer_windows) == ["newcomer"]
@@ -0,0 +1,53 @@
+# services/routing_service/test/test_ids_anon.py
+# keyed IDS pseudonyms: stability per epoch, key separation, and per-event cost vs. plain sha256.
+# test: pytest services/routing_service/test/test_ids_anon.py -v -s
+import hashlib
+import time
+
+from services.routing_service.ids_anon import Pseudonymizer
+
+
+def test_pseudonyms_are_stable_within_an_epoch():
+    anon = Pseudonymizer(b"node-key", epoch=3)
+    assert anon.peer("peer-a") == anon.peer("peer-a") == anon.value("peer-a")
+    assert len(anon.peer("peer-a")) == 16
+    assert anon.peer("peer-a") != anon.peer("peer-b")
+
+    # unkeyed dictionary attack no longer matches
+    assert anon.peer("peer-a") != hashlib.sha256(b"peer-a").hexdigest()[:16]
+
+
+def test_key_and_epoch_change_pseudonyms():
+    a = Pseudonymizer(b"node-key", epoch=1)
+    assert Pseudonymizer(b"other-key", epoch=1).peer("p") != a.peer("p")
+    assert Pseudonymizer(b"node-key", epoch=2).peer("p") != a.peer("p")
+
+    rotating = Pseudonymizer(b"node-key", rotate_seconds=3600)
+    assert rotating.epoch(now=3_599) == 0
+    assert rotating.epoch(now=3_600) == 1
+
+
+def test_peer_cache_is_bounded():
+    anon = Pseudonymizer(b"node-key", cache_size=100)
+    for i in range(1_000):
+        anon.peer(f"peer-{i}")
+    assert anon.cache_info().currsize == 100
+
+
+def test_cached_peer_pseudonym_is_cheaper_than_sha256():
+    anon = Pseudonymizer(b"node-key")
+    peer = "peer-fingerprint-" + "ab" * 16
+    n = 100_000
+
+    def per_event_ns(fn):
+        start = time.perf_counter()
+        for _ in range(n):
+            fn(peer)
+        return (time.perf_counter() - start) / n * 1e9
+
+    old = per_event_ns(lambda v: hashlib.sha256(v.encode("utf-8")).hexdigest()[:16])
+    uncached = per_event_ns(anon.value)
+    cached = per_event_ns(anon.peer)
+
+    print(f"per event: sha256 {old:.0f} ns, keyed blake2b {uncached:.0f} ns, cached peer {cached:.0f} ns")
+    assert cached < old
@@ -0,0 +1,82 @@
+# services/routing_service/test/test_ids_concurrency.py
+# lock-striped IDS state under the request threadpool: exact counts + throughput.
+# test: pytest services/routing_service/test/test_ids_concurrency.py -v -s
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services.routing_service import ids_module
+from services.routing_service.config_loader import current as current_config
+from services.routing_service.ids_state import DedupTable, ShardedPeerTable
+
+THREADS = 8
+
+
+@pytest.fixture(autouse=True)
+def ids_log(monkeypatch, tmp_path):
+    # keep IDS events out of the repo's routing_suspicious.log
+    monkeypatch.setattr(ids_module, "LOG_PATH", tmp_path / "ids.log", raising=False)
+
+
+@pytest.fixture
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(ids_module, "_peer_windows", ShardedPeerTable(100_000))
+    monkeypatch.setattr(ids_module, "_seen_msg_ids", DedupTable())
+    monkeypatch.setattr(ids_module, "_monotonic", lambda: 1_000.0)  # no refill during the test
+
+
+def _run_together(fn, jobs):
+    barrier = threading.Barrier(len(jobs))
+
+    def start(job):
+        barrier.wait()
+        return fn(job)
+
+    with ThreadPoolExecutor(len(jobs)) as pool:
+        return list(pool.map(start, jobs))
+
+
+def test_each_msg_id_is_new_exactly_once(fresh_state):
+    ids = [f"msg-{i}" for i in range(5_000)]
+    # every thread submits every id: only one thread may see each as new
+    results = _run_together(
+        lambda _: sum(not ids_module.is_duplicate(m) for m in ids), range(THREADS)
+    )
+    assert sum(results) == len(ids)
+
+
+def test_rate_limit_admits_exact_burst_across_threads(fresh_state):
+    peers = [f"peer-{i}" for i in range(200)]
+    attempts = current_config().ids.max_msgs_per_window * 3
+
+    def hammer(_):
+        return sum(
+            not ids_module.is_rate_limited(p) for p in peers for _ in range(attempts // THREADS)
+        )
+
+    allowed = sum(_run_together(hammer, range(THREADS)))
+    assert allowed == len(peers) * current_config().ids.max_msgs_per_window
+
+
+def test_threaded_throughput_does_not_collapse(fresh_state):
+    per_thread = 20_000
+
+    def work(t):
+        for i in range(per_thread):
+            ids_module.is_duplicate(f"t{t}-m{i}")
+            ids_module.is_rate_limited(f"t{t}-p{i % 500}")
+
+    start = time.perf_counter()
+    work("solo")
+    single = per_thread / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    _run_together(work, range(THREADS))
+    threaded = THREADS * per_thread / (time.perf_counter() - start)
+
+    print(f"IDS ops/s: 1 thread {single:,.0f}, {THREADS} threads {threaded:,.0f}")
+    # Striped locks must not serialize the pool behind one hot lock. Under the
+    # GIL total throughput stays roughly flat; free-threaded builds scale.
+    assert threaded > 0.5 * single
@@ -0,0 +1,134 @@
+# services/routing_service/test/test_ids_log_index.py
+# reverse tail reads, sidecar-index filters and cursor pagination for the IDS log.
+# test: pytest services/routing_service/test/test_ids_log_index.py -v
+import json
+
+from services.routing_service.ids_logger import IdsEventLogger, index_path
+from services.routing_service.ids_log_index import query_log, read_lines_backward
+
+
+def _write_events(path, n, batch=10):
+    logger = IdsEventLogger(path, aggregate_window_seconds=0)
+    for i in range(n):
+        event = "RATE_LIMIT" if i % 3 else "TS_FUTURE"
+        logger.submit({
+            "ts": 1_700_000_000 + i,
+            "event": event,
+            "peer": f"peer-{i % 4}",
+            "msg_id": f"m{i}",
+            "detail": "d",
+            "extra": {"i": i},
+        })
+        if i % batch == batch - 1:
+            logger.flush()
+    logger.close()
+
+
+def test_tail_returns_last_lines_in_order(tmp_path):
+    path = tmp_path / "ids.log"
+    _write_events(path, 100)
+
+    page = query_log(path, limit=5)
+    assert [e["extra"]["i"] for e in page["events"]] == [95, 96, 97, 98, 99]
+    assert page["next_cursor"] is not None
+
+
+def test_backward_reader_handles_block_boundaries(tmp_path, monkeypatch):
+    from services.routing_service import ids_log_index
+
+    path = tmp_path / "plain.log"
+    lines = [f"line-{i}" * (i % 7 + 1) for i in range(200)]
+    path.write_text("\n".join(lines) + "\n")
+    monkeypatch.setattr(ids_log_index, "READ_BLOCK_BYTES", 37)
+
+    got = list(read_lines_backward(path, path.stat().st_size))
+    assert [l.decode() for _, l in got] == list(reversed(lines))
+    data = path.read_bytes()
+    for offset, line in got:
+        assert data[offset:offset + len(line)] == line
+
+
+def test_filters_use_index_and_match_records(tmp_path):
+    path = tmp_path / "ids.log"
+    _write_events(path, 100)
+    assert index_path(path).exists()
+
+    page = query_log(path, limit=1000, event="TS_FUTURE")
+    assert {e["event"] for e in page["events"]} == {"TS_FUTURE"}
+    assert len(page["events"]) == 34
+
+    page = query_log(path, limit=1000, since=1_700_000_090)
+    assert [e["extra"]["i"] for e in page["events"]] == list(range(90, 100))
+
+    page = query_log(path, limit=1000, peers=["peer-1"], event="RATE_LIMIT")
+    assert all(e["peer"] == "peer-1" for e in page["events"])
+    assert len(page["events"]) == 17
+
+
+def test_since_sees_blocks_before_an_older_summary(tmp_path):
+    # the repeat of A is folded into a summary written at close, in its own
+    # block and stamped with A's (older) time, after B's newer block
+    path = tmp_path / "ids.log"
+    logger = IdsEventLogger(path, aggregate_window_seconds=3600)
+    for ts, event, peer in ((1_700_000_100, "A", "p1"), (1_700_000_101, "A", "p1"), (1_700_000_200, "B", "p2")):
+        logger.submit({"ts": ts, "event": event, "peer": peer, "msg_id": "", "detail": "d", "extra": {}})
+    logger.flush()
+    logger.close()
+
+    entries = [json.loads(l) for l in index_path(path).read_text().splitlines()]
+    assert len(entries) == 2 and entries[1]["t1"] < entries[0]["t1"]
+
+    page = query_log(path, limit=1000, since=1_700_000_150)
+    assert [e["event"] for e in page["events"]] == ["B"]
+    page = query_log(path, limit=1000, since=1_700_000_101)
+    assert [(e["event"], e.get("count")) for e in page["events"]] == [("B", None), ("A", 1)]
+
+
+def test_cursor_pagination_walks_whole_log(tmp_path):
+    path = tmp_path / "ids.log"
+    _write_events(path, 100)
+
+    seen = []
+    cursor = None
+    while True:
+        page = query_log(path, limit=7, cursor=cursor, event="RATE_LIMIT")
+        seen = [e["extra"]["i"] for e in page["events"]] + seen
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [i for i in range(100) if i % 3]
+
+
+def test_log_without_index_is_still_readable(tmp_path):
+    path = tmp_path / "legacy.log"
+    with path.open("w") as f:
+        for i in range(20):
+            f.write(json.dumps({"ts": "2024-01-01T00:00:00+00:00", "event": "X", "peer": "p",
+                                "msg_id": str(i), "detail": "", "extra": {}}) + "\n")
+
+    page = query_log(path, limit=3)
+    assert [e["msg_id"] for e in page["events"]] == ["17", "18", "19"]
+
+
+def test_ids_log_tail_endpoint_filters_by_raw_peer(monkeypatch, tmp_path):
+    from fastapi.testclient import TestClient
+    from services.routing_service import ids_module, routing_api
+
+    log_path = tmp_path / "routing_suspicious.log"
+    monkeypatch.setattr(ids_module, "LOG_PATH", log_path, raising=False)
+    monkeypatch.setattr(routing_api, "IDS_LOG_PATH", log_path, raising=False)
+    monkeypatch.setattr(routing_api, "DEBUG_MODE", True, raising=False)
+
+    ids_module.log_suspicious("TS_OLD", "peer-a", "m1", "detail")
+    ids_module.log_suspicious("TS_FUTURE", "peer-b", "m2", "detail")
+
+    client = TestClient(routing_api.app)
+    headers = {
+        "X-Device-Fp": routing_api.DEV_DEVICE_FP,
+        "X-Device-Token": routing_api.DEV_DEVICE_TOKEN,
+    }
+    resp = client.get("/v1/router/ids_log_tail", params={"peer": "peer-b"}, headers=headers)
+    assert resp.status_code == 200
+    events = resp.json()["events"]
+    assert [e["event"] for e in events] == ["TS_FUTURE"]
+    assert events[0]["peer"] == ids_module.anonymize_peer("peer-b")
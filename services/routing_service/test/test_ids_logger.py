@@ -0,0 +1,97 @@
+# services/routing_service/test/test_ids_logger.py
+# background IDS logger: batching, aggregation, overflow accounting, rotation.
+# test: pytest services/routing_service/test/test_ids_logger.py -v
+import json
+
+from services.routing_service.ids_logger import IdsEventLogger, rotated_path
+
+
+def _event(event="RATE_LIMIT", peer="p1", msg_id="m"):
+    return {"ts": "2024-01-01T00:00:00+00:00", "event": event, "peer": peer,
+            "msg_id": msg_id, "detail": "d", "extra": {}}
+
+
+def _read(path):
+    return [json.loads(l) for l in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_repeated_events_are_aggregated(tmp_path):
+    path = tmp_path / "ids.log"
+    logger = IdsEventLogger(path, aggregate_window_seconds=60)
+
+    for i in range(500):
+        logger.submit(_event(msg_id=f"m{i}"))
+    logger.submit(_event(event="DUPLICATE"))
+    logger.close()
+
+    records = _read(path)
+    assert [r["event"] for r in records].count("RATE_LIMIT") == 2
+    summary = [r for r in records if r.get("count")][0]
+    assert summary["count"] == 499
+    assert "RATE_LIMIT x499 for peer p1" in summary["detail"]
+    assert any(r["event"] == "DUPLICATE" for r in records)
+
+
+def test_flush_makes_events_visible(tmp_path):
+    path = tmp_path / "ids.log"
+    logger = IdsEventLogger(path, flush_interval_seconds=30)
+    logger.submit(_event())
+    assert logger.flush(timeout=5)
+    assert _read(path)[0]["event"] == "RATE_LIMIT"
+    logger.close()
+
+
+def test_overflow_is_counted_and_reported(tmp_path):
+    path = tmp_path / "ids.log"
+    # writer only wakes on the (long) interval, so the queue fills up
+    logger = IdsEventLogger(
+        path, queue_size=5, batch_size=100, flush_interval_seconds=30,
+        aggregate_window_seconds=0,
+    )
+    accepted = sum(logger.submit(_event(peer=f"p{i}")) for i in range(20))
+    logger.close()
+
+    assert logger.dropped == 20 - accepted
+    assert logger.dropped > 0
+    dropped_lines = [r for r in _read(path) if r["event"] == "LOG_DROPPED"]
+    assert dropped_lines[0]["extra"]["dropped"] == logger.dropped
+
+
+def test_size_based_rotation(tmp_path):
+    path = tmp_path / "ids.log"
+    logger = IdsEventLogger(
+        path, max_bytes=2_000, backup_count=2, aggregate_window_seconds=0,
+    )
+    for i in range(200):
+        logger.submit(_event(peer=f"p{i}"))
+        if i % 20 == 0:
+            logger.flush()
+    logger.close()
+
+    assert logger.rotations > 0
+    assert rotated_path(path, 1).exists()
+    assert not rotated_path(path, 3).exists()
+    assert path.stat().st_size <= 2_000
+
+
+def test_write_error_does_not_stop_the_writer(tmp_path, monkeypatch):
+    path = tmp_path / "ids.log"
+    logger = IdsEventLogger(path, aggregate_window_seconds=0)
+    logger.submit(_event(peer="before"))
+    assert logger.flush(timeout=5)
+
+    real_write = logger._write_block
+
+    def disk_full(chunk):
+        monkeypatch.setattr(logger, "_write_block", real_write)
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(logger, "_write_block", disk_full)
+    logger.submit(_event(peer="lost"))
+    assert logger.flush(timeout=5)
+    assert logger.stats()["write_errors"] == 1
+
+    logger.submit(_event(peer="after"))
+    assert logger.flush(timeout=1)
+    logger.close()
+    assert [r["peer"] for r in _read(path)] == ["before", "after"]
@@ -0,0 +1,62 @@
+# services/routing_service/test/test_ids_metrics.py
+# in-memory IDS counters: bucket rollover, rates, top offenders, admin endpoint.
+# test: pytest services/routing_service/test/test_ids_metrics.py -v
+from services.routing_service.ids_metrics import IdsMetrics, RingCounter
+
+
+def test_ring_counter_forgets_stale_buckets():
+    ring = RingCounter(resolution=1, slots=10)
+    ring.add(1000.2)
+    ring.add(1000.7)
+    ring.add(1003.0, n=5)
+    assert ring.total(1003.5, span=10) == 7
+
+    # 10 s later the same slots are reused for new time, old counts vanish
+    ring.add(1013.0)
+    assert ring.total(1013.5, span=10) == 1
+    assert ring.series(1013.5, span=3) == [(1011, 0), (1012, 0), (1013, 1)]
+
+
+def test_snapshot_rates_and_top_offenders():
+    metrics = IdsMetrics(max_peers=100)
+    now = 50_000.0
+    for i in range(30):
+        metrics.record("RATE_LIMIT", "loud", now=now - i)
+    for i in range(5):
+        metrics.record("DUPLICATE", "quiet", now=now - i)
+    metrics.record("TS_OLD", "ancient", now=now - 3_000)
+
+    snap = metrics.snapshot(window_seconds=60, top=2, now=now)
+    assert snap["events"]["RATE_LIMIT"]["count"] == 30
+    assert snap["events"]["RATE_LIMIT"]["rate_per_sec"] == 0.5
+    assert "TS_OLD" not in snap["events"]
+    assert [p["peer"] for p in snap["top_peers"]] == ["loud", "quiet"]
+
+    # coarse (1 min) series still sees the old event within 24 h
+    snap = metrics.snapshot(window_seconds=3_600, now=now)
+    assert snap["resolution_seconds"] == 60
+    assert snap["events"]["TS_OLD"]["count"] == 1
+
+
+def test_ids_metrics_endpoint(monkeypatch, tmp_path):
+    from fastapi.testclient import TestClient
+    from services.routing_service import ids_module, routing_api
+
+    monkeypatch.setattr(ids_module, "LOG_PATH", tmp_path / "ids.log", raising=False)
+    monkeypatch.setattr(ids_module, "_metrics", IdsMetrics())
+    monkeypatch.setattr(routing_api, "DEBUG_MODE", True, raising=False)
+    for _ in range(3):
+        ids_module.log_suspicious("RATE_LIMIT", "peer-m", "m", "detail")
+
+    client = TestClient(routing_api.app)
+    headers = {
+        "X-Device-Fp": routing_api.DEV_DEVICE_FP,
+        "X-Device-Token": routing_api.DEV_DEVICE_TOKEN,
+    }
+    resp = client.get("/v1/router/ids_metrics", params={"window": 60}, headers=headers)
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["events"]["RATE_LIMIT"]["count"] == 3
+    assert body["top_peers"][0] == {
+        "peer": ids_module.anonymize_peer("peer-m"), "count": 3, "window_seconds": 60,
+    }
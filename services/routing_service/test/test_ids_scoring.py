@@ -0,0 +1,132 @@
+# services/routing_service/test/test_ids_scoring.py
+# vectorized anomaly scoring: outlier detection, slot reuse, blocking, 100k-peer tick benchmark.
+# test: pytest services/routing_service/test/test_ids_scoring.py -v
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from services.routing_service.ids_scoring import PeerScorer
+
+
+def _normal_traffic(scorer, peers=200, msgs=3, size=800):
+    for i in range(peers):
+        for _ in range(msgs):
+            scorer.record_message(f"peer-{i}", size)
+
+
+def test_flooding_peer_is_flagged_and_normal_peers_are_not():
+    scorer = PeerScorer(max_peers=1_000, threshold=8.0)
+    flagged = []
+    for _ in range(5):
+        _normal_traffic(scorer)
+        for _ in range(60):
+            scorer.record_message("flooder", 800)
+        flagged += scorer.tick()
+
+    assert {peer for peer, _ in flagged} == {"flooder"}
+
+
+def test_duplicates_and_bad_timestamps_add_up():
+    scorer = PeerScorer(max_peers=1_000, threshold=3.0)
+    flagged = []
+    for _ in range(5):
+        _normal_traffic(scorer)
+        for _ in range(3):
+            scorer.record_message("replayer", 800)
+            scorer.record_duplicate("replayer")
+            scorer.record_bad_timestamp("replayer")
+        flagged += scorer.tick()
+
+    assert {peer for peer, _ in flagged} == {"replayer"}
+
+
+def test_idle_peers_release_their_slots():
+    scorer = PeerScorer(max_peers=10, idle_ticks=2)
+    for i in range(10):
+        scorer.record_message(f"p{i}")
+    scorer.record_message("late")
+    assert scorer.untracked == 1
+
+    for _ in range(3):  # active tick, then two quiet ones
+        scorer.tick()
+    assert len(scorer) == 0
+    scorer.record_message("late")
+    assert len(scorer) == 1
+
+
+def test_scoring_tick_blocks_flagged_peers(monkeypatch, tmp_path):
+    from services.routing_service import ids_module
+    from services.routing_service.ids_metrics import IdsMetrics
+    from services.routing_service.ids_state import BlockedPeerTable
+
+    monkeypatch.setattr(ids_module, "LOG_PATH", tmp_path / "ids.log", raising=False)
+    monkeypatch.setattr(ids_module, "_metrics", IdsMetrics())
+    monkeypatch.setattr(ids_module, "_blocked_peers", BlockedPeerTable(100))
+    monkeypatch.setattr(ids_module, "_traffic_sketch", None)
+    monkeypatch.setattr(ids_module, "_scorer", PeerScorer(max_peers=1_000))
+
+    for i in range(100):
+        ids_module.observe_traffic(f"peer-{i}", "dst", f"m{i}", size=500)
+    for i in range(80):
+        ids_module.observe_traffic("flooder", "dst", f"f{i}", size=500)
+
+    flagged = ids_module.scoring_tick()
+    assert [peer for peer, _ in flagged] == ["flooder"]
+    assert ids_module.is_rate_limited("flooder") is True
+    assert ids_module.ids_metrics_snapshot()["events"]["ANOMALY_SCORE"]["count"] == 1
+
+
+def _median_ms(timings):
+    timings = sorted(timings)
+    return timings[len(timings) // 2] * 1000
+
+
+def test_tick_over_100k_peers_is_fast():
+    n = 100_000
+    scorer = PeerScorer(max_peers=n)
+    rng = np.random.default_rng(0)
+    # fill every slot, then drive the counters directly as a busy mesh would
+    for i in range(n):
+        scorer.record_message(f"peer-{i}", 500)
+    scorer.tick()
+
+    # churn: a few hundred peers go quiet every tick and are released
+    # idle_ticks later; newcomers take the freed slots
+    quiet = np.zeros(n, dtype=bool)
+    timings = []
+    joined = 0
+    for _ in range(scorer.idle_ticks + 20):
+        quiet[rng.integers(0, n, 300)] = True
+        for _ in range(100):
+            scorer.record_message(f"new-{joined}", 500)
+            joined += 1
+        msgs = rng.poisson(3, n).astype(np.float32)
+        msgs[quiet | ~scorer._used] = 0
+        scorer._msgs += msgs
+        scorer._bytes += msgs * rng.normal(800, 50, n).astype(np.float32)
+        scorer._dups += rng.poisson(0.05, n) * (msgs > 0)
+        start = time.perf_counter()
+        scorer.tick()
+        timings.append(time.perf_counter() - start)
+
+    assert len(scorer) < n                      # quiet peers were released
+    assert _median_ms(timings) < 20
+    assert _median_ms(timings[scorer.idle_ticks:]) < 20
+
+
+def test_tick_cost_does_not_grow_with_free_slots():
+    # a big, mostly empty table: free slots must not be walked once they
+    # pass idle_ticks
+    scorer = PeerScorer(max_peers=100_000, idle_ticks=10)
+    timings = []
+    for _ in range(40):
+        for i in range(100):
+            scorer.record_message(f"peer-{i}", 500)
+        start = time.perf_counter()
+        scorer.tick()
+        timings.append(time.perf_counter() - start)
+
+    assert len(scorer) == 100
+    assert _median_ms(timings[20:]) < 2 * _median_ms(timings[:10]) + 1
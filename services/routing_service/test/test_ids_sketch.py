@@ -0,0 +1,88 @@
+# services/routing_service/test/test_ids_sketch.py
+# fixed-memory IDS sketches: count-min bounds, distinct counts, heavy-hitter / flood alerts.
+# test: pytest services/routing_service/test/test_ids_sketch.py -v
+from services.routing_service.ids_sketch import (
+    CountMinSketch,
+    HyperLogLog,
+    TrafficSketch,
+    hash_key,
+)
+
+
+def test_count_min_never_underestimates():
+    cms = CountMinSketch(width=64, depth=4)  # small on purpose: many collisions
+    truth = {}
+    for i in range(2_000):
+        key = f"peer-{i % 300}"
+        truth[key] = truth.get(key, 0) + 1
+        cms.add(*hash_key(key))
+    for key, count in truth.items():
+        assert cms.estimate(*hash_key(key)) >= count
+
+
+def test_hyperloglog_distinct_count_is_close():
+    for n in (100, 10_000):
+        hll = HyperLogLog(precision=12)
+        for i in range(n):
+            h1, _ = hash_key(f"sender-{i}")
+            hll.add(h1)
+            hll.add(h1)  # repeats do not count
+        assert abs(hll.estimate() - n) / n < 0.05
+
+
+def test_heavy_sender_alerts_once_per_window():
+    sketch = TrafficSketch(window_seconds=60, heavy_min_count=50, heavy_share=0.2)
+    alerts = []
+    for i in range(400):
+        sender = "loud" if i % 2 == 0 else f"quiet-{i}"
+        alerts += sketch.observe(sender, f"dst-{i % 20}", now=1_000.0 + i * 0.01)
+
+    heavy = [a for a in alerts if a[0] == "HEAVY_SENDER"]
+    assert [(a[0], a[1]) for a in heavy] == [("HEAVY_SENDER", "loud")]
+    assert not [a for a in alerts if a[0] == "HEAVY_RECIPIENT"]
+    assert sketch.summary()["current"]["top_senders"][0][0] == "loud"
+
+    # new window: the alert can fire again
+    alerts = []
+    for i in range(100):
+        alerts += sketch.observe("loud", "dst", now=1_100.0 + i * 0.01)
+    assert ("HEAVY_SENDER", "loud") in [(a[0], a[1]) for a in alerts]
+    assert sketch.summary()["previous"]["total"] == 400
+
+
+def test_many_distinct_senders_raise_sender_flood():
+    sketch = TrafficSketch(window_seconds=60, max_distinct_senders=500)
+    alerts = []
+    for i in range(2_000):
+        alerts += sketch.observe(f"sybil-{i}", "victim", now=2_000.0)
+
+    floods = [a for a in alerts if a[0] == "SENDER_FLOOD"]
+    assert len(floods) == 1
+    assert floods[0][2]["distinct_senders"] > 500
+    assert ("HEAVY_RECIPIENT", "victim") in [(a[0], a[1]) for a in alerts]
+
+
+def test_recipient_alerts_do_not_block_the_victim(monkeypatch, tmp_path):
+    from services.routing_service import config_loader, ids_module
+    from services.routing_service.ids_metrics import IdsMetrics
+    from services.routing_service.ids_state import BlockedPeerTable
+
+    monkeypatch.setattr(ids_module, "LOG_PATH", tmp_path / "ids.log", raising=False)
+    monkeypatch.setattr(ids_module, "_metrics", IdsMetrics())
+    monkeypatch.setattr(ids_module, "_blocked_peers", BlockedPeerTable(100))
+    monkeypatch.setattr(
+        config_loader, "_current", config_loader.current().merged({"ids": {"block_peer_after": 1}})
+    )
+    monkeypatch.setattr(
+        ids_module, "_traffic_sketch", TrafficSketch(heavy_min_count=10, max_distinct_senders=10)
+    )
+
+    for i in range(200):
+        ids_module.observe_traffic(f"sybil-{i}", "victim", f"m{i}")
+
+    assert "victim" not in ids_module._blocked_peers
+    snap = ids_module.ids_metrics_snapshot(window_seconds=60)
+    assert snap["events"]["HEAVY_RECIPIENT"]["count"] == 1
+    assert snap["events"]["SENDER_FLOOD"]["count"] == 1
+    top = snap["heavy_hitters"]["current"]["top_recipients"][0]
+    assert top["peer"] == ids_module.anonymize_peer("victim")
@@ -0,0 +1,95 @@
+# services/routing_service/test/test_ids_snapshot.py
+# IDS warm restart: snapshot round trip, expiry on load, bad files, 1M-entry load time.
+# test: pytest services/routing_service/test/test_ids_snapshot.py -v -s
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from services.routing_service import config_loader, ids_module
+from services.routing_service.ids_snapshot import read_snapshot, write_snapshot
+from services.routing_service.ids_state import BlockedPeerTable, DedupTable, ShardedPeerTable
+
+
+def _reset_state(monkeypatch):
+    monkeypatch.setattr(ids_module, "_peer_windows", ShardedPeerTable(2_000_000))
+    monkeypatch.setattr(ids_module, "_seen_msg_ids", DedupTable())
+    monkeypatch.setattr(ids_module, "_blocked_peers", BlockedPeerTable(1_000))
+
+
+@pytest.fixture
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(
+        config_loader,
+        "_current",
+        config_loader.current().merged({"ids": {"duplicate_suppression_ttl": 600}}),
+    )
+    _reset_state(monkeypatch)
+    return monkeypatch
+
+
+def test_round_trip_restores_dedup_limiter_and_blocks(fresh_state, tmp_path):
+    path = tmp_path / "ids.snapshot"
+    now = datetime.now(timezone.utc)
+
+    ids_module.is_duplicate("replayed-msg")
+    for _ in range(config_loader.current().ids.max_msgs_per_window):
+        ids_module.is_rate_limited("busy-peer")
+    ids_module._blocked_peers.block("evil-peer", now)
+    expired = now - config_loader.current().ids.block_peer_ttl - timedelta(seconds=5)
+    ids_module._blocked_peers.block("old-block", expired)
+    ids_module.save_state_snapshot(path)
+
+    # "restart": empty state, then load
+    _reset_state(fresh_state)
+    loaded = ids_module.load_state_snapshot(path)
+
+    assert loaded["seen_msg_ids"] == 1
+    assert loaded["blocked"] == 1  # the expired block is dropped
+    assert ids_module.is_duplicate("replayed-msg") is True
+    assert ids_module.is_rate_limited("busy-peer") is True
+    assert ids_module.is_rate_limited("evil-peer") is True
+    assert "old-block" not in ids_module._blocked_peers
+
+
+def test_expired_msg_ids_are_not_loaded(fresh_state, tmp_path):
+    path = tmp_path / "ids.snapshot"
+    now = time.time()
+    write_snapshot(path, ([("stale", now - 700), ("fresh", now - 10)], [], []), now)
+
+    assert ids_module.load_state_snapshot(path)["seen_msg_ids"] == 1
+    assert "fresh" in ids_module._seen_msg_ids
+    assert "stale" not in ids_module._seen_msg_ids
+
+
+def test_unreadable_snapshot_is_ignored(fresh_state, tmp_path):
+    path = tmp_path / "ids.snapshot"
+    path.write_bytes(b"not a snapshot at all")
+    assert ids_module.load_state_snapshot(path) == {}
+    assert ids_module.load_state_snapshot(tmp_path / "missing") == {}
+
+    write_snapshot(path, ([("a", 1.0)], [], []), 0.0)
+    path.write_bytes(path.read_bytes()[:-4])  # truncated
+    with pytest.raises(ValueError):
+        read_snapshot(path, 3)
+
+
+def test_million_entry_snapshot_loads_under_a_second(fresh_state, tmp_path):
+    path = tmp_path / "ids.snapshot"
+    now = time.time()
+    n = 1_000_000
+    dedup = ((f"msg-{i:07d}", now - 300 + i * 1e-4) for i in range(n))
+    rates = ((f"peer-{i}", now + 2.0) for i in range(10_000))
+    blocks = ((f"blocked-{i}", now - 60) for i in range(1_000))
+    write_snapshot(path, (dedup, rates, blocks), now)
+
+    start = time.perf_counter()
+    loaded = ids_module.load_state_snapshot(path)
+    elapsed = time.perf_counter() - start
+
+    print(f"loaded {sum(loaded[k] for k in ('seen_msg_ids', 'rate_limit', 'blocked'))} entries in {elapsed:.3f}s")
+    assert loaded["seen_msg_ids"] == n
+    assert loaded["rate_limit"] == 10_000
+    assert loaded["blocked"] == 1_000
+    assert ids_module.is_duplicate("msg-0999999") is True
+    assert elapsed < 1.0
@@ -0,0 +1,97 @@
+# services/routing_service/test/test_ids_state.py
+# bounded IDS state: eviction order, block protection, and a 1M unique-peer flood.
+# test: pytest services/routing_service/test/test_ids_state.py -v
+import gc
+import os
+
+import pytest
+
+from services.routing_service import config_loader, ids_module
+from services.routing_service.ids_state import (
+    BoundedPeerTable,
+    BlockedPeerTable,
+    ShardedPeerTable,
+)
+
+
+def _rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+@pytest.fixture(autouse=True)
+def ids_log(monkeypatch, tmp_path):
+    # keep IDS events out of the repo's routing_suspicious.log
+    monkeypatch.setattr(ids_module, "LOG_PATH", tmp_path / "ids.log", raising=False)
+
+
+@pytest.fixture
+def small_ids_state(monkeypatch):
+    monkeypatch.setattr(ids_module, "_peer_windows", ShardedPeerTable(10_000))
+    monkeypatch.setattr(ids_module, "_peer_suspicious_counts", ShardedPeerTable(10_000))
+    monkeypatch.setattr(ids_module, "_blocked_peers", BlockedPeerTable(1_000))
+    monkeypatch.setattr(
+        config_loader, "_current", config_loader.current().merged({"ids": {"block_peer_after": 3}})
+    )
+
+
+def test_new_peers_evicted_before_established_ones():
+    table = BoundedPeerTable(4)
+    table["regular"] = 1
+    table.get("regular")  # seen twice -> protected
+
+    for i in range(100):
+        table[f"sybil-{i}"] = 1
+
+    assert len(table) == 4
+    assert "regular" in table
+    assert table.evictions == 97
+
+
+def test_blocked_peers_survive_peer_churn(small_ids_state):
+    for _ in range(3):
+        ids_module._note_suspicious("evil-peer")
+    assert "evil-peer" in ids_module._blocked_peers
+
+    for i in range(50_000):
+        ids_module.is_rate_limited(f"churn-{i}")
+        ids_module._note_suspicious(f"churn-{i}")
+
+    assert ids_module.is_rate_limited("evil-peer") is True
+    stats = ids_module.ids_memory_stats()
+    assert stats["rate_limit_entries"] <= 10_000
+    assert stats["suspicious_count_entries"] <= 10_000
+    assert stats["evicted_peers"] > 0
+
+
+def test_blocked_table_is_capped():
+    table = BlockedPeerTable(2)
+    table.block("a", 1)
+    table.block("b", 2)
+    table.block("a", 3)  # re-block moves to the end
+    table.block("c", 4)
+    assert list(table) == ["a", "c"]
+    assert table.evictions == 1
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/statm"), reason="needs /proc for RSS")
+def test_million_unique_peers_keeps_rss_flat(small_ids_state):
+    # warm up until every table is at capacity
+    for i in range(100_000):
+        peer = f"warm-{i}"
+        ids_module.is_rate_limited(peer)
+        ids_module._note_suspicious(peer)
+    gc.collect()
+    rss_before = _rss_bytes()
+
+    for i in range(1_000_000):
+        peer = f"flood-{i}"
+        ids_module.is_rate_limited(peer)
+        ids_module._note_suspicious(peer)
+    gc.collect()
+    rss_after = _rss_bytes()
+
+    assert len(ids_module._peer_windows) <= 10_000
+    assert len(ids_module._peer_suspicious_counts) <= 10_000
+    # unbounded dicts would need >100 MB here
+    assert rss_after - rss_before < 8 * 1024 * 1024
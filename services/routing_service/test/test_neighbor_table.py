@@ -0,0 +1,199 @@
+# services/routing_service/test/test_neighbor_table.py
+# neighbor / route table: link-quality scoring, reverse-path routes, cached decisions, router targeting.
+# test: pytest services/routing_service/test/test_neighbor_table.py -v
+import asyncio
+import json
+import uuid
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from lib.envelope import MessageEnvelope, EnvelopeHeader, ChunkInfo, RoutingMeta
+from lib.utils import current_unix_ts
+from services.routing_service import config_loader, ids_module, neighbor_table, router_db, router_loop, routing_api, strategies
+from services.routing_service.circuit_breaker import BreakerTable
+from services.routing_service.ids_state import DedupTable
+from services.routing_service.neighbor_table import NeighborTable
+from services.routing_service.path_digest import path_add
+
+AUTH_HEADERS = {
+    "X-Device-Fp": routing_api.DEV_DEVICE_FP,
+    "X-Device-Token": routing_api.DEV_DEVICE_TOKEN,
+}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000.0]
+    monkeypatch.setattr(neighbor_table, "_monotonic", lambda: now[0])
+    return now
+
+
+def test_reverse_path_routes(clock):
+    table = NeighborTable()
+    table.observe("N1", -50, "S", hop_count=3)
+
+    assert table.next_hop("S") == "N1"
+    assert table.next_hop("N1") == "N1"
+    assert table.next_hop("unknown") is None
+    assert table.neighbor("N1").rssi == -50
+
+
+def test_link_quality_and_hops_decide(clock):
+    table = NeighborTable(decision_ttl_seconds=0)
+    table.observe("weak", -95, "D", hop_count=2)
+    table.observe("strong", -45, "D", hop_count=2)
+    assert table.next_hop("D") == "strong"
+
+    # a much shorter route beats a slightly better link
+    table.observe("near", -55, "D", hop_count=1)
+    table.observe("far", -45, "D", hop_count=4)
+    assert table.next_hop("D") == "near"
+
+
+def test_rssi_is_smoothed(clock):
+    table = NeighborTable(rssi_alpha=0.5)
+    table.observe("N1", -40, "N1", 1)
+    table.observe("N1", -80, "N1", 1)
+    assert table.neighbor("N1").rssi == -60
+
+
+def test_failures_move_traffic_and_drop_cached_decision(clock):
+    table = NeighborTable(decision_ttl_seconds=60, outcome_alpha=0.5)
+    table.observe("A", -50, "D", 2)
+    table.observe("B", -60, "D", 2)
+    assert table.next_hop("D") == "A"
+    assert table.next_hop("D") == "A"
+    assert table.stats()["decision_hits"] == 1
+
+    table.record_outcome("A", False)
+    table.record_outcome("A", False)
+    assert table.next_hop("D") == "B"
+    assert table.neighbor("A").failed == 2
+
+
+def test_stale_neighbors_and_routes_are_skipped(clock):
+    table = NeighborTable(neighbor_timeout_seconds=30, decision_ttl_seconds=0)
+    table.observe("old", -40, "D", 1)
+    clock[0] += 20
+    table.observe("new", -80, "D", 1)
+    clock[0] += 15
+    assert table.next_hop("D") == "new"
+    clock[0] += 30
+    assert table.next_hop("D") is None
+
+
+def test_exclude_skips_neighbors_on_path(clock):
+    table = NeighborTable()
+    table.observe("A", -40, "D", 2)
+    table.observe("B", -70, "D", 2)
+    assert table.next_hop("D", exclude=lambda n: n == "A") == "B"
+    # an excluded lookup does not poison the cache
+    assert table.next_hop("D") == "A"
+
+
+def test_table_is_bounded(clock):
+    table = NeighborTable(max_neighbors=10, max_destinations=50)
+    for i in range(200):
+        table.observe(f"n{i}", -60, f"s{i}", 2)
+    stats = table.stats()
+    assert stats["neighbors"] == 10
+    assert stats["destinations"] == 50
+
+
+def test_neighbor_settings_are_validated():
+    with pytest.raises(ValueError) as exc:
+        config_loader.RoutingConfig.from_dict({
+            "neighbors": {"max_neighbors": 0, "rssi_alpha": 1.5, "route_timeout_seconds": "long"},
+        })
+    assert "neighbors.max_neighbors must be >= 1" in str(exc.value)
+    assert "neighbors.rssi_alpha must be > 0 and <= 1" in str(exc.value)
+    assert "neighbors.route_timeout_seconds must be a number" in str(exc.value)
+
+
+def test_reload_resizes_the_table(clock):
+    cfg = config_loader.RoutingConfig.from_dict({"neighbors": {"max_neighbors": 10}})
+    table = NeighborTable.from_config(cfg.neighbors)
+    for i in range(20):
+        table.observe(f"n{i}", -60, f"n{i}", 1)
+    assert table.stats()["neighbors"] == 10
+
+    table.configure(cfg.merged({"neighbors": {"max_neighbors": 4, "neighbor_timeout_seconds": 5}}).neighbors)
+    assert table.live_neighbors() == ["n19", "n18", "n17", "n16"]
+    clock[0] += 10
+    assert table.live_neighbors() == []
+
+
+def _env(sender="S", recipient="D", path="", msg_id=None):
+    return MessageEnvelope(
+        header=EnvelopeHeader(
+            sender_fp=sender,
+            recipient_fp=recipient,
+            msg_id=msg_id or str(uuid.uuid4()),
+            nonce="dummy",
+            ttl=4,
+            hop_count=2,
+            ts=current_unix_ts(),
+        ),
+        ciphertext="deadbeef",
+        chunks=ChunkInfo(),
+        routing=RoutingMeta(path=path),
+    )
+
+
+@pytest.fixture
+def router(monkeypatch, tmp_path):
+    monkeypatch.setattr(router_db, "DB_PATH", str(tmp_path / "routing.db"))
+    router_db.init_db()
+    monkeypatch.setattr(ids_module, "LOG_PATH", tmp_path / "ids.log", raising=False)
+    monkeypatch.setattr(ids_module, "_seen_msg_ids", DedupTable())
+    table = NeighborTable()
+    monkeypatch.setattr(neighbor_table, "NEIGHBORS", table)
+    monkeypatch.setattr(routing_api, "NEIGHBORS", table)
+    monkeypatch.setattr(router_loop, "NEIGHBORS", table)
+    monkeypatch.setattr(router_loop, "BREAKERS", BreakerTable())
+    monkeypatch.setattr(strategies, "NEIGHBORS", table)
+    return table
+
+
+def test_ingress_feeds_table_and_outgoing_targets_peers(router):
+    client = TestClient(routing_api.app)
+    payload = {"chunk": _env(sender="D").model_dump(), "link_meta": {"peer": "N1", "rssi": -48}}
+    client.post("/v1/router/on_chunk_received", json=payload, headers=AUTH_HEADERS)
+    assert router.neighbor("N1").rssi == -48
+
+    for msg_id, env in (
+        ("to-d", _env(recipient="D", msg_id="to-d")),
+        ("to-x", _env(recipient="X", msg_id="to-x")),
+        # N1 is already on this one's path
+        ("looped", _env(recipient="D", msg_id="looped", path=path_add("", "N1"))),
+    ):
+        router_db.enqueue_message(msg_id, env.model_dump_json(), 4)
+
+    items = client.get("/v1/router/outgoing_chunks", headers=AUTH_HEADERS).json()["items"]
+    targets = {json.loads(item["chunk"])["header"]["msg_id"]: item["target_peer"] for item in items}
+    assert targets == {"to-d": "N1", "to-x": None, "looped": None}
+
+
+def test_router_loop_sends_to_next_hop_and_records_outcome(router, monkeypatch):
+    router.observe("N1", -50, "D", 2)
+    router_db.enqueue_message("m1", _env(recipient="D").model_dump_json(), 4)
+
+    sent = []
+
+    def handler(request):
+        sent.append(json.loads(request.content))
+        return httpx.Response(503)
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(
+        router_loop.httpx, "AsyncClient",
+        lambda: real_client(transport=httpx.MockTransport(handler)),
+    )
+    asyncio.run(router_loop.process_outgoing_queue())
+
+    assert [body["target_peer"] for body in sent] == ["N1"]
+    entry = router.neighbor("N1")
+    assert (entry.sent, entry.failed) == (1, 1)
+    assert entry.success < 1.0
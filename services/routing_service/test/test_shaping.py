@@ -0,0 +1,217 @@
+# services/routing_service/test/test_shaping.py
+# token-bucket shaping: bucket arithmetic, AIMD on adapter feedback, goodput vs retries over a simulated slow BLE link.
+# test: pytest services/routing_service/test/test_shaping.py -v -s
+import asyncio
+import json
+import uuid
+
+import httpx
+import pytest
+
+from lib.envelope import MessageEnvelope, EnvelopeHeader, ChunkInfo, RoutingMeta
+from lib.utils import current_unix_ts
+from services.routing_service import config_loader, router_db, router_loop, shaper, strategies
+from services.routing_service.adapter_pool import AdapterPool
+from services.routing_service.circuit_breaker import BreakerTable
+from services.routing_service.config_loader import AdapterEndpoint
+from services.routing_service.duty_cycle import DutyCycle
+from services.routing_service.neighbor_table import NeighborTable
+from services.routing_service.shaper import Shaper
+from services.routing_service.strategies import NextHopStrategy
+
+_REAL_CLIENT = httpx.AsyncClient
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000.0]
+    monkeypatch.setattr(shaper, "_monotonic", lambda: now[0])
+    return now
+
+
+def test_buckets_pace_and_allow_oversized_transmissions(clock):
+    table = Shaper(bytes_per_second=4000, target_bytes_per_second=1000, target_msgs_per_second=2)
+    assert table.delay("N1", 500, 1) == 0.0
+    table.take("N1", 500, 1)
+    assert table.delay("N1", 800, 1) == pytest.approx(0.3)
+    # bigger than the whole bucket: waits for a full one, then goes into debt
+    assert table.delay("N1", 5000, 1) == pytest.approx(0.5)
+    clock[0] += 0.5
+    table.take("N1", 5000, 1)
+    assert table.delay("N1", 100, 1) == pytest.approx(4.1)
+    # other targets only share the global bucket
+    assert table.delay("N2", 100, 1) == pytest.approx(0.275)
+    clock[0] += 10
+    # envelopes per second: two in the bucket, the third waits
+    table.take("N2", 10, 1)
+    table.take("N2", 10, 1)
+    assert table.delay("N2", 10, 1) == pytest.approx(0.5)
+
+
+def test_feedback_adapts_target_and_global_share(clock):
+    table = Shaper(target_bytes_per_second=1000, target_estimate_ms=300, decrease=0.5, increase=0.1)
+    table.feedback("N1", 503, None)
+    assert table.share("N1") == 0.5
+    assert table.share(overall=True) == 1.0              # a peer error is not the adapter's
+    table.feedback("N1", 200, 900.0)
+    assert table.share("N1") == 0.25
+    assert table.share(overall=True) == 0.5              # a long estimate is
+    table.feedback("N2", None, None)
+    assert table.share(overall=True) == 0.25
+    table.feedback("N1", 200, 100.0)
+    assert table.share("N1") == pytest.approx(0.35)
+    assert table.stats()["throttled"] == {"N1": pytest.approx(0.35), "N2": 0.5}
+
+
+def test_shaping_settings_are_validated(clock):
+    cfg = config_loader.RoutingConfig.from_dict({"shaping": {"enabled": True, "target_bytes_per_second": 1000}})
+    table = Shaper.from_config(cfg.shaping)
+    assert table.delay("N1", 100, 1) == 0.0
+    table.take("N1", 1000, 1)
+    assert table.delay("N1", 500, 1) == pytest.approx(0.5)
+    with pytest.raises(ValueError) as exc:
+        config_loader.current().merged({"shaping": {
+            "bytes_per_second": -1, "burst_seconds": 0, "decrease": 1.5, "max_wait_ms": "500",
+        }})
+    msg = str(exc.value)
+    for key in ("bytes_per_second", "burst_seconds", "decrease", "max_wait_ms"):
+        assert f"shaping.{key}" in msg
+
+
+@pytest.mark.parametrize("body", [
+    b"queued", b"[]", b'{"queued": true}', b'{"estimate_ms": "soon"}',
+    b'{"estimate_ms": NaN}', b'{"estimate_ms": -5}', b'{"estimate_ms": 1' + b"0" * 400 + b"}",
+])
+def test_bad_estimate_is_ignored(monkeypatch, body):
+    buckets = Shaper(target_bytes_per_second=1000)
+    monkeypatch.setattr(router_loop, "SHAPER", buckets)
+    monkeypatch.setattr(router_loop, "BREAKERS", BreakerTable())
+    pool = AdapterPool([AdapterEndpoint("http://ble/v1/ble/send_chunk")])
+    monkeypatch.setattr(router_loop, "POOL", pool)
+    feedback = []
+    monkeypatch.setattr(buckets, "feedback", lambda *args: feedback.append(args))
+
+    async def send():
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body))
+        async with _REAL_CLIENT(transport=transport) as client:
+            chunks = ['{"header": {"msg_id": "m"}}']
+            return await router_loop._send(
+                client, config_loader.current(), {}, chunks, "N1", DutyCycle(), pool.pick("N1"),
+            )
+
+    assert asyncio.run(send()) is True
+    assert feedback == [("N1", 200, None)]
+
+
+def _env(size):
+    return MessageEnvelope(
+        header=EnvelopeHeader(
+            sender_fp="S",
+            recipient_fp="D",
+            msg_id=str(uuid.uuid4()),
+            nonce="dummy",
+            ttl=4,
+            hop_count=0,
+            ts=current_unix_ts(),
+        ),
+        ciphertext="a" * size,
+        chunks=ChunkInfo(),
+        routing=RoutingMeta(),
+    )
+
+
+def _simulate(monkeypatch, tmp_path, enabled, count=120, capacity=2000, buffer_bytes=3000):
+    """
+    Drain `count` envelopes over a link that moves `capacity` bytes/s out
+    of an adapter buffer of `buffer_bytes`; a transmission that does not
+    fit is refused (503). Time is simulated; between passes the clock
+    advances like routing_loop sleeps (2 s, or until deferred
+    transmissions fit), and the shaper's waits advance it too. Returns
+    (delivered, failed transmissions, dropped rows, seconds until the
+    queue was empty).
+    """
+    monkeypatch.setattr(router_db, "DB_PATH", str(tmp_path / f"shaping-{enabled}.db"))
+    router_db.init_db()
+    table = NeighborTable(neighbor_timeout_seconds=10**9)
+    table.observe("N1", -50, "D", 1)
+    monkeypatch.setattr(router_loop, "NEIGHBORS", table)
+    monkeypatch.setattr(strategies, "STRATEGY", NextHopStrategy(table))
+    monkeypatch.setattr(router_loop, "BREAKERS", BreakerTable())
+    buckets = Shaper()
+    monkeypatch.setattr(router_loop, "SHAPER", buckets)
+    cfg = config_loader.current().merged({
+        "base_retry_backoff_ms": 0,
+        "retry_jitter_ms": 0,
+        "bundling": {"max_items": 2},
+        "circuit_breaker": {"enabled": False},
+        "shaping": {
+            "enabled": enabled,
+            "bytes_per_second": 0,
+            "msgs_per_second": 0,
+            "target_bytes_per_second": 4 * capacity,     # the link is slower than configured
+            "target_msgs_per_second": 0,
+            "target_estimate_ms": 1000,
+        },
+    })
+    monkeypatch.setattr(config_loader, "_current", cfg)
+
+    start = 1_000.0
+    link = {"now": start, "drained_at": start, "buffer": 0.0, "delivered": 0, "failed": 0}
+    monkeypatch.setattr(shaper, "_monotonic", lambda: link["now"])
+
+    async def sleep(seconds):
+        link["now"] += seconds
+
+    monkeypatch.setattr(router_loop, "_sleep", sleep)
+
+    def handler(request):
+        link["buffer"] = max(link["buffer"] - (link["now"] - link["drained_at"]) * capacity, 0.0)
+        link["drained_at"] = link["now"]
+        size = len(request.content)
+        if link["buffer"] + size > buffer_bytes:
+            link["failed"] += 1
+            return httpx.Response(503, json={"queued": False, "error": "buffer full"})
+        link["buffer"] += size
+        body = json.loads(request.content)
+        link["delivered"] += len(body.get("bundle") or [body["chunk"]])
+        return httpx.Response(200, json={"queued": True, "estimate_ms": link["buffer"] / capacity * 1000})
+
+    monkeypatch.setattr(
+        router_loop.httpx, "AsyncClient",
+        lambda: _REAL_CLIENT(transport=httpx.MockTransport(handler)),
+    )
+
+    for _ in range(count):
+        env = _env(500)
+        router_db.enqueue_message(env.header.msg_id, env.model_dump_json(), 4)
+    for _ in range(200):
+        asyncio.run(router_loop.process_outgoing_queue())
+        if not router_db.get_outgoing():
+            break
+        resume = buckets.resume_in()
+        link["now"] += 2.0 if resume is None else min(2.0, resume)
+
+    conn = router_db.get_connection()
+    dropped = conn.execute("SELECT COUNT(*) FROM queue WHERE status = 'max_retries'").fetchone()[0]
+    conn.close()
+    return link["delivered"], link["failed"], dropped, link["now"] - start
+
+
+def test_shaping_keeps_goodput_near_link_capacity(monkeypatch, tmp_path):
+    count, size, capacity = 120, 500, 2000
+    plain = _simulate(monkeypatch, tmp_path, False, count, capacity)
+    shaped = _simulate(monkeypatch, tmp_path, True, count, capacity)
+    for name, (delivered, failed, dropped, seconds) in (("unshaped", plain), ("shaped", shaped)):
+        print(
+            f"\n{name}: {delivered}/{count} delivered, {failed} refused transmissions, "
+            f"{dropped} dropped after max_retries, {seconds:.0f} s"
+        )
+
+    delivered, failed, dropped, seconds = shaped
+    assert delivered == count and dropped == 0
+    # the unshaped loop overruns the buffer and gives up on messages
+    assert plain[2] > 0
+    assert failed * 5 < plain[1]
+    # goodput: at least ~60% of what the link can carry
+    envelope_bytes = len(_env(size).model_dump_json())
+    assert count * envelope_bytes / seconds > 0.6 * capacity
@@ -0,0 +1,222 @@
+# services/routing_service/test/test_strategies.py
+# store-and-forward strategies: spray-and-wait splitting, PRoPHET predictabilities, replica bookkeeping, simulation.
+# test: pytest services/routing_service/test/test_strategies.py -v -s
+import asyncio
+import json
+import uuid
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from lib.envelope import MessageEnvelope, EnvelopeHeader, ChunkInfo, RoutingMeta
+from lib.utils import current_unix_ts
+from services.routing_service import config_loader, neighbor_table, router_db, router_loop, routing_api, strategies, strategy_sim
+from services.routing_service.circuit_breaker import BreakerTable
+from services.routing_service.neighbor_table import NeighborTable
+from services.routing_service.strategies import (
+    NextHopStrategy,
+    ProphetStrategy,
+    RoutingStrategy,
+    SprayAndWaitStrategy,
+    build_strategy,
+)
+
+AUTH_HEADERS = {
+    "X-Device-Fp": routing_api.DEV_DEVICE_FP,
+    "X-Device-Token": routing_api.DEV_DEVICE_TOKEN,
+}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000.0]
+    monkeypatch.setattr(strategies, "_monotonic", lambda: now[0])
+    monkeypatch.setattr(neighbor_table, "_monotonic", lambda: now[0])
+    return now
+
+
+def _env(recipient="D", msg_id=None):
+    return MessageEnvelope(
+        header=EnvelopeHeader(
+            sender_fp="S",
+            recipient_fp=recipient,
+            msg_id=msg_id or str(uuid.uuid4()),
+            nonce="dummy",
+            ttl=4,
+            hop_count=0,
+            ts=current_unix_ts(),
+        ),
+        ciphertext="deadbeef",
+        chunks=ChunkInfo(),
+        routing=RoutingMeta(),
+    )
+
+
+def test_binary_spray_then_wait():
+    spray = SprayAndWaitStrategy(copies=8)
+    env = _env()
+
+    assert spray.handoffs(env, 8, ["a", "b", "c", "d"], set()) == [("a", 4), ("b", 2), ("c", 1)]
+    # one copy left: only the destination gets it
+    assert spray.handoffs(env, 1, ["e"], set()) == []
+    assert spray.handoffs(env, 1, ["e", "D"], set()) == [("D", 1)]
+    # neighbors that already got a copy are skipped
+    assert spray.handoffs(env, 4, ["a", "b"], {"a"}) == [("b", 2)]
+    assert spray.done(0, False) and not spray.done(1, False)
+    # a peer cannot inflate its copy budget
+    assert spray.accept_copies(10_000) == 8
+    assert spray.accept_copies(0) == 1
+
+
+def test_next_hop_uses_neighbor_table(clock):
+    table = NeighborTable()
+    table.observe("N1", -50, "D", 2)
+    strategy = NextHopStrategy(table)
+    assert strategy.handoffs(_env(), 1, [], set()) == [("N1", 1)]
+    assert strategy.handoffs(_env(recipient="X"), 1, [], set()) == [(None, 1)]
+    assert strategy.done(strategy.after_handoff(1, 1), False)
+
+
+def test_prophet_encounters_aging_and_transitivity(clock):
+    prophet = ProphetStrategy(p_init=0.5, beta=0.5, gamma=0.5, aging_seconds=10, contact_gap_seconds=5)
+    prophet.on_contact("B")
+    assert prophet.predictability("B") == 0.5
+    prophet.on_contact("B")                    # same encounter (within the gap)
+    assert prophet.predictability("B") == 0.5
+    clock[0] += 10
+    assert prophet.predictability("B") == 0.25  # aged one unit
+    prophet.on_contact("B", {"C": 0.8, "bogus": 7})
+    assert prophet.predictability("B") == 0.625
+    assert prophet.predictability("C") == pytest.approx(0.625 * 0.8 * 0.5)
+    assert "bogus" not in prophet.vector()
+
+
+def test_prophet_forwards_to_better_carriers(clock):
+    prophet = ProphetStrategy()
+    prophet.on_contact("good", {"D": 0.9})
+    prophet.on_contact("poor", {"D": 0.0})
+    env = _env()
+
+    assert prophet.handoffs(env, 1, ["good", "poor"], set()) == [("good", 1)]
+    assert prophet.handoffs(env, 1, ["good", "D"], set()) == [("D", 1)]
+    # replication: the copy stays until the destination has it
+    assert prophet.after_handoff(1, 1) == 1
+    assert not prophet.done(1, False) and prophet.done(1, True)
+
+
+def _strategy_cfg(**block):
+    return config_loader.RoutingConfig.from_dict({"strategy": block})
+
+
+def test_build_strategy():
+    assert isinstance(build_strategy(_strategy_cfg().strategy), NextHopStrategy)
+    assert build_strategy(_strategy_cfg(name="spray_and_wait", spray_copies=4).strategy).initial_copies() == 4
+    prophet = build_strategy(_strategy_cfg(name="prophet", prophet={"beta": 0.1}).strategy)
+    assert isinstance(prophet, ProphetStrategy) and prophet.beta == 0.1
+    with pytest.raises(ValueError):
+        build_strategy(config_loader.StrategyConfig(name="epidemic"))
+    with pytest.raises(TypeError):
+        type("NoHandoffs", (RoutingStrategy,), {})()
+
+
+def test_strategy_settings_are_validated():
+    with pytest.raises(ValueError) as exc:
+        _strategy_cfg(name="epidemic", spray_copies=0, prophet={"gamma": 2, "aging_seconds": 0})
+    assert "strategy.name must be one of next_hop, spray_and_wait, prophet" in str(exc.value)
+    assert "strategy.spray_copies must be >= 1" in str(exc.value)
+    assert "strategy.prophet.gamma must be > 0 and <= 1" in str(exc.value)
+    assert "strategy.prophet.aging_seconds must be > 0" in str(exc.value)
+
+
+def test_strategy_follows_config_reloads(monkeypatch, clock):
+    cfg = _strategy_cfg(name="prophet")
+    monkeypatch.setattr(strategies, "_settings", cfg.strategy)
+    monkeypatch.setattr(strategies, "STRATEGY", build_strategy(cfg.strategy))
+    prophet = strategies.STRATEGY
+    prophet.on_contact("B")
+
+    # same name: tuned in place, predictabilities kept
+    tuned = cfg.merged({"strategy": {"prophet": {"gamma": 0.5}}})
+    assert strategies.configure(tuned.strategy) is prophet
+    assert prophet.gamma == 0.5 and prophet.predictability("B") == 0.75
+
+    spray = tuned.merged({"strategy": {"name": "spray_and_wait", "spray_copies": 3}})
+    assert isinstance(strategies.configure(spray.strategy), SprayAndWaitStrategy)
+    assert strategies.STRATEGY.initial_copies() == 3
+
+
+@pytest.fixture
+def spray_router(monkeypatch, tmp_path, clock):
+    monkeypatch.setattr(router_db, "DB_PATH", str(tmp_path / "routing.db"))
+    router_db.init_db()
+    table = NeighborTable()
+    monkeypatch.setattr(router_loop, "NEIGHBORS", table)
+    monkeypatch.setattr(router_loop, "BREAKERS", BreakerTable())
+    monkeypatch.setattr(strategies, "STRATEGY", SprayAndWaitStrategy(copies=4))
+
+    sent = []
+
+    def handler(request):
+        sent.append(json.loads(request.content))
+        return httpx.Response(200)
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(
+        router_loop.httpx, "AsyncClient",
+        lambda: real_client(transport=httpx.MockTransport(handler)),
+    )
+    return table, sent
+
+
+def test_router_loop_keeps_replica_bookkeeping(spray_router):
+    table, sent = spray_router
+    table.observe("A", -50, "A", 1)
+    table.observe("B", -50, "B", 1)
+    router_db.enqueue_message("m1", _env(msg_id="m1").model_dump_json(), 4, copies=4)
+
+    asyncio.run(router_loop.process_outgoing_queue())
+    assert sorted((s["target_peer"], s["chunk"]["routing"]["copies"]) for s in sent) == [("A", 1), ("B", 2)]
+    assert router_db.handed_out(["m1"]) == {"m1": {"A", "B"}}
+    (row,) = router_db.get_outgoing()
+    assert (row["copies"], row["retries"]) == (1, 0)
+
+    # waiting: no new contacts, nothing sent, not counted as a retry
+    sent.clear()
+    asyncio.run(router_loop.process_outgoing_queue())
+    assert sent == []
+
+    table.observe("D", -50, "D", 1)
+    asyncio.run(router_loop.process_outgoing_queue())
+    assert [s["target_peer"] for s in sent] == ["D"]
+    assert router_db.get_outgoing() == []
+
+
+def test_contact_endpoint(monkeypatch, clock):
+    monkeypatch.setattr(strategies, "STRATEGY", ProphetStrategy())
+    client = TestClient(routing_api.app)
+    resp = client.post(
+        "/v1/router/contact",
+        json={"neighbor": "B", "predictability": {"D": 0.5}},
+        headers=AUTH_HEADERS,
+    )
+    body = resp.json()
+    assert body["strategy"] == "prophet"
+    assert body["predictability"]["B"] == 0.75
+    assert 0 < body["predictability"]["D"] < 0.5
+
+    resp = client.post("/v1/router/contact", json={"predictability": []}, headers=AUTH_HEADERS)
+    assert resp.status_code == 400
+
+
+def test_simulation_delivery_vs_overhead():
+    trace = strategy_sim.make_trace(nodes=20, ticks=300, messages=60, seed=3)
+    results = {r.strategy: r.as_dict() for r in strategy_sim.compare(trace, ["next_hop", "spray_and_wait", "prophet"])}
+    for row in results.values():
+        print(row)
+
+    spray = results["spray_and_wait"]
+    # bounded copies: at most copies - 1 spray hand-offs plus one delivery per copy
+    assert spray["transmissions"] <= 60 * (2 * 8 - 1)
+    assert spray["delivery_ratio"] > results["next_hop"]["delivery_ratio"]
+    assert results["prophet"]["delivery_ratio"] >= spray["delivery_ratio"] - 0.1
@@ -0,0 +1,237 @@
+# services/routing_service/test/test_summary_sync.py
+# anti-entropy summary vectors: Bloom filter encoding, neighbor summaries, set-difference transfer, bytes per encounter.
+# test: pytest services/routing_service/test/test_summary_sync.py -v -s
+import asyncio
+import json
+import uuid
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from lib.envelope import MessageEnvelope, EnvelopeHeader, ChunkInfo, RoutingMeta
+from lib.utils import current_unix_ts
+from services.routing_service import config_loader, router_db, router_loop, routing_api, strategies, summary_vector
+from services.routing_service.circuit_breaker import BreakerTable
+from services.routing_service.neighbor_table import NeighborTable
+from services.routing_service.strategies import NextHopStrategy
+from services.routing_service.summary_vector import PeerSummaries, SummaryVector
+
+client = TestClient(routing_api.app)
+
+AUTH_HEADERS = {
+    "X-Device-Fp": routing_api.DEV_DEVICE_FP,
+    "X-Device-Token": routing_api.DEV_DEVICE_TOKEN,
+}
+
+_REAL_CLIENT = httpx.AsyncClient
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000.0]
+    monkeypatch.setattr(summary_vector, "_monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def summaries(monkeypatch, clock):
+    table = PeerSummaries(ttl_seconds=60)
+    monkeypatch.setattr(routing_api, "PEER_SUMMARIES", table)
+    monkeypatch.setattr(router_loop, "PEER_SUMMARIES", table)
+    monkeypatch.setattr(router_loop, "BREAKERS", BreakerTable())
+    return table
+
+
+def _env(msg_id=None):
+    return MessageEnvelope(
+        header=EnvelopeHeader(
+            sender_fp="S",
+            recipient_fp="D",
+            msg_id=msg_id or str(uuid.uuid4()),
+            nonce="bm9uY2Vub25jZQ==",
+            ttl=4,
+            hop_count=0,
+            ts=current_unix_ts(),
+        ),
+        ciphertext="ab" * 200,
+        chunks=ChunkInfo(),
+        routing=RoutingMeta(),
+    )
+
+
+def test_summary_vector_roundtrip_and_false_positive_rate():
+    held = [str(uuid.uuid4()) for _ in range(5_000)]
+    summary = SummaryVector.build(held, fp_rate=0.01)
+    assert all(msg_id in summary for msg_id in held)
+
+    wire = json.loads(json.dumps(summary.to_dict()))
+    parsed = SummaryVector.from_dict(wire)
+    assert all(msg_id in parsed for msg_id in held)
+    others = [str(uuid.uuid4()) for _ in range(20_000)]
+    assert sum(msg_id in parsed for msg_id in others) < 20_000 * 0.02
+    # ~1.2 bytes per msg_id instead of 36
+    assert len(wire["filter"]) < 5_000 * 2
+    # fresh salt per summary: a false positive does not repeat
+    assert SummaryVector.build(held).salt != summary.salt
+
+
+@pytest.mark.parametrize("bad", [
+    None,
+    {"bits": 63, "hashes": 3, "salt": "", "filter": ""},
+    {"bits": 64, "hashes": 0, "salt": "", "filter": "AAAAAAAAAAA="},
+    {"bits": 64, "hashes": 3, "salt": "zz", "filter": "AAAAAAAAAAA="},
+    {"bits": 64, "hashes": 3, "salt": "", "filter": "AAAA"},
+    {"bits": 2 ** 40, "hashes": 3, "salt": "", "filter": ""},
+])
+def test_malformed_summaries_are_rejected(bad):
+    with pytest.raises(ValueError):
+        SummaryVector.from_dict(bad)
+
+
+def test_peer_summaries_expire_and_cover_broadcasts(clock):
+    table = PeerSummaries(max_peers=2, ttl_seconds=60)
+    table.update("B", SummaryVector.build(["m1", "m2"]))
+    table.update("C", SummaryVector.build(["m1"]))
+
+    assert table.covers("B", "m2", ["B", "C"])
+    assert table.covers(None, "m1", ["B", "C"])
+    assert not table.covers(None, "m2", ["B", "C"])
+    assert not table.covers(None, "m1", [])
+    assert table.stats()["skipped"] == 2
+
+    clock[0] += 61
+    assert not table.has("B", "m1")
+    table.update("D", SummaryVector.build(["m1"]))
+    table.update("E", SummaryVector.build(["m1"]))
+    assert table.stats()["peers"] == 2
+
+
+def test_summary_endpoints(monkeypatch, tmp_path, summaries):
+    monkeypatch.setattr(router_db, "DB_PATH", str(tmp_path / "routing.db"))
+    router_db.init_db()
+    for msg_id in ("m1", "m2", "m3"):
+        router_db.enqueue_message(msg_id, _env(msg_id).model_dump_json(), 4)
+
+    own = client.get("/v1/router/summary", headers=AUTH_HEADERS).json()["summary"]
+    assert own["count"] == 3
+    assert "m2" in SummaryVector.from_dict(own)
+
+    neighbor = SummaryVector.build(["m1", "m3"]).to_dict()
+    resp = client.post("/v1/router/summary", json={"neighbor": "B", "summary": neighbor}, headers=AUTH_HEADERS)
+    assert resp.json() == {"accepted": True, "to_send": 1}
+    items = client.get("/v1/router/outgoing_chunks?peer=B", headers=AUTH_HEADERS).json()["items"]
+    assert [json.loads(item["chunk"])["header"]["msg_id"] for item in items] == ["m2"]
+    assert len(client.get("/v1/router/outgoing_chunks", headers=AUTH_HEADERS).json()["items"]) == 3
+
+    resp = client.post("/v1/router/summary", json={"neighbor": "B", "summary": {"bits": 8}}, headers=AUTH_HEADERS)
+    assert resp.status_code == 400
+
+
+def _encounter(monkeypatch, tmp_path, envelopes, held_by_b, exchange):
+    """
+    A (holding `envelopes`) meets B (holding the first `held_by_b` of
+    them); returns (bytes over the air, envelopes A transmitted).
+    """
+    a_db, b_db = str(tmp_path / f"a-{exchange}.db"), str(tmp_path / f"b-{exchange}.db")
+    for db, envs in ((a_db, envelopes), (b_db, envelopes[:held_by_b])):
+        monkeypatch.setattr(router_db, "DB_PATH", db)
+        router_db.init_db()
+        for env in envs:
+            router_db.enqueue_message(env.header.msg_id, env.model_dump_json(), 4)
+
+    air = 0
+    if exchange:
+        # B's summary travels to A
+        monkeypatch.setattr(router_db, "DB_PATH", b_db)
+        resp = client.get("/v1/router/summary", headers=AUTH_HEADERS)
+        air += len(json.dumps(resp.json()["summary"]))
+        monkeypatch.setattr(router_db, "DB_PATH", a_db)
+        client.post("/v1/router/summary", json={"neighbor": "B", **resp.json()}, headers=AUTH_HEADERS)
+    monkeypatch.setattr(router_db, "DB_PATH", a_db)
+
+    sent = []
+
+    def handler(request):
+        nonlocal air
+        body = json.loads(request.content)
+        air += len(request.content)
+        sent.extend(body.get("bundle") or [body["chunk"]])
+        return httpx.Response(200)
+
+    monkeypatch.setattr(
+        router_loop.httpx, "AsyncClient",
+        lambda: _REAL_CLIENT(transport=httpx.MockTransport(handler)),
+    )
+    asyncio.run(router_loop.process_outgoing_queue())
+    # skipped envelopes stay queued (a summary hit may be a false positive)
+    assert len(router_db.get_outgoing()) == len(envelopes) - len(sent)
+    return air, len(sent)
+
+
+def test_encounter_bytes_with_and_without_summaries(monkeypatch, tmp_path, summaries):
+    table = NeighborTable()
+    table.observe("B", -50, "B", 1)
+    monkeypatch.setattr(router_loop, "NEIGHBORS", table)
+    monkeypatch.setattr(strategies, "STRATEGY", NextHopStrategy(table))
+
+    count, overlap = 300, 240
+    envelopes = [_env() for _ in range(count)]
+    blast_bytes, blast_sent = _encounter(monkeypatch, tmp_path, envelopes, overlap, exchange=False)
+    sync_bytes, sync_sent = _encounter(monkeypatch, tmp_path, envelopes, overlap, exchange=True)
+    print(
+        f"\nencounter, {count} queued / {overlap} already at the neighbor: "
+        f"{blast_sent} envelopes, {blast_bytes} bytes without summaries; "
+        f"{sync_sent} envelopes, {sync_bytes} bytes with summaries"
+    )
+
+    assert blast_sent == count
+    # the set difference, give or take a Bloom false positive
+    assert count - overlap - 5 <= sync_sent <= count - overlap
+    assert sync_bytes < blast_bytes * 0.35
+
+
+def test_summary_hit_does_not_mark_delivered(monkeypatch, tmp_path, summaries, clock):
+    monkeypatch.setattr(router_db, "DB_PATH", str(tmp_path / "routing.db"))
+    router_db.init_db()
+    table = NeighborTable()
+    table.observe("B", -50, "D", 2)
+    monkeypatch.setattr(router_loop, "NEIGHBORS", table)
+    monkeypatch.setattr(strategies, "STRATEGY", NextHopStrategy(table))
+    env = _env()
+    router_db.enqueue_message(env.header.msg_id, env.model_dump_json(), 4)
+    # B's summary claims the message: a Bloom false positive looks the same
+    summaries.update("B", SummaryVector.build([env.header.msg_id]))
+
+    sent = []
+    monkeypatch.setattr(
+        router_loop.httpx, "AsyncClient",
+        lambda: _REAL_CLIENT(transport=httpx.MockTransport(lambda r: sent.append(r) or httpx.Response(200))),
+    )
+    asyncio.run(router_loop.process_outgoing_queue())
+    assert sent == []
+    (row,) = router_db.get_outgoing()
+    assert (row["msg_id"], row["retries"]) == (env.header.msg_id, 0)
+
+    # once the summary has expired the message goes out
+    clock[0] += 61
+    asyncio.run(router_loop.process_outgoing_queue())
+    assert len(sent) == 1
+    assert router_db.get_outgoing() == []
+
+
+def test_summary_settings_are_validated_and_follow_reloads(clock):
+    with pytest.raises(ValueError) as exc:
+        config_loader.RoutingConfig.from_dict({"summary": {"fp_rate": 0, "max_ids": 0, "ttl_seconds": -1}})
+    assert "summary.fp_rate must be > 0 and < 1" in str(exc.value)
+    assert "summary.max_ids must be >= 1" in str(exc.value)
+    assert "summary.ttl_seconds must be >= 0" in str(exc.value)
+
+    cfg = config_loader.RoutingConfig.from_dict({"summary": {"ttl_seconds": 60}})
+    table = PeerSummaries.from_config(cfg.summary)
+    for peer in ("A", "B", "C"):
+        table.update(peer, SummaryVector.build(["m1"]))
+    table.configure(cfg.merged({"summary": {"max_peers": 2, "ttl_seconds": 5}}).summary)
+    assert not table.has("A", "m1") and table.has("C", "m1")
+    clock[0] += 10
+    assert not table.has("C", "m1")
@@ -0,0 +1,138 @@
+# services/routing_service/test/test_ws_ingress.py
+# WebSocket ingress: handshake auth, verdicts by msg_id, credits, revocation, HTTP parity.
+# test: pytest services/routing_service/test/test_ws_ingress.py -v
+import threading
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from lib.envelope import MessageEnvelope, EnvelopeHeader, ChunkInfo, RoutingMeta
+from lib.utils import current_unix_ts
+from services.routing_service import config_loader, ids_module, router_db, routing_api
+from services.routing_service.device_registry import DeviceRegistry
+
+client = TestClient(routing_api.app)
+
+AUTH_HEADERS = {
+    "X-Device-Fp": routing_api.DEV_DEVICE_FP,
+    "X-Device-Token": routing_api.DEV_DEVICE_TOKEN,
+}
+URL = "/v1/router/ingress"
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch, tmp_path):
+    monkeypatch.setattr(router_db, "DB_PATH", str(tmp_path / "routing.db"))
+    router_db.init_db()
+    monkeypatch.setattr(routing_api, "DEVICES", DeviceRegistry(static_devices=routing_api.DEV_DEVICES))
+    monkeypatch.setattr(ids_module, "LOG_PATH", tmp_path / "ids.log", raising=False)
+    ids_module._peer_windows.clear()
+    ids_module._seen_msg_ids.clear()
+    ids_module._blocked_peers.clear()
+
+
+def _frame(sender="A", msg_id=None, ttl=4):
+    env = MessageEnvelope(
+        header=EnvelopeHeader(
+            sender_fp=sender,
+            recipient_fp="B",
+            msg_id=msg_id or str(uuid.uuid4()),
+            nonce="dummy",
+            ttl=ttl,
+            hop_count=0,
+            ts=current_unix_ts(),
+        ),
+        ciphertext="deadbeef",
+        chunks=ChunkInfo(),
+        routing=RoutingMeta(),
+    )
+    return {"chunk": env.model_dump(), "link_meta": {"peer": sender, "rssi": -50}}
+
+
+def test_handshake_requires_credentials():
+    with pytest.raises(WebSocketDisconnect) as exc:
+        with client.websocket_connect(URL, headers={"X-Device-Fp": "x", "X-Device-Token": "bad"}):
+            pass
+    assert exc.value.code == 1008
+
+
+def test_verdicts_match_http_endpoint(monkeypatch):
+    frames = [_frame(msg_id="m-1"), _frame(msg_id="m-1"), _frame(msg_id="m-ttl", ttl=99)]
+    with client.websocket_connect(URL, headers=AUTH_HEADERS) as ws:
+        hello = ws.receive_json()
+        assert hello["type"] == "hello" and hello["credits"] >= 3
+        for frame in frames:
+            ws.send_json(frame)
+        verdicts = [ws.receive_json() for _ in frames]
+
+    by_id = {}
+    for v in verdicts:
+        assert v["type"] == "verdict"
+        by_id.setdefault(v["msg_id"], []).append(v)
+    actions = sorted(v.get("action") for v in by_id["m-1"])
+    assert actions == ["drop", "final"]  # second copy is a duplicate
+    assert by_id["m-ttl"][0]["status"] == 400
+    assert by_id["m-ttl"][0]["error"]["code"] == "INVALID_INPUT"
+
+    # same payload over HTTP gives the same verdict shape
+    resp = client.post("/v1/router/on_chunk_received", json=_frame(msg_id="m-2"), headers=AUTH_HEADERS)
+    assert resp.json() == {"accepted": True, "action": "final"}
+
+
+def test_invalid_frame_gets_error_verdict():
+    with client.websocket_connect(URL, headers=AUTH_HEADERS) as ws:
+        ws.receive_json()
+        ws.send_text("not json")
+        v = ws.receive_json()
+    assert v["msg_id"] is None
+    assert v["status"] == 400
+
+
+def test_ingress_settings_are_validated():
+    cfg = config_loader.RoutingConfig.from_dict({"ingress": {"ws_credits": 8}})
+    assert cfg.ingress == config_loader.IngressConfig(ws_credits=8, max_batch_items=1000)
+    with pytest.raises(ValueError) as exc:
+        config_loader.current().merged({"ingress": {"ws_credits": "64", "max_batch_items": -1}})
+    assert "ingress.ws_credits" in str(exc.value)
+    assert "ingress.max_batch_items" in str(exc.value)
+
+
+def test_exceeding_credits_closes_socket(monkeypatch):
+    monkeypatch.setattr(
+        config_loader, "_current", config_loader.current().merged({"ingress": {"ws_credits": 1}})
+    )
+    # hold the single credit by blocking the worker until the client overruns
+    release = threading.Event()
+    real = routing_api._ws_verdict
+
+    def slow(raw, fp, token):
+        release.wait(5)
+        return real(raw, fp, token)
+
+    monkeypatch.setattr(routing_api, "_ws_verdict", slow)
+    with client.websocket_connect(URL, headers=AUTH_HEADERS) as ws:
+        assert ws.receive_json()["credits"] == 1
+        ws.send_json(_frame())
+        ws.send_json(_frame())
+        with pytest.raises(WebSocketDisconnect) as exc:
+            ws.receive_json()
+        release.set()
+    assert exc.value.code == 1008
+
+
+def test_revoked_device_is_disconnected():
+    reg = routing_api.DEVICES
+    token = reg.register("ble-ws", ["ble"])
+    headers = {"X-Device-Fp": "ble-ws", "X-Device-Token": token}
+    with client.websocket_connect(URL, headers=headers) as ws:
+        ws.receive_json()
+        ws.send_json(_frame())
+        assert ws.receive_json()["action"] == "final"
+
+        reg.revoke("ble-ws")
+        ws.send_json(_frame())
+        with pytest.raises(WebSocketDisconnect) as exc:
+            ws.receive_json()
+    assert exc.value.code == 1008